@@ -0,0 +1,23 @@
+# Compare mmseqs clustering engines (cluster, linclust, cascade) on the example dataset:
+# run time, peak memory and number of families.
+# To run from the root of the repository. Requires GNU time (/usr/bin/time).
+# Replace the list file, protein directory and identity by your own dataset to benchmark it.
+LSTINFO=Examples/input_files/pan-input/LSTINFO-list_genomes.lst
+PROTEINS=Examples/input_files/pan-input/Proteins
+ID=0.8
+OUT=Examples/3-pangenome-benchmark
+
+mkdir -p $OUT
+echo -e "engine\twall_time\tpeak_memory_kb\tnb_families" > $OUT/benchmark.tsv
+for engine in cluster linclust cascade; do
+    # Same database cache for all engines: database creation is done only once,
+    # and not taken into account in the comparison
+    /usr/bin/time -v -o $OUT/time-$engine.txt \
+        PanACoTA pangenome -l $LSTINFO -n GENO3 -d $PROTEINS -i $ID --engine $engine \
+                           -o $OUT/$engine --db-cache $OUT/db_cache -q
+    wall=$(grep "Elapsed (wall clock) time" $OUT/time-$engine.txt | awk '{print $NF}')
+    mem=$(grep "Maximum resident set size" $OUT/time-$engine.txt | awk '{print $NF}')
+    nbfam=$(cat $OUT/$engine/PanGenome-*.lst | wc -l)
+    echo -e "$engine\t$wall\t$mem\t$nbfam" >> $OUT/benchmark.tsv
+done
+cat $OUT/benchmark.tsv
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+# ###############################################################################
+# This file is part of PanACOTA.                                                #
+#                                                                               #
+# Authors: Amandine Perrin                                                      #
+# Copyright © 2018-2020 Institut Pasteur (Paris).                               #
+# See the COPYRIGHT file for details.                                           #
+#                                                                               #
+# PanACOTA is a software providing tools for large scale bacterial comparative  #
+# genomics. From a set of complete and/or draft genomes, you can:               #
+#    -  Do a quality control of your strains, to eliminate poor quality         #
+# genomes, which would not give any information for the comparative study       #
+#    -  Uniformly annotate all genomes                                          #
+#    -  Do a Pan-genome                                                         #
+#    -  Do a Core or Persistent genome                                          #
+#    -  Align all Core/Persistent families                                      #
+#    -  Infer a phylogenetic tree from the Core/Persistent families             #
+#                                                                               #
+# PanACOTA is free software: you can redistribute it and/or modify it under the #
+# terms of the Affero GNU General Public License as published by the Free       #
+# Software Foundation, either version 3 of the License, or (at your option)     #
+# any later version.                                                            #
+#                                                                               #
+# PanACOTA is distributed in the hope that it will be useful, but WITHOUT ANY   #
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS     #
+# FOR A PARTICULAR PURPOSE. See the Affero GNU General Public License           #
+# for more details.                                                             #
+#                                                                               #
+# You should have received a copy of the Affero GNU General Public License      #
+# along with PanACOTA (COPYING file).                                           #
+# If not, see <https://www.gnu.org/licenses/>.                                  #
+# ###############################################################################
+
+
+"""
+Cache of family alignments, shared between runs and datasets.
+
+A family is identified by a checksum of its sorted (name, sequence) proteins and genes,
+and of the settings of the aligner used. Its protein alignment and back-translated
+alignment (before adding missing genomes) are stored in a folder named after this
+checksum, so that any run aligning exactly the same sequences with the same aligner can
+copy them instead of aligning the family again.
+
+When the cache is bigger than its maximum size, the least recently used families are
+removed (see evict). Statistics on the use of the cache (hits, misses, families stored and
+evicted) are kept in the cache, as they are updated by all processes aligning families.
+
+@author gem
+October 2026
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+logger = logging.getLogger("align.cache")
+
+# Files of a cache entry: protein alignment and back-translated alignment
+ENTRY_FILES = ["mafft-align.aln", "mafft-prt2nuc.aln"]
+# File containing statistics on cache use
+STATS_FILE = "stats.json"
+STATS = ["hits", "misses", "stored", "evicted"]
+
+
+def family_key(proteins, genes, settings):
+    """
+    Get the checksum identifying a family in the cache
+
+    Parameters
+    ----------
+    proteins : list
+        [(name, sequence)] proteins of the family, as bytes
+    genes : list
+        [(name, sequence)] genes of the family, as bytes
+    settings : str
+        aligner and its options
+
+    Returns
+    -------
+    str
+        sha256 hexadecimal digest, whatever the order of sequences
+    """
+    sha = hashlib.sha256(settings.encode() + b"\n")
+    for records in [proteins, genes]:
+        for name, seq in sorted(records):
+            sha.update(name + b"\t" + seq + b"\n")
+        sha.update(b"//\n")
+    return sha.hexdigest()
+
+
+def get(cache_dir, key, files):
+    """
+    Copy the alignments of a family from the cache, if it is there
+
+    Parameters
+    ----------
+    cache_dir : str
+        cache directory
+    key : str
+        checksum of the family (see family_key)
+    files : list
+        [protein alignment file, back-translated alignment file] to create
+
+    Returns
+    -------
+    bool
+        True if the family was in cache and its alignments were copied, False otherwise
+    """
+    entry = os.path.join(cache_dir, key)
+    try:
+        for name, dest in zip(ENTRY_FILES, files):
+            shutil.copyfile(os.path.join(entry, name), dest)
+        # Mark entry as recently used
+        os.utime(entry)
+    except OSError:
+        # Not in cache (or removed by another run while copying)
+        for dest in files:
+            if os.path.isfile(dest):
+                os.remove(dest)
+        update_stats(cache_dir, misses=1)
+        return False
+    update_stats(cache_dir, hits=1)
+    return True
+
+
+def put(cache_dir, key, files):
+    """
+    Store the alignments of a family in the cache. They are first written to a temporary
+    folder, renamed once complete, so that other runs never find a partial entry.
+
+    Parameters
+    ----------
+    cache_dir : str
+        cache directory
+    key : str
+        checksum of the family (see family_key)
+    files : list
+        [protein alignment file, back-translated alignment file] to store
+    """
+    entry = os.path.join(cache_dir, key)
+    tmpdir = tempfile.mkdtemp(prefix=".tmp-", dir=cache_dir)
+    try:
+        for name, src in zip(ENTRY_FILES, files):
+            shutil.copyfile(src, os.path.join(tmpdir, name))
+        os.rename(tmpdir, entry)
+    except OSError:
+        # Already stored by another run
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        return
+    update_stats(cache_dir, stored=1)
+
+
+def get_entries(cache_dir):
+    """
+    Get all families stored in the cache
+
+    Parameters
+    ----------
+    cache_dir : str
+        cache directory
+
+    Returns
+    -------
+    list
+        [(last use time, size in bytes, key)] of all entries, from the least recently used
+    """
+    entries = []
+    for key in os.listdir(cache_dir):
+        entry = os.path.join(cache_dir, key)
+        if key.startswith(".") or not os.path.isdir(entry):
+            continue
+        try:
+            size = sum(os.path.getsize(os.path.join(entry, name)) for name in ENTRY_FILES)
+            entries.append((os.path.getmtime(entry), size, key))
+        except OSError:
+            continue
+    return sorted(entries)
+
+
+def evict(cache_dir, max_size):
+    """
+    Remove the least recently used families until the cache size is at most max_size
+
+    Parameters
+    ----------
+    cache_dir : str
+        cache directory
+    max_size : int
+        maximum size of the cache, in bytes
+
+    Returns
+    -------
+    list
+        keys of families removed
+    """
+    entries = get_entries(cache_dir)
+    total = sum(size for _, size, _ in entries)
+    removed = []
+    for _, size, key in entries:
+        if total <= max_size:
+            break
+        shutil.rmtree(os.path.join(cache_dir, key), ignore_errors=True)
+        total -= size
+        removed.append(key)
+    if removed:
+        update_stats(cache_dir, evicted=len(removed))
+    return removed
+
+
+def update_stats(cache_dir, **counts):
+    """
+    Add the given counts to the statistics of the cache. The statistics file is locked
+    while it is updated, as it is shared by all processes using the cache.
+
+    Parameters
+    ----------
+    cache_dir : str
+        cache directory
+    counts : dict
+        {stat: number to add}, stat being one of STATS
+    """
+    with open(os.path.join(cache_dir, STATS_FILE), "a+") as statf:
+        fcntl.flock(statf, fcntl.LOCK_EX)
+        statf.seek(0)
+        content = statf.read()
+        stats = json.loads(content) if content else {}
+        for stat, count in counts.items():
+            stats[stat] = stats.get(stat, 0) + count
+        statf.seek(0)
+        statf.truncate()
+        json.dump(stats, statf)
+
+
+def read_stats(cache_dir):
+    """
+    Get statistics on the cache
+
+    Parameters
+    ----------
+    cache_dir : str
+        cache directory
+
+    Returns
+    -------
+    dict
+        {stat: count} for each stat of STATS since the cache creation, with the current
+        number of families ('entries') and size in bytes ('size')
+    """
+    stats = dict.fromkeys(STATS, 0)
+    statfile = os.path.join(cache_dir, STATS_FILE)
+    if os.path.isfile(statfile):
+        with open(statfile) as statf:
+            fcntl.flock(statf, fcntl.LOCK_SH)
+            content = statf.read()
+        stats.update(json.loads(content) if content else {})
+    entries = get_entries(cache_dir)
+    stats["entries"] = len(entries)
+    stats["size"] = sum(size for _, size, _ in entries)
+    return stats
+
+
+def report(cache_dir, before):
+    """
+    Log statistics of the cache use since 'before', and its current content
+
+    Parameters
+    ----------
+    cache_dir : str
+        cache directory
+    before : dict
+        statistics at the beginning of the run (see read_stats)
+
+    Returns
+    -------
+    dict
+        {stat: count} during the run for each stat of STATS, with current number of
+        families ('entries') and size ('size')
+    """
+    stats = read_stats(cache_dir)
+    run = {stat: stats[stat] - before.get(stat, 0) for stat in STATS}
+    run["entries"] = stats["entries"]
+    run["size"] = stats["size"]
+    logger.info(f"Alignment cache {cache_dir}: {run['hits']} families found in cache, "
+                f"{run['misses']} aligned, {run['stored']} stored, {run['evicted']} evicted. "
+                f"It contains {run['entries']} families ({run['size'] / 2**20:.1f} MB).")
+    return run
@@ -49,14 +49,18 @@ import sys
 import logging
 import multiprocessing
 import progressbar
+import queue
 import threading
+import numpy as np
 
 from PanACoTA import utils
+from PanACoTA.align_module import align_cache
 
 main_logger = logging.getLogger("align.alignment")
 
 
-def align_all_families(prefix, all_fams, ngenomes, dname, quiet, threads):
+def align_all_families(prefix, all_fams, ngenomes, dname, quiet, threads, aligner="mafft",
+                       cache_dir=None):
     """
     For each family:
 
@@ -78,7 +82,14 @@ def align_all_families(prefix, all_fams, ngenomes, dname, quiet, threads):
     quiet : bool
         True if nothing must be written in stdout/stderr, False otherwise
     threads : int
-        max number of threads that can be used by mafft
+        max number of threads that can be used by the aligner. Families are aligned from the
+        biggest to the smallest, big families using several aligner threads (see
+        schedule_families), while the total number of threads used stays below this value.
+    aligner : str
+        aligner used for the proteins of each family (key of ALIGNERS), or 'auto' to choose
+        it according to family size (see choose_aligner)
+    cache_dir : str or None
+        directory of the alignment cache (see align_cache). None to not use a cache.
 
     Returns
     -------
@@ -98,77 +109,177 @@ def align_all_families(prefix, all_fams, ngenomes, dname, quiet, threads):
         bar = progressbar.ProgressBar(widgets=widgets, max_value=nbfam,
                                       term_width=79).start()
     final = []
+    # Alignment settings, common to all families
+    params = {"aligner": aligner, "cache_dir": cache_dir}
     if threads == 1:
         update_bar = 1
         for num_fam in all_fams:
-            f = handle_family_1thread((prefix, num_fam, ngenomes))
+            f = handle_family_1thread((prefix, num_fam, ngenomes, params))
             final.append(f)
-            bar.update(update_bar)
+            if bar:
+                bar.update(update_bar)
             update_bar+=1
 
     else:
+        sizes = get_family_sizes(prefix, all_fams)
+        schedule = schedule_families(sizes, threads)
         pool = multiprocessing.Pool(threads)
 
         # Create a Queue to put logs from processes, and handle them after from a single thread
         m = multiprocessing.Manager()
         q = m.Queue()
-        # arguments : (gpath, cores_prokka, name, force, nbcont, q) for each genome
-        arguments = [(prefix, num_fam, ngenomes, q) for num_fam in all_fams]
+        # Listen for logs in processes
+        lp = threading.Thread(target=utils.logger_thread, args=(q,))
+        lp.start()
         try:
-            final = pool.map_async(handle_family, arguments, chunksize=1)
+            results = run_schedule(pool, schedule, (prefix, ngenomes, q, params), threads, bar)
             pool.close()
-            # Listen for logs in processes
-            lp = threading.Thread(target=utils.logger_thread, args=(q,))
-            lp.start()
-            if not quiet:
-                while True:
-                    if final.ready():
-                        break
-                    remaining = final._number_left
-                    bar.update(nbfam - remaining)
-                bar.finish()
             pool.join()
             q.put(None)
             lp.join()
-            final = final.get()
+            final = [results[num_fam].get() for num_fam in all_fams]
         # If an error occurs (or user kills with keybord), terminate pool and exit
         except Exception as excp:  # pragma: no cover
             pool.terminate()
             main_logger.error(excp)
             sys.exit(1)
+        if bar:
+            bar.finish()
     # We re-aligned (or added missing genomes) at least one family 
-    # -> remove concatenated files and groupby files (if they exist)
+    # -> remove groupby files (if they exist)
     if set(final) != {"OK"}:
         aldir = os.path.split(prefix)[0]
-        concat_nucl = os.path.join(aldir, f"{dname}-complete.nucl.cat.aln")
-        concat_aa = os.path.join(aldir, f"{dname}-complete.aa.cat.aln")
         outdir = os.path.split(aldir)[0]
         treedir = os.path.join(outdir, "Phylo-" + dname)
         grpfile_nucl = os.path.join(treedir, dname + ".nucl.grp.aln")
         grpfile_aa = os.path.join(treedir, dname + ".aa.grp.aln")
-        utils.remove(concat_nucl)
-        utils.remove(concat_aa)
         utils.remove(grpfile_nucl)
         utils.remove(grpfile_aa)
     return False not in final
 
 
+def get_family_sizes(prefix, all_fams):
+    """
+    Get the size of each family to align: size of its file of extracted proteins, which
+    is proportional to number x length of its sequences.
+
+    Parameters
+    ----------
+    prefix :  str
+        path to ``aldir/<name of dataset>``
+    all_fams : []
+        list of all family numbers
+
+    Returns
+    -------
+    dict
+        {num_fam: size}. Size is 0 if the file does not exist (error will be given while
+        aligning the family)
+    """
+    sizes = {}
+    for num_fam in all_fams:
+        prt_file = f"{prefix}-current.{num_fam}.prt"
+        sizes[num_fam] = os.path.getsize(prt_file) if os.path.isfile(prt_file) else 0
+    return sizes
+
+
+def schedule_families(sizes, threads):
+    """
+    Order families from the biggest to the smallest, so that the longest alignments start
+    first, and give each family a number of aligner threads proportional to its part of the
+    total size to align (at least 1, at most 'threads').
+
+    Parameters
+    ----------
+    sizes : dict
+        {num_fam: size} (see get_family_sizes)
+    threads : int
+        total number of threads available
+
+    Returns
+    -------
+    list
+        [(num_fam, align_threads)] in the order families must be aligned
+    """
+    total = sum(sizes.values())
+    schedule = []
+    for num_fam in sorted(sizes, key=lambda fam: -sizes[fam]):
+        align_threads = int(threads * sizes[num_fam] / total) if total else 1
+        schedule.append((num_fam, min(threads, max(1, align_threads))))
+    return schedule
+
+
+def run_schedule(pool, schedule, args, threads, bar=None):
+    """
+    Align families in the given order. A family is started only when enough threads are free
+    for its aligner: the number of families aligned in parallel decreases when big families are
+    running, so that the total number of threads never exceeds 'threads'.
+
+    Parameters
+    ----------
+    pool : multiprocessing.Pool
+        pool of 'threads' processes aligning the families
+    schedule : list
+        [(num_fam, align_threads)] (see schedule_families)
+    args : tuple
+        (prefix, ngenomes, q, params) arguments of handle_family common to all families
+    threads : int
+        total number of threads available
+    bar : progressbar.ProgressBar or None
+        progress bar to update each time a family is done
+
+    Returns
+    -------
+    dict
+        {num_fam: multiprocessing.pool.AsyncResult}, all finished
+    """
+    prefix, ngenomes, q, params = args
+    # Each family puts its number of threads in this queue when it is done
+    done = queue.Queue()
+    results = {}
+    free = threads
+    nb_done = 0
+
+    def wait_family():
+        nonlocal free, nb_done
+        free += done.get()
+        nb_done += 1
+        if bar:
+            bar.update(nb_done)
+
+    for num_fam, align_threads in schedule:
+        while free < align_threads:
+            wait_family()
+        free -= align_threads
+        release = lambda _, nb=align_threads: done.put(nb)
+        results[num_fam] = pool.apply_async(handle_family,
+                                            ((prefix, num_fam, ngenomes, q,
+                                              dict(params, threads=align_threads)),),
+                                            callback=release, error_callback=release)
+    while nb_done < len(schedule):
+        wait_family()
+    return results
+
+
 def handle_family_1thread(args):
     """
     For the given family:
 
-    - align its proteins with mafft
+    - align its proteins with mafft (or the given aligner)
     - back-translate to nucleotides
     - add missing genomes
 
     Parameters
     ----------
     args : ()
-         (prefix, num_fam, ngenomes, q) with:
+         (prefix, num_fam, ngenomes[, params]) with:
 
          - prefix: path to ``aldir/<name of dataset>``
          - num_fam: the current family number
          - ngenomes: the total number of genomes in dataset
+         - params: alignment settings, given to family_alignment: {"threads": number of
+           threads used by the aligner for this family, "aligner": aligner used,
+           "cache_dir": alignment cache}. Defaults of family_alignment if not given.
 
     Returns
     -------
@@ -180,7 +291,8 @@ def handle_family_1thread(args):
         - False if any problem (extractions, alignment, btr, add missing genomes...)
         - True if just generated all files, and everything is ok
     """
-    prefix, num_fam, ngenomes = args
+    prefix, num_fam, ngenomes = args[:3]
+    params = args[3] if len(args) > 3 else {}
     logger = logging.getLogger('align.align_family')
     # Get file names
     prt_file = f"{prefix}-current.{num_fam}.prt"
@@ -188,9 +300,11 @@ def handle_family_1thread(args):
     miss_file = f"{prefix}-current.{num_fam}.miss.lst"
     mafft_file = f"{prefix}-mafft-align.{num_fam}.aln"
     btr_file = f"{prefix}-mafft-prt2nuc.{num_fam}.aln"
-    # Align all sequences for given family
+    # Align all sequences for given family. Information on each alignment file (number and
+    # length of sequences) is kept in 'infos' while it is written or read, for the next steps
+    infos = {}
     status1 = family_alignment(prt_file, gen_file, miss_file, mafft_file, btr_file,
-                               num_fam, ngenomes, logger)
+                               num_fam, ngenomes, logger, infos, **params)
     #  status1 is:
     # - False if problem with extractions, alignment or backtranslation -> return False
     # - 'nb_seqs' = number of sequences aligned if everything went well (extractions and
@@ -199,8 +313,10 @@ def handle_family_1thread(args):
     # If it returned true or the , Add missing genomes
     # If 'OK' or nb_seq, add missing genomes
     if status1:
-        added_aa = add_missing_genomes(mafft_file, "protein", miss_file, num_fam, ngenomes, status1, logger)
-        added_nucl = add_missing_genomes(btr_file, "back-translated", miss_file, num_fam, ngenomes, status1, logger)
+        added_aa = add_missing_genomes(mafft_file, "protein", miss_file, num_fam, ngenomes,
+                                       status1, logger, infos)
+        added_nucl = add_missing_genomes(btr_file, "back-translated", miss_file, num_fam,
+                                         ngenomes, status1, logger, infos)
         # 1 of them false: return false
         # both are "OK": return OK (no need to remove concatenated and grouped files)
         # 1 of them true (not "OK"): return true
@@ -218,19 +334,20 @@ def handle_family(args):
     """
     For the given family:
 
-    - align its proteins with mafft
+    - align its proteins with mafft (or the given aligner)
     - back-translate to nucleotides
     - add missing genomes
 
     Parameters
     ----------
     args : ()
-         (prefix, num_fam, ngenomes, q) with:
+         (prefix, num_fam, ngenomes, q[, params]) with:
 
          - prefix: path to ``aldir/<name of dataset>``
          - num_fam: the current family number
          - ngenomes: the total number of genomes in dataset
          - q: a queue, which will be used by logger to put logs while in other process
+         - params: alignment settings (see handle_family_1thread)
 
     Returns
     -------
@@ -242,7 +359,7 @@ def handle_family(args):
         - False if any problem (extractions, alignment, btr, add missing genomes...)
         - True if just generated all files, and everything is ok
     """
-    prefix, num_fam, ngenomes, q = args
+    prefix, num_fam, ngenomes, q = args[:4]
     qh = logging.handlers.QueueHandler(q)
     root = logging.getLogger()
     root.setLevel(logging.DEBUG)
@@ -250,10 +367,11 @@ def handle_family(args):
     logging.addLevelName(utils.detail_lvl(), "DETAIL")
     root.addHandler(qh)
     logger = logging.getLogger('align.align_family')
-    return handle_family_1thread((prefix, num_fam, ngenomes))
+    return handle_family_1thread((prefix, num_fam, ngenomes) + tuple(args[4:]))
 
 
-def add_missing_genomes(align_file, ali_type, miss_file, num_fam, ngenomes, status1, logger):
+def add_missing_genomes(align_file, ali_type, miss_file, num_fam, ngenomes, status1, logger,
+                        infos=None):
     """
     Once all family proteins are aligned, and back-translated to nucleotides,
     add missing genomes for the family to the alignment with '-'.
@@ -281,6 +399,10 @@ def add_missing_genomes(align_file, ali_type, miss_file, num_fam, ngenomes, stat
           this function is not called if status1 == False)
     logger : logging.Logger
         the logger, having a queue Handler, to give logs to the main logger
+    infos : dict or None
+        {alignment file: AlignInfo} for alignment files already read or written for this
+        family. If align_file is not in it, it is scanned. Its AlignInfo is updated when
+        missing genomes are added.
 
     Returns
     -------
@@ -296,7 +418,12 @@ def add_missing_genomes(align_file, ali_type, miss_file, num_fam, ngenomes, stat
     # btr_file should always exist.
     # Sometimes it comes from previous step ('missing genomes' are missing)
     # Sometimes it comes from a previous run (all genomes should be here)
-    status = check_add_missing(align_file, num_fam, ngenomes, logger, prev=True)
+    if infos is None:
+        infos = {}
+    if align_file not in infos:
+        infos[align_file] = scan_fasta(align_file)
+    info = infos[align_file]
+    status = check_add_missing(align_file, num_fam, ngenomes, logger, prev=True, info=info)
     # If btr_file has the correct number of sequences, all the same length, return True
     if status is True:
         if status1 == "OK":
@@ -317,13 +444,14 @@ def add_missing_genomes(align_file, ali_type, miss_file, num_fam, ngenomes, stat
             genome = genome.strip()
             toadd = ">" + genome + "\n" + "-" * len_aln + "\n"
             alif.write(toadd)
+            info.lens.append(len_aln)
     # check_add_missing called with prev=False :
     # output is True if all ok, or False if problems. Cannot be sequence length (as it can be with prev=True)
-    ret = check_add_missing(align_file, num_fam, ngenomes, logger, prev=False)
+    ret = check_add_missing(align_file, num_fam, ngenomes, logger, prev=False, info=info)
     return ret
 
 
-def check_add_missing(btr_file, num_fam, ngenomes, logger, prev):
+def check_add_missing(btr_file, num_fam, ngenomes, logger, prev, info=None):
     """
     Check back-translated alignment while missing genomes have been added
 
@@ -344,6 +472,8 @@ def check_add_missing(btr_file, num_fam, ngenomes, logger, prev):
         if the number of sequences does not correspond to the total number of genomes.
         False if we just added missing genomes. In that case, nb sequences should be equal to
         the total number of genomes. If not, write error message.
+    info : AlignInfo or None
+        sequences of btr_file, if already known. If None, btr_file is scanned.
 
     Returns
     -------
@@ -354,7 +484,7 @@ def check_add_missing(btr_file, num_fam, ngenomes, logger, prev):
         - alignment length if sequences aligned all have the same length, but missing
           genomes are not added yet (so, will have to add lines with this number of '-')
     """
-    res = check_lens(btr_file, num_fam, logger)
+    res = check_lens(btr_file, num_fam, logger, info)
     # If all sequences have the same length, res = (length of a sequence, number of sequences in btr file)
     if res:
         len_aln, nb = res
@@ -383,7 +513,8 @@ def check_add_missing(btr_file, num_fam, ngenomes, logger, prev):
 
 
 def family_alignment(prt_file, gen_file, miss_file, mafft_file, btr_file,
-                     num_fam, ngenomes, logger):
+                     num_fam, ngenomes, logger, infos=None, threads=1, aligner="mafft",
+                     cache_dir=None):
     """
     From a given family, align all its proteins with mafft, back-translate
     to nucleotides, and add missing genomes in this family.
@@ -407,6 +538,16 @@ def family_alignment(prt_file, gen_file, miss_file, mafft_file, btr_file,
         total number of genomes in dataset
     logger : logging.Logger
         logger with queueHandler to give logs to main logger
+    infos : dict or None
+        filled with {alignment file: AlignInfo} for mafft and btr files, when they are
+        written, or read from a previous run
+    threads : int
+        number of threads used by the aligner for this family
+    aligner : str
+        aligner used (key of ALIGNERS), or 'auto' to choose it according to family size
+    cache_dir : str or None
+        directory of the alignment cache. If given, alignments are copied from it when the
+        family was already aligned, and stored in it after being done.
 
     Returns
     -------
@@ -419,6 +560,8 @@ def family_alignment(prt_file, gen_file, miss_file, mafft_file, btr_file,
     # Check number of proteins extracted
     # =check that nb_prt (or nb_gen, which should be the same) + nb_miss = nb_genomes
     # returns number of genomes extracted (so, excludes missing genomes for the family)
+    if infos is None:
+        infos = {}
     nbfprt = check_extractions(num_fam, miss_file, prt_file, gen_file, ngenomes, logger)
     nbfal = None
     # If problem with extractions (0 proteins extracted), remove mafft and btr files if they exist, so that they will
@@ -432,16 +575,14 @@ def family_alignment(prt_file, gen_file, miss_file, mafft_file, btr_file,
     if os.path.isfile(mafft_file):
         # There can be nbfprt (number of proteins extracted) 
         # or nb_genomes (proteins extracted + missing added with '-')
-        nbfal1 = check_nb_seqs(mafft_file, nbfprt, logger, "")
-        nbfal2 = check_nb_seqs(mafft_file, ngenomes, logger, "")
-        # if nbfal1: missing genomes have not been added yet. Save this value for later
-        if nbfal1:
-            nbfal = nbfal1
-        # if nbfal2: missing genomes already there, save for later
-        elif nbfal2:
-            nbfal = nbfal2
+        # if nbfprt: missing genomes have not been added yet.
+        # if nb_genomes: missing genomes already there
+        infos[mafft_file] = scan_fasta(mafft_file)
+        nbfal = check_nb_seqs(mafft_file, [nbfprt, ngenomes], logger, "",
+                              info=infos[mafft_file])
         # If not any of those 2 numbers: error
-        else:
+        if not nbfal:
+            del infos[mafft_file]
             message = (f"fam {num_fam}: Will redo alignment, because found a different number of proteins "
                        f"extracted in {prt_file} ({nbfprt}) and proteins aligned in "
                        f"existing {mafft_file}")
@@ -449,10 +590,19 @@ def family_alignment(prt_file, gen_file, miss_file, mafft_file, btr_file,
             os.remove(mafft_file)
             utils.remove(btr_file)
     # If mafft file does not exist (removed because problem in its alignment, or just not generated
-    # yet), remove btr (will be regenerated), and do alignment with mafft
+    # yet), remove btr (will be regenerated), and get alignments from cache, or do alignment
+    # with mafft
+    key = None
     if not os.path.isfile(mafft_file):
         utils.remove(btr_file)  # remove if exists...
-        nbfal = mafft_align(num_fam, prt_file, mafft_file, nbfprt, logger)
+        if cache_dir:
+            key = get_cache_key(prt_file, gen_file, aligner, nbfprt)
+            nbfal = get_cached_alignment(cache_dir, key, mafft_file, btr_file, nbfprt,
+                                         num_fam, logger, infos)
+            if nbfal:
+                return nbfal
+        nbfal = mafft_align(num_fam, prt_file, mafft_file, nbfprt, logger, infos, threads,
+                            aligner)
     # If problem with alignment, return False
     if not nbfal:
         return False
@@ -466,16 +616,95 @@ def family_alignment(prt_file, gen_file, miss_file, mafft_file, btr_file,
         # btr file contains either nbfal entries (number of proteins extracted) if it was not completed 
         # with missing genomes, or ngenomes if it was completed. If it is not the case, remove it
         # (will be regenerated)
-        res = check_nb_seqs(btr_file, [nbfal, ngenomes], logger, message)
+        info = scan_fasta(btr_file)
+        res = check_nb_seqs(btr_file, [nbfal, ngenomes], logger, message, info=info)
         if not res:
             utils.remove(btr_file)
         else:
+            infos[btr_file] = info
             return "OK"
     # If btr file does not exist (removed because problem with mafft generated before,
     # or just not generated yet), do back-translation, and return:
     # - number of sequences back-translated if it went well,
     # - False otherwise
-    return back_translate(num_fam, mafft_file, gen_file, btr_file, nbfal, logger)
+    nbbtr = back_translate(num_fam, mafft_file, gen_file, btr_file, nbfal, logger, infos)
+    # Alignments just done: store them in cache (before adding missing genomes)
+    if nbbtr and key:
+        align_cache.put(cache_dir, key, [mafft_file, btr_file])
+    return nbbtr
+
+
+def get_cache_key(prt_file, gen_file, aligner, nbfprt):
+    """
+    Get the checksum identifying a family in the alignment cache: it depends on the family
+    proteins and genes, and on the aligner command used to align it.
+
+    Parameters
+    ----------
+    prt_file : str
+        path to file containing proteins extracted
+    gen_file : str
+        path to file containing genes extracted
+    aligner : str
+        aligner asked (key of ALIGNERS), or 'auto'
+    nbfprt : int
+        number of proteins in the family
+
+    Returns
+    -------
+    str
+        checksum of the family (see align_cache.family_key)
+    """
+    get_cmd, _ = ALIGNERS[choose_aligner(aligner, nbfprt)]
+    settings = get_cmd("<proteins>", "<alignment>", 1)
+    return align_cache.family_key(read_fasta_bytes(prt_file), read_fasta_bytes(gen_file),
+                                  settings)
+
+
+def get_cached_alignment(cache_dir, key, mafft_file, btr_file, nbfprt, num_fam, logger, infos):
+    """
+    Get protein and back-translated alignments of a family from the cache, if found, and
+    check them as files from a previous run.
+
+    Parameters
+    ----------
+    cache_dir : str
+        directory of the alignment cache
+    key : str
+        checksum of the family (see get_cache_key)
+    mafft_file : str
+        path to file which will contain the protein alignment
+    btr_file : str
+        path to file which will contain the back-translated alignment
+    nbfprt : int
+        number of proteins extracted in the family
+    num_fam : int
+        current family number
+    logger : logging.Logger
+        logger with queueHandler to give logs to main logger
+    infos : dict
+        {alignment file: AlignInfo}, to which mafft_file and btr_file are added
+
+    Returns
+    -------
+    bool or int
+        False if the family is not in cache (or its alignments are not as expected),
+        number of sequences aligned otherwise
+    """
+    if not align_cache.get(cache_dir, key, [mafft_file, btr_file]):
+        return False
+    logger.log(utils.detail_lvl(), f"fam {num_fam}: alignments found in cache {cache_dir}")
+    infos[mafft_file] = scan_fasta(mafft_file)
+    infos[btr_file] = scan_fasta(btr_file)
+    if (infos[mafft_file].nb == infos[btr_file].nb == nbfprt
+            and len(infos[mafft_file].widths) == len(infos[btr_file].widths) == 1):
+        return nbfprt
+    logger.warning(f"fam {num_fam}: alignments found in cache do not correspond to the "
+                   "proteins extracted. Family will be aligned again.")
+    del infos[mafft_file], infos[btr_file]
+    utils.remove(mafft_file)
+    utils.remove(btr_file)
+    return False
 
 
 def check_extractions(num_fam, miss_file, prt_file, gen_file, ngenomes, logger):
@@ -520,8 +749,8 @@ def check_extractions(num_fam, miss_file, prt_file, gen_file, ngenomes, logger):
         logger.error(f"fam {num_fam}: no file with proteins extracted "
                      f"('{prt_file}'). Cannot align.")
         sys.exit(1)
-    nbfprt = utils.grep(prt_file, "^>", counts=True)
-    nbfgen = utils.grep(gen_file, "^>", counts=True)
+    nbfprt = count_seqs(prt_file)
+    nbfgen = count_seqs(gen_file)
     if nbmiss + nbfprt != ngenomes:
         logger.error(("fam {}: wrong sum of missing genomes ({}) and prt extracted ({}) for {} "
                       "genomes in the dataset.").format(num_fam, nbmiss, nbfprt, ngenomes))
@@ -533,9 +762,11 @@ def check_extractions(num_fam, miss_file, prt_file, gen_file, ngenomes, logger):
     return nbfprt
 
 
-def mafft_align(num_fam, prt_file, mafft_file, nbfprt, logger):
+def mafft_align(num_fam, prt_file, mafft_file, nbfprt, logger, infos=None, threads=1,
+                aligner="mafft"):
     """
-    Align all proteins of the given family with mafft
+    Align all proteins of the given family with mafft, or with the given aligner. Whatever
+    the aligner, the alignment is written to mafft_file, in the same format as mafft.
 
     Parameters
     ----------
@@ -549,6 +780,12 @@ def mafft_align(num_fam, prt_file, mafft_file, nbfprt, logger):
         number of proteins extracted in prt file
     logger : logging.Logger
         logger with queueHandler to give logs to main logger
+    infos : dict or None
+        if given, {mafft_file: AlignInfo} is added to it
+    threads : int
+        number of threads used by the aligner
+    aligner : str
+        aligner used (key of ALIGNERS), or 'auto' to choose it according to family size
 
     Returns
     -------
@@ -556,27 +793,145 @@ def mafft_align(num_fam, prt_file, mafft_file, nbfprt, logger):
         True if no problem (alignment ok, same number of proteins extracted and aligned),
         False otherwise
     """
+    aligner = choose_aligner(aligner, nbfprt)
+    get_cmd, to_stdout = ALIGNERS[aligner]
     logger.log(utils.detail_lvl(), f"Aligning family {num_fam}")
-    cmd = f"mafft --auto --amino {prt_file}"
+    cmd = get_cmd(prt_file, mafft_file, threads)
     error = f"Problem while trying to align fam {num_fam}"
-    stdout = open(mafft_file, "w")
     stderr = open(mafft_file + ".log", "w")
-    logger.log(utils.detail_lvl(), f"Mafft command: {cmd}")
+    # mafft writes the alignment to stdout, other aligners to the given output file
+    stdout = open(mafft_file, "w") if to_stdout else stderr
+    logger.log(utils.detail_lvl(), f"{aligner.capitalize()} command: {cmd}")
     ret = utils.run_cmd(cmd, error, stdout=stdout, stderr=stderr, logger=logger)
     stdout.close()
+    stderr.close()
     if not isinstance(ret, int):
         ret = ret.returncode
-    if ret != 0:
-        os.remove(mafft_file)
+    if ret != 0 or not os.path.isfile(mafft_file):
+        utils.remove(mafft_file)
         return False
+    if not to_stdout:
+        normalize_alignment(prt_file, mafft_file)
     message = (f"fam {num_fam}: different number of proteins extracted in {prt_file} ({nbfprt}) and proteins "
                f"aligned in {mafft_file}")
-    return check_nb_seqs(mafft_file, nbfprt, logger, message)
+    info = scan_fasta(mafft_file)
+    if infos is not None:
+        infos[mafft_file] = info
+    return check_nb_seqs(mafft_file, nbfprt, logger, message, info=info)
+
+
+def mafft_cmd(prt_file, aln_file, threads):
+    """
+    Command aligning proteins of prt_file with mafft (alignment written to stdout)
+    """
+    if threads > 1:
+        return f"mafft --auto --amino --thread {threads} {prt_file}"
+    return f"mafft --auto --amino {prt_file}"
+
+
+def famsa_cmd(prt_file, aln_file, threads):
+    """
+    Command aligning proteins of prt_file to aln_file with FAMSA
+    """
+    return f"famsa -t {threads} {prt_file} {aln_file}"
+
+
+def muscle_cmd(prt_file, aln_file, threads):
+    """
+    Command aligning proteins of prt_file to aln_file with MUSCLE (version 5)
+    """
+    return f"muscle -align {prt_file} -output {aln_file} -threads {threads}"
+
+
+def clustalo_cmd(prt_file, aln_file, threads):
+    """
+    Command aligning proteins of prt_file to aln_file with Clustal Omega
+    """
+    return f"clustalo -i {prt_file} -o {aln_file} --outfmt=fasta --threads={threads} --force"
+
+
+# Aligners which can be used: {name (also name of executable): (function giving the command
+# to align a family, True if the alignment is written to stdout)}
+ALIGNERS = {"mafft": (mafft_cmd, True),
+            "famsa": (famsa_cmd, False),
+            "muscle": (muscle_cmd, False),
+            "clustalo": (clustalo_cmd, False)}
 
+# With 'auto' aligner, families with at least this number of proteins are aligned with FAMSA,
+# smaller ones with mafft
+LARGE_FAMILY = 1000
 
-def back_translate(num_fam, mafft_file, gen_file, btr_file, nbfal, logger):
+
+def choose_aligner(aligner, nbfprt):
+    """
+    Get the aligner to use for a family
+
+    Parameters
+    ----------
+    aligner : str
+        aligner asked (key of ALIGNERS), or 'auto'
+    nbfprt : int
+        number of proteins in the family
+
+    Returns
+    -------
+    str
+        aligner asked, or, for 'auto', famsa for families with at least LARGE_FAMILY
+        proteins, mafft for the others
+    """
+    if aligner != "auto":
+        return aligner
+    return "famsa" if nbfprt >= LARGE_FAMILY else "mafft"
+
+
+def get_executables(aligner):
+    """
+    Get the executables needed to align families with the given aligner
+
+    Parameters
+    ----------
+    aligner : str
+        aligner asked (key of ALIGNERS), or 'auto'
+
+    Returns
+    -------
+    list
+        names of executables which must be installed
+    """
+    if aligner == "auto":
+        return ["mafft", "famsa"]
+    return [aligner]
+
+
+def normalize_alignment(prt_file, aln_file):
+    """
+    Rewrite an alignment file in the same format as mafft output: sequences in the same
+    order as in prt_file, with their full header, in upper case, and 60 characters per line.
+
+    Parameters
+    ----------
+    prt_file : str
+        path to file containing the proteins given to the aligner
+    aln_file : str
+        path to the alignment file, overwritten
+    """
+    aligned = dict(read_fasta_bytes(aln_file))
+    with open(prt_file, "rb") as prtf:
+        headers = [line.rstrip(b"\r\n") for line in prtf if line.startswith(b">")]
+    with open(aln_file, "wb") as alnf:
+        for header in headers:
+            name = header.split(None, 1)[0][1:] if header.strip() != b">" else b""
+            if name not in aligned:
+                continue
+            seq = aligned.pop(name).upper()
+            alnf.write(header + b"\n")
+            alnf.writelines(seq[start:start + 60] + b"\n" for start in range(0, len(seq), 60))
+
+
+def back_translate(num_fam, mafft_file, gen_file, btr_file, nbfal, logger, infos=None):
     """
-    Backtranslate protein alignment to nucleotides
+    Backtranslate protein alignment to nucleotides, and check that all back-translated
+    sequences have the same length.
 
     Parameters
     ----------
@@ -593,6 +948,8 @@ def back_translate(num_fam, mafft_file, gen_file, btr_file, nbfal, logger):
         number of sequences aligned for the family by mafft
     logger : logging.Logger
         logger with queueHandler to give logs to main logger
+    infos : dict or None
+        if given, {btr_file: AlignInfo} is added to it
 
     Returns
     -------
@@ -601,26 +958,115 @@ def back_translate(num_fam, mafft_file, gen_file, btr_file, nbfal, logger):
         - number of sequences in btr file if everything went well
     """
     logger.log(utils.detail_lvl(), f"Back-translating family {num_fam}")
-    curpath = os.path.dirname(os.path.abspath(__file__))
-    awk_script = os.path.join(curpath, "prt2codon.awk")
-    cmd = f"awk -f {awk_script} {mafft_file} {gen_file}"
-    stdout = open(btr_file, "w")
     error = f"Problem while trying to backtranslate {mafft_file} to a nucleotide alignment"
-    ret = utils.run_cmd(cmd, error, stdout=stdout, logger=logger)
-    stdout.close()
-    if not isinstance(ret, int):
-        ret = ret.returncode
-    if ret != 0:
-        os.remove(btr_file)
+    try:
+        proteins = read_fasta_bytes(mafft_file)
+        genes = dict(read_fasta_bytes(gen_file))
+    except OSError as err:
+        logger.error(f"{error}: {err}")
+        utils.remove(btr_file)
         return False
+    info = AlignInfo()
+    with open(btr_file, "wb") as btrf:
+        for name, prot in proteins:
+            codons = prt2codon(prot, genes.get(name, b""))
+            info.lens.append(len(codons))
+            btrf.write(b">" + name + b"\n")
+            btrf.writelines(codons[start:start + 60] + b"\n"
+                            for start in range(0, len(codons), 60))
     message = (f"fam {num_fam}: different number of proteins aligned in {mafft_file} ({nbfal}) and genes "
                f"back-translated in {btr_file}")
-    # Check number of sequences in btr file, and return True/False according to it
-    # It should contain the same number of sequences as the mafft file.
-    return check_nb_seqs(mafft_file, nbfal, logger, message)
+    # btr file must contain the same number of sequences as the mafft file
+    if infos is not None:
+        infos[btr_file] = info
+    if not check_nb_seqs(btr_file, nbfal, logger, message, info=info):
+        return False
+    # and all back-translated sequences must have the same length
+    if not check_lens(btr_file, num_fam, logger, info):
+        return False
+    return info.nb
+
+
+def read_fasta_bytes(fasta_file):
+    """
+    Read all sequences of a fasta file, as bytes. As for awk fields, only the first word
+    of each line is kept: the sequence name for headers, the sequence itself otherwise.
+
+    Parameters
+    ----------
+    fasta_file : str
+        path to fasta file
+
+    Returns
+    -------
+    list
+        [(name, sequence)] in the order of the file
+    """
+    return list(iter_fasta_bytes(fasta_file))
 
 
-def check_nb_seqs(alnfile, nbfal, logger, message=""):
+def iter_fasta_bytes(fasta_file):
+    """
+    Read sequences of a fasta file one by one, as bytes (see :func:`read_fasta_bytes`)
+
+    Parameters
+    ----------
+    fasta_file : str
+        path to fasta file
+
+    Yields
+    ------
+    tuple
+        (name, sequence) in the order of the file
+    """
+    name = None
+    parts = []
+    with open(fasta_file, "rb") as fastf:
+        for line in fastf:
+            fields = line.split(None, 1)
+            if line.startswith(b">"):
+                if name is not None:
+                    yield name, b"".join(parts)
+                name = fields[0][1:] if fields else b""
+                parts = []
+            elif fields:
+                parts.append(fields[0])
+    if name is not None:
+        yield name, b"".join(parts)
+
+
+def prt2codon(prot, gene):
+    """
+    Back-translate an aligned protein to its codons: each residue is replaced by the
+    next codon of the gene, and each gap by '---'. If the gene is too short, missing
+    codons are left empty (the sequence is then shorter than the alignment).
+
+    Parameters
+    ----------
+    prot : bytes
+        aligned protein sequence
+    gene : bytes
+        nucleotide sequence of the gene coding this protein
+
+    Returns
+    -------
+    bytes
+        back-translated sequence
+    """
+    residues = np.frombuffer(prot, dtype=np.uint8)
+    is_res = residues != ord("-")
+    # Codon index of each residue, and position of its 3 nucleotides in the gene
+    codon_idx = np.cumsum(is_res) - 1
+    positions = 3 * codon_idx[:, np.newaxis] + np.arange(3)
+    # Pad gene with 0, so that positions after its end give empty codons
+    nucl = np.zeros(max(len(gene), 3 * int(is_res.sum())) + 1, dtype=np.uint8)
+    nucl[:len(gene)] = np.frombuffer(gene, dtype=np.uint8)
+    positions[~is_res] = -1
+    codons = np.where(is_res[:, np.newaxis], nucl[positions], ord("-")).ravel()
+    return codons[codons != 0].astype(np.uint8).tobytes()
+
+
+def check_nb_seqs(alnfile, nbfal, logger, message="", info=None):
     """
     Check the number of sequences in the given alignment file
 
@@ -634,6 +1080,8 @@ def check_nb_seqs(alnfile, nbfal, logger, message=""):
         logger with queueHandler to give logs to main logger
     message : str
         message to write when sequence numbers do not match
+    info : AlignInfo or None
+        sequences of alnfile, if already known. If None, alnfile headers are counted.
 
     Returns
     -------
@@ -641,7 +1089,7 @@ def check_nb_seqs(alnfile, nbfal, logger, message=""):
         - False if not same number of sequences
         - nbseqs in align file if found among values in 'nbfal'
     """
-    nbseqs = utils.grep(alnfile, "^>", counts=True)
+    nbseqs = info.nb if info is not None else count_seqs(alnfile)
     if isinstance(nbfal, int):
         nbfal = [nbfal]
     for num in nbfal:
@@ -652,7 +1100,7 @@ def check_nb_seqs(alnfile, nbfal, logger, message=""):
     return False
 
 
-def check_lens(aln_file, num_fam, logger):
+def check_lens(aln_file, num_fam, logger, info=None):
     """
     In the given alignment file, check that all sequences have the same length.
     If there is no problem, it returns the length of alignment, and the number
@@ -666,6 +1114,8 @@ def check_lens(aln_file, num_fam, logger):
         current family number. Used for log message if problem
     logger : logging.Logger
         logger having a queue Handler to give logs to the main logger in the main process
+    info : AlignInfo or None
+        sequences of aln_file, if already known. If None, aln_file is scanned.
 
     Returns
     -------
@@ -674,24 +1124,86 @@ def check_lens(aln_file, num_fam, logger):
         same length).
         If they all have the same length, returns this length and the number of sequences
     """
-    nb_gen = 0
-    all_sums = set()
-    with open(aln_file, "r") as btrf:
-        cur_sum = 0
-        start = True
-        for line in btrf:
-            if line.startswith(">"):
-                nb_gen += 1
-                if not start:
-                    all_sums.add(cur_sum)
-                    cur_sum = 0
-            else:
-                start = False
-                cur_sum += len(line.strip())
-        all_sums.add(cur_sum)
+    if info is None:
+        info = scan_fasta(aln_file)
+    all_sums = info.widths
     if len(all_sums) > 1:
         logger.error(f"Nucleic alignments for family {num_fam} (in {aln_file}) do not all have the same "
                      f"length. Lengths found are: {all_sums}\n")
         return False
     # Return sequence length and number of sequences in alignment file
-    return list(all_sums)[0], nb_gen
+    return list(all_sums)[0], info.nb
+
+
+class AlignInfo:
+    """
+    Sequences of an alignment file: their number and lengths. It is filled while the file is
+    written, or by scanning it when it comes from a previous run, and is passed between the
+    steps aligning a family, so that they do not read the file again.
+
+    Parameters
+    ----------
+    lens : list
+        length of each sequence, in file order
+    """
+
+    def __init__(self, lens=None):
+        self.lens = [] if lens is None else list(lens)
+
+    @property
+    def nb(self):
+        """
+        Number of sequences
+        """
+        return len(self.lens)
+
+    @property
+    def widths(self):
+        """
+        Set of different sequence lengths (only 1 for a correct alignment)
+        """
+        return set(self.lens) if self.lens else {0}
+
+
+def scan_fasta(fasta_file):
+    """
+    Get the number and lengths of sequences in a fasta file, without parsing it line by line.
+
+    Parameters
+    ----------
+    fasta_file : str
+        path to fasta file
+
+    Returns
+    -------
+    AlignInfo
+        sequences found in the file
+    """
+    with open(fasta_file, "rb") as fastf:
+        content = fastf.read()
+    records = (b"\n" + content).split(b"\n>")[1:]
+    lens = []
+    for record in records:
+        end_header = record.find(b"\n")
+        seq = record[end_header + 1:] if end_header >= 0 else b""
+        lens.append(len(seq.translate(None, b" \t\r\n")))
+    return AlignInfo(lens)
+
+
+def count_seqs(fasta_file):
+    """
+    Count sequences (lines starting with '>') in a fasta file
+
+    Parameters
+    ----------
+    fasta_file : str
+        path to fasta file
+
+    Returns
+    -------
+    int
+        number of sequences
+    """
+    with open(fasta_file, "rb") as fastf:
+        content = fastf.read()
+    return content.count(b"\n>") + content.startswith(b">")
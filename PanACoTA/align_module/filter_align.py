@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+# ###############################################################################
+# This file is part of PanACOTA.                                                #
+#                                                                               #
+# Authors: Amandine Perrin                                                      #
+# Copyright © 2018-2020 Institut Pasteur (Paris).                               #
+# See the COPYRIGHT file for details.                                           #
+#                                                                               #
+# PanACOTA is a software providing tools for large scale bacterial comparative  #
+# genomics. From a set of complete and/or draft genomes, you can:               #
+#    -  Do a quality control of your strains, to eliminate poor quality         #
+# genomes, which would not give any information for the comparative study       #
+#    -  Uniformly annotate all genomes                                          #
+#    -  Do a Pan-genome                                                         #
+#    -  Do a Core or Persistent genome                                          #
+#    -  Align all Core/Persistent families                                      #
+#    -  Infer a phylogenetic tree from the Core/Persistent families             #
+#                                                                               #
+# PanACOTA is free software: you can redistribute it and/or modify it under the #
+# terms of the Affero GNU General Public License as published by the Free       #
+# Software Foundation, either version 3 of the License, or (at your option)     #
+# any later version.                                                            #
+#                                                                               #
+# PanACOTA is distributed in the hope that it will be useful, but WITHOUT ANY   #
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS     #
+# FOR A PARTICULAR PURPOSE. See the Affero GNU General Public License           #
+# for more details.                                                             #
+#                                                                               #
+# You should have received a copy of the Affero GNU General Public License      #
+# along with PanACOTA (COPYING file).                                           #
+# If not, see <https://www.gnu.org/licenses/>.                                  #
+# ###############################################################################
+
+
+"""
+Filter columns of alignments grouped by genome, before inferring a tree: remove columns
+with too many gaps, and keep only variable or parsimony-informative sites if asked.
+Partitions of families are updated to the filtered alignment.
+
+@author: GEM, Institut Pasteur
+"""
+
+import os
+import sys
+import logging
+import numpy as np
+from PanACoTA.align_module import alignment
+from PanACoTA.align_module import post_align
+
+logger = logging.getLogger("align.filter")
+
+# Sites kept: all, variable (at least 2 states), or informative (at least 2 states found
+# in at least 2 sequences each)
+SITES = ["all", "variable", "informative"]
+# States of each type of alignment, in the order used by IQ-TREE -fconst
+ALPHABETS = {"nucl": b"ACGT", "aa": b"ARNDCQEGHILKMFPSTWYV"}
+GAP = ord("-")
+# Max number of characters of the alignment handled at once when selecting columns
+CHUNK_SIZE = 2**26
+
+
+def filter_alignment(grp_file, prefix, fam_nums, ali_type, max_gaps=None, sites="all"):
+    """
+    Filter columns of the alignment grouped by genome, and write:
+
+    - ``<grp_file>.filtered.aln``: filtered alignment
+    - ``<grp_file>.partitions.nex``: position of each family in grp_file
+    - ``<grp_file>.filtered.partitions.nex``: position of each family in filtered alignment
+    - ``<grp_file>.filtered.fconst``: if only variable or informative sites are kept, number
+      of constant sites removed for each state (ACGT or amino acids), to give to IQ-TREE
+      (``-fconst``) for ascertainment correction.
+
+    Parameters
+    ----------
+    grp_file : str
+        path to alignment grouped by genome (``<dname>.<ali_type>.grp.aln``)
+    prefix : str
+        path to ``aldir/<name of dataset>``, to get width of each family from its alignment
+    fam_nums : []
+        list of family numbers, in the order of grp_file
+    ali_type : str
+        nucl or aa
+    max_gaps : float or None
+        remove columns with a higher proportion of gaps. None to keep all of them
+    sites : str
+        sites kept among the columns which do not have too many gaps: all, variable or
+        informative
+
+    Returns
+    -------
+    str
+        path to filtered alignment file
+    """
+    base = os.path.splitext(grp_file)[0]
+    out_file = base + ".filtered.aln"
+    logger.info(f"Filtering columns of {grp_file}")
+    widths = post_align.get_family_widths(post_align.get_family_files(fam_nums, prefix,
+                                                                      ali_type))
+    names, matrix = read_matrix(grp_file)
+    if matrix.shape[1] != sum(widths):
+        logger.error(f"{grp_file} contains {matrix.shape[1]} columns, whereas families "
+                     f"contain {sum(widths)} columns. Remove it and run again to group "
+                     "alignments by genome.")
+        sys.exit(1)
+    keep, const, nb_gappy = select_columns(matrix, ALPHABETS[ali_type], max_gaps, sites)
+    write_matrix(out_file, names, matrix, keep)
+    # Width of each family in filtered alignment
+    kept = np.concatenate(([0], np.cumsum(keep)))
+    bounds = np.cumsum([0] + widths)
+    new_widths = kept[bounds[1:]] - kept[bounds[:-1]]
+    write_partitions(base + ".partitions.nex", fam_nums, widths)
+    write_partitions(base + ".filtered.partitions.nex", fam_nums, new_widths)
+    if sites != "all":
+        with open(base + ".filtered.fconst", "w") as fcf:
+            fcf.write(",".join(str(num) for num in const) + "\n")
+    logger.info(f"{keep.sum()} columns kept out of {len(keep)}: {nb_gappy} removed with "
+                f"too many gaps, {const.sum()} constant and "
+                f"{len(keep) - keep.sum() - nb_gappy - const.sum()} other non-{sites} "
+                "sites removed.")
+    return out_file
+
+
+def read_matrix(ali_file):
+    """
+    Read an alignment as a matrix of characters, in upper case.
+
+    The file is read twice: once to get the number of sequences and the width of the
+    alignment, then to fill the matrix sequence by sequence. So, only the matrix and 1
+    sequence are in memory at the same time.
+
+    Parameters
+    ----------
+    ali_file : str
+        path to alignment file, in fasta format
+
+    Returns
+    -------
+    tuple
+        (names, matrix) with names the list of sequence names, and matrix a numpy array of
+        uint8, with 1 line per sequence
+    """
+    nseq = 0
+    width = 0
+    for _, seq in alignment.iter_fasta_bytes(ali_file):
+        if nseq == 0:
+            width = len(seq)
+        nseq += 1
+    matrix = np.empty((nseq, width), dtype=np.uint8)
+    names = []
+    for num, (name, seq) in enumerate(alignment.iter_fasta_bytes(ali_file)):
+        if len(seq) != width:
+            logger.error(f"All sequences of {ali_file} do not have the same length.")
+            sys.exit(1)
+        names.append(name)
+        matrix[num] = np.frombuffer(seq.upper(), dtype=np.uint8)
+    return names, matrix
+
+
+def select_columns(matrix, alphabet, max_gaps=None, sites="all"):
+    """
+    Select columns to keep in the alignment
+
+    Parameters
+    ----------
+    matrix : numpy.ndarray
+        alignment, 1 line per sequence
+    alphabet : bytes
+        all states (characters which are not gaps nor ambiguous)
+    max_gaps : float or None
+        remove columns with a higher proportion of gaps. None to keep all of them
+    sites : str
+        sites kept among the columns which do not have too many gaps: all, variable or
+        informative
+
+    Returns
+    -------
+    tuple
+        (keep, const, nb_gappy) with:
+
+        - keep: array of bool, True for columns to keep
+        - const: for each state of alphabet, number of constant columns removed
+        - nb_gappy: number of columns removed because of gaps
+    """
+    nseq, ncol = matrix.shape
+    keep = np.ones(ncol, dtype=bool)
+    const = np.zeros(len(alphabet), dtype=np.int64)
+    nb_gappy = 0
+    step = max(1, CHUNK_SIZE // max(nseq, 1))
+    for start in range(0, ncol, step):
+        block = matrix[:, start:start + step]
+        ok = np.ones(block.shape[1], dtype=bool)
+        if max_gaps is not None:
+            ok = (block == GAP).sum(axis=0) <= max_gaps * nseq
+            nb_gappy += int((~ok).sum())
+        if sites != "all":
+            # Number of sequences with each state, for each column
+            counts = np.stack([(block == state).sum(axis=0) for state in alphabet])
+            nb_states = (counts > 0).sum(axis=0)
+            constant = ok & (nb_states == 1)
+            const += (counts[:, constant] > 0).sum(axis=1)
+            if sites == "variable":
+                ok &= nb_states >= 2
+            else:
+                ok &= (counts >= 2).sum(axis=0) >= 2
+        keep[start:start + step] = ok
+    return keep, const, nb_gappy
+
+
+def write_matrix(out_file, names, matrix, keep):
+    """
+    Write the selected columns of the alignment
+
+    Parameters
+    ----------
+    out_file : str
+        path to output alignment file
+    names : []
+        names of sequences (bytes)
+    matrix : numpy.ndarray
+        alignment, 1 line per sequence
+    keep : numpy.ndarray
+        array of bool, True for columns to write
+    """
+    columns = np.flatnonzero(keep)
+    with open(out_file, "wb") as outf:
+        for name, seq in zip(names, matrix):
+            outf.write(b">" + name + b"\n" + seq[columns].tobytes() + b"\n")
+
+
+def write_partitions(part_file, fam_nums, widths):
+    """
+    Write position of each family in the alignment, as nexus charsets (which can be given
+    to IQ-TREE with -p or -q). Families without any column are not written.
+
+    Parameters
+    ----------
+    part_file : str
+        path to partition file
+    fam_nums : []
+        list of family numbers, in the order of the alignment
+    widths : []
+        number of columns of each family in the alignment
+    """
+    start = 1
+    with open(part_file, "w") as partf:
+        partf.write("#nexus\nbegin sets;\n")
+        for num_fam, width in zip(fam_nums, widths):
+            if width:
+                partf.write(f"    charset fam_{num_fam} = {start}-{start + width - 1};\n")
+            start += width
+        partf.write("end;\n")
@@ -35,19 +35,128 @@
 
 import sys
 import os
+import re
 import logging
+import collections
+import multiprocessing
+import resource
+import shutil
 import progressbar
 
 from PanACoTA import utils
 
 logger = logging.getLogger("align.extract")
 
+# Maximum number of family files open at the same time during extraction
+MAX_OPEN_FILES = 1024
+# Maximum number of characters kept in memory for family files which are not open
+MAX_BUFFER = 64 * 1024 * 1024
+# Start of a fasta record
+HEADER = re.compile("^>", re.M)
 
-def get_all_seqs(all_genomes, dname, dbpath, listdir, aldir, all_fams, quiet):
+
+class FilePool:
+    """
+    Pool of output files open in append mode, with at most 'max_open' files open at the same
+    time: when it is full, the least recently used file is closed. This avoids opening and
+    closing a family file each time a sequence is extracted to it.
+
+    Text written to a file which is not open is kept in memory, and written when 'max_buffer'
+    characters are waiting, or when the pool is closed. Each genome writes to all families in
+    the same order, so with more families than 'max_open', opening them on each write would
+    close each file just before it is needed again. Here, each file is opened once per flush.
+
+    Parameters
+    ----------
+    max_open : int or None
+        maximum number of files open at the same time. None to use get_max_open_files()
+    max_buffer : int
+        maximum number of characters waiting to be written to files which are not open
+    """
+
+    def __init__(self, max_open=None, max_buffer=MAX_BUFFER):
+        self.max_open = max_open or get_max_open_files()
+        self.max_buffer = max_buffer
+        self.files = collections.OrderedDict()
+        self.buffers = collections.defaultdict(list)
+        self.buffered = 0
+
+    def get(self, path):
+        """
+        Get the file open in append mode for path, opening it if needed
+        """
+        if path in self.files:
+            self.files.move_to_end(path)
+            return self.files[path]
+        if len(self.files) >= self.max_open:
+            _, oldest = self.files.popitem(last=False)
+            oldest.close()
+        self.files[path] = open(path, "a")
+        return self.files[path]
+
+    def write(self, path, text):
+        """
+        Write text to path: directly if it is open, otherwise once there is enough text
+        waiting to be written (see flush)
+        """
+        if path in self.files:
+            self.files[path].write(text)
+            return
+        self.buffers[path].append(text)
+        self.buffered += len(text)
+        if self.buffered >= self.max_buffer:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all waiting text, opening each file once
+        """
+        for path, texts in self.buffers.items():
+            self.get(path).write("".join(texts))
+        self.buffers.clear()
+        self.buffered = 0
+
+    def close(self):
+        """
+        Write all waiting text, and close all open files
+        """
+        self.flush()
+        for outf in self.files.values():
+            outf.close()
+        self.files.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def get_max_open_files():
+    """
+    Get the number of family files which can be open at the same time: half of the max
+    number of open files allowed (soft limit), at most MAX_OPEN_FILES
+
+    Returns
+    -------
+    int
+        max number of family files open at the same time
+    """
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY:
+        return MAX_OPEN_FILES
+    return max(1, min(MAX_OPEN_FILES, soft // 2))
+
+
+def get_all_seqs(all_genomes, dname, dbpath, listdir, aldir, all_fams, quiet, threads=1):
     """
     For all genomes, extract its proteins present in a persistent family to the file
     corresponding to this family.
 
+    With several threads, genomes are split into shards of consecutive genomes, each
+    extracted by a process to its own fragment of each family file. Fragments are then
+    merged in the order of shards, so that family files are the same as with 1 thread.
+
     Parameters
     ----------
     all_genomes : []
@@ -64,6 +173,8 @@ def get_all_seqs(all_genomes, dname, dbpath, listdir, aldir, all_fams, quiet):
         list of all family numbers
     quiet : bool
         True if nothin must be written to stdout/stderr, False otherwise
+    threads : int
+        number of processes extracting sequences
     """
     # Get list of files not already existing
     files_todo = check_existing_extract(all_fams, aldir, dname)
@@ -87,21 +198,158 @@ def get_all_seqs(all_genomes, dname, dbpath, listdir, aldir, all_fams, quiet):
                    progressbar.ETA()]
         bar = progressbar.ProgressBar(widgets=widgets, max_value=nbgen, term_width=79).start()
         curnum = 1
-    for genome in all_genomes:
-        ge_gen = os.path.join(listdir, dname + "-getEntry_gen_" + genome + ".txt")
-        ge_prt = os.path.join(listdir, dname + "-getEntry_prt_" + genome + ".txt")
-        logger.details(f"Extracting proteins and genes from {genome}")
-        prtdb = os.path.join(dbpath, "Proteins", genome + ".prt")
-        gendb = os.path.join(dbpath, "Genes", genome + ".gen")
-        get_genome_seqs(prtdb, ge_prt, files_todo)
-        get_genome_seqs(gendb, ge_gen, files_todo)
+    if threads > 1 and nbgen > 1:
+        extract_parallel(all_genomes, dname, dbpath, listdir, aldir, files_todo, threads, bar)
         if not quiet:
-            bar.update(curnum)
-            curnum += 1
+            bar.finish()
+        return
+    # Family files stay open from one genome to the next (as long as there are not too many)
+    with FilePool() as handles:
+        for genome in all_genomes:
+            ge_gen = os.path.join(listdir, dname + "-getEntry_gen_" + genome + ".txt")
+            ge_prt = os.path.join(listdir, dname + "-getEntry_prt_" + genome + ".txt")
+            logger.details(f"Extracting proteins and genes from {genome}")
+            prtdb = os.path.join(dbpath, "Proteins", genome + ".prt")
+            gendb = os.path.join(dbpath, "Genes", genome + ".gen")
+            get_genome_seqs(prtdb, ge_prt, files_todo, handles=handles)
+            get_genome_seqs(gendb, ge_gen, files_todo, handles=handles)
+            if not quiet:
+                bar.update(curnum)
+                curnum += 1
     if not quiet:
         bar.finish()
 
 
+def extract_parallel(all_genomes, dname, dbpath, listdir, aldir, files_todo, threads, bar=None):
+    """
+    Extract sequences of all genomes with several processes. Each process extracts the
+    sequences of a shard of consecutive genomes to its own fragment directory. Fragments of
+    each family file are then concatenated in the order of shards.
+
+    Parameters
+    ----------
+    all_genomes : []
+        list of all genome names
+    dname : str
+        name of dataset
+    dbpath : str
+        path to folder containing 'Proteins' and 'Genes' folders
+    listdir : str
+        path to folder containing the lists of proteins/genes to extract
+    aldir : str
+        path to folder where extracted proteins/genes must be saved
+    files_todo : list
+        list of family files which must be generated
+    threads : int
+        number of processes
+    bar : progressbar.ProgressBar or None
+        progress bar to update with the number of genomes done
+    """
+    fragdir = os.path.join(aldir, f"tmp-extract_{dname}")
+    shutil.rmtree(fragdir, ignore_errors=True)
+    shards = get_shards(all_genomes, threads)
+    arguments = [(shard, dname, dbpath, listdir, files_todo, os.path.join(fragdir, str(num)))
+                 for num, shard in enumerate(shards)]
+    logger.details(f"Extracting sequences of {len(all_genomes)} genomes in {len(shards)} "
+                   f"shards, with {threads} processes")
+    pool = multiprocessing.Pool(threads)
+    try:
+        done = 0
+        for nb_done in pool.imap_unordered(extract_shard, arguments):
+            done += nb_done
+            if bar:
+                bar.update(done)
+        pool.close()
+        pool.join()
+    # If an error occurs (or user kills with keybord), terminate pool and exit
+    except Exception as excp:  # pragma: no cover
+        pool.terminate()
+        logger.error(excp)
+        shutil.rmtree(fragdir, ignore_errors=True)
+        sys.exit(1)
+    merge_fragments([arg[-1] for arg in arguments], files_todo)
+    shutil.rmtree(fragdir, ignore_errors=True)
+
+
+def get_shards(all_genomes, threads):
+    """
+    Split genomes into shards of consecutive genomes. There are several shards per process,
+    so that processes finishing early can take another shard.
+
+    Parameters
+    ----------
+    all_genomes : []
+        list of all genome names
+    threads : int
+        number of processes
+
+    Returns
+    -------
+    list
+        list of shards, each one being a list of consecutive genomes
+    """
+    nb_shards = min(len(all_genomes), threads * 4)
+    size, extra = divmod(len(all_genomes), nb_shards)
+    shards = []
+    start = 0
+    for num in range(nb_shards):
+        end = start + size + (num < extra)
+        shards.append(all_genomes[start:end])
+        start = end
+    return shards
+
+
+def extract_shard(args):
+    """
+    Extract proteins and genes of all genomes of a shard, in the fragment directory of
+    this shard
+
+    Parameters
+    ----------
+    args : tuple
+        (genomes, dname, dbpath, listdir, files_todo, fragdir)
+
+    Returns
+    -------
+    int
+        number of genomes extracted
+    """
+    genomes, dname, dbpath, listdir, files_todo, fragdir = args
+    os.makedirs(fragdir, exist_ok=True)
+    with FilePool() as handles:
+        for genome in genomes:
+            ge_gen = os.path.join(listdir, dname + "-getEntry_gen_" + genome + ".txt")
+            ge_prt = os.path.join(listdir, dname + "-getEntry_prt_" + genome + ".txt")
+            prtdb = os.path.join(dbpath, "Proteins", genome + ".prt")
+            gendb = os.path.join(dbpath, "Genes", genome + ".gen")
+            get_genome_seqs(prtdb, ge_prt, files_todo, handles=handles, fragdir=fragdir)
+            get_genome_seqs(gendb, ge_gen, files_todo, handles=handles, fragdir=fragdir)
+    return len(genomes)
+
+
+def merge_fragments(fragdirs, files_todo):
+    """
+    Concatenate the fragments of each family file, in the order of fragment directories.
+    A family file without any fragment is not created.
+
+    Parameters
+    ----------
+    fragdirs : list
+        fragment directories, in the order of genome shards
+    files_todo : list
+        list of family files to generate
+    """
+    for famfile in files_todo:
+        fragments = [os.path.join(fragdir, os.path.basename(famfile)) for fragdir in fragdirs]
+        fragments = [frag for frag in fragments if os.path.isfile(frag)]
+        if not fragments:
+            continue
+        with open(famfile, "ab") as famf:
+            for frag in fragments:
+                with open(frag, "rb") as fragf:
+                    shutil.copyfileobj(fragf, famf)
+
+
 def check_existing_extract(all_fams, aldir, dname):
     """
     For each family, check if its prt and gen extraction file already exist.
@@ -148,7 +396,7 @@ def check_existing_extract(all_fams, aldir, dname):
     return extract_fams
 
 
-def get_genome_seqs(fasta, tabfile, files_todo, outfile=None):
+def get_genome_seqs(fasta, tabfile, files_todo, outfile=None, handles=None, fragdir=None):
     """
     From a fasta file, extract all sequences given in the tab file.
     The tab file can contain:
@@ -173,9 +421,19 @@ def get_genome_seqs(fasta, tabfile, files_todo, outfile=None):
         if None, the tab file must contain 2 columns (1 for the sequence name,
         1 for its output file). If an outfile is given (not None), only the 1st column of tab file
         will be considered, and all sequences will be extracted to the given outfile.
+    handles : FilePool or None
+        pool of open output files, shared between genomes. None to open each output file
+        only for this genome
+    fragdir : str or None
+        if given, sequences are extracted to files with the same name as their output file,
+        but in this directory (fragments of output files, see extract_parallel)
     """
     with open(tabfile, "r") as tabf:
         to_extract = get_names_to_extract(tabf, outfile)
+    if fragdir and not outfile:
+        to_extract = {seq: os.path.join(fragdir, os.path.basename(out))
+                      for seq, out in to_extract.items()}
+        files_todo = [os.path.join(fragdir, os.path.basename(out)) for out in files_todo]
     if outfile:
         if os.path.isfile(outfile):
             logger.warning("Sequences are already extracted in {}. This will "
@@ -187,7 +445,7 @@ def get_genome_seqs(fasta, tabfile, files_todo, outfile=None):
             extract_sequences(to_extract, fasf, outf=outf)
     else:
         with open(fasta, "r") as fasf:
-            extract_sequences(to_extract, fasf, files_todo=files_todo)
+            extract_sequences(to_extract, fasf, files_todo=files_todo, handles=handles)
 
 
 def get_names_to_extract(tabf, outfile):
@@ -226,10 +484,14 @@ def get_names_to_extract(tabf, outfile):
     return to_extract
 
 
-def extract_sequences(to_extract, fasf, files_todo=None, outf=None):
+def extract_sequences(to_extract, fasf, files_todo=None, outf=None, handles=None):
     """
     Extract sequences from an open fasta file 'fasf', and a list of sequences to
-    extract
+    extract.
+
+    The fasta file is read at once, and the offsets of all its records are indexed. Records
+    to extract are then grouped by output file, so that each output file gets all its
+    sequences from this fasta file in a single write.
 
     Parameters
     ----------
@@ -246,47 +508,71 @@ def extract_sequences(to_extract, fasf, files_todo=None, outf=None):
         considered, and all these sequences will be extracted to 'outfile' (if 'to_extract' is a
         list, will extract all sequences of this list). Otherwise, if None,
         each sequence will be extracted to its corresponding value in 'to_extract'.
+    handles : FilePool or None
+        pool of open output files to use when outf is None. None to open each output file
+        only for this fasta file.
     """
-
     # Create optimized index for requests
     if files_todo is None:
         files_todo = []
     files_todo = frozenset(files_todo)
     if type(to_extract) == list:
         to_extract = frozenset(to_extract)
-    # State machine variables
-    previous_fp = None
-
-    for line in fasf:
-        if line[0] == '>':
-            # Close previous file if needed
-            if outf is None and previous_fp is not None:
-                previous_fp.close()
-            previous_fp = None
-
-            # Extract sequence name
-            last_char = line.find('\t')
+    content = fasf.read()
+    # Records to write to each output file, in the order of the fasta file
+    records = collections.defaultdict(list)
+    for seq, start, end in index_sequences(content):
+        # Seq is not part of sequences to extract
+        if seq not in to_extract:
+            continue
+        if outf is not None:
+            records[None].append(content[start:end])
+            continue
+        out = to_extract[seq]
+        if out in files_todo:
+            records[out].append(content[start:end])
+        else:
+            print(f"Sequence {seq} not written because no output file specified", file=sys.stderr)
+    if outf is not None:
+        outf.write("".join(records[None]))
+        return
+    own_handles = handles is None
+    if own_handles:
+        handles = FilePool(max(len(records), 1))
+    try:
+        for out, out_records in records.items():
+            handles.write(out, "".join(out_records))
+    finally:
+        if own_handles:
+            handles.close()
+
+
+def index_sequences(content):
+    """
+    Get the name and position of all records of a multi-fasta content. The sequence name
+    is the header until the first tabulation (or space if there is no tabulation).
+
+    Parameters
+    ----------
+    content : str
+        content of a multi-fasta file
+
+    Returns
+    -------
+    list
+        [(name, start, end)] for each record, with content[start:end] being the whole
+        record (header and sequence lines)
+    """
+    starts = [match.start() for match in HEADER.finditer(content)]
+    ends = starts[1:] + [len(content)]
+    index = []
+    for start, end in zip(starts, ends):
+        eol = content.find("\n", start, end)
+        header = content[start:end if eol == -1 else eol]
+        last_char = header.find('\t')
+        if last_char == -1:
+            last_char = header.find(' ')
             if last_char == -1:
-                last_char = line.find(' ')
-                if last_char == -1:            
-                    last_char = len(line)
-            seq = line[1:last_char].strip()
-            # seq = line.strip().split()[0][1:]
-
-            # Seq is part of sequences to extract
-            if seq in to_extract:
-                # Open the right file
-                previous_fp = outf
-                if previous_fp is None:
-                    out = to_extract[seq]
-                    if out in files_todo:
-                        previous_fp = open(out, "a")
-                    else:
-                        print(f"Sequence {seq} not written because no output file specified", file=sys.stderr)
-
-        # Write the line content if the file pointer is opened
-        if previous_fp is not None:
-            previous_fp.write(line)
-
-    if outf is None and previous_fp is not None:
-        previous_fp.close()
+                last_char = len(header)
+        index.append((header[1:last_char].strip(), start, end))
+    return index
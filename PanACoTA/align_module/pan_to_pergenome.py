@@ -62,6 +62,8 @@ November 2016
 import os
 import sys
 import logging
+import numpy as np
+from PanACoTA import utils_pangenome as utilsp
 
 logger = logging.getLogger("align.pan_to_pergenome")
 
@@ -148,6 +150,8 @@ def proteins_per_strain(persgen, all_genomes):
     ----------
     persgen : str
         File containing persistent genome
+    all_genomes : list
+        list of all genomes
 
     Returns
     -------
@@ -158,7 +162,9 @@ def proteins_per_strain(persgen, all_genomes):
         * several: dict, {fam_num: set(genomes having several members in fam)}
     """
     logger.info("Getting all persistent proteins and classify by strain.")
-    all_genomes = frozenset(all_genomes)
+    resolver = utilsp.GenomeResolver(all_genomes)
+    if utilsp.has_protein_index(persgen):
+        return proteins_per_strain_index(persgen, all_genomes, resolver)
     all_prots = {}  # {strain: {member: fam_num}}
     fam_genomes = {}  # {fam_num: set(genomes having a member in fam)}
     several = {}  # {fam_num: set(genomes having several members in fam)}
@@ -169,15 +175,7 @@ def proteins_per_strain(persgen, all_genomes):
             fam_genomes[fam_num] = set()
             several[fam_num] = set()
             for mem in members:
-                # if format is ESCO.1512.00001.i0002_12124, strain is 3 first fields
-                # separated by '.'
-                if "." in mem and len(mem.split(".")) >= 3:
-                    strain = ".".join(mem.split(".")[:3])
-                    if strain not in all_genomes:
-                        strain = "_".join(mem.split("_")[:-1])
-                # if format is not like this, it must be something_00001:
-                else:
-                    strain = "_".join(mem.split("_")[:-1])
+                strain = resolver(mem)
                 # if strain not already in fam_genomes, add it
                 if strain not in fam_genomes[fam_num]:
                     fam_genomes[fam_num].add(strain)
@@ -193,6 +191,44 @@ def proteins_per_strain(persgen, all_genomes):
     return all_prots, fam_genomes, several
 
 
+def proteins_per_strain_index(persgen, all_genomes, resolver):
+    """
+    Same as proteins_per_strain, from the protein index of the persistent genome
+    (memory-mapped), without reading the persistent genome file: the proteins of each
+    genome are found by binary search in the index.
+
+    Parameters
+    ----------
+    persgen : str
+        File containing persistent genome, with its index
+    all_genomes : list
+        list of all genomes
+    resolver : utils_pangenome.GenomeResolver
+        resolver built from all genomes
+
+    Returns
+    -------
+    (all_prots, fam_genomes, several) : tuple
+
+        * all_prots: dict, {strain: {member: fam_num}}
+        * fam_genomes: dict, {fam_num: set(genomes having a member in fam)}
+        * several: dict, {fam_num: set(genomes having several members in fam)}
+    """
+    logger.info(f"Using protein index of {persgen}")
+    index = utilsp.load_protein_index(persgen)
+    fam_genomes = {str(num): set() for num in np.unique(index[1])}
+    several = {fam_num: set() for fam_num in fam_genomes}
+    all_prots = {}
+    for genome in all_genomes:
+        for mem, fam_num in utilsp.get_genome_families(index, genome, resolver).items():
+            fam_num = str(fam_num)
+            if genome in fam_genomes[fam_num]:
+                several[fam_num].add(genome)
+            fam_genomes[fam_num].add(genome)
+            all_prots.setdefault(genome, {})[mem] = fam_num
+    return all_prots, fam_genomes, several
+
+
 def write_getentry_files(all_prots, several, listdir, aldir, dname, all_genomes):
     """
     For each species, write all its persistent proteins into a file, with the
@@ -34,8 +34,8 @@
 # ###############################################################################
 
 """
-Concatenate all alignment files of all families. Then,
-group alignments by genome.
+Group alignments of all families by genome: for each genome, concatenate its sequences
+in all family alignments.
 
 @author: GEM, Institut Pasteur
 March 2017
@@ -45,18 +45,24 @@ import os
 import sys
 import logging
 import progressbar
+import threading
 import multiprocessing
+import logging.handlers
+import numpy as np
 from PanACoTA import utils
+from PanACoTA import utils_pangenome as utilsp
+from PanACoTA.align_module import alignment
 
 logger = logging.getLogger("align.post")
 
 
-def post_alignment(fam_nums, all_genomes, prefix, outdir, dname, prot_ali, quiet):
+def post_alignment(fam_nums, all_genomes, prefix, outdir, dname, prot_ali, quiet, threads=1):
     """
     After the alignment of all proteins by family:
 
-    - concatenate all alignment files
-    - group the alignment by genome
+    - get alignment files of all families
+    - group the alignments by genome, in nucleotides, and in aa if asked. Both are done
+      at the same time.
 
     Parameters
     ----------
@@ -69,72 +75,62 @@ def post_alignment(fam_nums, all_genomes, prefix, outdir, dname, prot_ali, quiet
     outdir : str
         path to output directory, containing Aldir and Listdir, and that will also contain Treedir
     dname : str
-        name of dataset (used to name concat and grouped files, as well as tree folder)
+        name of dataset (used to name grouped files, as well as tree folder)
     prot_ali : bool
         true: also give concatenated alignment in aa
     quiet : bool
         True if nothing must be sent to sdtout/stderr, False otherwise
+    threads : int
+        max number of threads to use
+
+    Returns
+    -------
+    str
+        path to file containing nucleic alignments grouped by genome
     """
-    all_alns_nucl, status_nucl = concat_alignments(fam_nums, prefix, "nucl", quiet)
     treedir = os.path.join(outdir, "Phylo-" + dname)
     os.makedirs(treedir, exist_ok=True)
     outfile_nucl = os.path.join(treedir, dname + ".nucl.grp.aln")
-    res_nucl = launch_group_by_genome(all_genomes, all_alns_nucl, status_nucl, outfile_nucl, dname, "nucleic", quiet)
-    if not res_nucl:
-        utils.remove(all_alns_nucl)
+    tracks = {"nucleic": (get_family_files(fam_nums, prefix, "nucl"), outfile_nucl)}
+    if prot_ali:
+        outfile_aa = os.path.join(treedir, dname + ".aa.grp.aln")
+        tracks["protein"] = (get_family_files(fam_nums, prefix, "aa"), outfile_aa)
+    res = launch_group_by_genome(all_genomes, tracks, quiet, threads)
+    if prot_ali and not res["protein"]:
+        utils.remove(outfile_aa)
+        logger.error("An error occurred. We could not group protein alignments by genome.")
+    if not res["nucleic"]:
         utils.remove(outfile_nucl)
         logger.error("An error occurred. We could not group DNA alignments by genome.")
         sys.exit(1)
-    if prot_ali:
-        all_alns_aa, status_aa = concat_alignments(fam_nums, prefix, "aa", quiet)
-        outfile_aa = os.path.join(treedir, dname + ".aa.grp.aln")
-        res_aa = launch_group_by_genome(all_genomes, all_alns_aa, status_aa, outfile_aa, dname, "protein", quiet)
-        if not res_aa:
-            utils.remove(all_alns_aa)
-            utils.remove(outfile_aa)
-            logger.error("An error occurred. We could not group protein alignments by genome.")
     return outfile_nucl
 
 
-def concat_alignments(fam_nums, prefix, ali_type, quiet):
+def get_family_files(fam_nums, prefix, ali_type):
     """
-    Concatenate all family alignment files to a unique file
+    Get the alignment files of all families, and check that they all exist
 
     Parameters
     ----------
     fam_nums : []
         list of family numbers
     prefix : str
-        path to ``aldir/<name of dataset>-[mafft-align or mafft-prt2nuc]`` 
-        (used to get extraction, alignment and btr files easily)
+        path to ``aldir/<name of dataset>`` (used to get alignment and btr files easily)
     ali_type : str
         aa or nucl
-    quiet : bool
-        True if nothing must be sent to sdtout/stderr, False otherwise
 
     Returns
     -------
-    tuple
-        (output, str) with:
-
-        - output: path to file containing concatenation of all alignments
-        - str: "OK" if concatenation file already exists, "Done" if just did concatenation
+    list
+        list of alignment files, in the order of fam_nums
     """
     if ali_type == "aa":
         info = "mafft-align"
     elif ali_type == "nucl":
         info = "mafft-prt2nuc"
     else:
-        logger.error(f"Not possible to concatenate '{ali_type}' type of alignments.")
+        logger.error(f"Not possible to group '{ali_type}' type of alignments.")
         sys.exit(1)
-    output = f"{prefix}-complete.{ali_type}.cat.aln"
-    if os.path.isfile(output):
-        logger.info(f"{ali_type} alignments already concatenated")
-        logger.warning(f"{ali_type} alignments already concatenated in {output}. Program will use "
-                        "it for next steps. If you want to redo it, remove it before "
-                        "running.")
-        return output, "OK"
-    logger.info(f"Concatenating all {ali_type} alignment files")
     list_files = [f"{prefix}-{info}.{num_fam}.aln" for num_fam in fam_nums]
     # Check that all files exist
     for f in list_files:
@@ -142,177 +138,308 @@ def concat_alignments(fam_nums, prefix, ali_type, quiet):
             logger.error(f"The alignment file {f} does not exist. Please check the families you "
                          "want, and their corresponding alignment files")
             sys.exit(1)
-    if quiet:
-        utils.cat(list_files, output)
-    else:
-        utils.cat(list_files, output, title="Concatenation")
-    return output, "Done"
+    return list_files
 
 
-def launch_group_by_genome(all_genomes, all_alns, status, outfile, dname, type_ali, quiet):
+def launch_group_by_genome(all_genomes, tracks, quiet, threads=1):
     """
-    Function calling group_by_genome in a pool, while giving information to user
-    (time elapsed)
+    Group alignments by genome for all given tracks (nucleic, protein...).
+
+    The output file of each track is first created, as ``<outfile>.tmp``, with all genome
+    headers. Columns of each track are then split in blocks of consecutive families, and all
+    blocks of all tracks are written independently, in parallel if several threads are given.
+    Once all blocks of a track are written, its temporary file is renamed to its output file,
+    so that an existing output file is always complete.
 
     Parameters
     ----------
     all_genomes : []
         list of all genomes in the dataset
-    all_alns : str
-        path to file containing all alignments concatenated
-    status : str
-        "OK" if concatenation file already existed before running, "Done" if just did concatenation
-    outfile : str
-        file containing all families align by genome
-    dname : str
-        name of dataset
-    type_ali : str
-        nucleic or protein
+    tracks : dict
+        {type_ali: (ali_files, outfile)} with, for each type of alignment (nucleic or protein),
+        the list of alignment files of all families, and the file which will contain all
+        families aligned by genome
     quiet : bool
         True if nothing must be sent to sdtout/stderr, False otherwise
+    threads : int
+        max number of threads to use
 
     Returns
     -------
-    bool
+    dict
+        {type_ali: bool}, with, for each track:
+
         - True if everything went well or was already done
         - False if error occurred in at least one step
     """
-    # Status = Done means that we just did the concatenation. So, if grouped by genome
-    # file already exists, remove it.
-    if status == "Done":
+    genomes = sorted(all_genomes, key=utils.sort_genomes_by_name)
+    status = {}
+    tasks = []
+    tmpfiles = {}
+    for type_ali, (ali_files, outfile) in tracks.items():
+        status[type_ali] = True
+        # Grouped by genome file is removed when at least 1 family was realigned. So, if it
+        # already exists, it is up to date. Warn user
         if os.path.isfile(outfile):
-            utils.remove(outfile)
-    # Status was not 'Done' (it was 'ok', concat file already existed). And by_genome file
-    # also already exists. Warn user
-    if os.path.isfile(outfile):
-        logger.info(f"{type_ali} alignments already grouped by genome")
-        logger.warning((f"{type_ali} alignments already grouped by genome in {outfile}. "
-                        "Program will end. "))
-        return True
-    logger.info(f"Grouping {type_ali} alignments per genome")
+            logger.info(f"{type_ali} alignments already grouped by genome")
+            logger.warning((f"{type_ali} alignments already grouped by genome in {outfile}. "
+                            "Program will end. "))
+            continue
+        logger.info(f"Grouping {type_ali} alignments per genome")
+        widths = get_family_widths(ali_files)
+        tmpfiles[type_ali] = outfile + ".tmp"
+        starts = init_grouped_file(tmpfiles[type_ali], genomes, sum(widths))
+        for first, last in split_columns(widths, 4 * threads):
+            tasks.append([type_ali, tmpfiles[type_ali], ali_files[first:last], widths[first:last],
+                          sum(widths[:first]), genomes, starts])
+    if not tasks:
+        return status
+    logger.log(utils.detail_lvl(), "Writing alignments per genome")
     bar = None
     if not quiet:
-        widgets = [progressbar.BouncingBar(marker=progressbar.RotatingMarker(markers="◐◓◑◒")),
-                   "  -  ", progressbar.Timer()]
-        bar = progressbar.ProgressBar(widgets=widgets, max_value=20, term_width=50)
-    pool = multiprocessing.Pool(1)
-    args = [all_genomes, all_alns, outfile]
-    final = pool.map_async(group_by_genome, [args], chunksize=1)
-    pool.close()
-    if not quiet:
-        while True:
-            if final.ready():
-                break
-            bar.update()
+        widgets = ['Grouping: ', progressbar.Bar(marker='█', left='', right='', fill=' '),
+                   ' ', progressbar.Counter(), f"/{len(tasks)}", ' (',
+                   progressbar.Percentage(), ') - ', progressbar.Timer()]
+        bar = progressbar.ProgressBar(widgets=widgets, max_value=len(tasks),
+                                      term_width=79).start()
+    if threads == 1:
+        results = []
+        for num, task in enumerate(tasks, 1):
+            results.append(group_block(task))
+            if bar:
+                bar.update(num)
+    else:
+        pool = multiprocessing.Pool(threads)
+        # Create a Queue to put logs from processes, and handle them after from a single thread
+        m = multiprocessing.Manager()
+        q = m.Queue()
+        lp = threading.Thread(target=utils.logger_thread, args=(q,))
+        lp.start()
+        try:
+            results = []
+            for num, res in enumerate(pool.imap_unordered(group_block,
+                                                          [task + [q] for task in tasks]), 1):
+                results.append(res)
+                if bar:
+                    bar.update(num)
+            pool.close()
+            pool.join()
+            q.put(None)
+            lp.join()
+        # If an error occurs (or user kills with keybord), terminate pool and exit
+        except Exception as excp:  # pragma: no cover
+            pool.terminate()
+            logger.error(excp)
+            for tmpfile in tmpfiles.values():
+                utils.remove(tmpfile)
+            sys.exit(1)
+    if bar:
         bar.finish()
-    pool.join()
-    return False not in final.get()
+    for type_ali, res in results:
+        status[type_ali] = status[type_ali] and res
+    for type_ali, tmpfile in tmpfiles.items():
+        ali_files, outfile = tracks[type_ali]
+        if not status[type_ali]:
+            utils.remove(tmpfile)
+            utils.remove(outfile)
+            continue
+        os.replace(tmpfile, outfile)
+        logger.log(utils.detail_lvl(), f"{len(ali_files)} sequences found per genome "
+                                       f"in {type_ali} alignments")
+    return status
 
 
-def group_by_genome(args):
+def split_columns(widths, nb_blocks):
     """
-    From the alignment file 'all_alns' containing all proteins, group the alignments of
-    proteins by their genome (listed in 'all_genomes'), and save the result
-    in 'treedir'
+    Split families in blocks of consecutive families, with about the same number of columns
 
     Parameters
     ----------
-    args : tuple
-        - all_genomes: list of all genomes
-        - all_alns: path to file containing all alignments concatenated
-        - outfile: path to file which will contain alignments grouped by genome
+    widths : []
+        width of each family alignment
+    nb_blocks : int
+        number of blocks wanted. There are less blocks if there are less families.
 
     Returns
     -------
-    bool
-        - True if everything went well
-        - False if problem when trying to group by genomes
+    list
+        [(first, last)] index of the first family of each block, and index after its last
+        family
     """
-    all_genomes, all_alns, outfile = args
-    sequences = read_alignments(all_alns, all_genomes)
-    if not sequences:
-        return False
-    write_groups(outfile, sequences)
-    return True
+    total = sum(widths)
+    blocks = []
+    first = 0
+    col = 0
+    for num, width in enumerate(widths):
+        col += width
+        # Close block when it reaches its part of all columns
+        if col * nb_blocks >= (len(blocks) + 1) * total and num + 1 < len(widths):
+            blocks.append((first, num + 1))
+            first = num + 1
+    blocks.append((first, len(widths)))
+    return blocks
+
+
+def group_block(args):
+    """
+    Write a block of consecutive families of a track at their place in each genome
+    sequence of the track output file
 
+    Parameters
+    ----------
+    args : list
+        [type_ali, outfile, ali_files, widths, col, genomes, starts[, q]] with:
+
+        - type_ali: type of alignment (nucleic or protein)
+        - outfile: path to file which will contain alignments grouped by genome, created by
+          :func:`init_grouped_file`
+        - ali_files: list of alignment files of the families of the block
+        - widths: width of each family of the block
+        - col: position of the first column of the block in genome sequences
+        - genomes: list of genomes, in the order of outfile
+        - starts: position in outfile of the sequence of each genome
+        - q: a queue, which will be used by logger to put logs while in other process
 
-def read_alignments(all_alns, all_genomes):
+    Returns
+    -------
+    tuple
+        (type_ali, bool) with bool: True if block was written, False if there was a problem
+    """
+    type_ali, outfile, ali_files, widths, col, genomes, starts = args[:7]
+    if len(args) > 7:
+        qh = logging.handlers.QueueHandler(args[7])
+        root = logging.getLogger()
+        root.setLevel(logging.DEBUG)
+        root.handlers = []
+        logging.addLevelName(utils.detail_lvl(), "DETAIL")
+        root.addHandler(qh)
+    return type_ali, write_families(outfile, ali_files, widths, genomes, starts, col)
+
+
+def get_family_widths(ali_files):
     """
-    Read alignment file, and assign each sequence to a genome
+    Get the width of each family alignment, from the length of its first sequence
 
     Parameters
     ----------
-    all_alns : str
-        path to file containing all alignments concatenated
-    all_genomes : []
-        list of all genomes
+    ali_files : []
+        list of alignment files of all families
 
     Returns
     -------
-    dict or None
-        - {genome_name: [list of sequences for this genome]}
-        - None if problem with a protein for which we don't find the genome
+    list
+        width of each family alignment, in the order of ali_files
     """
-    sequences = {}  # name: [ordered list of sequences]
-    genome = None
-    seq = ""
-    with open(all_alns, 'r') as alnf:
-        for line in alnf:
-            if line.startswith(">"):
-                # If new header, write previous protein name/sequence to 'sequences'
-                if genome and seq:
-                    sequences[genome].append(seq)
-                    seq = ""
-                # Get new genome header
-                genome = get_genome(line, all_genomes)
-                if not genome:
-                    return None
-                if genome not in sequences:
-                    sequences[genome] = []
-            else:
-                seq += line.strip()
-    if genome and seq:
-        sequences[genome].append(seq)
-    per_genome = [len(seq) for seq in sequences.values()]
-    if len(set(per_genome)) != 1:
-        logger.error("Problems occurred while grouping alignments by genome: all genomes "
-                     "do not have the same number of sequences. Check that each protein "
-                     "name contains the name of the genome from which it comes.")
-        return None
-    logger.log(utils.detail_lvl(), f"{per_genome[0]} sequences found per genome")
-    return sequences
-
-
-def write_groups(outfile, sequences):
+    widths = []
+    for ali_file in ali_files:
+        width = 0
+        with open(ali_file, "rb") as alif:
+            alif.readline()
+            for line in alif:
+                if line.startswith(b">"):
+                    break
+                width += len(line.strip())
+        widths.append(width)
+    return widths
+
+
+def init_grouped_file(outfile, genomes, width):
     """
-    Writing alignments per genome to output file.
+    Create the file which will contain alignments grouped by genome, with the header of
+    each genome, and space for its sequence of 'width' characters.
 
     Parameters
     ----------
     outfile : str
         path to file that will contain alignments grouped by genome
-    sequences : dict
-        {genome_name: [list of sequences (DNA, prot...) for this genome]}
+    genomes : []
+        list of genomes, in the order they must be written
+    width : int
+        length of the sequence of each genome (sum of all family widths)
+
+    Returns
+    -------
+    numpy.ndarray
+        position in outfile of the first character of the sequence of each genome
     """
-    logger.log(utils.detail_lvl(), "Writing alignments per genome")
-    with open(outfile, "w") as outf:
-        for genome in sorted(sequences, key=utils.sort_genomes_by_name):
-            # write header for genome
-            outf.write(">" + genome + "\n")
-            # Write all sequences
-            outf.write("".join(sequences[genome]) + "\n")
+    starts = []
+    with open(outfile, "wb") as outf:
+        for genome in genomes:
+            outf.write(f">{genome}\n".encode())
+            starts.append(outf.tell())
+            outf.seek(width, os.SEEK_CUR)
+            outf.write(b"\n")
+    return np.array(starts, dtype=np.int64)
+
 
+def write_families(outfile, ali_files, widths, genomes, starts, col=0):
+    """
+    Write each family alignment at its place in the sequence of each genome. As each call
+    writes its own columns, several processes can write to the same file at the same time.
 
-def get_genome(header, all_genomes):
+    Parameters
+    ----------
+    outfile : str
+        path to file created by :func:`init_grouped_file`
+    ali_files : []
+        list of alignment files of all families
+    widths : []
+        width of each family alignment
+    genomes : []
+        list of genomes, in the order of outfile
+    starts : numpy.ndarray
+        position in outfile of the sequence of each genome
+    col : int
+        position of the first given family in genome sequences
+
+    Returns
+    -------
+    bool
+        True if all families contain 1 sequence of each genome, with the family width.
+        False otherwise
+    """
+    index = {genome: num for num, genome in enumerate(genomes)}
+    resolver = utilsp.GenomeResolver(genomes)
+    grouped = np.memmap(outfile, dtype=np.uint8, mode="r+")
+    for ali_file, width in zip(ali_files, widths):
+        records = alignment.read_fasta_bytes(ali_file)
+        rows = []
+        for name, _ in records:
+            genome = get_genome(name.decode(), genomes, resolver)
+            if not genome:
+                return False
+            rows.append(index[genome])
+        if len(rows) != len(genomes) or len(set(rows)) != len(genomes):
+            logger.error("Problems occurred while grouping alignments by genome: all genomes "
+                         "do not have the same number of sequences. Check that each protein "
+                         "name contains the name of the genome from which it comes.")
+            return False
+        if {len(seq) for _, seq in records} != {width}:
+            logger.error("Problems occurred while grouping alignments by genome: sequences "
+                         f"in {ali_file} do not all have the same length.")
+            return False
+        for row, (_, seq) in zip(rows, records):
+            start = starts[row] + col
+            grouped[start:start + width] = np.frombuffer(seq, dtype=np.uint8)
+        col += width
+    grouped.flush()
+    del grouped
+    return True
+
+
+def get_genome(header, all_genomes, resolver=None):
     """
     Find to which genome belongs 'header'
 
     Parameters
     ----------
     header : str
-        header read in alignment file
+        header read in alignment file (with or without its '>')
     all_genomes : []
         list of all genomes
+    resolver : utils_pangenome.GenomeResolver or None
+        resolver built on all_genomes, to give when resolving many headers. If None, it is
+        built for this header
 
     Returns
     -------
@@ -323,13 +450,14 @@ def get_genome(header, all_genomes):
     # Name of protein is not always genome-name_num
     # Ex: in gembase complete DB: >TOTO.0215.00002.i006_00065 is from genome TOTO.0215.00002
     # So, genome name cannot be deduced directly from header. But it is always included in header
-    header = header.split(">")[1].split()[0]
-
-    for genome in all_genomes:
-        if header.startswith(genome):
-            # header should start with the genome name. Nothing before it.
-            # Ex: >86KG_12345 is from genome 86KG. >6KG_12345 is from genome 6KG, not 86KG
-            return genome
+    # header should start with the genome name. Nothing before it.
+    # Ex: >86KG_12345 is from genome 86KG. >6KG_12345 is from genome 6KG, not 86KG
+    header = header.lstrip(">").split()[0]
+    if not resolver:
+        resolver = utilsp.GenomeResolver(all_genomes)
+    genome = resolver.find(header)
+    if genome:
+        return genome
     logger.error((f"Protein {header} does not correspond to any genome name "
                   f"given... {all_genomes}"))
     return None
@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+# ###############################################################################
+# This file is part of PanACOTA.                                                #
+#                                                                               #
+# Authors: Amandine Perrin                                                      #
+# Copyright © 2018-2020 Institut Pasteur (Paris).                               #
+# See the COPYRIGHT file for details.                                           #
+#                                                                               #
+# PanACOTA is a software providing tools for large scale bacterial comparative  #
+# genomics. From a set of complete and/or draft genomes, you can:               #
+#    -  Do a quality control of your strains, to eliminate poor quality         #
+# genomes, which would not give any information for the comparative study       #
+#    -  Uniformly annotate all genomes                                          #
+#    -  Do a Pan-genome                                                         #
+#    -  Do a Core or Persistent genome                                          #
+#    -  Align all Core/Persistent families                                      #
+#    -  Infer a phylogenetic tree from the Core/Persistent families             #
+#                                                                               #
+# PanACOTA is free software: you can redistribute it and/or modify it under the #
+# terms of the Affero GNU General Public License as published by the Free       #
+# Software Foundation, either version 3 of the License, or (at your option)     #
+# any later version.                                                            #
+#                                                                               #
+# PanACOTA is distributed in the hope that it will be useful, but WITHOUT ANY   #
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS     #
+# FOR A PARTICULAR PURPOSE. See the Affero GNU General Public License           #
+# for more details.                                                             #
+#                                                                               #
+# You should have received a copy of the Affero GNU General Public License      #
+# along with PanACOTA (COPYING file).                                           #
+# If not, see <https://www.gnu.org/licenses/>.                                  #
+# ###############################################################################
+
+"""
+Answer core/persistent genome queries on a pangenome loaded only once.
+
+A PangenomeQuery object reads the pangenome and its family x genome count matrix
+(memory-mapped), and keeps the most recent results in an LRU cache. It can be used
+directly from python, or through a local HTTP service (TCP or Unix socket) started
+with serve.
+
+Queries to the service are GET requests on /pers, with parameters given in the URL
+(genomes separated by commas), or POST requests on /pers with a JSON body:
+
+- genomes: list of genomes of the subset (all genomes of the pangenome if not given)
+- tol, multi, mixed, floor: persistent genome definition (same as corepers options)
+- outfile: if given, the persistent genome is written to this file, in the output
+  directory of the service, and only the number of families is returned
+
+@author gem
+October 2026
+"""
+
+import functools
+import http.server
+import json
+import logging
+import os
+import socketserver
+import stat
+import sys
+import urllib.parse
+
+from PanACoTA import utils_pangenome as utilsp
+import PanACoTA.corepers_module.persistent_functions as pers
+
+logger = logging.getLogger("corepers.query")
+
+# Default number of query results kept in cache
+CACHE_SIZE = 128
+
+
+class PangenomeQuery:
+    """
+    Pangenome loaded once, on which core/persistent genomes of any subset of genomes can be
+    asked, concurrently.
+
+    Parameters
+    ----------
+    pangenome : str
+        pangenome file
+    cache_size : int
+        maximum number of query results kept in cache
+    outdir : str or None
+        directory where persistent genomes are written when an output file is asked.
+        None if no file can be written.
+    """
+
+    def __init__(self, pangenome, cache_size=CACHE_SIZE, outdir=None):
+        fams_by_strain, self.families, self.all_strains = utilsp.read_pangenome(pangenome,
+                                                                                logger)
+        self.matrix = get_matrix(pangenome, fams_by_strain)
+        self.outdir = outdir
+        self.cached_pers = functools.lru_cache(maxsize=cache_size)(self.compute_pers)
+
+    def get_pers(self, genomes=None, tol=1, multi=False, mixed=False, floor=False,
+                 outfile=None):
+        """
+        Get the core/persistent genome of a subset of genomes
+
+        Parameters
+        ----------
+        genomes : list or None
+            genomes of the subset. None for all genomes of the pangenome
+        tol, multi, mixed, floor : float, bool, bool, bool
+            persistent genome definition (see persistent_functions.get_pers)
+        outfile : str or None
+            if given, file (in outdir) where the persistent genome is written
+
+        Returns
+        -------
+        dict
+            {fam_num: [list of members]} for persistent families. It is shared with the
+            cache, and must not be modified.
+        """
+        check_query(tol, multi, mixed, floor)
+        key = None if genomes is None else tuple(sorted(set(genomes)))
+        fams = self.cached_pers(key, float(tol), bool(multi), bool(mixed), bool(floor))
+        if outfile:
+            pers.write_persistent(fams, self.get_outfile(outfile))
+        return fams
+
+    def compute_pers(self, genomes, tol, multi, mixed, floor):
+        """
+        Compute the persistent genome asked, when it is not in cache yet
+
+        Parameters
+        ----------
+        genomes : tuple or None
+            sorted genomes of the subset, None for all genomes
+        tol, multi, mixed, floor : float, bool, bool, bool
+            persistent genome definition
+
+        Returns
+        -------
+        dict
+            {fam_num: [list of members]} for persistent families
+        """
+        if genomes is None:
+            counts = pers.get_fam_counts(self.matrix)
+            return pers.get_pers_from_counts(counts, self.families, len(self.all_strains),
+                                             tol, multi, mixed, floor)
+        mask = pers.get_subset_mask(self.matrix[1], genomes)
+        counts = pers.get_fam_counts(pers.get_subset_matrix(self.matrix, mask))
+        fams = pers.get_pers_from_counts(counts, self.families, len(genomes), tol, multi,
+                                         mixed, floor)
+        return pers.get_subset_members(fams, genomes)
+
+    def get_outfile(self, outfile):
+        """
+        Get the path of an output file asked: it must be a filename, written in outdir.
+
+        Parameters
+        ----------
+        outfile : str
+            name of file asked
+
+        Returns
+        -------
+        str
+            path to output file
+        """
+        if not self.outdir:
+            raise ValueError("No output directory given: persistent genomes cannot be "
+                             "written to a file.")
+        if os.path.basename(outfile) != outfile or outfile in [".", ".."]:
+            raise ValueError(f"Invalid output file name: '{outfile}'. Give a filename, "
+                             "without directory.")
+        return os.path.join(self.outdir, outfile)
+
+    def cache_info(self):
+        """
+        Get cache statistics (hits, misses, maxsize, currsize)
+        """
+        return self.cached_pers.cache_info()
+
+
+def get_matrix(pangenome, fams_by_strain):
+    """
+    Get the count matrix of the pangenome: load it (memory-mapped) if it was already saved
+    after the pangenome binary file was written, or compute and save it.
+
+    Parameters
+    ----------
+    pangenome : str
+        pangenome file. Its binary file must exist (see utils_pangenome.read_pangenome)
+    fams_by_strain : dict
+        {fam_num: {genome1: [members], genome2: [members]}}
+
+    Returns
+    -------
+    tuple
+        (fam_nums, genomes, counts) as returned by persistent_functions.get_count_matrix
+    """
+    binfile = pangenome + ".bin"
+    matrix_dir = pangenome + ".matrix"
+    names = os.path.join(matrix_dir, "names.bin")
+    if os.path.isfile(names) and os.path.getmtime(names) >= os.path.getmtime(binfile):
+        logger.info("Retrieving count matrix from saved files")
+        return pers.load_count_matrix(matrix_dir)
+    logger.info("Saving count matrix for later use")
+    pers.save_count_matrix(pers.get_count_matrix(fams_by_strain), matrix_dir)
+    return pers.load_count_matrix(matrix_dir)
+
+
+def check_query(tol, multi, mixed, floor):
+    """
+    Check that a persistent genome definition is valid. Raise ValueError if not.
+    """
+    if not 0 <= float(tol) <= 1:
+        raise ValueError(f"tol must be in [0, 1]. Invalid value: {tol}")
+    if multi and mixed:
+        raise ValueError("multi and mixed families cannot be allowed together.")
+    if (mixed or floor) and float(tol) == 1:
+        raise ValueError("mixed families and floor cannot be used with tol=1 (core genome).")
+
+
+def parse_query(params):
+    """
+    Get the arguments of PangenomeQuery.get_pers from the parameters of a request
+
+    Parameters
+    ----------
+    params : dict
+        parameters given in JSON body, or in URL ({name: [values]})
+
+    Returns
+    -------
+    dict
+        arguments for PangenomeQuery.get_pers
+    """
+    params = {key: val[-1] if isinstance(val, list) and key != "genomes" else val
+              for key, val in params.items()}
+    wrong = set(params) - {"genomes", "tol", "multi", "mixed", "floor", "outfile"}
+    if wrong:
+        raise ValueError(f"Unknown parameter(s): {', '.join(sorted(wrong))}")
+    genomes = params.get("genomes")
+    if isinstance(genomes, list) and all(isinstance(gen, str) for gen in genomes):
+        genomes = [gen for val in genomes for gen in val.split(",") if gen]
+    elif genomes is not None:
+        raise ValueError("genomes must be a list of genome names.")
+    tol = params.get("tol", 1)
+    if isinstance(tol, bool) or not isinstance(tol, (int, float, str)):
+        raise ValueError(f"tol must be a number. Invalid value: {tol}")
+    try:
+        tol = float(tol)
+    except ValueError:
+        raise ValueError(f"tol must be a number. Invalid value: {tol}")
+    outfile = params.get("outfile")
+    if outfile is not None and not isinstance(outfile, str):
+        raise ValueError(f"outfile must be a file name. Invalid value: {outfile}")
+    query = {"genomes": genomes, "tol": tol, "outfile": outfile}
+    for option in ["multi", "mixed", "floor"]:
+        value = params.get(option, False)
+        if isinstance(value, str):
+            value = value.lower() in ["1", "true", "yes"]
+        elif not isinstance(value, (bool, int, float)):
+            raise ValueError(f"{option} must be a boolean. Invalid value: {value}")
+        query[option] = bool(value)
+    return query
+
+
+class QueryHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Answer persistent genome requests with the PangenomeQuery of the server
+    """
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        self.answer(url.path, urllib.parse.parse_qs(url.query))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            params = json.loads(self.rfile.read(length) or "{}")
+        except ValueError:
+            self.send_json(400, {"error": "Invalid JSON body."})
+            return
+        if not isinstance(params, dict):
+            self.send_json(400, {"error": "JSON body must be an object."})
+            return
+        self.answer(urllib.parse.urlparse(self.path).path, params)
+
+    def answer(self, path, params):
+        """
+        Compute the persistent genome asked, and send it (or its number of families if it
+        was written to a file)
+        """
+        if path != "/pers":
+            self.send_json(404, {"error": f"Unknown path: {path}"})
+            return
+        try:
+            query = parse_query(params)
+            fams = self.server.query.get_pers(**query)
+        except ValueError as err:
+            self.send_json(400, {"error": str(err)})
+            return
+        answer = {"nb_families": len(fams)}
+        if query["outfile"]:
+            answer["outfile"] = self.server.query.get_outfile(query["outfile"])
+        else:
+            answer["families"] = {str(num): members for num, members in fams.items()}
+        self.send_json(200, answer)
+
+    def send_json(self, code, content):
+        body = json.dumps(content).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        if isinstance(self.client_address, tuple) and self.client_address:
+            return str(self.client_address[0])
+        return "unix-socket"
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    HTTP server listening on a Unix socket, answering each request in a thread
+    """
+    daemon_threads = True
+
+
+def make_server(query, address):
+    """
+    Create the HTTP server answering queries on the given pangenome
+
+    Parameters
+    ----------
+    query : PangenomeQuery
+        pangenome on which queries are done
+    address : str
+        'host:port' to listen on TCP, or 'unix:<path>' to listen on a Unix socket
+
+    Returns
+    -------
+    socketserver.BaseServer
+        server, not started yet (see serve)
+
+    Raises
+    ------
+    ValueError
+        if the Unix socket path is an existing file which is not a socket
+    """
+    if address.startswith("unix:"):
+        path = address[len("unix:"):]
+        # Remove socket left by a previous service, but never another file
+        if os.path.lexists(path):
+            if not stat.S_ISSOCK(os.lstat(path).st_mode):
+                raise ValueError(f"{path} already exists and is not a Unix socket. Give "
+                                 "another path to listen on.")
+            os.remove(path)
+        server = ThreadingUnixHTTPServer(path, QueryHandler)
+    else:
+        host, _, port = address.rpartition(":")
+        server = http.server.ThreadingHTTPServer((host or "127.0.0.1", int(port)),
+                                                 QueryHandler)
+    server.query = query
+    return server
+
+
+def serve(query, address):
+    """
+    Answer queries on the given pangenome until interrupted
+
+    Parameters
+    ----------
+    query : PangenomeQuery
+        pangenome on which queries are done
+    address : str
+        'host:port' to listen on TCP, or 'unix:<path>' to listen on a Unix socket
+    """
+    try:
+        server = make_server(query, address)
+    except ValueError as err:
+        logger.error(str(err))
+        sys.exit(1)
+    logger.info(f"Answering persistent genome queries on {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Stopping service.")
+    finally:
+        server.server_close()
+        if address.startswith("unix:") and os.path.exists(address[len("unix:"):]):
+            os.remove(address[len("unix:"):])
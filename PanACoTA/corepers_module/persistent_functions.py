@@ -41,72 +41,153 @@ April 2017
 """
 import logging
 import math
+import os
+import sys
+import numpy as np
+import scipy.sparse
 
 from PanACoTA import utils
 from PanACoTA import utils_pangenome as utilsp
 
 logger = logging.getLogger("corepers.pers")
 
+# Above this number of (family, genome) cells, the count matrix is stored as a sparse matrix
+DENSE_MAX_CELLS = 2 * 10**7
 
-def get_subset_genomes(fam_by_strain, fam_all_members, list_file):
+
+def read_subset(list_file):
     """
-    If the user gives a list of genomes, which is a subset of all genomes in the pangenome, 
-    just keep them in fam_by_strain and fam_all_members dicts. This will give the pangenome of those genomes.
-    They will then be handled by the get_pers function to get corresponding core/persistent genome
+    Read the list of genomes of a subset
 
     Parameters
     ----------
-    fam_by_strain : dict
-        {fam_num: {genome1: [members], genome2: [members]}, fam_num2: {genome1: [members]}}
-    fam_all_members : dict
-        {fam_num: [all members]}
     list_file : str
-        name of file containing all genome names
+        name of file containing all genome names (first column)
 
-    Return
-    ------
-    tuple
-
-        sub_fbs = {fam_num: {genome: [members]}} -> with only genomes in list_genomes
-        sub_fam = {fam_num: [members]} -> with only members from genomes in list_genomes
+    Returns
+    -------
+    list
+        list of genomes in the subset
     """
     logger.info(f"Getting subset of pangenome for genomes in {list_file}.")
-    list_genomes = utilsp.read_lstinfo(list_file, logger)
-    sub_fbs = {}
-    sub_fam = {}
-    for fam_num, family in fam_by_strain.items():
-        kept = {genome:members for genome, members in family.items() if genome in list_genomes}
-        if kept != {}:
-            sub_fbs[fam_num] = kept
-            sub_fam[fam_num] = [member for member in fam_all_members[fam_num] if is_in_subset(member, list_genomes)]
-    return sub_fbs, sub_fam, list_genomes
-
-
-def is_in_subset(member, list_genomes):
+    return utilsp.read_lstinfo(list_file, logger)
+
+
+def read_subsets(subsets):
+    """
+    Read all subsets of genomes for which a core/persistent genome must be generated. They are
+    given either as:
+
+    - a directory containing 1 file per subset, each file being a list of genomes (same
+      format as for a single subset). The subset name is the filename
+    - a file with 1 line per genome, with 2 columns: subset name, genome name
+
+    Parameters
+    ----------
+    subsets : str
+        directory or file with all subsets
+
+    Returns
+    -------
+    dict
+        {subset_name: [list of genomes]}, ordered by subset filename in a directory, by
+        first appearance in a file.
     """
-    From a list of members, keep only those in the given list of genomes
+    if os.path.isdir(subsets):
+        files = sorted(name for name in os.listdir(subsets)
+                       if os.path.isfile(os.path.join(subsets, name)))
+        if files == []:
+            logger.error(f"No genome list found in {subsets} directory.")
+            sys.exit(1)
+        return {name: read_subset(os.path.join(subsets, name)) for name in files}
+    if not os.path.isfile(subsets):
+        logger.error(f"{subsets} file not found.")
+        sys.exit(1)
+    logger.info(f"Getting subsets of pangenome for genomes in {subsets}.")
+    all_subsets = {}
+    with open(subsets) as subf:
+        for num, line in enumerate(subf, start=1):
+            fields = line.split()
+            if fields == []:
+                continue
+            if len(fields) < 2:
+                logger.error(f"Line {num} of {subsets} must contain the subset name "
+                             f"and the genome name: '{line.strip()}'")
+                sys.exit(1)
+            all_subsets.setdefault(fields[0], []).append(fields[1])
+    if all_subsets == {}:
+        logger.error(f"No genome found in {subsets} file.")
+        sys.exit(1)
+    return all_subsets
+
+
+def get_subset_mask(genomes, list_genomes):
+    """
+    Get the columns of the count matrix corresponding to the genomes of a subset
 
     Parameters
     ----------
-    members : str
-        protein name
-    list_genomes : str
-        filename containing list of genomes
-
-    Return
-    ------
-    bool
-        True if member is in list_genomes, False otherwise
+    genomes : list
+        genomes of the count matrix columns (see get_count_matrix)
+    list_genomes : list
+        genomes of the subset
+
+    Returns
+    -------
+    numpy.ndarray
+        boolean array, True for the genomes (columns) in the subset
     """
-    # if format is gembase (ex: ESCO.1512.00001.i0002_12124), genome name is 3 first . separated fields
-    if "." in member and len(member.split(".")) >= 3:
-        genome = ".".join(member.split(".")[:3])
-        return genome in list_genomes
-    else:   
-        # if format is not like this, it must be something_00001 (genomeName_proteinNumber):
-        return member.split("_")[0] in list_genomes
+    genomes_set = set(list_genomes)
+    return np.fromiter((genome in genomes_set for genome in genomes), dtype=bool,
+                       count=len(genomes))
 
 
+def get_subset_matrix(matrix, mask):
+    """
+    Get the count matrix of a subset of genomes, by keeping only the columns in mask.
+    Families without any genome of the subset are kept, with no member.
+
+    Parameters
+    ----------
+    matrix : tuple
+        (fam_nums, genomes, counts) as returned by get_count_matrix
+    mask : numpy.ndarray
+        boolean array, True for the genomes (columns) to keep (see get_subset_mask)
+
+    Returns
+    -------
+    tuple
+        (fam_nums, genomes, counts) with only the genomes of the subset
+    """
+    fam_nums, genomes, counts = matrix
+    sub_genomes = [genome for genome, kept in zip(genomes, mask) if kept]
+    return fam_nums, sub_genomes, counts[:, mask]
+
+
+def get_subset_members(fams, list_genomes):
+    """
+    Keep, in each family, only the members from genomes of a subset
+
+    The genome of each member is found as when reading the pangenome (see
+    utils_pangenome.get_strain), so that members kept are those of the columns of the count
+    matrix kept for the subset (see get_subset_mask).
+
+    Parameters
+    ----------
+    fams : dict
+        {fam_num: [list of members]}
+    list_genomes : list
+        genomes of the subset
+
+    Returns
+    -------
+    dict
+        {fam_num: [members from genomes in list_genomes]}
+    """
+    genomes_set = set(list_genomes)
+    return {fam_num: [member for member in members if utilsp.get_strain(member) in genomes_set]
+            for fam_num, members in fams.items()}
+
 
 def get_pers(fam_by_strain, fam_all_members, nb_strains, tol=1, multi=False, mixed=False,
              floor=False):
@@ -114,6 +195,9 @@ def get_pers(fam_by_strain, fam_all_members, nb_strains, tol=1, multi=False, mix
     From the list of families, get the Pers Genome families, that are families having at least
     tol% of 'nb_strain' members.
 
+    Families are selected from the number of members of each genome in each family
+    (see get_count_matrix and get_pers_from_counts).
+
     Parameters
     ----------
     fam_by_strain : dict
@@ -143,105 +227,277 @@ def get_pers(fam_by_strain, fam_all_members, nb_strains, tol=1, multi=False, mix
     dict
         {fam_num: [list of members]} for persistent families
     """
-    logger.info("Generating Persistent genome of a dataset "
-                f"containing {nb_strains} genomes")
-    pers = {}  # {fam_num: {strain1: [genes from strain1], strain2: [genes from strain2]}}
-    fams = {}  # {fam_num: [list of members]}
+    counts = get_fam_counts(get_count_matrix(fam_by_strain))
+    return get_pers_from_counts(counts, fam_all_members, nb_strains, tol, multi, mixed, floor)
+
+
+def get_min_members(nb_strains, tol, floor=False):
+    """
+    Get the minimum number of genomes a persistent family must contain
+
+    Parameters
+    ----------
+    nb_strains : int
+        total number of strains/genomes in dataset
+    tol : float
+        min percentage of different genomes present in a family
+    floor : bool
+        True to use floor(nb_strains*tol), False to use ceil(nb_strains*tol)
+
+    Returns
+    -------
+    int
+        minimum number of genomes
+    """
     if floor:
-        min_members = math.floor(tol * nb_strains)
-    else:
-        min_members = math.ceil(tol * nb_strains)
-    for fam_num, family in fam_by_strain.items():
-        # If enough strains and multi accepted, or multi not accepted but 1 member per
-        # strain, add family to core
-        if mixed:
-            if mixed_family(family, min_members):
-                pers[fam_num] = family
-                fams[fam_num] = fam_all_members[fam_num]
-        else:
-            if len(family) >= min_members and (multi or uniq_members(family)):
-                pers[fam_num] = family
-                fams[fam_num] = fam_all_members[fam_num]
+        return math.floor(tol * nb_strains)
+    return math.ceil(tol * nb_strains)
+
+
+def log_pers(nb_pers, nb_strains, min_members, tol, multi, mixed):
+    """
+    Write information on the persistent genome generated
+
+    Parameters
+    ----------
+    nb_pers : int
+        number of persistent families
+    nb_strains : int
+        total number of strains/genomes in dataset
+    min_members : int
+        minimum number of genomes in a persistent family
+    tol : float
+        min percentage of different genomes present in a family
+    multi : bool
+        True if multigenic families are allowed
+    mixed : bool
+        True if mixed families are allowed
+    """
     # coregenome computed
     if tol == 1 and not multi and not mixed:
-        logger.info(f"The core genome contains {len(pers)} families, each one having "
+        logger.info(f"The core genome contains {nb_pers} families, each one having "
                     f"exactly {int(min_members)} members, from the {nb_strains} different genomes.")
     # multi persistent genome with multigenic families allowed
     elif multi:
-        logger.info(f"The persistent genome contains {len(pers)} families with members present "
+        logger.info(f"The persistent genome contains {nb_pers} families with members present "
                     f"in at least {min_members} different genomes ({tol*100}% of the total number of "
                     "genomes).")
     # mixed persistent genome, tol% families with exactly 1 member from each genome,
     # multigenic families allowed for the '1-tol'% remaining families
     elif mixed:
-        logger.info(f"The persistent genome contains {len(pers)} families, "
+        logger.info(f"The persistent genome contains {nb_pers} families, "
                     f"each one having exactly 1 member from at least {tol*100}% of the genomes ({min_members} "
                     f"genomes). In the remaining {round((1-tol)*100,3)}% genomes, there can be 0, 1 or "
                     "several members.")
     # Strict persistent genome. tol% families with exactly one member in each genome
     else:
-        logger.info(f"The persistent genome contains {len(pers)} families, each one having "
+        logger.info(f"The persistent genome contains {nb_pers} families, each one having "
                     f"exactly 1 member from at least {tol*100}% of the {nb_strains} "
                     f"different genomes (that is {min_members} genomes). The other genomes are absent from "
                     "the family.")
-    return fams
 
 
-def mixed_family(family, thres):
+def get_count_matrix(fam_by_strain):
+    """
+    Get the number of members of each genome in each family, as a (family, genome) matrix.
+    It is a numpy array, or a scipy sparse (CSR) matrix if there are more than
+    DENSE_MAX_CELLS cells.
+
+    A genome with an empty list of members in a family is considered as absent from it.
+
+    Parameters
+    ----------
+    fam_by_strain : dict
+        {fam_num: {genome1: [members], genome2: [members]}, fam_num2: {genome1: [members]}}
+
+    Returns
+    -------
+    tuple
+        (fam_nums, genomes, counts), with:
+
+        - fam_nums: list of family numbers, in the order of the matrix rows
+        - genomes: sorted list of genomes, in the order of the matrix columns
+        - counts: matrix with the number of members of each genome in each family
+    """
+    fam_nums = list(fam_by_strain)
+    genomes = sorted({genome for family in fam_by_strain.values() for genome in family})
+    gen_index = {genome: num for num, genome in enumerate(genomes)}
+    nb_cells = np.fromiter((len(family) for family in fam_by_strain.values()),
+                           dtype=np.int64, count=len(fam_nums))
+    total = int(nb_cells.sum())
+    rows = np.repeat(np.arange(len(fam_nums)), nb_cells)
+    cols = np.fromiter((gen_index[genome] for family in fam_by_strain.values()
+                        for genome in family), dtype=np.int64, count=total)
+    data = np.fromiter((len(members) for family in fam_by_strain.values()
+                        for members in family.values()), dtype=np.int32, count=total)
+    empty = data == 0
+    if empty.any():
+        logger.warning(f"Problem, no members for {np.count_nonzero(empty)} genome(s) "
+                       "of families!")
+        rows, cols, data = rows[~empty], cols[~empty], data[~empty]
+    shape = (len(fam_nums), len(genomes))
+    if shape[0] * shape[1] <= DENSE_MAX_CELLS:
+        counts = np.zeros(shape, dtype=np.int32)
+        counts[rows, cols] = data
+    else:
+        counts = scipy.sparse.csr_matrix((data, (rows, cols)), shape=shape)
+    return fam_nums, genomes, counts
+
+
+def save_count_matrix(matrix, outdir):
     """
-    1 family = several genomes (genome=strain), each containing x members
-    Returns True if at least 'thres' genomes of the family have exactly 1 member.
+    Save the count matrix to a directory, as numpy files which can then be memory-mapped
+    (see load_count_matrix).
 
     Parameters
     ----------
-    family : dict
-        {strain1: [members in strain1]}
-    thres : float
-         minimum number of genomes which must have exactly 1 member
+    matrix : tuple
+        (fam_nums, genomes, counts) as returned by get_count_matrix
+    outdir : str
+        directory where matrix files are saved
+    """
+    fam_nums, genomes, counts = matrix
+    os.makedirs(outdir, exist_ok=True)
+    utils.save_bin([fam_nums, genomes, counts.shape], os.path.join(outdir, "names.bin"))
+    if scipy.sparse.issparse(counts):
+        for array in ["data", "indices", "indptr"]:
+            np.save(os.path.join(outdir, array + ".npy"), getattr(counts, array))
+    else:
+        np.save(os.path.join(outdir, "counts.npy"), counts)
+
+
+def load_count_matrix(matrix_dir):
+    """
+    Load a count matrix saved by save_count_matrix. Numpy arrays are memory-mapped
+    (read-only), so that they are only read from disk when needed.
+
+    Parameters
+    ----------
+    matrix_dir : str
+        directory where matrix files were saved
 
     Returns
     -------
-    bool
+    tuple
+        (fam_nums, genomes, counts) as returned by get_count_matrix
     """
-    nb_uniq = 0
-    for genome, members in family.items():
-        if nb_uniq < thres:
-            if len(members) == 0:
-                logger.warning(f"Problem, no members for {genome}!")
-            if len(members) == 1:
-                nb_uniq += 1
-        else:
-            return True
-    return nb_uniq >= thres
-
-
-def uniq_members(family, num=1):
+    fam_nums, genomes, shape = utils.load_bin(os.path.join(matrix_dir, "names.bin"))
+    dense_file = os.path.join(matrix_dir, "counts.npy")
+    if os.path.isfile(dense_file):
+        counts = np.load(dense_file, mmap_mode="r")
+    else:
+        arrays = [np.load(os.path.join(matrix_dir, array + ".npy"), mmap_mode="r")
+                  for array in ["data", "indices", "indptr"]]
+        counts = scipy.sparse.csr_matrix(tuple(arrays), shape=shape, copy=False)
+    return fam_nums, genomes, counts
+
+
+def count_per_family(counts, condition):
     """
-    Returns True if, in the family, each genome has no more than 'num' member(s),
-    False otherwise (multigenic family)
+    Count, for each family (row of counts matrix), the number of genomes whose number
+    of members satisfies the given condition.
 
     Parameters
     ----------
-    family : dict
-        {strain1: [members in strain1], strain2: [members in strain2]}
-    num : int
-        max number of members allowed in each genome to return True
+    counts : numpy.ndarray or scipy.sparse.csr_matrix
+        (family, genome) matrix of number of members (see get_count_matrix)
+    condition : function
+        takes an array of numbers of members and returns a boolean array. It must be False
+        for 0 members, so that absent genomes (not stored in sparse matrices) are not counted
 
     Returns
     -------
-    bool
+    numpy.ndarray
+        number of genomes satisfying condition in each family
+    """
+    if scipy.sparse.issparse(counts):
+        rows = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+        return np.bincount(rows[condition(counts.data)], minlength=counts.shape[0])
+    return np.count_nonzero(condition(counts), axis=1)
+
+
+def get_fam_counts(matrix):
     """
-    for genome, members in family.items():
-        if len(members) == 0:
-            logger.warning(f"Problem, no members for {genome}!")
-        if len(members) > num:
-            return False
-    return True
+    Count, for each family, the number of genomes it contains, the number of genomes having
+    exactly 1 member and the number of genomes having several members. These counts are
+    enough to know if a family is persistent for any (tol, multi, mixed, floor)
+    combination (see get_pers_from_counts).
+
+    Parameters
+    ----------
+    matrix : tuple
+        (fam_nums, genomes, counts) as returned by get_count_matrix
+
+    Returns
+    -------
+    tuple
+        (fam_nums, nb_genomes, nb_uniq, nb_multi), with:
+
+        - fam_nums: list of family numbers
+        - nb_genomes: array with number of genomes in each family of fam_nums
+        - nb_uniq: array with number of genomes having exactly 1 member in each family
+        - nb_multi: array with number of genomes having several members in each family
+    """
+    fam_nums, _, counts = matrix
+    nb_genomes = count_per_family(counts, lambda nb: nb > 0)
+    nb_uniq = count_per_family(counts, lambda nb: nb == 1)
+    nb_multi = count_per_family(counts, lambda nb: nb > 1)
+    return fam_nums, nb_genomes, nb_uniq, nb_multi
+
+
+def get_pers_from_counts(counts, fam_all_members, nb_strains, tol=1, multi=False, mixed=False,
+                         floor=False):
+    """
+    Select persistent families from the counts of get_fam_counts, so that several persistent
+    genomes can be computed without reading all families again:
+
+    - mixed: at least min_members genomes with exactly 1 member
+    - multi: at least min_members genomes
+    - strict: at least min_members genomes, and no genome with several members
+
+    Parameters
+    ----------
+    counts : tuple
+        (fam_nums, nb_genomes, nb_uniq, nb_multi) returned by get_fam_counts
+    fam_all_members : dict
+        {fam_num: [all members]}
+    nb_strains : int
+        total number of strains/genomes in dataset
+    tol : float
+        min percentage of different genomes present in a family
+    multi : bool
+        True if multiple genes from the same genome/strain in a family are tolerated
+    mixed : bool
+        True if mixed families are allowed
+    floor : bool
+        Use floor(nb_strains*tol) as minimum number of genomes if True, ceil(nb_strains*tol)
+        if False.
+
+    Returns
+    -------
+    dict
+        {fam_num: [list of members]} for persistent families
+    """
+    logger.info("Generating Persistent genome of a dataset "
+                f"containing {nb_strains} genomes")
+    fam_nums, nb_genomes, nb_uniq, nb_multi = counts
+    min_members = get_min_members(nb_strains, tol, floor)
+    if mixed:
+        selected = nb_uniq >= min_members
+    elif multi:
+        selected = nb_genomes >= min_members
+    else:
+        selected = (nb_genomes >= min_members) & (nb_multi == 0)
+    fams = {fam_nums[idx]: fam_all_members[fam_nums[idx]] for idx in np.flatnonzero(selected)}
+    log_pers(len(fams), nb_strains, min_members, tol, multi, mixed)
+    return fams
 
 
 def write_persistent(fams, outfile):
     """
-    Write persistent families into output file
+    Write persistent families into output file, and its protein index (see
+    utils_pangenome.write_protein_index), used by align to get the persistent proteins of
+    each genome
 
     Parameters
     ----------
@@ -258,3 +514,4 @@ def write_persistent(fams, outfile):
             for mem in sorted(fam, key=utils.sort_proteins):
                 outf.write(" " + mem)
             outf.write("\n")
+    utilsp.write_protein_index(fams, outfile)
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+# ###############################################################################
+# This file is part of PanACOTA.                                                #
+#                                                                               #
+# Authors: Amandine Perrin                                                      #
+# Copyright © 2018-2020 Institut Pasteur (Paris).                               #
+# See the COPYRIGHT file for details.                                           #
+#                                                                               #
+# PanACOTA is a software providing tools for large scale bacterial comparative  #
+# genomics. From a set of complete and/or draft genomes, you can:               #
+#    -  Do a quality control of your strains, to eliminate poor quality         #
+# genomes, which would not give any information for the comparative study       #
+#    -  Uniformly annotate all genomes                                          #
+#    -  Do a Pan-genome                                                         #
+#    -  Do a Core or Persistent genome                                          #
+#    -  Align all Core/Persistent families                                      #
+#    -  Infer a phylogenetic tree from the Core/Persistent families             #
+#                                                                               #
+# PanACOTA is free software: you can redistribute it and/or modify it under the #
+# terms of the Affero GNU General Public License as published by the Free       #
+# Software Foundation, either version 3 of the License, or (at your option)     #
+# any later version.                                                            #
+#                                                                               #
+# PanACOTA is distributed in the hope that it will be useful, but WITHOUT ANY   #
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS     #
+# FOR A PARTICULAR PURPOSE. See the Affero GNU General Public License           #
+# for more details.                                                             #
+#                                                                               #
+# You should have received a copy of the Affero GNU General Public License      #
+# along with PanACOTA (COPYING file).                                           #
+# If not, see <https://www.gnu.org/licenses/>.                                  #
+# ###############################################################################
+
+
+"""
+Functions to compute pan-genome and core-genome accumulation curves: number of families
+present in at least 1 genome (pan) or in all genomes (core) when genomes are added one by
+one, in random orders.
+
+@author gem
+October 2026
+"""
+import logging
+import multiprocessing
+import numpy as np
+
+logger = logging.getLogger("pangenome.accumulation")
+
+# Seed used to draw genome orders, so that curves are reproducible
+SEED = 42
+
+
+def get_presence_matrix(qualis, all_strains):
+    """
+    Get the genome x family presence matrix from the qualitative pangenome
+
+    Parameters
+    ----------
+    qualis : dict
+        {fam_num: [0 if no gene for species, 1 if at least 1 gene, for each species in\
+        all_strains]}
+    all_strains : list
+        list of all genome names
+
+    Returns
+    -------
+    numpy.ndarray
+        boolean matrix, lines = genomes, columns = families. True if the genome has at least
+        1 member in the family
+    """
+    presence = np.zeros((len(all_strains), len(qualis)), dtype=bool)
+    for col, quali in enumerate(qualis.values()):
+        presence[:, col] = quali
+    return presence
+
+
+def accumulation_curves(presence, nb_perm, threads=1, chunk=None, seed=SEED):
+    """
+    Compute pan and core genome sizes when genomes are added one by one, for nb_perm random
+    orders of genomes. Permutations are split between 'threads' processes. Orders are drawn
+    before, so that results do not depend on the number of processes.
+
+    Parameters
+    ----------
+    presence : numpy.ndarray
+        boolean matrix, lines = genomes, columns = families (see get_presence_matrix)
+    nb_perm : int
+        number of random orders of genomes
+    threads : int
+        number of processes to use
+    chunk : int or None
+        max number of families handled at once, to bound memory used. None to handle all
+        families at once
+    seed : int
+        seed used to draw random orders of genomes
+
+    Returns
+    -------
+    (pan, core) : tuple
+        numpy arrays of shape (nb_perm, nb_genomes), with pan[p, i] (resp. core[p, i]) the
+        number of families present in at least 1 (resp. all) of the i+1 first genomes of
+        permutation p
+    """
+    nb_genomes = presence.shape[0]
+    rng = np.random.default_rng(seed)
+    perms = np.array([rng.permutation(nb_genomes) for _ in range(nb_perm)],
+                     dtype=np.int64).reshape(nb_perm, nb_genomes)
+    logger.info(f"Computing pan and core genome accumulation curves for {nb_perm} random "
+                f"orders of {nb_genomes} genomes")
+    blocks = [block for block in np.array_split(perms, min(threads, nb_perm) or 1)
+              if len(block)]
+    if len(blocks) <= 1:
+        curves = [permutation_curves((presence, perms, chunk))]
+    else:
+        arguments = [(presence, block, chunk) for block in blocks]
+        with multiprocessing.Pool(len(blocks)) as pool:
+            curves = pool.map(permutation_curves, arguments, chunksize=1)
+    pan = np.vstack([curve[0] for curve in curves])
+    core = np.vstack([curve[1] for curve in curves])
+    return pan, core
+
+
+def permutation_curves(args):
+    """
+    Compute pan and core genome sizes for the given orders of genomes, with a cumulative OR
+    (pan) and AND (core) of presence vectors along genomes. Families are handled by chunks:
+    pan and core sizes are sums over families, so that they are the sums of sizes found for
+    each chunk.
+
+    Parameters
+    ----------
+    args : tuple
+        (presence, perms, chunk) with:
+
+        - presence: boolean matrix, lines = genomes, columns = families
+        - perms: array (nb_perm, nb_genomes) with order of genomes in each permutation
+        - chunk: max number of families handled at once, None for all families
+
+    Returns
+    -------
+    (pan, core) : tuple
+        numpy arrays of shape (nb_perm, nb_genomes) with pan and core sizes
+    """
+    presence, perms, chunk = args
+    nb_fams = presence.shape[1]
+    chunk = chunk or max(nb_fams, 1)
+    pan = np.zeros(perms.shape, dtype=np.int64)
+    core = np.zeros(perms.shape, dtype=np.int64)
+    for start in range(0, nb_fams, chunk):
+        sub = presence[:, start:start + chunk]
+        for num, perm in enumerate(perms):
+            ordered = sub[perm]
+            pan[num] += np.logical_or.accumulate(ordered, axis=0).sum(axis=1)
+            core[num] += np.logical_and.accumulate(ordered, axis=0).sum(axis=1)
+    return pan, core
+
+
+def fit_heaps(pan):
+    """
+    Fit Heaps' law n = kappa * N^(-alpha) on the mean number of new families n found when
+    adding the Nth genome (N >= 2). The pangenome is open if alpha <= 1, closed otherwise.
+
+    Parameters
+    ----------
+    pan : numpy.ndarray
+        pan genome sizes, of shape (nb_perm, nb_genomes) (see accumulation_curves)
+
+    Returns
+    -------
+    tuple or None
+        (kappa, alpha). None if there are not at least 2 genomes adding new families.
+    """
+    new_fams = np.diff(pan, axis=1).mean(axis=0)
+    nb_genomes = np.arange(2, pan.shape[1] + 1)
+    kept = new_fams > 0
+    if np.count_nonzero(kept) < 2:
+        return None
+    slope, intercept = np.polyfit(np.log(nb_genomes[kept]), np.log(new_fams[kept]), 1)
+    return float(np.exp(intercept)), float(-slope)
+
+
+def write_curves(pan, core, outfile):
+    """
+    Write mean, standard deviation, min and max pan and core genome sizes for each number
+    of genomes.
+
+    Parameters
+    ----------
+    pan : numpy.ndarray
+        pan genome sizes, of shape (nb_perm, nb_genomes)
+    core : numpy.ndarray
+        core genome sizes, of shape (nb_perm, nb_genomes)
+    outfile : str
+        file where curves are written
+    """
+    columns = [np.arange(1, pan.shape[1] + 1)]
+    for sizes in [pan, core]:
+        columns += [sizes.mean(axis=0), sizes.std(axis=0), sizes.min(axis=0), sizes.max(axis=0)]
+    header = "\t".join(["nb_genomes"] + [f"{name}_{stat}" for name in ["pan", "core"]
+                                         for stat in ["mean", "sd", "min", "max"]])
+    fmt = ["%d"] + ["%.2f", "%.2f", "%d", "%d"] * 2
+    np.savetxt(outfile, np.column_stack(columns), fmt=fmt, delimiter="\t", header=header,
+               comments="")
+
+
+def do_accumulation(qualis, all_strains, pangenome, nb_perm, threads=1, chunk=None,
+                    heaps=False):
+    """
+    Compute pan and core genome accumulation curves of the pangenome, and write them to
+    <pangenome>.accumulation.tsv. If asked, fit Heaps' law and write its parameters to
+    <pangenome>.heaps.tsv
+
+    Parameters
+    ----------
+    qualis : dict
+        {fam_num: [0/1 for each species in all_strains]}
+    all_strains : list
+        list of all genome names
+    pangenome : str
+        pangenome filename, extended for output files
+    nb_perm : int
+        number of random orders of genomes
+    threads : int
+        number of processes to use
+    chunk : int or None
+        max number of families handled at once. None for all families
+    heaps : bool
+        True to fit Heaps' law on the pan genome curve
+
+    Returns
+    -------
+    tuple or None
+        (kappa, alpha) if Heaps' law was fitted, None otherwise
+    """
+    presence = get_presence_matrix(qualis, all_strains)
+    pan, core = accumulation_curves(presence, nb_perm, threads, chunk)
+    outfile = pangenome + ".accumulation.tsv"
+    write_curves(pan, core, outfile)
+    logger.info(f"Accumulation curves written to {outfile}")
+    if not heaps:
+        return None
+    fit = fit_heaps(pan)
+    if fit is None:
+        logger.warning("Heaps' law cannot be fitted: at least 2 genomes must add new "
+                       "families to the pangenome.")
+        return None
+    kappa, alpha = fit
+    state = "open" if alpha <= 1 else "closed"
+    logger.info(f"Heaps' law fit: kappa = {kappa:.3f}, alpha = {alpha:.3f} "
+                f"({state} pangenome)")
+    with open(pangenome + ".heaps.tsv", "w") as heapf:
+        heapf.write("kappa\talpha\tpangenome\n")
+        heapf.write(f"{kappa}\t{alpha}\t{state}\n")
+    return fit
@@ -46,18 +46,57 @@ import time
 import threading
 import progressbar
 import copy
+import contextlib
+import fcntl
+import hashlib
+import shutil
+import json
+import re
+import shlex
+import subprocess
 
 from PanACoTA import utils
 from PanACoTA import utils_pangenome as utils_pan
+from PanACoTA.pangenome_module import protein_seq_functions as protf
 
 logger = logging.getLogger("pangenome.mmseqs")
 
+# Clustering engines available:
+# - cluster: 'mmseqs cluster' (prefilter + alignment of all proteins)
+# - linclust: 'mmseqs linclust', linear in the number of proteins, for huge banks at high identity
+# - cascade: 'mmseqs linclust', then 'mmseqs cluster' on the representatives of linclust
+#   clusters, and merge both clusterings
+CLUST_ENGINES = ["cluster", "linclust", "cascade"]
 
-def run_all_pangenome(min_id, clust_mode, outdir, prt_path, threads, panfile=None, quiet=False):
+# File of the mmseqs database cache with checksums of protein files, to read them only
+# when they changed
+CHECKSUMS_FILE = "bank_checksums.json"
+
+# Files created by 'mmseqs createdb'
+DB_EXTS = ["", ".index", ".dbtype", ".lookup", "_h", "_h.index", "_h.dbtype"]
+
+# Part of the available memory given to mmseqs through --split-memory-limit when the
+# user does not give it
+MEM_FRACTION = 0.8
+
+# mmseqs modules, run by mmseqs workflows (cluster, linclust, search), whose processing
+# time is reported in the resource report
+MMSEQS_MODULES = ["createdb", "prefilter", "align", "clust", "kmermatcher", "rescorediagonal",
+                  "linclust", "cluster", "search", "filterdb", "createsubdb", "mergeclusters",
+                  "createtsv", "convertalis", "offsetalignment", "swapresults", "concatdbs",
+                  "mergedbs", "mvdb", "rmdb", "cpdb", "result2flat"]
+
+# Seconds between 2 measures of the disk space used by mmseqs temporary directory
+DISK_POLL = 5
+
+
+def run_all_pangenome(min_id, clust_mode, outdir, prt_path, threads, panfile=None, quiet=False,
+                      db_cache=None, engine="cluster", dupfile=None, prt_files=None,
+                      mem_limit=None):
     """
     Run all steps to build a pangenome:
 
-    - create mmseqs database from protein bank
+    - create mmseqs database from protein bank (or reuse the one in cache)
     - cluster proteins
     - convert to pangenome
 
@@ -78,6 +117,22 @@ def run_all_pangenome(min_id, clust_mode, outdir, prt_path, threads, panfile=Non
         name for output pangenome file. Otherwise, will use default name
     quiet : bool
         True if nothing must be written on stdout, False otherwise.
+    db_cache : str or None
+        directory containing mmseqs databases shared between runs. None to use
+        <outdir>/mmseqs_db_cache
+    engine : str
+        clustering engine to use, in CLUST_ENGINES. Default is 'cluster'
+    dupfile : str or None
+        if prt_path contains only 1 protein per unique sequence, file mapping the other
+        proteins to their representative in prt_path. They are added to the families of
+        their representative.
+    prt_files : list or None
+        per-genome protein files from which the mmseqs database must be built directly.
+        prt_path is then not read (it does not need to exist), and is only used to name
+        output files. None to build the database from prt_path.
+    mem_limit : str or None
+        value given to mmseqs '--split-memory-limit' (see get_split_memory_limit). None
+        to let mmseqs use all the memory of the machine
 
     Returns
     -------
@@ -92,14 +147,15 @@ def run_all_pangenome(min_id, clust_mode, outdir, prt_path, threads, panfile=Non
     information = ("Will run MMseqs2 with:\n"
                    f"\t- minimum sequence identity = {min_id*100}%\n"
                    f"\t- cluster mode {clust_mode}")
+    if engine != "cluster":
+        information += f"\n\t- clustering engine {engine}"
     if threads > 1:
         information += f"\n\t- {threads} threads"
     logger.info(information)
-    infoname = get_info(threads, min_id, clust_mode)
+    infoname = get_info(threads, min_id, clust_mode, engine)
     logmmseq = get_logmmseq(outdir, prt_bank, infoname)
 
     tmpdir = os.path.join(outdir, "tmp_" + prt_bank + "_" + infoname)
-    mmseqdb = os.path.join(tmpdir, prt_bank + "-msDB")
     mmseqclust = os.path.join(tmpdir, prt_bank + "-clust-" + infoname)
     mmseqstsv = mmseqclust + ".tsv"
     # Get pangenome filename
@@ -115,17 +171,500 @@ def run_all_pangenome(min_id, clust_mode, outdir, prt_path, threads, panfile=Non
     else:
         os.makedirs(tmpdir, exist_ok=True)
         # Create ffindex of DB if not already done
-        status = do_mmseqs_db(mmseqdb, prt_path, logmmseq, quiet)
-        # status = create_mmseqs_db(mmseqdb, prt_path, logmmseq)
         # Status = ok means that mmseqs_db files already existed and were not re-done
-        # If they were redone (or just done), remove any existing following file (mmseqs clust, tsv, csv)
-        # Cluster with mmseqs
-        families, panfile = do_pangenome(outdir, prt_bank, mmseqdb, mmseqclust, tmpdir, logmmseq, min_id,
-                                         clust_mode, status, threads, panfile, quiet)
+        # If they were redone (or just done), remove any existing following file
+        # (mmseqs clust, tsv, csv)
+        with cached_mmseqs_db(prt_path, outdir, db_cache, logmmseq, quiet,
+                              prt_files) as (mmseqdb, status):
+            # Cluster with mmseqs
+            families, panfile = do_pangenome(outdir, prt_bank, mmseqdb, mmseqclust, tmpdir,
+                                             logmmseq, min_id, clust_mode, status, threads,
+                                             panfile, quiet, engine, dupfile, mem_limit)
     return families, panfile
 
 
-def get_info(threads, min_id, clust_mode):
+def run_sweep_pangenome(min_ids, clust_mode, outdir, prt_path, threads, panfile=None,
+                        quiet=False, db_cache=None, dupfile=None, prt_files=None,
+                        mem_limit=None):
+    """
+    Build one pangenome per identity threshold, sharing the all-vs-all search:
+
+    - create mmseqs database from protein bank (or reuse the one in cache)
+    - compare all proteins against all proteins once, at the loosest threshold
+    - for each threshold, keep the alignments reaching it, cluster proteins from them,
+      and convert to pangenome
+
+    Parameters
+    ----------
+    min_ids : list
+        all minimum percentages of identity to be in the same family
+    clust_mode : [0, 1, 2]
+        0 for 'set cover', 1 for 'single-linkage', 2 for 'CD-Hit'
+    outdir : str
+        directory where output cluster files must be saved
+    prt_path : str
+        path to file containing all proteins to cluster.
+    threads : int
+        number of threads which can be used
+    panfile : str or None
+        base name for output pangenome files, which will be suffixed by the threshold.
+        Otherwise, will use default names
+    quiet : bool
+        True if nothing must be written on stdout, False otherwise.
+    db_cache : str or None
+        directory containing mmseqs databases shared between runs. None to use
+        <outdir>/mmseqs_db_cache
+    dupfile : str or None
+        if prt_path contains only 1 protein per unique sequence, file mapping the other
+        proteins to their representative in prt_path. They are added to the families of
+        their representative.
+    prt_files : list or None
+        per-genome protein files from which the mmseqs database must be built directly
+        (see run_all_pangenome). None to build the database from prt_path.
+    mem_limit : str or None
+        value given to mmseqs '--split-memory-limit' (see get_split_memory_limit). None
+        to let mmseqs use all the memory of the machine
+
+    Returns
+    -------
+    dict
+        {min_id: (families, outfile)}, with:
+
+        - families : {fam_num: [all members]}
+        - outfile : pangenome filename
+    """
+    prt_bank = os.path.basename(prt_path)
+    min_ids = sorted(set(min_ids))
+    loosest = min_ids[0]
+    information = ("Will run MMseqs2 with:\n"
+                   "\t- minimum sequence identities = "
+                   f"{', '.join(str(min_id*100) + '%' for min_id in min_ids)}\n"
+                   f"\t- cluster mode {clust_mode}")
+    if threads > 1:
+        information += f"\n\t- {threads} threads"
+    logger.info(information)
+    # The all-vs-all search only depends on the loosest threshold
+    logmmseq = get_logmmseq(outdir, prt_bank, f"sweep{loosest}-mode{clust_mode}")
+    tmpdir = os.path.join(outdir, f"tmp_{prt_bank}_sweep{loosest}")
+    mmseqaln = os.path.join(tmpdir, f"{prt_bank}-aln-{loosest}")
+    results = {}
+    todo = []
+    for min_id in min_ids:
+        infoname = get_info(threads, min_id, clust_mode)
+        if not panfile:
+            id_panfile = os.path.join(outdir, f"PanGenome-{prt_bank}-clust-{infoname}.lst")
+        else:
+            id_panfile = os.path.join(outdir, f"{panfile}-{min_id}")
+        # If pangenome file already exists, read it to get families
+        if os.path.isfile(id_panfile):
+            logger.warning(f"Pangenome file {id_panfile} already exists. PanACoTA will read it "
+                           "to get families.")
+            _, families, _ = utils_pan.read_pan_file(id_panfile, logger)
+            results[min_id] = (families, id_panfile)
+        else:
+            todo.append((min_id, infoname, id_panfile))
+    if not todo:
+        return results
+    os.makedirs(tmpdir, exist_ok=True)
+    with cached_mmseqs_db(prt_path, outdir, db_cache, logmmseq, quiet,
+                          prt_files) as (mmseqdb, just_done):
+        # If we just made the database, previous search results must be redone
+        if just_done or not os.path.isfile(mmseqaln + ".dbtype"):
+            logger.info(f"Comparing all proteins at {loosest*100}% identity...")
+            args = (mmseqdb, mmseqaln, tmpdir, logmmseq, loosest, threads)
+            run_with_progressbar(lambda args: run_mmseqs_search(args, mem_limit), args, quiet)
+        else:
+            logger.warning(f"mmseqs search {mmseqaln} already exists. It will be used to cluster "
+                           "proteins.")
+        for min_id, infoname, id_panfile in todo:
+            mmseqclust = os.path.join(tmpdir, prt_bank + "-clust-" + infoname)
+            for ext in ["", ".index", ".dbtype", ".tsv"]:
+                utils.remove(mmseqclust + ext)
+            logger.info(f"Clustering proteins at {min_id*100}% identity...")
+            args = (mmseqdb, mmseqaln, mmseqclust, tmpdir, logmmseq, min_id, threads, clust_mode)
+            run_with_progressbar(run_mmseqs_clust_from_aln, args, quiet)
+            families = mmseqs_to_pangenome(mmseqdb, mmseqclust, logmmseq, id_panfile, dupfile)
+            results[min_id] = (families, id_panfile)
+    return results
+
+
+def run_update_pangenome(old_families, reps, min_id, clust_mode, outdir, new_bank, reps_bank,
+                         threads, panfile=None, quiet=False, db_cache=None, engine="cluster",
+                         mem_limit=None):
+    """
+    Add the proteins of new genomes to an existing pangenome:
+
+    - search proteins of new genomes against representatives of existing families
+    - each protein with a hit is added to the family of its best hit
+    - cluster the other proteins, and add them as new families
+
+    Existing families keep their number, new families are numbered after them.
+
+    Parameters
+    ----------
+    old_families : dict
+        families of the existing pangenome {fam_num: [members]}
+    reps : dict
+        {representative: fam_num} for each existing family
+    min_id : float
+        minimum percentage of identity to be in the same family
+    clust_mode : [0, 1, 2]
+        0 for 'set cover', 1 for 'single-linkage', 2 for 'CD-Hit'
+    outdir : str
+        directory where output cluster file must be saved
+    new_bank : str
+        path to file containing all proteins of new genomes
+    reps_bank : str
+        path to file containing representatives of existing families
+    threads : int
+        number of threads which can be used
+    panfile : str or None
+        name for output pangenome file. Otherwise, will use default name
+    quiet : bool
+        True if nothing must be written on stdout, False otherwise.
+    db_cache : str or None
+        directory containing mmseqs databases shared between runs. None to use
+        <outdir>/mmseqs_db_cache
+    engine : str
+        clustering engine to use for proteins not assigned to an existing family,
+        in CLUST_ENGINES. Default is 'cluster'
+    mem_limit : str or None
+        value given to mmseqs '--split-memory-limit' (see get_split_memory_limit). None
+        to let mmseqs use all the memory of the machine
+
+    Returns
+    -------
+    (families, outfile) : tuple
+
+        - families : {fam_num: [all members]}
+        - outfile : pangenome filename
+    """
+    prt_bank = os.path.basename(new_bank)
+    logger.info("Will add new proteins to existing families with MMseqs2, with:\n"
+                f"\t- minimum sequence identity = {min_id*100}%\n"
+                f"\t- cluster mode {clust_mode} for new families")
+    infoname = get_info(threads, min_id, clust_mode, engine)
+    logmmseq = get_logmmseq(outdir, prt_bank, infoname)
+    tmpdir = os.path.join(outdir, "tmp_" + prt_bank + "_" + infoname)
+    os.makedirs(tmpdir, exist_ok=True)
+    if not panfile:
+        panfile = os.path.join(outdir, f"PanGenome-{prt_bank}-clust-{infoname}.lst")
+    else:
+        panfile = os.path.join(outdir, panfile)
+    mmseqaln = os.path.join(tmpdir, prt_bank + "-aln-reps")
+    with cached_mmseqs_db(new_bank, outdir, db_cache, logmmseq, quiet) as (newdb, _), \
+         cached_mmseqs_db(reps_bank, outdir, db_cache, logmmseq, quiet) as (repsdb, _):
+        logger.info("Searching new proteins against existing families...")
+        args = (newdb, repsdb, mmseqaln, tmpdir, logmmseq, min_id, threads)
+        run_with_progressbar(lambda args: run_mmseqs_best_hits(args, mem_limit), args, quiet)
+    assigned = {}  # {new protein: family number of its best hit}
+    with open(mmseqaln + "-best.tsv") as alnf:
+        for line in alnf:
+            query, target = line.split()[:2]
+            assigned[query] = reps[target]
+    logger.info(f"{len(assigned)} new proteins added to existing families.")
+    # Cluster proteins which are not in any existing family
+    unassigned = os.path.join(tmpdir, prt_bank + "-unassigned.prt")
+    with open(unassigned, "w") as unf:
+        for header, seq in protf.read_proteins(new_bank):
+            if header[1:].split()[0] not in assigned:
+                unf.write(header)
+                unf.writelines(seq)
+    families = {int(num): list(members) for num, members in old_families.items()}
+    for prot, num in assigned.items():
+        families[int(num)].append(prot)
+    if os.path.getsize(unassigned) > 0:
+        logger.info("Clustering new proteins which are not in existing families...")
+        infoclust = get_info(threads, min_id, clust_mode, engine)
+        mmseqclust = os.path.join(tmpdir, prt_bank + "-unassigned-clust-" + infoclust)
+        with cached_mmseqs_db(unassigned, outdir, db_cache, logmmseq, quiet) as (undb, _):
+            for ext in ["", ".index", ".dbtype", ".tsv"]:
+                utils.remove(mmseqclust + ext)
+            args = (undb, mmseqclust, tmpdir, logmmseq, min_id, threads, clust_mode)
+            run_with_progressbar(lambda args: run_mmseqs_clust(args, engine, mem_limit), args,
+                                 quiet)
+            cmd = f"mmseqs createtsv {undb} {undb} {mmseqclust} {mmseqclust}.tsv"
+            msg = "Problem while trying to convert mmseq result file to tsv file"
+            logger.details(f"MMseqs command: {cmd}")
+            run_mmseqs_cmd(cmd, msg, logmmseq)
+        new_clusters = mmseq_tsv_to_clusters(mmseqclust + ".tsv")
+        next_num = max(families) + 1
+        for members in new_clusters.values():
+            families[next_num] = members
+            next_num += 1
+        logger.info(f"{len(new_clusters)} new families created.")
+    families = families_to_file(families, panfile)
+    return families, panfile
+
+
+@contextlib.contextmanager
+def cached_mmseqs_db(prt_path, outdir, db_cache, logmmseq, quiet, prt_files=None):
+    """
+    Get the mmseqs database of the protein bank from the cache, creating it if not already
+    done, and keep it locked while it is used.
+
+    mmseqs database only depends on the protein bank content: it is stored in the cache,
+    in a folder named after the bank checksum, so that all runs on this bank share it.
+    The folder is locked (exclusive lock, see lock_db_entry) before being created, and while
+    the database is created: concurrent runs on the same bank wait for it, and then find it
+    complete. Then, a shared lock is kept until the end of the 'with' block, so that the
+    database cannot be removed from the cache while it is used.
+
+    Parameters
+    ----------
+    prt_path : str
+        path to the file containing all proteins to cluster
+    outdir : str
+        output directory of pangenome
+    db_cache : str or None
+        directory containing mmseqs databases shared between runs. None to use
+        <outdir>/mmseqs_db_cache
+    logmmseq : str
+         path to file where logs must be written
+    quiet : bool
+        True if no output in stderr/stdout, False otherwise
+    prt_files : list or None
+        per-genome protein files, in the order of prt_path, from which the database must be
+        built directly, without reading prt_path. Once created, the database is checked to
+        contain proteins of all these genomes (see check_db_genomes).
+
+    Yields
+    ------
+    (mmseqdb, just_done) : tuple
+
+        - mmseqdb : path to base filename of the mmseqs database
+        - just_done : True if mmseqs db just created, False if already existed
+    """
+    prt_bank = os.path.basename(prt_path)
+    db_cache = get_db_cache(outdir, db_cache)
+    prt_input = prt_files or prt_path
+    checksum = bank_checksum(prt_input, db_cache)
+    dbdir = os.path.join(db_cache, checksum)
+    mmseqdb = os.path.join(dbdir, prt_bank + "-msDB")
+    with lock_db_entry(db_cache, checksum) as lockf:
+        os.makedirs(dbdir, exist_ok=True)
+        just_done = do_mmseqs_db(mmseqdb, prt_input, logmmseq, quiet)
+        if just_done and prt_files:
+            genomes = [os.path.splitext(os.path.basename(file))[0] for file in prt_files]
+            if not check_db_genomes(mmseqdb, genomes):
+                for ext in DB_EXTS:
+                    utils.remove(mmseqdb + ext)
+                sys.exit(1)
+        fcntl.flock(lockf, fcntl.LOCK_SH)
+        yield mmseqdb, just_done
+
+
+@contextlib.contextmanager
+def lock_db_entry(db_cache, checksum, blocking=True):
+    """
+    Take an exclusive lock on a database of the cache, until the end of the 'with' block.
+
+    The lock is taken on <checksum>.lock, next to the database folder, so that it can be
+    taken before the folder is created, and kept while the folder is removed. As the lock
+    file is removed with the folder, the lock is taken again if the file was removed while
+    waiting for it.
+
+    Parameters
+    ----------
+    db_cache : str
+        directory containing the mmseqs databases
+    checksum : str
+        checksum of the protein bank, naming its database folder
+    blocking : bool
+        True to wait for the lock if another run has it, False to give up
+
+    Yields
+    ------
+    file or None
+        the lock file, locked, or None if not blocking and another run has the lock
+    """
+    lockpath = os.path.join(db_cache, checksum + ".lock")
+    while True:
+        lockf = open(lockpath, "a")
+        try:
+            fcntl.flock(lockf, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lockf.close()
+            lockf = None
+            break
+        try:
+            if os.stat(lockpath).st_ino == os.fstat(lockf.fileno()).st_ino:
+                break
+        except FileNotFoundError:
+            pass
+        lockf.close()
+    try:
+        yield lockf
+    finally:
+        if lockf:
+            lockf.close()
+
+
+def get_db_cache(outdir, db_cache=None):
+    """
+    Get directory containing the mmseqs databases, and create it if it does not exist
+
+    Parameters
+    ----------
+    outdir : str
+        output directory of pangenome
+    db_cache : str or None
+        directory given by user to share mmseqs databases between runs. None to use
+        the default one, <outdir>/mmseqs_db_cache
+
+    Returns
+    -------
+    str
+        path to the mmseqs database cache directory
+    """
+    if not db_cache:
+        db_cache = os.path.join(outdir, "mmseqs_db_cache")
+    os.makedirs(db_cache, exist_ok=True)
+    return db_cache
+
+
+def bank_checksum(prt_path, db_cache=None):
+    """
+    Get checksum of the protein bank content. It identifies the mmseqs database of this
+    bank in the cache, whatever its name and the parameters used to cluster it.
+
+    The checksum of each file is saved in the cache with its size and modification time:
+    a file is read again only if one of them changed since its checksum was computed.
+
+    Parameters
+    ----------
+    prt_path : str or list
+        path to the file containing all proteins to cluster, or list of per-genome protein
+        files
+    db_cache : str or None
+        directory containing the mmseqs databases, where checksums of files are saved.
+        None to always read all files.
+
+    Returns
+    -------
+    str
+        md5 hexadecimal digest of the protein bank: md5 of the file, or, for a list of files,
+        md5 of their md5s
+    """
+    if isinstance(prt_path, str):
+        prt_path = [prt_path]
+    known = read_checksums(db_cache) if db_cache else {}
+    digests = []
+    changed = False
+    for file in prt_path:
+        stat = os.stat(file)
+        signature = [stat.st_size, stat.st_mtime_ns]
+        key = os.path.abspath(file)
+        if known.get(key, [])[:2] != signature:
+            known[key] = signature + [file_md5(file)]
+            changed = True
+        digests.append(known[key][2])
+    if db_cache and changed:
+        write_checksums(db_cache, known)
+    if len(digests) == 1:
+        return digests[0]
+    return hashlib.md5("\n".join(digests).encode()).hexdigest()
+
+
+def file_md5(file):
+    """
+    Get checksum of a file content
+
+    Parameters
+    ----------
+    file : str
+        path to the file
+
+    Returns
+    -------
+    str
+        md5 hexadecimal digest of the file
+    """
+    md5 = hashlib.md5()
+    with open(file, "rb") as inf:
+        for chunk in iter(lambda: inf.read(1024 * 1024), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def read_checksums(db_cache):
+    """
+    Read checksums of protein files saved in the cache
+
+    Parameters
+    ----------
+    db_cache : str
+        directory containing the mmseqs databases
+
+    Returns
+    -------
+    dict
+        {absolute path of file: [size, modification time (ns), md5]}
+    """
+    try:
+        with open(os.path.join(db_cache, CHECKSUMS_FILE)) as chkf:
+            return json.load(chkf)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_checksums(db_cache, checksums):
+    """
+    Save checksums of protein files in the cache. The file is replaced at once, so that
+    concurrent runs always read a complete file.
+
+    Parameters
+    ----------
+    db_cache : str
+        directory containing the mmseqs databases
+    checksums : dict
+        {absolute path of file: [size, modification time (ns), md5]}
+    """
+    chkfile = os.path.join(db_cache, CHECKSUMS_FILE)
+    tmpfile = f"{chkfile}.{os.getpid()}.tmp"
+    with open(tmpfile, "w") as chkf:
+        json.dump(checksums, chkf)
+    os.replace(tmpfile, chkfile)
+
+
+def clean_db_cache(db_cache, keep=None):
+    """
+    Remove mmseqs databases from the cache. Databases currently used by another run
+    (locked) are kept.
+
+    Parameters
+    ----------
+    db_cache : str
+        directory containing the mmseqs databases
+    keep : list or None
+        checksums of the databases which must not be removed
+
+    Returns
+    -------
+    list
+        checksums of all databases removed
+    """
+    keep = keep or []
+    removed = []
+    if not os.path.isdir(db_cache):
+        return removed
+    for checksum in sorted(os.listdir(db_cache)):
+        dbdir = os.path.join(db_cache, checksum)
+        if checksum in keep or not os.path.isdir(dbdir):
+            continue
+        with lock_db_entry(db_cache, checksum, blocking=False) as lockf:
+            if not lockf:
+                logger.warning(f"mmseqs database {dbdir} is currently used by another run. "
+                               "It will not be removed.")
+                continue
+            shutil.rmtree(dbdir)
+            os.remove(lockf.name)
+        logger.details(f"Removing mmseqs database '{dbdir}'.")
+        removed.append(checksum)
+    return removed
+
+
+def get_info(threads, min_id, clust_mode, engine="cluster"):
     """
     Get string containing all information on future run
 
@@ -137,6 +676,9 @@ def get_info(threads, min_id, clust_mode):
         min percentage of identity to consider 2 proteins in hte same family
     clust_mode : [0, 1, 2]
         0 for 'set cover', 1 for 'single-linkage', 2 for 'CD-Hit'
+    engine : str
+        clustering engine used. Only added to the string if it is not the default one,
+        'cluster'
 
     Returns
     -------
@@ -147,7 +689,11 @@ def get_info(threads, min_id, clust_mode):
         threadinfo = "-th" + str(threads)
     else:
         threadinfo = ""
-    infoname = str(min_id) + "-mode" + str(clust_mode) + threadinfo
+    if engine != "cluster":
+        engineinfo = "-" + engine
+    else:
+        engineinfo = ""
+    infoname = str(min_id) + "-mode" + str(clust_mode) + engineinfo + threadinfo
     return infoname
 
 
@@ -184,8 +730,9 @@ def do_mmseqs_db(mmseqdb, prt_path, logmmseq, quiet):
     ----------
     mmseqdb : str
          path to base filename for output of mmseqs createdb
-    prt_path : str
-        path to the file containing all proteins to cluster
+    prt_path : str or list
+        path to the file containing all proteins to cluster, or list of files to concatenate
+        into the database
     logmmseq : str
          path to file where logs must be written
     quiet : bool
@@ -222,7 +769,8 @@ def do_mmseqs_db(mmseqdb, prt_path, logmmseq, quiet):
 
 
 def do_pangenome(outdir, prt_bank, mmseqdb, mmseqclust, tmpdir, logmmseq, min_id, clust_mode, 
-                just_done, threads, panfile, quiet=False):
+                just_done, threads, panfile, quiet=False, engine="cluster", dupfile=None,
+                mem_limit=None):
     """
     Use mmseqs to cluster proteins
 
@@ -253,6 +801,14 @@ def do_pangenome(outdir, prt_bank, mmseqdb, mmseqclust, tmpdir, logmmseq, min_id
         if a pangenome file is specified. Otherwise, default pangenome name will be used
     quiet : bool
         true if nothing must be print on stdout/stderr, false otherwise (show progress bar)
+    engine : str
+        clustering engine to use, in CLUST_ENGINES. Default is 'cluster'
+    dupfile : str or None
+        file mapping proteins which were not clustered to their representative (same
+        sequence) if the protein bank was deduplicated, None otherwise
+    mem_limit : str or None
+        value given to mmseqs '--split-memory-limit'. None to let mmseqs use all the memory
+        of the machine
 
     Returns
     -------
@@ -292,7 +848,7 @@ def do_pangenome(outdir, prt_bank, mmseqdb, mmseqclust, tmpdir, logmmseq, min_id
             x = threading.Thread(target=utils.thread_progressbar, args=(widgets, lambda : stop_bar,))
             x.start()
             args = (mmseqdb, mmseqclust, tmpdir, logmmseq, min_id, threads, clust_mode)
-            run_mmseqs_clust(args)
+            run_mmseqs_clust(args, engine, mem_limit)
         # except KeyboardInterrupt: # pragma: no cover
         except: # pragma: no cover
             stop_bar = True
@@ -304,11 +860,11 @@ def do_pangenome(outdir, prt_bank, mmseqdb, mmseqclust, tmpdir, logmmseq, min_id
     # Convert output to tsv file (one line per comparison done)
     #  # Convert output to tsv file (one line per comparison done)
     # -> returns (families, outfile)
-    families = mmseqs_to_pangenome(mmseqdb, mmseqclust, logmmseq, panfile)
+    families = mmseqs_to_pangenome(mmseqdb, mmseqclust, logmmseq, panfile, dupfile)
     return families, panfile
 
 
-def run_mmseqs_clust(args):
+def run_mmseqs_clust(args, engine="cluster", mem_limit=None):
     """
     Run mmseqs clustering
 
@@ -325,18 +881,442 @@ def run_mmseqs_clust(args):
             *         (between 0 and 1)
             * threads : max number of threads to use
             * clust_mode : [0, 1, 2], 0 for 'set cover', 1 for 'single-linkage', 2 for 'CD-Hit'
+    engine : str
+        clustering engine to use, in CLUST_ENGINES. Default is 'cluster'
+    mem_limit : str or None
+        value given to mmseqs '--split-memory-limit'. None to let mmseqs use all the memory
+        of the machine
 
     """
     mmseqdb, mmseqclust, tmpdir, logmmseq, min_id, threads, clust_mode = args
-    cmd = (f"mmseqs cluster {mmseqdb} {mmseqclust} {tmpdir} --min-seq-id {min_id} --threads {threads} --cluster-mode "
-           f"{clust_mode}")
-    logger.details(f"MMseqs command: {cmd}")
+    params = (f"--min-seq-id {min_id} --threads {threads} --cluster-mode {clust_mode}"
+              f"{mem_option(mem_limit)}")
+    if engine == "cluster":
+        cmds = [f"mmseqs cluster {mmseqdb} {mmseqclust} {tmpdir} {params}"]
+    elif engine == "linclust":
+        cmds = [f"mmseqs linclust {mmseqdb} {mmseqclust} {tmpdir} {params}"]
+    elif engine == "cascade":
+        # linclust on all proteins, then cluster the representatives of linclust clusters,
+        # and merge both steps to get clusters of all proteins, in the same format as
+        # the other engines
+        linclust = mmseqclust + "-linclust"
+        reprs = mmseqclust + "-linclust-rep"
+        reprclust = mmseqclust + "-rep-clust"
+        cmds = [f"mmseqs linclust {mmseqdb} {linclust} {tmpdir} {params}",
+                f"mmseqs createsubdb {linclust} {mmseqdb} {reprs}",
+                f"mmseqs cluster {reprs} {reprclust} {tmpdir} {params}",
+                (f"mmseqs mergeclusters {mmseqdb} {mmseqclust} {linclust} {reprclust} "
+                 f"--threads {threads}")]
+    else:
+        logger.error(f"Unknown clustering engine '{engine}'. Choose among {CLUST_ENGINES}.")
+        sys.exit(1)
     msg = f"Problem while clustering proteins with mmseqs. See log in {logmmseq}"
-    with open(logmmseq, "a") as logm:
-        utils.run_cmd(cmd, msg, eof=False, stdout=logm, stderr=logm)
+    for cmd in cmds:
+        logger.details(f"MMseqs command: {cmd}")
+        retcode = run_mmseqs_cmd(cmd, msg, logmmseq, eof=False, tmpdir=tmpdir)
+        # Next steps need the output of this one: do not run them if it failed
+        if retcode != 0:
+            break
+
+
+def run_mmseqs_search(args, mem_limit=None):
+    """
+    Compare all proteins against all proteins with mmseqs (prefilter + alignment), keeping
+    alignments with at least the given identity. Alignment parameters are the ones used
+    by 'mmseqs cluster'.
+
+    Parameters
+    ----------
+    args : tuple
+         (mmseqdb, mmseqaln, tmpdir, logmmseq, min_id, threads), with:
+
+            * mmseqdb: path to base filename (output created by mmseq db)
+            * mmseqaln: path to base filename for output of mmseq alignment
+            * tmpdir : path to folder which will contain mmseq temporary files
+            * logmmseq : path to file where logs must be written
+            * min_id : min percentage of identity to keep an alignment (between 0 and 1)
+            * threads : max number of threads to use
+    mem_limit : str or None
+        value given to mmseqs '--split-memory-limit'. None to let mmseqs use all the memory
+        of the machine
+
+    """
+    mmseqdb, mmseqaln, tmpdir, logmmseq, min_id, threads = args
+    mmseqpref = mmseqaln + "-pref"
+    cmds = [(f"mmseqs prefilter {mmseqdb} {mmseqdb} {mmseqpref} --threads {threads}"
+             f"{mem_option(mem_limit)}"),
+            (f"mmseqs align {mmseqdb} {mmseqdb} {mmseqpref} {mmseqaln} --min-seq-id {min_id} "
+             f"-c 0.8 --alignment-mode 3 --threads {threads}")]
+    msg = f"Problem while comparing proteins with mmseqs. See log in {logmmseq}"
+    for cmd in cmds:
+        logger.details(f"MMseqs command: {cmd}")
+        run_mmseqs_cmd(cmd, msg, logmmseq, tmpdir=tmpdir)
+
+
+def run_mmseqs_best_hits(args, mem_limit=None):
+    """
+    Search proteins against a target database with mmseqs, and write the best hit of each
+    protein having a hit with at least the given identity to <mmseqaln>-best.tsv
+    (columns: query, target). Alignment parameters are the ones used by 'mmseqs cluster'.
+
+    Parameters
+    ----------
+    args : tuple
+         (querydb, targetdb, mmseqaln, tmpdir, logmmseq, min_id, threads), with:
+
+            * querydb: path to base filename of mmseqs database of proteins to search
+            * targetdb: path to base filename of mmseqs database in which to search them
+            * mmseqaln: path to base filename for output of mmseq search
+            * tmpdir : path to folder which will contain mmseq temporary files
+            * logmmseq : path to file where logs must be written
+            * min_id : min percentage of identity to keep a hit (between 0 and 1)
+            * threads : max number of threads to use
+    mem_limit : str or None
+        value given to mmseqs '--split-memory-limit'. None to let mmseqs use all the memory
+        of the machine
+
+    """
+    querydb, targetdb, mmseqaln, tmpdir, logmmseq, min_id, threads = args
+    best = mmseqaln + "-best"
+    for ext in ["", ".index", ".dbtype"]:
+        utils.remove(mmseqaln + ext)
+        utils.remove(best + ext)
+    cmds = [(f"mmseqs search {querydb} {targetdb} {mmseqaln} {tmpdir} --min-seq-id {min_id} "
+             f"-c 0.8 --alignment-mode 3 --threads {threads}{mem_option(mem_limit)}"),
+            # Hits are sorted by decreasing score: keep the first one of each query
+            f"mmseqs filterdb {mmseqaln} {best} --extract-lines 1 --threads {threads}",
+            (f"mmseqs convertalis {querydb} {targetdb} {best} {best}.tsv "
+             f"--format-output query,target --threads {threads}")]
+    msg = f"Problem while searching proteins with mmseqs. See log in {logmmseq}"
+    for cmd in cmds:
+        logger.details(f"MMseqs command: {cmd}")
+        run_mmseqs_cmd(cmd, msg, logmmseq, tmpdir=tmpdir)
+
+
+def run_mmseqs_clust_from_aln(args):
+    """
+    Run mmseqs clustering from alignments already computed, keeping only the ones
+    with at least the given identity
+
+    Parameters
+    ----------
+    args : tuple
+         (mmseqdb, mmseqaln, mmseqclust, tmpdir, logmmseq, min_id, threads, clust_mode), with:
+
+            * mmseqdb: path to base filename (output created by mmseq db)
+            * mmseqaln: path to base filename of mmseq alignment (run_mmseqs_search output)
+            * mmseqclust: path to base filename for output of mmseq clustering
+            * tmpdir : path to folder which will contain mmseq temporary files
+            * logmmseq : path to file where logs must be written
+            * min_id : min percentage of identity to be considered in the same family
+            *         (between 0 and 1)
+            * threads : max number of threads to use
+            * clust_mode : [0, 1, 2], 0 for 'set cover', 1 for 'single-linkage', 2 for 'CD-Hit'
+
+    """
+    mmseqdb, mmseqaln, mmseqclust, tmpdir, logmmseq, min_id, threads, clust_mode = args
+    mmseqfilt = os.path.join(tmpdir, os.path.basename(mmseqaln) + f"-filt-{min_id}")
+    # 3rd column of alignment results is the sequence identity
+    cmds = [(f"mmseqs filterdb {mmseqaln} {mmseqfilt} --filter-column 3 "
+             f"--comparison-operator ge --comparison-value {min_id} --threads {threads}"),
+            (f"mmseqs clust {mmseqdb} {mmseqfilt} {mmseqclust} --cluster-mode {clust_mode} "
+             f"--threads {threads}")]
+    msg = f"Problem while clustering proteins with mmseqs. See log in {logmmseq}"
+    for cmd in cmds:
+        logger.details(f"MMseqs command: {cmd}")
+        run_mmseqs_cmd(cmd, msg, logmmseq, tmpdir=tmpdir)
+
+
+def get_split_memory_limit(max_memory=None):
+    """
+    Get the memory that mmseqs can use, given to its '--split-memory-limit' option: mmseqs
+    then splits its databases into chunks fitting in this memory, instead of swapping or
+    being killed.
+
+    Parameters
+    ----------
+    max_memory : str or None
+        memory given by the user, with mmseqs format (for example '20G' or '500M'). '0' to
+        let mmseqs use all the memory of the machine. None to give MEM_FRACTION of the memory
+        available (see utils.get_available_memory)
+
+    Returns
+    -------
+    str or None
+        value for '--split-memory-limit', None if this option must not be used
+    """
+    if max_memory:
+        if max_memory == "0":
+            return None
+        return max_memory
+    available = utils.get_available_memory()
+    if not available:
+        logger.warning("Could not find the memory available. mmseqs will use all the memory "
+                       "of the machine.")
+        return None
+    return f"{int(available * MEM_FRACTION) // (1024 * 1024)}M"
+
+
+def mem_option(mem_limit):
+    """
+    Get mmseqs option to limit its memory
+
+    Parameters
+    ----------
+    mem_limit : str or None
+        value for '--split-memory-limit', None if no limit
+
+    Returns
+    -------
+    str
+        option to add at the end of mmseqs command, empty string if no limit
+    """
+    if not mem_limit:
+        return ""
+    return f" --split-memory-limit {mem_limit}"
+
+
+def get_resource_file(logmmseq):
+    """
+    Get filename of the resource report corresponding to the given mmseqs log file
+
+    Parameters
+    ----------
+    logmmseq : str
+        path to mmseqs log file
+
+    Returns
+    -------
+    str
+        path to json resource report, next to the log file
+    """
+    return os.path.splitext(logmmseq)[0] + ".json"
+
+
+def run_mmseqs_cmd(cmd, msg, logmmseq, eof=True, mode="a", tmpdir=None):
+    """
+    Run a mmseqs command, writing its output to logmmseq, and add the resources it used
+    to the resource report of this log file (see get_resource_file):
+
+    - wall time of the command, and processing time of each mmseqs module it ran (read
+      from the mmseqs log)
+    - peak resident memory of the command
+    - peak disk space used by the temporary directory, if any
+
+    Parameters
+    ----------
+    cmd : str
+        mmseqs command to run
+    msg : str
+        error message to write if the command fails
+    logmmseq : str
+        path to file where mmseqs logs must be written
+    eof : bool
+        True to exit the program if the command fails
+    mode : str
+        'a' to append the logs to logmmseq, 'w' to start a new log file (and a new
+        resource report)
+    tmpdir : str or None
+        temporary directory used by mmseqs, whose disk usage must be reported
+
+    Returns
+    -------
+    int
+        return code of the command (1 if it could not be run)
+    """
+    resfile = get_resource_file(logmmseq)
+    if mode == "w":
+        utils.remove(resfile)
+    stop = threading.Event()
+    disk = [0]
+    if tmpdir:
+        watcher = threading.Thread(target=watch_dir_size, args=(tmpdir, stop, disk))
+        watcher.start()
+    start = time.time()
+    with open(logmmseq, mode) as logm:
+        offset = logm.tell()
+        try:
+            call = subprocess.Popen(shlex.split(cmd), stdout=logm, stderr=logm)
+            # wait4 gives the resources used by this command only
+            _, status, usage = os.wait4(call.pid, 0)
+            if os.WIFSIGNALED(status):
+                retcode = -os.WTERMSIG(status)
+            else:
+                retcode = os.WEXITSTATUS(status)
+            call.returncode = retcode
+        except OSError:
+            retcode = None
+    wall_time = time.time() - start
+    stop.set()
+    if tmpdir:
+        watcher.join()
+        disk[0] = max(disk[0], dir_size(tmpdir))
+    if retcode is None:
+        logger.error(f"error: command '>{cmd}' is not possible.")
+        if eof:
+            sys.exit(1)
+        return 1
+    with open(logmmseq) as logm:
+        logm.seek(offset)
+        steps = parse_mmseqs_log(logm)
+    record = {"subcommand": cmd.split()[1],
+              "command": cmd if len(cmd) <= 1000 else cmd[:1000] + "...",
+              "start": time.strftime('%Y-%m-%d_%H-%M-%S', time.localtime(start)),
+              "wall_time_s": round(wall_time, 3),
+              # ru_maxrss is in kilobytes on Linux
+              "peak_rss_kb": usage.ru_maxrss,
+              "tmp_disk_usage_bytes": disk[0] if tmpdir else None,
+              "returncode": retcode,
+              "steps": steps}
+    add_resource_record(resfile, record)
+    if retcode != 0:
+        logger.error(msg)
+        if eof:
+            sys.exit(retcode)
+    return retcode
+
+
+def parse_mmseqs_log(logm):
+    """
+    Get processing time of each mmseqs module from mmseqs log. Each module writes its
+    command line ('<module> <arguments>'), and then 'Time for processing: XhYmZs Nms'
+    when it ends.
+
+    Parameters
+    ----------
+    logm : file
+        open mmseqs log
+
+    Returns
+    -------
+    list
+        [{"module": <module name>, "time_s": <processing time in seconds>}], in the order
+        of the log
+    """
+    time_re = re.compile(r"Time for processing: (\d+)h (\d+)m (\d+)s (\d+)ms")
+    steps = []
+    module = None
+    for line in logm:
+        words = line.split()
+        if len(words) > 1 and words[0] in MMSEQS_MODULES:
+            module = words[0]
+            continue
+        found = time_re.search(line)
+        if found:
+            hours, mins, secs, msecs = (int(val) for val in found.groups())
+            steps.append({"module": module,
+                          "time_s": hours * 3600 + mins * 60 + secs + msecs / 1000})
+    return steps
+
+
+def add_resource_record(resfile, record):
+    """
+    Add a record to the json resource report
+
+    Parameters
+    ----------
+    resfile : str
+        path to json file, containing the list of all records
+    record : dict
+        resources used by 1 mmseqs command
+    """
+    records = []
+    if os.path.isfile(resfile):
+        try:
+            with open(resfile) as resf:
+                records = json.load(resf)
+        except ValueError:
+            logger.warning(f"Resource report {resfile} is not a valid json file. It will be "
+                           "overwritten.")
+    records.append(record)
+    with open(resfile, "w") as resf:
+        json.dump(records, resf, indent=2)
+
+
+def dir_size(path):
+    """
+    Get disk space used by all files in the given directory
+
+    Parameters
+    ----------
+    path : str
+        directory
+
+    Returns
+    -------
+    int
+        size of all files in path and its subdirectories, in bytes
+    """
+    total = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                total += os.path.getsize(os.path.join(root, file))
+            except OSError:
+                # file removed by mmseqs in the meantime
+                continue
+    return total
+
+
+def watch_dir_size(path, stop, peak):
+    """
+    Measure disk space used by the given directory every DISK_POLL seconds, until stop is set,
+    and keep the maximum.
+
+    Parameters
+    ----------
+    path : str
+        directory to watch
+    stop : threading.Event
+        set when the watch must stop
+    peak : list
+        list with 1 element, updated with the maximum disk space used, in bytes
+    """
+    while not stop.wait(DISK_POLL):
+        peak[0] = max(peak[0], dir_size(path))
+
+
+def run_with_progressbar(target, args, quiet):
+    """
+    Run target(args) with an "infinite progress bar" in the background.
 
+    Parameters
+    ----------
+    target : function
+        function to run, taking a tuple of arguments
+    args : tuple
+        arguments given to target
+    quiet : bool
+        True if no output in stderr/stdout, False otherwise (show progress bar)
 
-def mmseqs_to_pangenome(mmseqdb, mmseqclust, logmmseq, outfile):
+    Returns
+    -------
+    Object
+        what target returns
+    """
+    try:
+        stop_bar = False
+        if quiet:
+            widgets = []
+        # If not quiet, start a progress bar. We cannot guess how many time it will take,
+        # so we start an "infinite" bar, and send it a signal when it has to stop.
+        # If quiet, we start a thread that will immediatly stop
+        else:
+            widgets = [progressbar.BouncingBar(marker=progressbar.RotatingMarker(markers="◐◓◑◒")),
+                       "  -  ", progressbar.Timer()]
+        x = threading.Thread(target=utils.thread_progressbar, args=(widgets, lambda : stop_bar,))
+        x.start()
+        res = target(args)
+    except: # pragma: no cover
+        stop_bar = True
+        x.join()
+        sys.exit(1)
+    stop_bar = True
+    x.join()
+    return res
+
+
+def mmseqs_to_pangenome(mmseqdb, mmseqclust, logmmseq, outfile, dupfile=None):
     """
     Convert mmseqs clustering to a pangenome file:
 
@@ -353,6 +1333,9 @@ def mmseqs_to_pangenome(mmseqdb, mmseqclust, logmmseq, outfile):
          path to file where logs must be written
     outfile : str
         pangenome filename
+    dupfile : str or None
+        file mapping proteins which were not clustered to their representative (same
+        sequence) if the protein bank was deduplicated, None otherwise
 
     Returns
     -------
@@ -362,14 +1345,13 @@ def mmseqs_to_pangenome(mmseqdb, mmseqclust, logmmseq, outfile):
     cmd = f"mmseqs createtsv {mmseqdb} {mmseqdb} {mmseqclust} {mmseqclust}.tsv"
     msg = "Problem while trying to convert mmseq result file to tsv file"
     logger.details(f"MMseqs command: {cmd}")
-    with open(logmmseq, "a") as logf:
-        utils.run_cmd(cmd, msg, eof=True, stdout=logf, stderr=logf)
+    run_mmseqs_cmd(cmd, msg, logmmseq)
     # Convert the tsv file to a 'pangenome' file: one line per family
-    families = mmseqs_tsv_to_pangenome(mmseqclust, logmmseq, outfile)
+    families = mmseqs_tsv_to_pangenome(mmseqclust, logmmseq, outfile, dupfile)
     return families
 
 
-def mmseqs_tsv_to_pangenome(mmseqclust, logmmseq, outfile):
+def mmseqs_tsv_to_pangenome(mmseqclust, logmmseq, outfile, dupfile=None):
     """
     Convert the tsv output file of mmseqs to the pangenome file
 
@@ -381,6 +1363,9 @@ def mmseqs_tsv_to_pangenome(mmseqclust, logmmseq, outfile):
         path to file where logs must be written
     outfile : str
         pangenome filename, or None if default one must be used
+    dupfile : str or None
+        file mapping proteins which were not clustered to their representative (same
+        sequence) if the protein bank was deduplicated, None otherwise
 
     Returns
     -------
@@ -391,6 +1376,8 @@ def mmseqs_tsv_to_pangenome(mmseqclust, logmmseq, outfile):
     logger.info("Converting mmseqs results to pangenome file")
     tsvfile = mmseqclust + ".tsv"
     clusters = mmseq_tsv_to_clusters(tsvfile)
+    if dupfile:
+        expand_clusters(clusters, dupfile)
     families = clusters_to_file(clusters, outfile)
     end = time.strftime('%Y-%m-%d_%H-%M-%S')
     with open(logmmseq, "a") as logm:
@@ -425,6 +1412,28 @@ def mmseq_tsv_to_clusters(mmseq):
     return clusters
 
 
+def expand_clusters(clusters, dupfile):
+    """
+    Add, to each cluster, the proteins having the same sequence as one of its members, and
+    which were not clustered because the protein bank was deduplicated.
+
+    Parameters
+    ----------
+    clusters : dict
+        {representative_of_cluster: [list of members]}, modified in place
+    dupfile : str
+        file with 1 line per protein removed from the bank: '<representative>\t<protein>',
+        representative being the protein with the same sequence kept in the bank
+    """
+    duplicates = {}  # {representative: [proteins with the same sequence]}
+    with open(dupfile) as dupf:
+        for line in dupf:
+            repres, other = line.split()
+            duplicates.setdefault(repres, []).append(other)
+    for members in clusters.values():
+        members.extend([dup for mem in members for dup in duplicates.get(mem, [])])
+
+
 def clusters_to_file(clust, fileout):
     """
     Write all clusters to a file
@@ -453,17 +1462,45 @@ def clusters_to_file(clust, fileout):
     return families
 
 
+def families_to_file(families, fileout):
+    """
+    Write families to a pangenome file, keeping their number
+
+    Parameters
+    ----------
+    families : dict
+        {famnum: [members]}, famnum being int
+    fileout : str
+        filename of pangenome where families must be written
+
+    Returns
+    -------
+    dict
+        families : {famnum: [members]}, with members sorted
+    """
+    sorted_fams = {}
+    with open(fileout, "w") as fout:
+        for num in sorted(families):
+            sorted_fams[num] = sorted(families[num], key=utils.sort_proteins)
+            fout.write(f"{num} {' '.join(sorted_fams[num])}\n")
+    return sorted_fams
+
+
 def create_mmseqs_db(mmseqdb, prt_path, logmmseq):
     """
     Create ffindex of protein bank (prt_path) if not already done. If done, just write a message
     to tell the user that the current existing file will be used.
 
+    If prt_path is a list of files, they are all given to mmseqs createdb, which concatenates
+    them in the database. If the command line would be too long for the system, they are
+    streamed to mmseqs through a named pipe instead (see stream_to_fifo).
+
     Parameters
     ----------
     mmseqdb : str
          path to base filename for output of mmseqs createdb
-    prt_path : str
-        path to the file containing all proteins to cluster
+    prt_path : str or list
+        path to the file containing all proteins to cluster, or list of protein files
     logmmseq : str
          path to file where logs must be written
 
@@ -473,7 +1510,7 @@ def create_mmseqs_db(mmseqdb, prt_path, logmmseq):
     bool
         True if mmseqs db just created, False if already existed
     """
-    outext = ["", ".index", ".dbtype", ".lookup", "_h", "_h.index", "_h.dbtype"]
+    outext = DB_EXTS
     files_existing = []
     if os.path.isfile(mmseqdb):
         for file in [mmseqdb + ext for ext in outext]:
@@ -496,10 +1533,100 @@ def create_mmseqs_db(mmseqdb, prt_path, logmmseq):
             return False
     logger.debug("Existing files: {}".format(len(files_existing)))
     logger.debug("Expected extensions: {}".format(len(outext)))
-    cmd = f"mmseqs createdb {prt_path} {mmseqdb}"
-    msg = (f"Problem while trying to convert database {prt_path} to mmseqs "
+    if isinstance(prt_path, str):
+        cmd = f"mmseqs createdb {prt_path} {mmseqdb}"
+        msg = (f"Problem while trying to convert database {prt_path} to mmseqs "
+               "database format.")
+        logger.details(f"MMseqs command: {cmd}")
+        run_mmseqs_cmd(cmd, msg, logmmseq, mode="w")
+        return True
+    msg = (f"Problem while trying to convert the {len(prt_path)} protein files to mmseqs "
            "database format.")
-    logger.details(f"MMseqs command: {cmd}")
-    with open(logmmseq, "w") as logf:
-        utils.run_cmd(cmd, msg, eof=True, stdout=logf, stderr=logf)
+    cmd = f"mmseqs createdb {' '.join(prt_path)} {mmseqdb}"
+    # Keep a margin for the environment, which shares the same system limit
+    if len(cmd) < os.sysconf("SC_ARG_MAX") // 2:
+        logger.details(f"MMseqs command: mmseqs createdb <{len(prt_path)} protein files> "
+                       f"{mmseqdb}")
+        run_mmseqs_cmd(cmd, msg, logmmseq, mode="w")
+        return True
+    fifo = mmseqdb + ".fifo"
+    utils.remove(fifo)
+    os.mkfifo(fifo)
+    cmd = f"mmseqs createdb {fifo} {mmseqdb}"
+    logger.details(f"MMseqs command: {cmd} (streaming {len(prt_path)} protein files)")
+    writer = threading.Thread(target=stream_to_fifo, args=(prt_path, fifo))
+    writer.start()
+    retcode = run_mmseqs_cmd(cmd, msg, logmmseq, eof=False, mode="w")
+    if writer.is_alive():
+        # mmseqs stopped before reading all proteins: unblock writer
+        with open(fifo, "rb") as fifof:
+            fifof.read()
+    writer.join()
+    os.remove(fifo)
+    if retcode != 0:
+        sys.exit(1)
+    return True
+
+
+def stream_to_fifo(list_files, fifo):
+    """
+    Write all given files, one after the other, to the named pipe fifo.
+
+    Parameters
+    ----------
+    list_files : list
+        list of files to write
+    fifo : str
+        path to the named pipe
+    """
+    try:
+        with open(fifo, "wb") as outf:
+            for file in list_files:
+                with open(file, "rb") as inf:
+                    shutil.copyfileobj(inf, outf)
+    except BrokenPipeError:  # pragma: no cover
+        # Reader stopped: it reports the error itself
+        pass
+
+
+def check_db_genomes(mmseqdb, genomes):
+    """
+    Check that the mmseqs database contains proteins of all given genomes, in the same order,
+    and no other protein. Protein names are read from the database lookup file, and must start
+    with the name of their genome, followed by '.' or '_'.
+
+    Parameters
+    ----------
+    mmseqdb : str
+        path to base filename of the mmseqs database
+    genomes : list
+        genomes expected in the database, in the order of their protein files
+
+    Returns
+    -------
+    bool
+        True if the database contains proteins of all genomes, False otherwise
+    """
+    nb_prots = [0] * len(genomes)
+    cur = 0
+    with open(mmseqdb + ".lookup") as lookf:
+        for line in lookf:
+            name = line.split("\t")[1].strip()
+            # Proteins of a genome are all consecutive: go to next genome if needed
+            while cur < len(genomes) and not name.startswith((genomes[cur] + ".",
+                                                               genomes[cur] + "_")):
+                cur += 1
+            if cur == len(genomes):
+                logger.error(f"Protein {name} of mmseqs database {mmseqdb} does not belong to "
+                             "any genome of the list, or is not with the other proteins of its "
+                             "genome.")
+                return False
+            nb_prots[cur] += 1
+    empty = [gen for gen, nb in zip(genomes, nb_prots) if nb == 0]
+    if empty:
+        logger.error(f"No protein found in mmseqs database {mmseqdb} for {len(empty)} "
+                     f"genome(s) of the list: {', '.join(empty)}")
+        return False
+    logger.details(f"mmseqs database contains {sum(nb_prots)} proteins of "
+                   f"{len(genomes)} genomes.")
     return True
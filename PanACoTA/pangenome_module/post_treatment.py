@@ -45,11 +45,12 @@ import numpy as np
 
 from PanACoTA import utils
 from PanACoTA import utils_pangenome as utilsp
+from PanACoTA.pangenome_module import accumulation as accu
 
 logger = logging.getLogger("pangenome.post-treat")
 
 
-def post_treat(families, pangenome):
+def post_treat(families, pangenome, nb_perm=0, threads=1, chunk=None, heaps=False):
     """
     From clusters = {num: [members]}, create:
 
@@ -68,6 +69,9 @@ def post_treat(families, pangenome):
         - sum_0-mono-multi: should be equal to the total number of genomes in dataset
         - max_multi: maximum number of members from 1 genome
 
+    - an index of all proteins, with their family (see utils_pangenome.write_protein_index)
+    - if nb_perm > 0, pan and core genome accumulation curves (see accumulation module)
+
     Parameters
     ----------
     families : dict
@@ -75,10 +79,23 @@ def post_treat(families, pangenome):
         pangenome file
     pangenome : str
         file containing pangenome
+    nb_perm : int
+        number of random orders of genomes used to compute pan and core genome accumulation
+        curves. 0 to not compute them
+    threads : int
+        number of processes used to compute accumulation curves
+    chunk : int or None
+        max number of families handled at once to compute accumulation curves. None for all
+    heaps : bool
+        True to fit Heaps' law on pan genome accumulation curve
     """
     fams_by_strain, families, all_strains = utilsp.read_pangenome(pangenome, logger, families)
-    open_outputs_to_write(fams_by_strain, families, all_strains, pangenome)
-    # result of open_outputs_to_write = (qualis, quantis, summaries)
+    qualis, _, _ = open_outputs_to_write(fams_by_strain, families, all_strains, pangenome)
+    # Index of proteins, to find the family of a protein without reading the pangenome
+    utilsp.write_protein_index(families, pangenome)
+    # Accumulation curves, from the presence of each genome in each family
+    if nb_perm:
+        accu.do_accumulation(qualis, all_strains, pangenome, nb_perm, threads, chunk, heaps)
 
 
 def open_outputs_to_write(fams_by_strain, families, all_strains, pangenome):
@@ -197,3 +214,31 @@ def generate_and_write_outputs(fams_by_strain, families, all_strains, panquali,
     tmatrix_quanti = matrix_quanti.transpose()
     np.savetxt(panquanti, tmatrix_quanti, delimiter=",", fmt="%s")
     return qualis, quantis, summaries
+
+
+def write_sweep_summary(pangenomes, outfile):
+    """
+    Write a table comparing pangenomes obtained with different identity thresholds.
+    1 line per threshold, with:
+
+        - min_id: minimum percentage of identity used
+        - nb_families: number of families in the pangenome
+        - nb_singletons: number of families with only 1 member
+        - max_members: number of members of the biggest family
+        - pangenome: pangenome filename
+
+    Parameters
+    ----------
+    pangenomes : dict
+        {min_id: (families, pangenome)}, with families = {fam_num: [all members]}
+    outfile : str
+        file where comparison table must be written
+    """
+    logger.info(f"Writing comparison of pangenome families to {outfile}")
+    with open(outfile, "w") as outf:
+        outf.write("min_id\tnb_families\tnb_singletons\tmax_members\tpangenome\n")
+        for min_id in sorted(pangenomes):
+            families, pangenome = pangenomes[min_id]
+            sizes = [len(members) for members in families.values()]
+            summ = [min_id, len(sizes), sizes.count(1), max(sizes), pangenome]
+            outf.write(utils.list_to_str(summ))
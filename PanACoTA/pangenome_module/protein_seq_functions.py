@@ -43,11 +43,14 @@ from PanACoTA import utils
 from PanACoTA import utils_pangenome as utilsp
 import logging
 import os
+import sys
+import hashlib
+import progressbar
 
 logger = logging.getLogger('pangenome.bank')
 
 
-def build_prt_bank(lstinfo, dbpath, name, spedir, quiet):
+def build_prt_bank(lstinfo, dbpath, name, spedir, quiet, dedup=False):
     """
     Build a file containing all proteins of all genomes contained in lstinfo.
 
@@ -66,6 +69,10 @@ def build_prt_bank(lstinfo, dbpath, name, spedir, quiet):
         else, it is specified here.
     quiet : bool
         True if nothing must be written in stdout/stderr, False otherwise
+    dedup : bool
+        True to keep only 1 protein per unique sequence in the databank
+        (<outdir>/<name>.All.uniq.prt). The other proteins with the same sequence are
+        written in a mapping file (see get_dup_file).
 
     Returns
     -------
@@ -77,8 +84,11 @@ def build_prt_bank(lstinfo, dbpath, name, spedir, quiet):
     else:
         os.makedirs(spedir, exist_ok=True)
         outdir = spedir
-    outfile = os.path.join(outdir, name + ".All.prt")
-    if os.path.isfile(outfile):
+    if dedup:
+        outfile = os.path.join(outdir, name + ".All.uniq.prt")
+    else:
+        outfile = os.path.join(outdir, name + ".All.prt")
+    if os.path.isfile(outfile) and (not dedup or os.path.isfile(get_dup_file(outfile))):
         logger.warning((f"Protein bank {outfile} already exists. "
                         "It will be used by mmseqs."))
         return outfile
@@ -86,7 +96,281 @@ def build_prt_bank(lstinfo, dbpath, name, spedir, quiet):
     genomes = utilsp.read_lstinfo(lstinfo, logger)
     all_names = [os.path.join(dbpath, gen + ".prt") for gen in genomes]
     if quiet:
-        utils.cat(all_names, outfile)
+        title = None
+    else:
+        title = "Building bank"
+    if dedup:
+        build_uniq_bank(all_names, outfile, get_dup_file(outfile), title)
     else:
-        utils.cat(all_names, outfile, title="Building bank")
+        utils.cat(all_names, outfile, title=title)
     return outfile
+
+
+def get_prt_files(lstinfo, dbpath, name, spedir):
+    """
+    Get all protein files of the genomes contained in lstinfo, to build the mmseqs database
+    directly from them, without writing the concatenated protein bank.
+
+    Check that each genome is only once in lstinfo, and that all protein files exist
+    and are not empty.
+
+    Parameters
+    ----------
+    lstinfo : str
+        1 line per genome, only 1st column considered here, as the genome name
+        without extension
+    dbpath : str
+        Proteins folder, containing all proteins for each genome. Each genome has
+        its own protein file, called `<genome_name>.prt`.
+    name : str
+        dataset name, used to name the protein databank: <outdir>/<name>.All.prt
+    spedir : str or None
+        folder where the protein databank would be saved. None for dbpath
+
+    Returns
+    -------
+    (prt_path, prt_files) : tuple
+
+        - prt_path : name (with path) of the protein databank, which is not written, but
+          used to name output files
+        - prt_files : list of protein files, in the order of lstinfo
+    """
+    outdir = spedir or dbpath
+    prt_path = os.path.join(outdir, name + ".All.prt")
+    genomes = utilsp.read_lstinfo(lstinfo, logger)
+    seen = set()
+    dups = sorted(set(gen for gen in genomes if gen in seen or seen.add(gen)))
+    if dups:
+        logger.error(f"Genome(s) {', '.join(dups)} found several times in {lstinfo}.")
+        sys.exit(1)
+    prt_files = [os.path.join(dbpath, gen + ".prt") for gen in genomes]
+    missing = [file for file in prt_files
+               if not os.path.isfile(file) or os.path.getsize(file) == 0]
+    if missing:
+        logger.error(f"{len(missing)} protein file(s) of genomes in {lstinfo} are missing or "
+                     f"empty: {', '.join(missing)}")
+        sys.exit(1)
+    logger.info(f"Protein bank is not written: mmseqs database will be built directly from "
+                f"the {len(prt_files)} protein files in {dbpath}")
+    return prt_path, prt_files
+
+
+def get_dup_file(prt_bank):
+    """
+    Get name of the file mapping each protein removed from a deduplicated bank to the
+    protein representing its sequence in the bank.
+
+    Parameters
+    ----------
+    prt_bank : str
+        path to the deduplicated protein bank
+
+    Returns
+    -------
+    str
+        path to the mapping file
+    """
+    return prt_bank + ".dup.tsv"
+
+
+def build_uniq_bank(list_files, outfile, dupfile, title=None):
+    """
+    Concatenate all protein files, keeping only the first protein found for each sequence.
+    Sequences are compared through their hash, so that only 1 hash per unique sequence is kept
+    in memory.
+
+    For each protein not written because its sequence was already found, write a line
+    '<representative>\t<protein>' to dupfile, where representative is the name of the
+    protein kept in the bank.
+
+    Parameters
+    ----------
+    list_files : list
+        list of protein files to concatenate
+    outfile : str
+        output protein bank, with 1 protein per unique sequence
+    dupfile : str
+        output file mapping proteins removed to their representative
+    title : str or None
+        if you want to show a progressbar while building bank, add a title for this
+        progressbar here. If no title, nothing will be shown.
+    """
+    bar = None
+    if title:
+        nbfiles = len(list_files)
+        widgets = [title + ': ', progressbar.Bar(marker='█', left='', right='', fill=' '),
+                   ' ', progressbar.Counter(), f"/{nbfiles}" ' (',
+                   progressbar.Percentage(), ") - ", progressbar.Timer()]
+        bar = progressbar.ProgressBar(widgets=widgets, max_value=nbfiles, term_width=79).start()
+    representatives = {}  # {hash of sequence: name of first protein with this sequence}
+    nb_prots = 0
+    with open(outfile, "w") as outf, open(dupfile, "w") as dupf:
+        for num, file in enumerate(list_files, start=1):
+            if bar:
+                bar.update(num)
+            for header, seq in read_proteins(file):
+                nb_prots += 1
+                name = header[1:].split()[0]
+                sequence = "".join(line.strip() for line in seq)
+                seqhash = hashlib.blake2b(sequence.encode(), digest_size=16).digest()
+                if seqhash in representatives:
+                    dupf.write(f"{representatives[seqhash]}\t{name}\n")
+                else:
+                    representatives[seqhash] = name
+                    outf.write(header)
+                    outf.writelines(seq)
+    if bar:
+        bar.finish()
+    logger.info(f"{len(representatives)} unique sequences among {nb_prots} proteins.")
+
+
+def read_proteins(prt_file):
+    """
+    Read a fasta file, and yield each sequence
+
+    Parameters
+    ----------
+    prt_file : str
+        fasta file to read
+
+    Returns
+    -------
+    generator
+        (header, seq) for each sequence, with header the header line (with '>' and
+        end of line), and seq the list of sequence lines (with end of line)
+    """
+    header = None
+    seq = []
+    with open(prt_file) as prtf:
+        for line in prtf:
+            if line.startswith(">"):
+                if header:
+                    yield header, seq
+                header = line
+                seq = []
+            else:
+                seq.append(line)
+    if header:
+        yield header, seq
+
+
+def build_update_banks(lstinfo, dbpath, name, spedir, old_families, old_strains, quiet):
+    """
+    Build the protein banks needed to add new genomes to an existing pangenome:
+
+    - a bank with all proteins of genomes contained in lstinfo but not in the existing
+      pangenome: <outdir>/<name>.Update.prt
+    - a bank with 1 representative protein per family of the existing pangenome (see
+      get_representatives): <outdir>/<name>.Update-reps.prt
+
+    Parameters
+    ----------
+    lstinfo : str
+        1 line per genome, only 1st column considered here, as the genome name
+        without extension
+    dbpath : str
+        Proteins folder, containing all proteins for each genome (genomes of lstinfo and
+        genomes of the existing pangenome). Each genome has its own protein file,
+        called `<genome_name>.prt`.
+    name : str
+        dataset name, used to name the output databanks
+    spedir : str or None
+        By default, output files are saved in dbpath directory. If they must be saved
+        somewhere else, it is specified here.
+    old_families : dict
+        families of the existing pangenome {fam_num: [members]}
+    old_strains : list
+        genomes of the existing pangenome
+    quiet : bool
+        True if nothing must be written in stdout/stderr, False otherwise
+
+    Returns
+    -------
+    (new_bank, reps_bank, reps) : tuple or None
+
+        - new_bank : bank of proteins of the new genomes
+        - reps_bank : bank of representatives of the existing families
+        - reps : {representative: fam_num}
+
+        None if there is no new genome in lstinfo
+    """
+    if not spedir:
+        outdir = dbpath
+    else:
+        os.makedirs(spedir, exist_ok=True)
+        outdir = spedir
+    genomes = utilsp.read_lstinfo(lstinfo, logger)
+    old_strains = set(old_strains)
+    new_genomes = [gen for gen in genomes if gen not in old_strains]
+    if not new_genomes:
+        return None
+    missing = old_strains - set(genomes)
+    if missing:
+        logger.warning(f"{len(missing)} genome(s) of the existing pangenome are not in "
+                       f"{lstinfo}. They will stay in the updated pangenome.")
+    logger.info(f"{len(new_genomes)} new genome(s) to add to the pangenome.")
+    new_bank = os.path.join(outdir, name + ".Update.prt")
+    logger.info(f"Building bank with all proteins of new genomes to {new_bank}")
+    new_names = [os.path.join(dbpath, gen + ".prt") for gen in new_genomes]
+    if quiet:
+        utils.cat(new_names, new_bank)
+    else:
+        utils.cat(new_names, new_bank, title="Building bank")
+    reps = get_representatives(old_families)
+    reps_bank = os.path.join(outdir, name + ".Update-reps.prt")
+    logger.info(f"Extracting representatives of existing families to {reps_bank}")
+    old_names = [os.path.join(dbpath, gen + ".prt") for gen in sorted(old_strains)]
+    old_names = [file for file in old_names if os.path.isfile(file)]
+    nb_found = extract_proteins(old_names, reps, reps_bank)
+    if nb_found != len(reps):
+        logger.error(f"Only {nb_found} representatives of the {len(reps)} existing families "
+                     f"were found in the protein files of {dbpath}. All genomes of the "
+                     "existing pangenome must have their protein file in this folder.")
+        sys.exit(1)
+    return new_bank, reps_bank, reps
+
+
+def get_representatives(families):
+    """
+    Get 1 representative protein per family: its first member.
+
+    Parameters
+    ----------
+    families : dict
+        {fam_num: [members]}
+
+    Returns
+    -------
+    dict
+        {representative: fam_num}
+    """
+    return {members[0]: num for num, members in families.items()}
+
+
+def extract_proteins(list_files, names, outfile):
+    """
+    Write to outfile all proteins of the given files whose name is in 'names'.
+
+    Parameters
+    ----------
+    list_files : list
+        list of protein files in which proteins must be searched
+    names : dict or set
+        names of proteins to extract
+    outfile : str
+        file where extracted proteins are written
+
+    Returns
+    -------
+    int
+        number of proteins extracted
+    """
+    nb_found = 0
+    with open(outfile, "w") as outf:
+        for file in list_files:
+            for header, seq in read_proteins(file):
+                if header[1:].split()[0] in names:
+                    outf.write(header)
+                    outf.writelines(seq)
+                    nb_found += 1
+    return nb_found
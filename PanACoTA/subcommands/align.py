@@ -56,11 +56,13 @@ def main_from_parse(args):
     """
     cmd = "PanACoTA " + ' '.join(args.argv)
     main(cmd, args.corepers, args.list_genomes, args.dataset_name, args.dbpath, 
-         args.outdir, args.prot_ali, args.threads, args.force, args.verbose, args.quiet)
+         args.outdir, args.prot_ali, args.threads, args.force, args.verbose, args.quiet,
+         args.aligner, args.align_cache, args.align_cache_size, args.max_gaps, args.sites)
 
 
 def main(cmd, corepers, list_genomes, dname, dbpath, outdir, prot_ali, threads, force, verbose=0,
-         quiet=False):
+         quiet=False, aligner="mafft", align_cache=None, align_cache_size=1024, max_gaps=None,
+         sites="all"):
     """
     Align given core genome families
 
@@ -92,6 +94,27 @@ def main(cmd, corepers, list_genomes, dname, dbpath, outdir, prot_ali, threads,
 
     quiet : bool
         True if nothing must be sent to stdout/stderr, False otherwise
+    aligner : str
+        Software used to align proteins of each family: mafft, famsa, muscle or clustalo,
+        or 'auto' to use famsa for big families and mafft for the others
+    align_cache : str or None
+        Directory where alignments of families are cached, to be reused by any run aligning
+        the same sequences. None to not use a cache.
+    align_cache_size : int
+        Maximum size of the alignment cache, in MB. Least recently used families are
+        removed at the end of the run to keep the cache under this size.
+    max_gaps : float or None
+        Remove columns of the alignments grouped by genome with a higher proportion of
+        gaps. None to keep all columns.
+    sites : str
+        Sites kept in the alignments grouped by genome: all, variable or informative
+        (parsimony-informative).
+
+    Returns
+    -------
+    str
+        path to the nucleic alignment grouped by genome (filtered if max_gaps or sites
+        is given)
     """
     # import needed packages
     import logging
@@ -100,13 +123,16 @@ def main(cmd, corepers, list_genomes, dname, dbpath, outdir, prot_ali, threads,
     from PanACoTA.align_module import pan_to_pergenome as p2g
     from PanACoTA.align_module import get_seqs as gseqs
     from PanACoTA.align_module import alignment as ali
+    from PanACoTA.align_module import align_cache as acache
     from PanACoTA.align_module import post_align as post
+    from PanACoTA.align_module import filter_align as filt
     from PanACoTA import __version__ as version
 
-    # test if prokka is installed and in the path
-    if not utils.check_installed("mafft"):  # pragma: no cover
-        print("mafft is not installed. 'PanACoTA align' cannot run.")
-        sys.exit(1)
+    # test if the aligner(s) are installed and in the path
+    for soft in ali.get_executables(aligner):
+        if not utils.check_installed(soft):  # pragma: no cover
+            print(f"{soft} is not installed. 'PanACoTA align' cannot run.")
+            sys.exit(1)
 
     if force and os.path.isdir(outdir):
         shutil.rmtree(outdir)
@@ -132,11 +158,18 @@ def main(cmd, corepers, list_genomes, dname, dbpath, outdir, prot_ali, threads,
     all_genomes, aldir, listdir, fam_nums = p2g.get_per_genome(corepers, list_genomes,
                                                                dname, outdir)
     # generate required files
-    gseqs.get_all_seqs(all_genomes, dname, dbpath, listdir, aldir, fam_nums, quiet)
+    gseqs.get_all_seqs(all_genomes, dname, dbpath, listdir, aldir, fam_nums, quiet, threads)
     prefix = os.path.join(aldir, dname)
 
     # Align all families
-    status = ali.align_all_families(prefix, fam_nums, len(all_genomes), dname, quiet, threads)
+    if align_cache:
+        os.makedirs(align_cache, exist_ok=True)
+        cache_stats = acache.read_stats(align_cache)
+    status = ali.align_all_families(prefix, fam_nums, len(all_genomes), dname, quiet, threads,
+                                    aligner, align_cache)
+    if align_cache:
+        acache.evict(align_cache, align_cache_size * 2**20)
+        acache.report(align_cache, cache_stats)
     if not status:
         logger.error(("At least one alignment did not run well. See detailed log file for "
                       "more information. Program will stop here, alignments won't be "
@@ -144,7 +177,15 @@ def main(cmd, corepers, list_genomes, dname, dbpath, outdir, prot_ali, threads,
         sys.exit(1)
 
     # post-process alignment files
-    align_file = post.post_alignment(fam_nums, all_genomes, prefix, outdir, dname, prot_ali, quiet)
+    align_file = post.post_alignment(fam_nums, all_genomes, prefix, outdir, dname, prot_ali, quiet,
+                                     threads)
+    # filter columns of alignments grouped by genome
+    if max_gaps is not None or sites != "all":
+        aa_file = align_file.replace(".nucl.grp.aln", ".aa.grp.aln")
+        align_file = filt.filter_alignment(align_file, prefix, fam_nums, "nucl", max_gaps,
+                                           sites)
+        if prot_ali and os.path.isfile(aa_file):
+            filt.filter_alignment(aa_file, prefix, fam_nums, "aa", max_gaps, sites)
     logger.info("END")
     return align_file
 
@@ -186,10 +227,40 @@ def build_parser(parser):
 
     optional = parser.add_argument_group('Optional arguments')
     optional.add_argument("--threads", dest="threads", default=1, type=utils_argparse.thread_num,
-                          help=("add this option if you want to parallelize on several threads. "
+                          help=("add this option if you want to parallelize on several threads "
+                                "(extraction of sequences and alignments). "
                                 "Indicate on how many threads you want to parallelize. "
                                 "By default, it uses 1 thread. Put 0 if you want to use "
                                 "all threads of your computer."))
+    optional.add_argument("--aligner", dest="aligner", default="mafft",
+                          choices=["mafft", "famsa", "muscle", "clustalo", "auto"],
+                          help=("Software used to align the proteins of each family. "
+                                "Default is mafft. Put 'auto' to align families of 1000 "
+                                "proteins or more with famsa, and the others with mafft. "
+                                "The installed aligner(s) must be in your $PATH."))
+    optional.add_argument("--align-cache", dest="align_cache",
+                          help=("Directory where alignments of each family are saved, and "
+                                "reused when the exact same proteins and genes are aligned "
+                                "again with the same aligner, in this run or any other one "
+                                "(for example after adding genomes, or for another dataset "
+                                "built from the same annotation database). By default, no "
+                                "cache is used."))
+    optional.add_argument("--align-cache-size", dest="align_cache_size", type=int,
+                          default=1024,
+                          help=("Maximum size of the alignment cache, in MB (default 1024). At "
+                                "the end of the run, least recently used families are removed "
+                                "from the cache until its size is below this value."))
+    optional.add_argument("--max-gaps", dest="max_gaps", type=float,
+                          help=("Remove the columns of the alignments grouped by genome "
+                                "containing a higher proportion of gaps (between 0 and 1). "
+                                "By default, all columns are kept."))
+    optional.add_argument("--sites", dest="sites", default="all",
+                          choices=["all", "variable", "informative"],
+                          help=("Sites kept in the alignments grouped by genome: all of them "
+                                "(default), only variable sites, or only "
+                                "parsimony-informative sites. With variable or informative, "
+                                "the number of constant sites removed is saved (.fconst file) "
+                                "for ascertainment bias correction."))
     optional.add_argument("-F", "--force", dest="force", action="store_true",
                           help=("Force run: Add this option if you want to redo all alignments "
                                 "for all families, even if their result file already exists. "
@@ -211,6 +282,30 @@ def build_parser(parser):
                         help="show this help message and exit")
 
 
+def check_args(parser, args):
+    """
+    Check that arguments given to parser are as expected.
+
+    Parameters
+    ----------
+    parser : argparse.ArgumentParser
+        The parser used to parse command-line
+    args : argparse.Namespace
+        Parsed arguments
+
+    Returns
+    -------
+    argparse.Namespace or None
+        The arguments parsed, updated according to some rules. Exit program
+        with error message if error occurs with arguments given.
+    """
+    if args.align_cache_size <= 0:
+        parser.error("--align-cache-size must be a positive number of MB.")
+    if args.max_gaps is not None and not 0 <= args.max_gaps <= 1:
+        parser.error("--max-gaps must be a proportion, between 0 and 1.")
+    return args
+
+
 def parse(parser, argu):
     """
     Parse arguments given to parser
@@ -227,7 +322,8 @@ def parse(parser, argu):
     argparse.Namespace
         Parsed arguments
     """
-    return parser.parse_args(argu)
+    args = parser.parse_args(argu)
+    return check_args(parser, args)
 
 
 if __name__ == '__main__':
@@ -65,10 +65,12 @@ def main_from_parse(args):
     """
     cmd = "PanACoTA " + ' '.join(args.argv)
     main(cmd, args.pangenome, args.tol, args.multi, args.mixed, args.outputdir,
-         args.lstinfo_file, args.floor, args.verbose, args.quiet)
+         args.lstinfo_file, args.floor, args.verbose, args.quiet, args.batch, args.subsets,
+         args.serve)
 
 
-def main(cmd, pangenome, tol, multi, mixed, outputdir, lstinfo_file, floor, verbose, quiet):
+def main(cmd, pangenome, tol, multi, mixed, outputdir, lstinfo_file, floor, verbose, quiet,
+         batch=None, subsets=None, serve=None):
     """
     Read pangenome and deduce Persistent genome according to the user criteria
 
@@ -96,6 +98,24 @@ def main(cmd, pangenome, tol, multi, mixed, outputdir, lstinfo_file, floor, verb
         - >=15: Add DEBUG in stdout
     quiet : bool
         True if nothing must be sent to stdout/stderr, False otherwise
+    batch : list or None
+        list of (tol, multi, mixed, floor) persistent genome definitions. If given, all
+        these persistent genomes are generated (and tol, multi, mixed and floor parameters
+        are ignored), reading the pangenome only once.
+    subsets : str or None
+        directory with 1 genome list file per subset, or file with 2 columns (subset name,
+        genome name). If given, the core/persistent genome(s) of each subset are generated
+        (and lstinfo_file is ignored), reading the pangenome only once.
+    serve : str or None
+        'host:port' or 'unix:<path>'. If given, the pangenome is loaded, and core/persistent
+        genome queries are answered on this address until interrupted (see pers_query).
+        Persistent genome files asked are written in outputdir.
+
+    Returns
+    -------
+    str or list or None
+        persistent genome file, or list of persistent genome files in batch or subsets mode.
+        None in serve mode
     """
     # import needed packages
     import logging
@@ -104,27 +124,9 @@ def main(cmd, pangenome, tol, multi, mixed, outputdir, lstinfo_file, floor, verb
     import PanACoTA.corepers_module.persistent_functions as pers
     from PanACoTA import __version__ as version
 
-    # get pangenome name info
-    _, base_pan = os.path.split(pangenome)
-    if lstinfo_file:
-        _, base_lst = os.path.split(lstinfo_file)
-    else:
-        base_lst = "all"
-    # Define output filename
-    output_name = f"PersGenome_{base_pan}-{base_lst}_"
-    if floor:
-        output_name += "F"
-    output_name += str(tol)
-    if multi:
-        output_name += "-multi.lst"
-    elif mixed:
-        output_name += "-mixed.lst"
-    else:
-        output_name += ".lst"
     # Define output directory and filename path
     if not os.path.isdir(outputdir):
         os.makedirs(outputdir)
-    outputfile = os.path.join(outputdir, output_name)
     logfile_base = os.path.join(outputdir, "PanACoTA-corepers")
     # level is the minimum level that will be considered.
     # for verbose = 0 or 1, ignore details and debug, start from info
@@ -141,19 +143,95 @@ def main(cmd, pangenome, tol, multi, mixed, outputdir, lstinfo_file, floor, verb
     logger.info(f'PanACoTA version {version}')
     logger.info("Command used\n \t > " + cmd)
 
-    logger.info(get_info(tol, multi, mixed, floor))
+    # Answer queries on this pangenome
+    if serve:
+        from PanACoTA.corepers_module import pers_query
+        pers_query.serve(pers_query.PangenomeQuery(pangenome, outdir=outputdir), serve)
+        return None
+
+    if not batch:
+        logger.info(get_info(tol, multi, mixed, floor))
+    definitions = batch or [(tol, multi, mixed, floor)]
 
     # Read pangenome
     fams_by_strain, families, all_strains = utilsp.read_pangenome(pangenome, logger)
-    # If list of genomes given, get subset of previous dicts, including only the genomes aksed
-    if lstinfo_file:
-        fams_by_strain, families, all_strains = pers.get_subset_genomes(fams_by_strain, families, lstinfo_file)
-    # Generate persistent genome
-    fams = pers.get_pers(fams_by_strain, families, len(all_strains), tol, multi, mixed, floor)
-    # Write persistent genome to file
-    pers.write_persistent(fams, outputfile)
+    # Get subsets of genomes asked: {subset name: list of genomes}, None for all genomes
+    if subsets:
+        all_subsets = pers.read_subsets(subsets)
+    elif lstinfo_file:
+        all_subsets = {lstinfo_file: pers.read_subset(lstinfo_file)}
+    else:
+        all_subsets = {None: all_strains}
+    # Generate all persistent genomes asked, for each subset, from the number of members
+    # of each genome in each family
+    matrix = pers.get_count_matrix(fams_by_strain)
+    outputfiles = []
+    for subset_name, list_genomes in all_subsets.items():
+        if subset_name is None:
+            counts = pers.get_fam_counts(matrix)
+        else:
+            mask = pers.get_subset_mask(matrix[1], list_genomes)
+            counts = pers.get_fam_counts(pers.get_subset_matrix(matrix, mask))
+        for p_tol, p_multi, p_mixed, p_floor in definitions:
+            if batch:
+                logger.info(get_info(p_tol, p_multi, p_mixed, p_floor))
+            fams = pers.get_pers_from_counts(counts, families, len(list_genomes), p_tol,
+                                             p_multi, p_mixed, p_floor)
+            if subset_name is not None:
+                fams = pers.get_subset_members(fams, list_genomes)
+            outputfile = os.path.join(outputdir, get_output_name(pangenome, subset_name, p_tol,
+                                                                 p_multi, p_mixed, p_floor))
+            # Write persistent genome to file
+            pers.write_persistent(fams, outputfile)
+            outputfiles.append(outputfile)
     logger.info("Persistent genome step done.")
-    return outputfile
+    if batch or subsets:
+        return outputfiles
+    return outputfiles[0]
+
+
+def get_output_name(pangenome, lstinfo_file, tol, multi, mixed, floor):
+    """
+    Get the name of the persistent genome file
+
+    Parameters
+    ----------
+    pangenome : str
+        file containing pangenome
+    lstinfo_file : str or None
+        list of genomes included in the core/persistent genome (or subset name). None if all
+        genomes of pan
+    tol : float
+        min % of genomes present in a family to consider it as persistent (between 0 and 1)
+    multi : bool
+        True if multigenic families are allowed, False otherwise
+    mixed : bool
+        True if mixed families are allowed, False otherwise
+    floor : bool
+        Require at least floor(nb_genomes*tol) genomes if True, ceil(nb_genomes*tol) if False
+
+    Returns
+    -------
+    str
+        persistent genome filename, without path
+    """
+    # get pangenome name info
+    _, base_pan = os.path.split(pangenome)
+    if lstinfo_file:
+        _, base_lst = os.path.split(lstinfo_file)
+    else:
+        base_lst = "all"
+    output_name = f"PersGenome_{base_pan}-{base_lst}_"
+    if floor:
+        output_name += "F"
+    output_name += str(tol)
+    if multi:
+        output_name += "-multi.lst"
+    elif mixed:
+        output_name += "-mixed.lst"
+    else:
+        output_name += ".lst"
+    return output_name
 
 
 def get_info(tol, multi, mixed, floor):
@@ -252,6 +330,32 @@ def build_parser(parser):
                                 "list of genomes. This file must have 1 line per genome, only the first column "
                                 "(genome name without extension) will be used."))
 
+    optional.add_argument("--batch", dest="batch", nargs="+", type=utils_argparse.pers_combo,
+                          help=("Generate several core/persistent genomes at once, reading "
+                                "the pangenome only once. Give each one as 'tol', optionally "
+                                "followed by ':multi' (like -M) or ':mixed' (like -X), and/or "
+                                "':F' (like -F), separated by spaces. For example, "
+                                "'--batch 1 0.99 0.95:mixed 0.9:multi:F' generates the core "
+                                "genome, the strict 99%% persistent genome, the mixed 95%% "
+                                "persistent genome and the multi persistent genome with at "
+                                "least floor(0.9*N) genomes. Cannot be used with -t, -M, -X "
+                                "and -F."))
+    optional.add_argument("--subsets", dest="subsets",
+                          help=("Generate the core/persistent genome(s) of several subsets of "
+                                "genomes at once, reading the pangenome only once. Give either "
+                                "a directory containing 1 file per subset (same format as for "
+                                "-l option, the subset name being the filename), or a file "
+                                "with 1 line per genome and 2 columns: subset name and "
+                                "genome name. Cannot be used with -l."))
+    optional.add_argument("--serve", dest="serve",
+                          help=("Load the pangenome once, and answer core/persistent genome "
+                                "queries (on any subset of genomes, with any definition) on "
+                                "the given address until interrupted: 'host:port' for HTTP "
+                                "over TCP, or 'unix:<path>' for HTTP over a Unix socket. "
+                                "Recent results are kept in cache. Persistent genome files "
+                                "asked are written in the output directory. Cannot be used "
+                                "with -l, --batch and --subsets."))
+
     helper = parser.add_argument_group('Others')
     helper.add_argument("-v", "--verbose", dest="verbose", action="count", default=0,
                         help="Increase verbosity in stdout/stderr.")
@@ -279,6 +383,19 @@ def check_args(parser, args):
         The arguments parsed, updated according to some rules. Exit program
         with error message if error occurs with arguments given.
     """
+    # 'PanACoTA all' does not have batch, serve and subsets options
+    batch = getattr(args, "batch", None)
+    serve = getattr(args, "serve", None)
+    subsets = getattr(args, "subsets", None)
+    if batch and (args.tol != 1 or args.multi or args.mixed or args.floor):
+        parser.error("--batch cannot be used with -t, -M, -X or -F options: give all "
+                     "core/persistent genomes to generate with --batch.")
+    if serve and (args.lstinfo_file or batch or subsets):
+        parser.error("--serve cannot be used with -l, --batch or --subsets: give the subset "
+                     "and persistent genome definition in each query.")
+    if subsets and args.lstinfo_file:
+        parser.error("--subsets cannot be used with -l option: give all subsets of genomes "
+                     "with --subsets.")
     if args.multi and args.mixed:
         parser.error("-M and -X options cannot be activated together. Choose if you want to:\n"
                      "- allow several members in any number of genomes of a family (-M)\n"
@@ -57,11 +57,15 @@ def main_from_parse(args):
     cmd = "PanACoTA " + ' '.join(args.argv)
     main(cmd, args.lstinfo_file, args.dataset_name, args.dbpath, args.min_id, args.outdir,
          args.clust_mode, args.spedir, args.threads, args.outfile, args.verbose,
-         args.quiet)
+         args.quiet, args.db_cache, args.clean_db_cache, args.sweep, args.engine,
+         args.dedup, args.update, args.stream_db, args.max_memory, args.accumulation,
+         args.heaps, args.accum_chunk)
 
 
 def main(cmd, lstinfo, name, dbpath, min_id, outdir, clust_mode, spe_dir, threads, outfile=None,
-         verbose=0, quiet=False):
+         verbose=0, quiet=False, db_cache=None, clean_db_cache=False, sweep=None,
+         engine="cluster", dedup=False, update=None, stream_db=False, max_memory=None,
+         accumulation=0, heaps=False, accum_chunk=None):
     """
     Main method, doing all steps:
 
@@ -102,6 +106,43 @@ def main(cmd, lstinfo, name, dbpath, min_id, outdir, clust_mode, spe_dir, thread
         - >=15: Add DEBUG in stdout
     quiet : bool
         True if nothing must be sent to stdout/stderr, False otherwise
+    db_cache : str or None
+        path to the folder where mmseqs databases are saved, to be shared between runs.
+        None to use <outdir>/mmseqs_db_cache
+    clean_db_cache : bool
+        True to remove, from the cache, the mmseqs databases of other protein banks than
+        the current one
+    sweep : list or None
+        Other identity thresholds for which a pangenome must be built, in addition to min_id.
+        All-vs-all protein comparison is then done only once, for all thresholds.
+    engine : str
+        mmseqs clustering engine: 'cluster', 'linclust' or 'cascade' (linclust then cluster).
+        Not used in sweep mode.
+    dedup : bool
+        True to cluster only 1 protein per unique sequence, and then add the other proteins
+        to the family of the protein with the same sequence
+    update : str or None
+        existing pangenome file, to which genomes of lstinfo which are not already in it
+        must be added. None to build a new pangenome from all genomes of lstinfo
+    stream_db : bool
+        True to build the mmseqs database directly from the protein files of all genomes,
+        without writing the concatenated protein bank
+    max_memory : str or None
+        Max memory mmseqs can use (for example '20G'). '0' for no limit. None to use most of
+        the memory available (including limits of the cgroup)
+    accumulation : int
+        number of random orders of genomes used to compute pan and core genome accumulation
+        curves. 0 to not compute them
+    heaps : bool
+        True to fit Heaps' law on the pan genome accumulation curve
+    accum_chunk : int or None
+        max number of families handled at once to compute accumulation curves (bounds
+        memory used). None to handle all families at once
+
+    Returns
+    -------
+    str
+        pangenome file (the one obtained with min_id in sweep mode)
     """
     # import needed packages
     import logging
@@ -134,13 +175,92 @@ def main(cmd, lstinfo, name, dbpath, min_id, outdir, clust_mode, spe_dir, thread
     logger.info(f'PanACoTA version {version}')
     logger.info("Command used\n \t > " + cmd)
 
-    # Build bank with all proteins to include in the pangenome
-    prt_path = protf.build_prt_bank(lstinfo, dbpath, name, spe_dir, quiet)
+    # Memory mmseqs can use before splitting its databases
+    mem_limit = mmf.get_split_memory_limit(max_memory)
+    if mem_limit:
+        logger.info(f"MMseqs2 will use at most {mem_limit} of memory.")
+    # Add new genomes to an existing pangenome
+    if update:
+        return update_pangenome(update, lstinfo, name, dbpath, min_id, outdir, clust_mode,
+                                spe_dir, threads, outfile, quiet, db_cache, engine, mem_limit,
+                                accumulation, heaps, accum_chunk)
+    # Build bank with all proteins to include in the pangenome, or only get the
+    # protein files of all genomes if the mmseqs database is built from them
+    if stream_db:
+        prt_path, prt_files = protf.get_prt_files(lstinfo, dbpath, name, spe_dir)
+    else:
+        prt_path = protf.build_prt_bank(lstinfo, dbpath, name, spe_dir, quiet, dedup)
+        prt_files = None
+    if dedup:
+        dupfile = protf.get_dup_file(prt_path)
+    else:
+        dupfile = None
     # Do pangenome
-    families, panfile = mmf.run_all_pangenome(min_id, clust_mode, outdir,
-                                              prt_path, threads, outfile, quiet)
-    # Create matrix pan_quali, pan_quanti and summary file
-    pt.post_treat(families, panfile)
+    if sweep:
+        if engine != "cluster":
+            logger.warning(f"Clustering engine '{engine}' is not used in sweep mode: proteins "
+                           "are clustered from an all-vs-all comparison.")
+        pangenomes = mmf.run_sweep_pangenome([min_id] + sweep, clust_mode, outdir, prt_path,
+                                             threads, outfile, quiet, db_cache, dupfile,
+                                             prt_files, mem_limit)
+        # Create matrix pan_quali, pan_quanti and summary file of each pangenome
+        for families, id_panfile in pangenomes.values():
+            pt.post_treat(families, id_panfile, accumulation, threads, accum_chunk, heaps)
+        prt_bank = os.path.basename(prt_path)
+        sweep_file = os.path.join(outdir,
+                                  f"PanGenome-{prt_bank}-clust-sweep-mode{clust_mode}.tsv")
+        pt.write_sweep_summary(pangenomes, sweep_file)
+        panfile = pangenomes[min_id][1]
+    else:
+        families, panfile = mmf.run_all_pangenome(min_id, clust_mode, outdir,
+                                                  prt_path, threads, outfile, quiet, db_cache,
+                                                  engine, dupfile, prt_files, mem_limit)
+        # Create matrix pan_quali, pan_quanti and summary file
+        pt.post_treat(families, panfile, accumulation, threads, accum_chunk, heaps)
+    # Remove mmseqs databases of previous protein banks
+    if clean_db_cache:
+        db_cache = mmf.get_db_cache(outdir, db_cache)
+        removed = mmf.clean_db_cache(db_cache,
+                                     keep=[mmf.bank_checksum(prt_files or prt_path,
+                                                            db_cache)])
+        logger.info(f"{len(removed)} mmseqs database(s) removed from {db_cache}")
+    logger.info("DONE")
+    return panfile
+
+
+def update_pangenome(update, lstinfo, name, dbpath, min_id, outdir, clust_mode, spe_dir,
+                     threads, outfile, quiet, db_cache, engine, mem_limit, accumulation=0,
+                     heaps=False, accum_chunk=None):
+    """
+    Add genomes of lstinfo which are not in the existing pangenome 'update' to it.
+    Existing families keep their number (see main for parameters).
+
+    Returns
+    -------
+    str
+        updated pangenome file (or existing one if there is no new genome)
+    """
+    import logging
+    from PanACoTA import utils_pangenome as utilsp
+    from PanACoTA.pangenome_module import protein_seq_functions as protf
+    from PanACoTA.pangenome_module import mmseqs_functions as mmf
+    from PanACoTA.pangenome_module import post_treatment as pt
+
+    logger = logging.getLogger("pangenome")
+    logger.info(f"Reading existing pangenome {update}")
+    _, old_families, old_strains = utilsp.read_pangenome(update, logger)
+    banks = protf.build_update_banks(lstinfo, dbpath, name, spe_dir, old_families,
+                                     old_strains, quiet)
+    if not banks:
+        logger.warning(f"All genomes of {lstinfo} are already in {update}. Nothing to update.")
+        logger.info("DONE")
+        return update
+    new_bank, reps_bank, reps = banks
+    families, panfile = mmf.run_update_pangenome(old_families, reps, min_id, clust_mode,
+                                                 outdir, new_bank, reps_bank, threads, outfile,
+                                                 quiet, db_cache, engine, mem_limit)
+    # Create matrix pan_quali, pan_quanti and summary file of updated pangenome
+    pt.post_treat(families, panfile, accumulation, threads, accum_chunk, heaps)
     logger.info("DONE")
     return panfile
 
@@ -156,6 +276,7 @@ def build_parser(parser):
     """
     import argparse
     from PanACoTA import utils_argparse
+    from PanACoTA.pangenome_module import mmseqs_functions as mmf
 
     # Create command-line parser for all options and arguments to give
     required = parser.add_argument_group('Required arguments')
@@ -184,6 +305,14 @@ def build_parser(parser):
     optional.add_argument("-i", dest="min_id", type=utils_argparse.perc_id, default=0.8,
                           help=("Minimum sequence identity to be considered in the same "
                                 "cluster (float between 0 and 1). Default is 0.8."))
+    optional.add_argument("--sweep", dest="sweep", type=utils_argparse.perc_id, nargs="+",
+                          help=("Build, in addition to the one at '-i' identity, a pangenome "
+                                "for each of the identity thresholds given here (floats "
+                                "between 0 and 1, separated by spaces). All proteins are "
+                                "compared only once, at the lowest threshold, and each "
+                                "pangenome is clustered from these comparisons. A table "
+                                "comparing the number of families of all pangenomes is also "
+                                "written."))
     optional.add_argument("-f", dest="outfile",
                           help=("Use this option if you want to give the name of the pangenome "
                                 "output file (without path). Otherwise, by default, it is called "
@@ -193,6 +322,40 @@ def build_parser(parser):
                           help=("Choose the clustering mode: 0 for 'set cover', 1 for "
                                 "'single-linkage', 2 for 'CD-Hit'. Default "
                                 "is 'single-linkage' (1)"))
+    optional.add_argument("--engine", dest="engine", choices=mmf.CLUST_ENGINES,
+                          default="cluster",
+                          help=("Choose the MMseqs2 clustering engine: 'cluster' (mmseqs "
+                                "cluster, default), 'linclust' (mmseqs linclust, linear time, "
+                                "much faster on huge protein banks at high identity, but less "
+                                "sensitive) or 'cascade' (mmseqs linclust, then mmseqs cluster "
+                                "on the representatives of linclust clusters)."))
+    optional.add_argument("--dedup", dest="dedup", action="store_true", default=False,
+                          help=("Cluster only 1 protein per unique sequence: proteins with "
+                                "the same sequence as a protein already in the bank are not "
+                                "written to the bank (called <dataset_name>.All.uniq.prt) but "
+                                "to a mapping file (<dataset_name>.All.uniq.prt.dup.tsv). They "
+                                "are then added to the family of this protein in the "
+                                "pangenome. It is much faster for species with many "
+                                "identical proteins between strains."))
+    optional.add_argument("--update", dest="update",
+                          help=("Existing pangenome file (obtained with 'PanACoTA pangenome') "
+                                "to update: genomes of the lstinfo file which are not already "
+                                "in it are added to it. Their proteins are compared to 1 "
+                                "representative protein per existing family, and added to the "
+                                "family of their best hit. Other new proteins are clustered "
+                                "into new families. Existing families keep their number, so "
+                                "that results of downstream steps can be compared. Protein "
+                                "files of all genomes, old and new, must be in the '-d' "
+                                "folder."))
+    optional.add_argument("--stream-db", dest="stream_db", action="store_true", default=False,
+                          help=("Do not write the concatenated protein bank "
+                                "(<dataset_name>.All.prt): build the MMseqs2 database directly "
+                                "from the protein files of all genomes of the list. It saves "
+                                "the disk space and time needed to write and read again all "
+                                "proteins. The database is then checked to contain the "
+                                "proteins of all genomes of the list. Without this option, "
+                                "the bank is written as before, for example to be used by "
+                                "other tools."))
     optional.add_argument("-s", dest="spedir",
                           help=("use this option if you want to save the concatenated protein "
                                 "databank in another directory than the one containing all "
@@ -202,6 +365,45 @@ def build_parser(parser):
                                 "Indicate on how many threads you want to parallelize. "
                                 "By default, it uses 1 thread. Put 0 if you want to use "
                                 "all threads of your computer."))
+    optional.add_argument("--db-cache", dest="db_cache",
+                          help=("Directory where MMseqs2 databases are saved. A database is "
+                                "identified by the checksum of its protein bank, so that it is "
+                                "created only once, and then reused by all runs on the same "
+                                "proteins, whatever their clustering parameters. Use the same "
+                                "directory for several output directories to share databases "
+                                "between them. Default is <outdir>/mmseqs_db_cache."))
+    optional.add_argument("--clean-db-cache", dest="clean_db_cache", action="store_true",
+                          default=False,
+                          help=("Remove, from the database cache, all MMseqs2 databases "
+                                "corresponding to another protein bank than the current one "
+                                "(for example, databases of previous versions of the dataset). "
+                                "Databases currently used by another run are kept."))
+
+    optional.add_argument("--max-memory", dest="max_memory", type=utils_argparse.mem_size,
+                          help=("Maximum memory MMseqs2 can use, with its unit (for example "
+                                "20G or 500M). MMseqs2 then splits its databases to process "
+                                "them in several chunks fitting in this memory, instead of "
+                                "swapping or being killed. By default, it uses 80%% of the "
+                                "memory available, taking into account the memory limit of "
+                                "the job or container if any. Put 0 to let MMseqs2 use all the "
+                                "memory of the machine."))
+    optional.add_argument("--accumulation", dest="accumulation", type=int, default=0,
+                          help=("Compute pan and core genome accumulation curves: number of "
+                                "families present in at least 1 genome (pan) or in all genomes "
+                                "(core) when genomes are added one by one, for the given "
+                                "number of random orders of genomes. Curves are written to "
+                                "<pangenome>.accumulation.tsv. Random orders are split "
+                                "between the --threads processes."))
+    optional.add_argument("--heaps", dest="heaps", action="store_true", default=False,
+                          help=("With --accumulation, fit Heaps' law n = kappa*N^-alpha on the "
+                                "number of new families n found when adding the Nth genome, "
+                                "and write kappa and alpha to <pangenome>.heaps.tsv "
+                                "(alpha <= 1: open pangenome, alpha > 1: closed pangenome)."))
+    optional.add_argument("--accum-chunk", dest="accum_chunk", type=int,
+                          help=("With --accumulation, maximum number of families handled at "
+                                "once by each process, to bound the memory used for "
+                                "accumulation curves with many genomes and families. "
+                                "By default, all families are handled at once."))
 
     helper = parser.add_argument_group('Others')
     helper.add_argument("-v", "--verbose", dest="verbose", action="count", default=0,
@@ -231,6 +433,44 @@ def parse(parser, argu):
         with error message if error occurs with arguments given.
     """
     args = parser.parse_args(argu)
+    return check_args(parser, args)
+
+
+def check_args(parser, args):
+    """
+    Check that arguments given to parser are as expected.
+
+    Parameters
+    ----------
+    parser : argparse.ArgumentParser
+        The parser used to parse command-line
+    args : argparse.Namespace
+        Parsed arguments
+
+    Returns
+    -------
+    argparse.Namespace or None
+        The arguments parsed, updated according to some rules. Exit program
+        with error message if error occurs with arguments given.
+    """
+    if args.update and args.sweep:
+        parser.error("--update cannot be used with --sweep: an existing pangenome can only "
+                     "be updated at 1 identity threshold.")
+    if args.update and args.dedup:
+        parser.error("--update cannot be used with --dedup.")
+    if args.stream_db and args.dedup:
+        parser.error("--stream-db cannot be used with --dedup: only 1 protein per unique "
+                     "sequence must be written to the protein bank.")
+    if args.stream_db and args.update:
+        parser.error("--stream-db cannot be used with --update.")
+    if args.accumulation < 0:
+        parser.error("The number of random orders of genomes for --accumulation must be a "
+                     f"positive integer. Invalid value: {args.accumulation}")
+    if args.accum_chunk is not None and args.accum_chunk <= 0:
+        parser.error("--accum-chunk must be a positive number of families. Invalid value: "
+                     f"{args.accum_chunk}")
+    if (args.heaps or args.accum_chunk) and not args.accumulation:
+        parser.error("--heaps and --accum-chunk can only be used with --accumulation.")
     return args
 
 
@@ -41,10 +41,13 @@ June 2017
 """
 
 from Bio import AlignIO
+from Bio import Phylo
+from Bio.Phylo.Consensus import get_support
 import os
 import logging
 
 from PanACoTA import utils
+from PanACoTA.tree_module import site_patterns as sp
 
 logger = logging.getLogger("tree.fastme")
 
@@ -70,11 +73,21 @@ def run_tree(alignfile, boot, outdir, quiet, threads, **kwargs):
         True if matrix file must be written, False otherwise
     kwargs["wb"]: bool
         True if all bootstrap pseudo-trees must be saved into a file, False otherwise
+
+    For the models whose distances can be computed from site patterns (see
+    site_patterns.MODELS), distances are computed here from the compressed alignment, and
+    given to FastME. Otherwise, FastME computes them from the whole alignment.
     """
     model = kwargs["model"]
     write_boot = kwargs["wb"]
     write_matrix = kwargs["matrix"]
     align_name = os.path.basename(alignfile)
+    if (model or "T") in sp.MODELS:
+        patfile = os.path.join(outdir, align_name + ".patterns.npz")
+        sp.compress_alignment(alignfile, patfile)
+        run_fastme_patterns(patfile, boot, write_boot, write_matrix, threads, model or "T",
+                            outdir, quiet)
+        return
     align_phylip = os.path.join(outdir, align_name + ".phylip")
     convert2phylip(alignfile, align_phylip)
     run_fastme(align_phylip, boot, write_boot, write_matrix, threads, model, outdir, quiet)
@@ -158,3 +171,94 @@ def run_fastme(alignfile, boot, write_boot, write_matrix, threads, model, outdir
     error = ("Problem while running FastME. See log file ({}) for "
              "more information.").format(logfile)
     utils.run_cmd(cmd, error, stdout=fnull, eof=True, logger=logger, stderr=fnull)
+
+
+def run_fastme_patterns(patfile, boot, write_boot, write_matrix, threads, model, outdir,
+                        quiet):
+    """
+    Compute distances from site patterns, and run fastME on them. For bootstraps, the
+    weights of the patterns are resampled, and support of each branch is the proportion of
+    trees inferred from the resampled distances containing it.
+
+    Parameters
+    ----------
+    patfile: str
+        Path to npz file containing site patterns of the alignment, as written by
+        site_patterns.compress_alignment
+    boot: int or None
+        Number of bootstraps to compute. None if no bootstrap asked
+    write_boot: bool
+        True if all bootstrap pseudo-trees must be saved into a file, False otherwise
+    write_matrix: bool
+        True if matrix file must be written, False otherwise
+    threads: int
+        Maximum number of threads to use
+    model: str
+        Distance model: 1 of site_patterns.MODELS
+    outdir: str
+        output directory to save all results
+    quiet: bool
+        True if nothing must be printed to stderr/stdout, False otherwise
+    """
+    names, patterns, weights = sp.load_patterns(patfile)
+    # Name output files as when fastME is run on the alignment
+    align_name = os.path.basename(patfile)[:-len(".patterns.npz")]
+    logfile = os.path.join(outdir, align_name + ".fastme.log")
+    treefile = os.path.join(outdir, align_name + ".fastme_tree.nwk")
+    matfile = os.path.join(outdir, align_name + ".fastme_dist-mat.txt")
+    logger.info(f"Computing {sp.MODELS[model]} distances from {len(weights)} site patterns.")
+    sp.write_distances(matfile, names, [sp.distance_matrix(patterns, weights, model)])
+    logger.info("Running FastME...")
+    if quiet:
+        fnull = open(os.devnull, 'w')
+    else:
+        fnull = None
+    error = ("Problem while running FastME. See log file ({}) for "
+             "more information.").format(logfile)
+    threadinfo = f"-T {threads}" if threads else ""
+    cmd = f"fastme -i {matfile} -n B -s {threadinfo} -o {treefile} -I {logfile}"
+    logger.details(cmd)
+    utils.run_cmd(cmd, error, stdout=fnull, eof=True, logger=logger, stderr=fnull)
+    if not write_matrix:
+        os.remove(matfile)
+    if not boot:
+        return
+    logger.info(f"Computing distances of {boot} bootstrap replicates.")
+    bootmat = os.path.join(outdir, align_name + ".fastme_boot_dist-mat.txt")
+    bootfile = os.path.join(outdir, align_name + ".fastme_bootstraps.nwk")
+    sp.write_distances(bootmat, names, (sp.distance_matrix(patterns, boot_weights, model)
+                                        for boot_weights in sp.bootstrap_weights(weights, boot)))
+    cmd = (f"fastme -i {bootmat} -D {boot} -n B -s {threadinfo} -o {bootfile} "
+           f"-I {logfile}.boot")
+    logger.details(cmd)
+    utils.run_cmd(cmd, error, stdout=fnull, eof=True, logger=logger, stderr=fnull)
+    os.remove(bootmat)
+    add_supports(treefile, bootfile, names[0])
+    if not write_boot:
+        os.remove(bootfile)
+
+
+def add_supports(treefile, bootfile, outgroup):
+    """
+    Add, to each branch of the tree, the percentage of bootstrap trees containing it.
+    All trees are rooted on the same leaf, so that each branch is found as the same clade
+    in all of them.
+
+    Parameters
+    ----------
+    treefile: str
+        Path to tree file, in Newick format. It is replaced by the tree with supports
+    bootfile: str
+        Path to file with all bootstrap trees, in Newick format
+    outgroup: str
+        Name of the leaf used to root all trees
+    """
+    tree = Phylo.read(treefile, "newick")
+    tree.root_with_outgroup(outgroup)
+    boot_trees = list(Phylo.parse(bootfile, "newick"))
+    for boot_tree in boot_trees:
+        boot_tree.root_with_outgroup(outgroup)
+    tree = get_support(tree, boot_trees, len_trees=len(boot_trees))
+    for clade in tree.get_terminals():
+        clade.confidence = None
+    Phylo.write(tree, treefile, "newick")
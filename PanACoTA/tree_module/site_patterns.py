@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+# ###############################################################################
+# This file is part of PanACOTA.                                                #
+#                                                                               #
+# Authors: Amandine Perrin                                                      #
+# Copyright © 2018-2020 Institut Pasteur (Paris).                               #
+# See the COPYRIGHT file for details.                                           #
+#                                                                               #
+# PanACOTA is a software providing tools for large scale bacterial comparative  #
+# genomics. From a set of complete and/or draft genomes, you can:               #
+#    -  Do a quality control of your strains, to eliminate poor quality         #
+# genomes, which would not give any information for the comparative study       #
+#    -  Uniformly annotate all genomes                                          #
+#    -  Do a Pan-genome                                                         #
+#    -  Do a Core or Persistent genome                                          #
+#    -  Align all Core/Persistent families                                      #
+#    -  Infer a phylogenetic tree from the Core/Persistent families             #
+#                                                                               #
+# PanACOTA is free software: you can redistribute it and/or modify it under the #
+# terms of the Affero GNU General Public License as published by the Free       #
+# Software Foundation, either version 3 of the License, or (at your option)     #
+# any later version.                                                            #
+#                                                                               #
+# PanACOTA is distributed in the hope that it will be useful, but WITHOUT ANY   #
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS     #
+# FOR A PARTICULAR PURPOSE. See the Affero GNU General Public License           #
+# for more details.                                                             #
+#                                                                               #
+# You should have received a copy of the Affero GNU General Public License      #
+# along with PanACOTA (COPYING file).                                           #
+# If not, see <https://www.gnu.org/licenses/>.                                  #
+# ###############################################################################
+
+"""
+Compression of an alignment into its unique site patterns (columns), each one with a
+weight (number of columns with this pattern), and computation of distances between
+sequences from these weighted patterns.
+
+@author gem
+"""
+
+import os
+import logging
+import numpy as np
+
+from PanACoTA.align_module import filter_align
+
+logger = logging.getLogger("tree.patterns")
+
+# Distance models computed from site patterns, with their FastME name
+MODELS = {"p": "p-distance", "J": "JC69", "K": "K2P", "T": "TN93"}
+# Distance given to pairs of sequences without any site to compare, or whose distance is
+# saturated
+MAX_DIST = 10.0
+# Max number of sequence characters handled at once
+CHUNK_SIZE = 2**24
+# Code of each nucleotide (A, C, G, T), others (gaps, ambiguous) are 4
+CODES = np.full(256, 4, dtype=np.uint8)
+for _num, _nucs in enumerate([b"Aa", b"Cc", b"Gg", b"TtUu"]):
+    CODES[list(_nucs)] = _num
+# Multiplier used to hash columns
+PRIME = np.uint64(1099511628211)
+
+
+def compress_alignment(alignfile, outfile):
+    """
+    Compress the given alignment into its site patterns, and save them in a numpy file
+    (npz) containing 'names', 'patterns' and 'weights' arrays.
+
+    Parameters
+    ----------
+    alignfile: str
+        Path to alignment file, in fasta format
+    outfile: str
+        Path to npz file to create
+    """
+    if os.path.isfile(outfile):
+        logger.info("Site patterns file already existing.")
+        logger.warning(f"The site patterns file {outfile} already exists. The program "
+                       f"will use it instead of re-compressing {alignfile}.")
+        return
+    logger.info("Compressing alignment into site patterns.")
+    names, matrix = filter_align.read_matrix(alignfile)
+    patterns, weights = compress(matrix)
+    logger.info(f"{matrix.shape[1]} columns compressed into {patterns.shape[1]} site "
+                f"patterns ({matrix.shape[1] / max(patterns.shape[1], 1):.1f}x).")
+    with open(outfile, "wb") as outf:
+        np.savez_compressed(outf, names=np.array([name.decode() for name in names]),
+                            patterns=patterns, weights=weights)
+
+
+def load_patterns(patfile):
+    """
+    Read site patterns saved by compress_alignment
+
+    Parameters
+    ----------
+    patfile: str
+        Path to npz file
+
+    Returns
+    -------
+    tuple
+        (names, patterns, weights): list of sequence names, matrix of patterns (1 line per
+        sequence, 1 column per pattern), and number of columns with each pattern
+    """
+    with np.load(patfile) as pats:
+        return list(pats["names"]), pats["patterns"], pats["weights"]
+
+
+def compress(matrix):
+    """
+    Find unique columns of the alignment, in order of their first occurrence.
+    Columns are grouped by hash, and hash groups are checked, so that 2 different columns
+    with the same hash are never merged.
+
+    Parameters
+    ----------
+    matrix: numpy.ndarray
+        alignment, 1 line per sequence
+
+    Returns
+    -------
+    tuple
+        (patterns, weights): matrix with the unique columns, and number of columns of
+        matrix equal to each one
+    """
+    _, first, inverse = np.unique(column_hashes(matrix), return_index=True,
+                                  return_inverse=True)
+    inverse = inverse.ravel()
+    patterns = matrix[:, first]
+    step = max(1, CHUNK_SIZE // max(matrix.shape[0], 1))
+    for start in range(0, matrix.shape[1], step):
+        if not (patterns[:, inverse[start:start + step]]
+                == matrix[:, start:start + step]).all():
+            logger.debug("Hash collision between site patterns: compare whole columns.")
+            columns = np.ascontiguousarray(matrix.T).view(f"V{matrix.shape[0]}").ravel()
+            _, first, inverse = np.unique(columns, return_index=True, return_inverse=True)
+            inverse = inverse.ravel()
+            break
+    # Sort patterns by their first column
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    weights = np.bincount(rank[inverse], minlength=len(order))
+    return matrix[:, first[order]], weights
+
+
+def column_hashes(matrix):
+    """
+    Hash each column of the alignment into a 64 bits integer
+
+    Parameters
+    ----------
+    matrix: numpy.ndarray
+        alignment, 1 line per sequence
+
+    Returns
+    -------
+    numpy.ndarray
+        hash of each column
+    """
+    hashes = np.zeros(matrix.shape[1], dtype=np.uint64)
+    for row in matrix:
+        hashes *= PRIME
+        hashes ^= row
+    return hashes
+
+
+def pair_counts(patterns, weights):
+    """
+    For each pair of sequences, count (with weights) the sites compared, and, among them,
+    identical sites, A <-> G transitions, C <-> T transitions and transversions.
+
+    Parameters
+    ----------
+    patterns: numpy.ndarray
+        site patterns, 1 line per sequence
+    weights: numpy.ndarray
+        weight of each pattern
+
+    Returns
+    -------
+    tuple
+        (compared, matches, trans_ag, trans_ct, transv): arrays of shape (nseq, nseq), with
+        [i, j] the number of sites where sequences i and j both have a nucleotide, and the
+        number of these sites with each type of difference
+    """
+    nseq, npat = patterns.shape
+    compared = np.zeros((nseq, nseq))
+    matches = np.zeros((nseq, nseq))
+    trans_ag = np.zeros((nseq, nseq))
+    trans_ct = np.zeros((nseq, nseq))
+    step = max(1, CHUNK_SIZE // max(nseq, 1))
+    for start in range(0, npat, step):
+        codes = CODES[patterns[:, start:start + step]]
+        block_weights = weights[start:start + step]
+        valid = (codes < 4).astype(float)
+        compared += (valid * block_weights) @ valid.T
+        onehot = [(codes == nuc).astype(float) for nuc in range(4)]
+        for nuc in range(4):
+            matches += (onehot[nuc] * block_weights) @ onehot[nuc].T
+        # A in i and G in j (C in i and T in j): G in i and A in j is the transpose
+        trans_ag += (onehot[0] * block_weights) @ onehot[2].T
+        trans_ct += (onehot[1] * block_weights) @ onehot[3].T
+    trans_ag = trans_ag + trans_ag.T
+    trans_ct = trans_ct + trans_ct.T
+    transv = compared - matches - trans_ag - trans_ct
+    return compared, matches, trans_ag, trans_ct, transv
+
+
+def distance_matrix(patterns, weights, model="T"):
+    """
+    Compute the distance between each pair of sequences, only considering sites where both
+    sequences have a nucleotide.
+
+    Parameters
+    ----------
+    patterns: numpy.ndarray
+        site patterns, 1 line per sequence
+    weights: numpy.ndarray
+        weight of each pattern
+    model: str
+        distance model, as named by FastME: p (p-distance), J (JC69), K (K2P) or T (TN93)
+
+    Returns
+    -------
+    numpy.ndarray
+        symmetric matrix of distances
+    """
+    compared, matches, trans_ag, trans_ct, transv = pair_counts(patterns, weights)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Proportion of sites with A <-> G transitions, C <-> T transitions, and transversions
+        trans_ag = trans_ag / compared
+        trans_ct = trans_ct / compared
+        transv = transv / compared
+        diff = 1 - matches / compared
+        if model == "p":
+            dist = diff
+        elif model == "J":
+            dist = -3 / 4 * np.log(1 - 4 / 3 * diff)
+        elif model == "K":
+            dist = (-1 / 2 * np.log(1 - 2 * (trans_ag + trans_ct) - transv)
+                    - 1 / 4 * np.log(1 - 2 * transv))
+        else:
+            dist = tn93(trans_ag, trans_ct, transv, base_frequencies(patterns, weights))
+    bad = ~np.isfinite(dist)
+    np.fill_diagonal(bad, False)
+    if bad.any():
+        logger.warning(f"{int(bad.sum()) // 2} pairs of sequences have no site to compare, "
+                       f"or a saturated {MODELS[model]} distance: their distance is set to "
+                       f"{MAX_DIST}.")
+    dist[bad] = MAX_DIST
+    np.fill_diagonal(dist, 0)
+    return dist
+
+
+def tn93(trans_ag, trans_ct, transv, freqs):
+    """
+    Tamura-Nei (1993) distance
+
+    Parameters
+    ----------
+    trans_ag: numpy.ndarray
+        proportion of A <-> G transitions, for each pair of sequences
+    trans_ct: numpy.ndarray
+        proportion of C <-> T transitions, for each pair of sequences
+    transv: numpy.ndarray
+        proportion of transversions, for each pair of sequences
+    freqs: numpy.ndarray
+        frequency of A, C, G and T
+
+    Returns
+    -------
+    numpy.ndarray
+        distance for each pair of sequences
+    """
+    fa, fc, fg, ft = freqs
+    fr = fa + fg
+    fy = fc + ft
+    dist = np.zeros_like(transv)
+    # Terms are 0 if one of the nucleotides is never found
+    if fr * fy > 0:
+        dist -= 2 * fr * fy * np.log(1 - transv / (2 * fr * fy))
+    if fa * fg > 0:
+        dist -= 2 * fa * fg / fr * np.log(1 - fr / (2 * fa * fg) * trans_ag - transv / (2 * fr))
+        dist += 2 * fa * fg * fy / fr * np.log(1 - transv / (2 * fr * fy))
+    if fc * ft > 0:
+        dist -= 2 * fc * ft / fy * np.log(1 - fy / (2 * fc * ft) * trans_ct - transv / (2 * fy))
+        dist += 2 * fc * ft * fr / fy * np.log(1 - transv / (2 * fr * fy))
+    return dist
+
+
+def base_frequencies(patterns, weights):
+    """
+    Frequency of each nucleotide in the whole alignment
+
+    Parameters
+    ----------
+    patterns: numpy.ndarray
+        site patterns, 1 line per sequence
+    weights: numpy.ndarray
+        weight of each pattern
+
+    Returns
+    -------
+    numpy.ndarray
+        frequency of A, C, G and T
+    """
+    codes = CODES[patterns]
+    counts = np.array([((codes == nuc) * weights).sum() for nuc in range(4)], dtype=float)
+    return counts / counts.sum()
+
+
+def bootstrap_weights(weights, boot, seed=None):
+    """
+    Resample columns of the alignment, directly on patterns: drawing as many columns as
+    in the alignment, with replacement, is drawing the new weight of each pattern from a
+    multinomial distribution.
+
+    Parameters
+    ----------
+    weights: numpy.ndarray
+        weight of each pattern
+    boot: int
+        number of bootstrap replicates
+    seed: int or None
+        seed of the random generator
+
+    Returns
+    -------
+    numpy.ndarray
+        array of shape (boot, number of patterns), with weights of each replicate
+    """
+    rng = np.random.default_rng(seed)
+    return rng.multinomial(weights.sum(), weights / weights.sum(), size=boot)
+
+
+def write_distances(outfile, names, matrices):
+    """
+    Write distance matrices in PHYLIP format, one after the other
+
+    Parameters
+    ----------
+    outfile: str
+        Path to output file
+    names: list
+        name of each sequence
+    matrices: iterable
+        distance matrices to write
+    """
+    with open(outfile, "w") as outf:
+        for dist in matrices:
+            outf.write(f"{len(names)}\n")
+            for name, row in zip(names, dist):
+                outf.write(name + " " + " ".join(f"{val:.8f}" for val in row) + "\n")
+            outf.write("\n")
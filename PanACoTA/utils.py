@@ -353,6 +353,43 @@ def run_cmd(cmd, error, eof=False, **kwargs):
     return call
 
 
+def get_available_memory():
+    """
+    Get memory available for the current process, in bytes: the minimum between the
+    memory available on the machine (MemAvailable in /proc/meminfo) and the memory limit
+    of its cgroup (v2 or v1), for example when running in a container or in a job of a
+    cluster scheduler.
+
+    Returns
+    -------
+    int or None
+        memory available in bytes, None if it cannot be found (for example, not on Linux)
+    """
+    limits = []
+    try:
+        with open("/proc/meminfo") as memf:
+            for line in memf:
+                if line.startswith("MemAvailable:"):
+                    limits.append(int(line.split()[1]) * 1024)
+                    break
+    except OSError:
+        pass
+    # Memory limit of the cgroup: 'max' (v2) or a huge number (v1) if there is no limit
+    for limit_file in ["/sys/fs/cgroup/memory.max",
+                       "/sys/fs/cgroup/memory/memory.limit_in_bytes"]:
+        try:
+            with open(limit_file) as limf:
+                limit = limf.read().strip()
+        except OSError:
+            continue
+        if limit.isdigit() and int(limit) < 2**60:
+            limits.append(int(limit))
+        break
+    if not limits:
+        return None
+    return min(limits)
+
+
 def plot_distr(values, limit, title, text, logger):
     """
     Plot histogram of given 'values', and add a vertical line corresponding to the chosen
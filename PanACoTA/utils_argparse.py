@@ -196,6 +196,47 @@ def perc_id(param):
     return param
 
 
+def pers_combo(param):
+    """
+    Check a persistent genome definition given to --batch: 'tol', optionally followed by
+    ':multi' or ':mixed' and/or ':F' (floor), for example '0.95:mixed:F'.
+    Returns (tol, multi, mixed, floor)
+    """
+    fields = param.split(":")
+    tol = percentage(fields[0])
+    options = fields[1:]
+    wrong = [opt for opt in options if opt not in ["multi", "mixed", "F"]]
+    if wrong or len(set(options)) != len(options):
+        msg = (f"invalid persistent genome definition: '{param}'. Use 'tol', optionally "
+               "followed by ':multi' or ':mixed' and/or ':F', for example 0.95:mixed:F")
+        raise argparse.ArgumentTypeError(msg)
+    multi = "multi" in options
+    mixed = "mixed" in options
+    floor = "F" in options
+    if multi and mixed:
+        msg = f"'{param}': multi and mixed families cannot be allowed together."
+        raise argparse.ArgumentTypeError(msg)
+    if (mixed or floor) and tol == 1:
+        msg = (f"'{param}': mixed families and floor cannot be used with tol=1 (core genome).")
+        raise argparse.ArgumentTypeError(msg)
+    return tol, multi, mixed, floor
+
+
+def mem_size(param):
+    """
+    Check memory size given to --max-memory: a positive int followed by a unit
+    (B, K, M, G or T), or 0 for no limit. Returns it with mmseqs format, for example '20G'
+    """
+    size = param.strip().upper()
+    if size == "0":
+        return size
+    if len(size) < 2 or not size[:-1].isdigit() or size[-1] not in "BKMGT" or int(size[:-1]) == 0:
+        msg = (f"invalid memory size: '{param}'. Give a positive number followed by its unit "
+               "(B, K, M, G or T), for example 20G, or 0 for no limit.")
+        raise argparse.ArgumentTypeError(msg)
+    return size
+
+
 class Conf_all_parser(configparser.ConfigParser):
     """
     Read configfile and return arguments found, according to required type
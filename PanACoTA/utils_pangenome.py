@@ -42,6 +42,7 @@ April 2017
 import logging
 import os
 import sys
+import numpy as np
 from PanACoTA import utils
 
 logger = logging.getLogger("utils.pan")
@@ -176,12 +177,7 @@ def read_gene(gene, num, fams_by_strain, all_strains):
         set of all strains
 
     """
-    # if format is ESCO.1512.00001.i001_12313 genome name is ESCO.1512.00001
-    if "." in gene and len(gene.split(".")) >= 3:
-        strain = ".".join(gene.split("_")[0].split(".")[:3])
-    # otherwise, genename is everything before the last "_"
-    else:
-        strain = "_".join(gene.split("_")[:-1])
+    strain = get_strain(gene)
     if strain in fams_by_strain[num]:
         fams_by_strain[num][strain].append(gene)
     else:
@@ -190,6 +186,262 @@ def read_gene(gene, num, fams_by_strain, all_strains):
         all_strains.add(strain)
 
 
+def get_strain(gene):
+    """
+    Get the name of the genome from which the given gene is
+
+    Parameters
+    ----------
+    gene : str
+        gene name (species.date.strain.contig_number or genome_number)
+
+    Returns
+    -------
+    str
+        genome name
+    """
+    # if format is ESCO.1512.00001.i001_12313 genome name is ESCO.1512.00001
+    if "." in gene and len(gene.split(".")) >= 3:
+        return ".".join(gene.split("_")[0].split(".")[:3])
+    # otherwise, genename is everything before the last "_"
+    return "_".join(gene.split("_")[:-1])
+
+
+class GenomeResolver:
+    """
+    Find the genome from which a protein is, from its name. Built once from the list of
+    all genomes, it then resolves each name in constant time, whatever the number of genomes.
+
+    A protein is from the genome whose name is the longest correct prefix of the protein name:
+    a prefix ending at a separator ('.' or '_'), or the whole name.
+    Ex: GEN_12_00001 is from genome GEN_12, even if GEN is also a genome, and GEN_1234 is from
+    genome GEN, not from genome GEN_12.
+
+    For gembase names (ESCO.1512.00001.i0002_12124), the genome (3 first fields) is directly
+    found in a dict. For other names, the correct prefixes of the name are tried from the
+    longest one: genomes are stored with all their correct prefixes, which is a trie on fields
+    of genome names.
+
+    Parameters
+    ----------
+    genomes : iterable
+        all genome names. If empty, names are resolved with :func:`get_strain`.
+    """
+
+    SEPARATORS = "._"
+
+    def __init__(self, genomes=()):
+        self.genomes = frozenset(genomes)
+        # Correct prefixes of genome names, which can lead to a longer genome name
+        self.prefixes = frozenset(pref for genome in self.genomes
+                                  for pref in self.correct_prefixes(genome, whole=False))
+
+    @classmethod
+    def correct_prefixes(cls, name, whole=True):
+        """
+        Generate all correct prefixes of name, from the longest one
+
+        Parameters
+        ----------
+        name : str
+            protein or genome name
+        whole : bool
+            True if the whole name must be given as first prefix
+
+        Yields
+        ------
+        str
+            prefixes of name ending just before a separator
+        """
+        end = len(name)
+        if whole:
+            yield name
+        while True:
+            end = max(name.rfind(sep, 0, end) for sep in cls.SEPARATORS)
+            if end <= 0:
+                return
+            yield name[:end]
+
+    def find(self, name):
+        """
+        Find the genome of the given protein name among all genomes
+
+        Parameters
+        ----------
+        name : str
+            protein name
+
+        Returns
+        -------
+        str or None
+            genome name, None if no genome corresponds to the protein name
+        """
+        if not self.genomes:
+            return None
+        # Gembase format: genome is the 3 first fields, if it is not the prefix of a longer
+        # genome name
+        fields = name.split(".", 3)
+        if len(fields) >= 3:
+            genome = ".".join(fields[:3])
+            if genome in self.genomes and genome not in self.prefixes:
+                return genome
+        for prefix in self.correct_prefixes(name):
+            if prefix in self.genomes:
+                return prefix
+        return None
+
+    def __call__(self, name):
+        """
+        Get the genome of the given protein name: the one found among all genomes, or,
+        if not found, the one given by :func:`get_strain`
+
+        Parameters
+        ----------
+        name : str
+            protein name
+
+        Returns
+        -------
+        str
+            genome name
+        """
+        return self.find(name) or get_strain(name)
+
+
+def write_protein_index(families, pangenome):
+    """
+    Write the index of the pangenome: sorted array of all proteins, and array with the family
+    of each of them, saved as numpy files in <pangenome>.index directory. They can then be
+    memory-mapped (see load_protein_index) to find the family of a protein, or all proteins
+    of a genome, by binary search, without reading the pangenome.
+
+    Parameters
+    ----------
+    families : dict
+        {fam_num: [all members]}. Family numbers must be integers (or strings of integers)
+    pangenome : str
+        pangenome file
+
+    Returns
+    -------
+    str
+        directory containing index files
+    """
+    index_dir = pangenome + ".index"
+    os.makedirs(index_dir, exist_ok=True)
+    proteins = np.array([member.encode() for members in families.values()
+                         for member in members], dtype=bytes)
+    fams = np.fromiter((int(num) for num, members in families.items() for _ in members),
+                       dtype=np.int64, count=len(proteins))
+    order = np.argsort(proteins, kind="stable")
+    np.save(os.path.join(index_dir, "proteins.npy"), proteins[order])
+    np.save(os.path.join(index_dir, "families.npy"), fams[order])
+    return index_dir
+
+
+def load_protein_index(pangenome):
+    """
+    Load the index of the pangenome (see write_protein_index), memory-mapped
+
+    Parameters
+    ----------
+    pangenome : str
+        pangenome file
+
+    Returns
+    -------
+    tuple
+        (proteins, families): sorted array of proteins (bytes), and array of their families
+    """
+    index_dir = pangenome + ".index"
+    if not os.path.isdir(index_dir):
+        logger.error(f"No index found for pangenome {pangenome} ({index_dir} does not exist).")
+        sys.exit(1)
+    proteins = np.load(os.path.join(index_dir, "proteins.npy"), mmap_mode="r")
+    fams = np.load(os.path.join(index_dir, "families.npy"), mmap_mode="r")
+    return proteins, fams
+
+
+def has_protein_index(pangenome):
+    """
+    Check if the pangenome has an index, written after the pangenome file itself (an index
+    older than the pangenome may not correspond to it)
+
+    Parameters
+    ----------
+    pangenome : str
+        pangenome file
+
+    Returns
+    -------
+    bool
+    """
+    index_files = [os.path.join(pangenome + ".index", name)
+                   for name in ["proteins.npy", "families.npy"]]
+    if not all(os.path.isfile(file) for file in [pangenome] + index_files):
+        return False
+    return min(os.path.getmtime(file) for file in index_files) >= os.path.getmtime(pangenome)
+
+
+def get_protein_family(index, protein):
+    """
+    Get the family of a protein, by binary search in the pangenome index
+
+    Parameters
+    ----------
+    index : tuple
+        (proteins, families) as returned by load_protein_index
+    protein : str
+        protein name
+
+    Returns
+    -------
+    int or None
+        family number, None if protein is not in the pangenome
+    """
+    proteins, fams = index
+    key = protein.encode()
+    pos = np.searchsorted(proteins, key)
+    if pos < len(proteins) and proteins[pos] == key:
+        return int(fams[pos])
+    return None
+
+
+def get_genome_families(index, genome, resolver=None):
+    """
+    Get all proteins of a genome, with their family. As proteins names start with their
+    genome name, they are all in a contiguous part of the sorted proteins array, found by
+    binary search.
+
+    Parameters
+    ----------
+    index : tuple
+        (proteins, families) as returned by load_protein_index
+    genome : str
+        genome name
+    resolver : GenomeResolver or None
+        resolver built from all genomes, to find the genome of each protein. None to
+        use get_strain
+
+    Returns
+    -------
+    dict
+        {protein: fam_num} for all proteins of the genome
+    """
+    proteins, fams = index
+    prefix = genome.encode()
+    start = np.searchsorted(proteins, prefix)
+    end = np.searchsorted(proteins, prefix + b"\xff")
+    members = {}
+    resolver = resolver or get_strain
+    for protein, fam_num in zip(proteins[start:end], fams[start:end]):
+        protein = protein.decode()
+        # Other genomes can start with the same name (GEN_1 and GEN_12 for example)
+        if resolver(protein) == genome:
+            members[protein] = int(fam_num)
+    return members
+
+
 def read_lstinfo(lstinfo, logger):
     """
     Read lstinfo file and return list of genomes
@@ -95,7 +95,56 @@ def test_parser_default():
     assert options.verbose == 0
     assert options.quiet is False
     assert options.prot_ali is False
-    
+    assert options.aligner == "mafft"
+    assert options.align_cache is None
+    assert options.align_cache_size == 1024
+    assert options.max_gaps is None
+    assert options.sites == "all"
+
+
+def test_parser_aligner(capsys):
+    """
+    Test that the chosen aligner is given, and that an unknown aligner gives an error
+    """
+    parser = argparse.ArgumentParser(description="Align families", add_help=False)
+    align.build_parser(parser)
+    options = align.parse(parser, "-c cp -l lg -n dname -d dbpath -o outdir --aligner famsa".split())
+    assert options.aligner == "famsa"
+    with pytest.raises(SystemExit):
+        align.parse(parser, "-c cp -l lg -n dname -d dbpath -o outdir --aligner probcons".split())
+    _, err = capsys.readouterr()
+    assert "argument --aligner: invalid choice: 'probcons'" in err
+
+
+def test_parser_cache_size(capsys):
+    """
+    Test that a negative or null cache size gives an error
+    """
+    parser = argparse.ArgumentParser(description="Align families", add_help=False)
+    align.build_parser(parser)
+    with pytest.raises(SystemExit):
+        align.parse(parser, "-c cp -l lg -n dname -d dbpath -o outdir --align-cache cache "
+                            "--align-cache-size 0".split())
+    _, err = capsys.readouterr()
+    assert "--align-cache-size must be a positive number of MB." in err
+
+
+def test_parser_filter(capsys):
+    """
+    Test that columns filters are given, and that a proportion of gaps not between 0 and 1
+    gives an error
+    """
+    parser = argparse.ArgumentParser(description="Align families", add_help=False)
+    align.build_parser(parser)
+    options = align.parse(parser, "-c cp -l lg -n dname -d dbpath -o outdir --max-gaps 0.5 "
+                                  "--sites informative".split())
+    assert options.max_gaps == 0.5
+    assert options.sites == "informative"
+    with pytest.raises(SystemExit):
+        align.parse(parser, "-c cp -l lg -n dname -d dbpath -o outdir --max-gaps 50".split())
+    _, err = capsys.readouterr()
+    assert "--max-gaps must be a proportion, between 0 and 1." in err
+
 
 def test_parser_allthreads():
     """
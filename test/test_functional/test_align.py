@@ -46,8 +46,8 @@ def setup_teardown_module():
 def test_main():
     """
     Test that when giving a database, a persistent genome and a list of genomes, it extracts
-    expected proteins by family, aligns each family, back-translates them, concatenates all
-    families into one file and groups them by genome.
+    expected proteins by family, aligns each family, back-translates them, and groups them
+    by genome.
     """
     corepers = os.path.join(TESTPATH, "test_pers0.99FX.lst")
     list_genomes = os.path.join("test", "data", "pangenome", "test_files", "list_to_pan.txt")
@@ -79,9 +79,7 @@ def test_main():
         assert os.path.isfile(os.path.join(aldir, f'{dname}-current.{fam}.miss.lst'))
         assert os.path.isfile(os.path.join(aldir, f'{dname}-mafft-align.{fam}.aln'))
         assert os.path.isfile(os.path.join(aldir, f'{dname}-mafft-prt2nuc.{fam}.aln'))
-    out_concat = os.path.join(aldir, dname + "-complete.nucl.cat.aln")
-    exp_concat = os.path.join(EXPPATH, "exp_pers4genome-complete.cat.aln")
-    assert tutil.compare_order_content(out_concat, exp_concat)
+    assert not os.path.isfile(os.path.join(aldir, dname + "-complete.nucl.cat.aln"))
     # Check content of treedir
     out_grp = os.path.join(treedir, dname + ".nucl.grp.aln")
     exp_grp = os.path.join(EXPPATH, "exp_pers4genomes.grp.aln")
@@ -178,9 +176,6 @@ def test_main_exist_ok():
         outaln = os.path.join(aldir, f'{dname}-mafft-align.{fam}.aln')
         refaln = os.path.join(ex_aldir, f"mafft-align.{fam}-completed.aln")
         shutil.copyfile(refaln, outaln)
-    outcat = os.path.join(aldir, dname + "-complete.nucl.cat.aln")
-    refcat = os.path.join(EXPPATH, "exp_pers4genome-complete.cat.aln")
-    shutil.copyfile(refcat, outcat)
     # Create content of treedir
     outgrp = os.path.join(treedir, dname + ".nucl.grp.aln")
     refgrp = os.path.join(EXPPATH, "exp_pers4genomes.grp.aln")
@@ -216,11 +211,6 @@ def test_main_exist_ok():
             "for the next step. If you want to re-extract a given family, remove its prt and "
             "gen extraction files. If you want to re-extract all families, use option -F "
             "(or --force).") in " ".join(log_content)
-    assert ("nucl alignments already concatenated in "
-            "test/data/align/generated_by_func_tests/test_main_exist_ok/Align-TEST4exists/"
-            "TEST4exists-complete.nucl.cat.aln. Program will "
-            "use it for next steps. If you want to redo it, remove it before "
-            "running.") in " ".join(log_content)
     assert ("nucleic alignments already grouped by genome in "
             "test/data/align/generated_by_func_tests/test_main_exist_ok/Phylo-TEST4exists/"
             "TEST4exists.nucl.grp.aln. Program will end.") in " ".join(log_content)
@@ -284,9 +274,6 @@ def test_main_exist_emptygrp(capsys):
         outaln = os.path.join(aldir, f'{dname}-mafft-align.{fam}.aln')
         refaln = os.path.join(ex_aldir, f"mafft-align.{fam}-completed.aln")
         shutil.copyfile(refaln, outaln)
-    outcat = os.path.join(aldir, dname + "-complete.nucl.cat.aln")
-    refcat = os.path.join(EXPPATH, "exp_pers4genome-complete.cat.aln")
-    shutil.copyfile(refcat, outcat)
     # Create content of treedir, with empty grp
     outgrp = os.path.join(treedir, dname + ".nucl.grp.aln")
     open(outgrp, "w").close()
@@ -296,10 +283,7 @@ def test_main_exist_emptygrp(capsys):
 
     # Check nucl grp still empty
     assert os.stat(outgrp).st_size == 0
-    # Check aa concat and grp are as expected
-    refcataa = os.path.join(ex_aldir, "complete.aa.cat.aln")
-    outcataa = os.path.join(aldir, dname + "-complete.aa.cat.aln")
-    assert tutil.compare_order_content(refcataa, outcataa)
+    # Check aa grp is as expected
     outgrpaa = os.path.join(treedir, dname + ".aa.grp.aln")
     refgrpaa = os.path.join(EXPPATH, "exp_pers4genomes.aa.grp.aln")
     assert tutil.compare_order_content(refgrpaa, outgrpaa)
@@ -334,12 +318,6 @@ def test_main_exist_emptygrp(capsys):
     print("OUT")
     for l in log_content:
         print(l)
-    assert "nucl alignments already concatenated" in out
-    assert ("nucl alignments already concatenated in "
-            f"{outdir}/Align-{dname}/{dname}-complete.nucl.cat.aln. Program will "
-            "use it for next steps. If you want to redo it, remove it before "
-            "running.") in " ".join(log_content)
-    assert ("Concatenating all aa alignment files") in " ".join(log_content)
     assert ("Grouping protein alignments per genome") in " ".join(log_content)
     assert "nucleic alignments already grouped by genome" in " ".join(log_content)
     assert ("nucleic alignments already grouped by genome in "
@@ -350,8 +328,9 @@ def test_main_exist_emptygrp(capsys):
 
 def test_main_exist_emptycat(capsys):
     """
-    test main all files exist but "Hello !!" in concat and "It's me" in grp
-    -> do nothing, as we do not check concat and grp files
+    test main all files exist but "Hello !!" in a concatenated file left by a previous version,
+    and "It's me" in grp
+    -> do nothing, as we do not check grp file, and concatenated file is not used anymore
     -> check that there is still the input content in cat and grp files
     """
     corepers = os.path.join(TESTPATH, "test_pers0.99FX.lst")
@@ -448,11 +427,6 @@ def test_main_exist_emptycat(capsys):
             "for the next step. If you want to re-extract a given family, remove its prt and "
             "gen extraction files. If you want to re-extract all families, use option -F "
             "(or --force).") in " ".join(log_content)
-    assert "nucl alignments already concatenated" in out
-    assert ("nucl alignments already concatenated in "
-            f"{outdir}/Align-{dname}/{dname}-complete.nucl.cat.aln. "
-            "Program will use it for next steps. If you want to redo it, remove it before "
-            "running.") in " ".join(log_content)
     assert "nucleic alignments already grouped by genome" in out
     assert ("nucleic alignments already grouped by genome in "
             f"{outdir}/Phylo-{dname}/{dname}.nucl.grp.aln. "
@@ -462,7 +436,7 @@ def test_main_exist_emptycat(capsys):
 
 def test_main_exist_emptyp2n(capsys):
     """
-    test main all files exist but empty prt2nuc for 1 fam -> redo this prt2nuc and concat and grp
+    test main all files exist but empty prt2nuc for 1 fam -> redo this prt2nuc and grp
     """
     corepers = os.path.join(TESTPATH, "test_pers0.99FX.lst")
     list_genomes = os.path.join("test", "data", "pangenome", "test_files", "list_to_pan.txt")
@@ -513,10 +487,6 @@ def test_main_exist_emptyp2n(capsys):
     outbtr1 = os.path.join(aldir, f'{dname}-mafft-prt2nuc.1.aln').format(dname)
     with open(outbtr1, "w") as outf:
         outf.write("Hello !!")
-    # Write wrong concat file
-    outcat = os.path.join(aldir, dname + "-complete.nucl.cat.aln")
-    with open(outcat, "w") as oc:
-        oc.write("complete cat aln")
     # Create content of treedir
     outgrp = os.path.join(treedir, dname + ".nucl.grp.aln")
     with open(outgrp, "w") as og:
@@ -528,12 +498,6 @@ def test_main_exist_emptyp2n(capsys):
     # Check btr file for fam 1 was changed
     ref_btr1 = os.path.join(ex_aldir, "mafft-prt2nuc.1.aln")
     assert tutil.compare_order_content(ref_btr1, outbtr1)
-    # Check concat files, for nucleic and protein
-    refcat = os.path.join(ex_aldir, "complete.cat.aln")
-    assert tutil.compare_order_content(refcat, outcat)
-    refcataa = os.path.join(ex_aldir, "complete.aa.cat.aln")
-    outcataa = os.path.join(aldir, dname + "-complete.aa.cat.aln")
-    assert tutil.compare_order_content(refcataa, outcataa)
     # Check grouped by genome files (aa and nucleic)
     refgrp = os.path.join(EXPPATH, "exp_pers4genomes.grp.aln")
     assert tutil.compare_order_content(refgrp, outgrp)
@@ -591,7 +555,7 @@ def test_main_exist_emptyp2n(capsys):
 def test_main_emptymafft1(capsys):
     """
     Test main all files exist but mafft empty for 1 fam -> redo mafft and prt2nuc for this fam,
-    + concat + grp
+    + grp
     """
     corepers = os.path.join(TESTPATH, "test_pers0.99FX.lst")
     list_genomes = os.path.join("test", "data", "pangenome", "test_files", "list_to_pan.txt")
@@ -651,10 +615,7 @@ def test_main_emptymafft1(capsys):
     out_p2n1 = os.path.join(aldir, f'{dname}-mafft-prt2nuc.1.aln')
     ref_p2n1 = os.path.join(ex_aldir, "mafft-prt2nuc.1.aln")
     assert tutil.compare_order_content(out_p2n1, ref_p2n1)
-    # Check content of concatenated and grouped files
-    out_concat = os.path.join(aldir, dname + "-complete.nucl.cat.aln")
-    exp_concat = os.path.join(EXPPATH, "exp_pers4genome-complete.cat.aln")
-    assert tutil.compare_order_content(out_concat, exp_concat)
+    # Check content of grouped file
     out_grp = os.path.join(treedir, dname + ".nucl.grp.aln")
     exp_grp = os.path.join(EXPPATH, "exp_pers4genomes.grp.aln")
     assert tutil.compare_order_content(out_grp, exp_grp)
@@ -712,7 +673,7 @@ def test_main_emptyprtgen(capsys):
     """
     Test main all files exist but empty prt extraction for 1 fam, empty gen extract for 1 other fam
     -> exits with error message because wrong extractions for family 1 and 4 (and not redone as
-    not force). Should have removed align and prt2nuc files for fams 1 and 4, and concat and group files
+    not force). Should have removed align and prt2nuc files for fams 1 and 4, and group files
     """
     corepers = os.path.join(TESTPATH, "test_pers0.99FX.lst")
     list_genomes = os.path.join("test", "data", "pangenome", "test_files", "list_to_pan.txt")
@@ -764,9 +725,7 @@ def test_main_emptyprtgen(capsys):
     outgen4 = os.path.join(aldir, f'{dname}-current.4.gen')
     open(outprt1, "w").close()
     open(outgen4, "w").close()
-    # Empty concat and group files
-    out_concat = os.path.join(aldir, dname + "-complete.nucl.cat.aln")
-    open(out_concat, "w").close()
+    # Empty group file
     out_grp = os.path.join(treedir, dname + ".nucl.grp.aln")
     open(out_grp, "w").close()
 
@@ -780,8 +739,7 @@ def test_main_emptyprtgen(capsys):
         outbtr = os.path.join(aldir, f'{dname}-mafft-prt2nuc.{fam}.aln')
         assert not os.path.isfile(outaln)
         assert not os.path.isfile(outbtr)
-    # Check concatenated and grouped files are removed
-    assert not os.path.isfile(out_concat)
+    # Check grouped file is removed
     assert not os.path.isfile(out_grp)
     # Check logs
     out, err = capsys.readouterr()
@@ -957,6 +915,11 @@ def test_main_from_parse_force(capsys):
     args.force = force
     args.verbose = 2
     args.quiet = False
+    args.aligner = "mafft"
+    args.align_cache = None
+    args.align_cache_size = 1024
+    args.max_gaps = None
+    args.sites = "all"
     args.argv = "cmd test_main_exist_empty-m1"
 
     # Create output directories and files
@@ -978,9 +941,8 @@ def test_main_from_parse_force(capsys):
     outmiss = os.path.join(aldir, f'{dname}-current.8.miss.lst')
     outbtr = os.path.join(aldir, f'{dname}-mafft-prt2nuc.4.aln')
     outaln = os.path.join(aldir, f'{dname}-mafft-align.1.aln')
-    outcat = os.path.join(aldir, dname + "-complete.nucl.cat.aln")
     outgrp = os.path.join(treedir, dname + ".nucl.grp.aln")
-    wrong_files = [outlistgen, outlistprt, outgen, outprt, outmiss, outbtr, outaln, outcat, outgrp]
+    wrong_files = [outlistgen, outlistprt, outgen, outprt, outmiss, outbtr, outaln, outgrp]
     for file in wrong_files:
         with open(file,"w") as f:
             f.write("wrong file content")
@@ -1019,9 +981,8 @@ def test_main_from_parse_force(capsys):
     refmiss = os.path.join(ex_aldir, f"current.8.miss.lst")
     refaln = os.path.join(ex_aldir, f"mafft-align.1.aln")
     refbtr = os.path.join(ex_aldir, f"mafft-prt2nuc.4.aln")
-    exp_concat = os.path.join(EXPPATH, "exp_pers4genome-complete.cat.aln")
     exp_grp = os.path.join(EXPPATH, "exp_pers4genomes.grp.aln")
-    ref_files = [refgen, refprt, refmiss, refbtr, refaln, exp_concat, exp_grp]
+    ref_files = [refgen, refprt, refmiss, refbtr, refaln, exp_grp]
     for fout, fexp in zip(wrong_files[2:], ref_files):
         assert tutil.compare_order_content(fout, fexp)
 
@@ -219,6 +219,23 @@ def test_corepers_tol(capsys):
     assert not options.boot
 
 
+def test_corepers_check(capsys):
+    """
+    Test that corepers options are checked, although 'all' does not have corepers-only
+    options (--batch, --subsets, --serve)
+    """
+    parser = argparse.ArgumentParser(description="Run all modules", add_help=False)
+    allm.build_parser(parser)
+    options = allm.parse(parser, "-o out-all -n TEST -T 1234 --tol 0.9 -X".split())
+    assert options.tol == 0.9
+    assert options.mixed
+    assert not hasattr(options, "batch")
+    with pytest.raises(SystemExit):
+        allm.parse(parser, "-o out-all -n TEST -T 1234 --tol 0.9 -X -Mu".split())
+    _, err = capsys.readouterr()
+    assert "-M and -X options cannot be activated together" in err
+
+
 def test_parser_cutn_l90_nbcont():
     """
     When user gives custom value for cutn, l90 and/or nbcont, it keeps it. No replacement with annotate module.
@@ -241,8 +241,8 @@ def test_main_norefseq():
     # CHECK PAN
     assert(len(glob.glob(os.path.join(ali_dir, "PanACoTA*log*")))) == 3
     assert os.path.isdir(os.path.join(ali_dir, "Align-TEST_4"))
-    assert os.path.isfile(os.path.join(ali_dir, "Align-TEST_4", "TEST_4-complete.nucl.cat.aln"))
-    assert os.path.isfile(os.path.join(ali_dir, "Align-TEST_4", "TEST_4-complete.aa.cat.aln"))
+    assert not os.path.isfile(os.path.join(ali_dir, "Align-TEST_4", "TEST_4-complete.nucl.cat.aln"))
+    assert not os.path.isfile(os.path.join(ali_dir, "Align-TEST_4", "TEST_4-complete.aa.cat.aln"))
     assert os.path.isdir(os.path.join(ali_dir, "List-TEST_4"))
     assert os.path.isdir(os.path.join(ali_dir, "Phylo-TEST_4"))
     assert os.path.isfile(os.path.join(ali_dir, "Phylo-TEST_4", "TEST_4.nucl.grp.aln"))
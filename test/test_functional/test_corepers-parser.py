@@ -120,6 +120,9 @@ def test_parser_default():
     assert not options.floor
     assert options.verbose == 0
     assert not options.quiet
+    assert not options.batch
+    assert not options.subsets
+    assert not options.serve
 
 
 def test_parser_mixed_floor():
@@ -138,3 +141,74 @@ def test_parser_mixed_floor():
     assert options.floor is True
     assert options.verbose == 0
     assert not options.quiet
+
+
+def test_parser_batch():
+    """
+    Test that all persistent genome definitions given to --batch are kept
+    """
+    parser = argparse.ArgumentParser(description="Do corepers", add_help=False)
+    corepers.build_parser(parser)
+    options = corepers.parse(parser, "-p pangenome -o outdir --batch 1 0.99 0.95:mixed "
+                                     "0.9:multi:F".split())
+    assert options.batch == [(1, False, False, False), (0.99, False, False, False),
+                             (0.95, False, True, False), (0.9, True, False, True)]
+
+
+@pytest.mark.parametrize("combo, error", [
+    ("0.9:toto", "invalid persistent genome definition: '0.9:toto'"),
+    ("0.9:F:F", "invalid persistent genome definition: '0.9:F:F'"),
+    ("0.9:multi:mixed", "'0.9:multi:mixed': multi and mixed families cannot be allowed together"),
+    ("1:mixed", "'1:mixed': mixed families and floor cannot be used with tol=1"),
+    ("1.5", "Invalid value: 1.5")])
+def test_parser_batch_wrong(combo, error, capsys):
+    """
+    Test that wrong persistent genome definitions given to --batch exit with an error
+    """
+    parser = argparse.ArgumentParser(description="Do corepers", add_help=False)
+    corepers.build_parser(parser)
+    with pytest.raises(SystemExit):
+        corepers.parse(parser, f"-p pangenome -o outdir --batch 0.95 {combo}".split())
+    _, err = capsys.readouterr()
+    assert error in err
+
+
+def test_parser_batch_tol(capsys):
+    """
+    Test that --batch cannot be used with -t, -M, -X or -F
+    """
+    parser = argparse.ArgumentParser(description="Do corepers", add_help=False)
+    corepers.build_parser(parser)
+    with pytest.raises(SystemExit):
+        corepers.parse(parser, "-p pangenome -o outdir -t 0.9 -M --batch 0.95".split())
+    _, err = capsys.readouterr()
+    assert "--batch cannot be used with -t, -M, -X or -F options" in err
+
+
+def test_parser_subsets_lstinfo(capsys):
+    """
+    Test that --subsets cannot be used with -l
+    """
+    parser = argparse.ArgumentParser(description="Do corepers", add_help=False)
+    corepers.build_parser(parser)
+    options = corepers.parse(parser, "-p pangenome -o outdir --subsets clades".split())
+    assert options.subsets == "clades"
+    with pytest.raises(SystemExit):
+        corepers.parse(parser, "-p pangenome -o outdir --subsets clades -l lstinfo".split())
+    _, err = capsys.readouterr()
+    assert "--subsets cannot be used with -l option" in err
+
+
+@pytest.mark.parametrize("option", ["-l lstinfo", "--batch 0.9", "--subsets clades"])
+def test_parser_serve_incompatible(option, capsys):
+    """
+    Test that --serve cannot be used with -l, --batch or --subsets
+    """
+    parser = argparse.ArgumentParser(description="Do corepers", add_help=False)
+    corepers.build_parser(parser)
+    options = corepers.parse(parser, "-p pangenome -o outdir --serve unix:pan.sock".split())
+    assert options.serve == "unix:pan.sock"
+    with pytest.raises(SystemExit):
+        corepers.parse(parser, f"-p pangenome -o outdir --serve 127.0.0.1:8000 {option}".split())
+    _, err = capsys.readouterr()
+    assert "--serve cannot be used with -l, --batch or --subsets" in err
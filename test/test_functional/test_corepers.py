@@ -293,6 +293,9 @@ def test_main_from_parse(capsys):
     args.outputdir = GENEPATH
     args.verbose = 0
     args.quiet = False
+    args.batch = None
+    args.subsets = None
+    args.serve = None
     args.argv = "PanACoTA corepers test_main_from_parse"
 
     corepers.main_from_parse(args)
@@ -315,3 +318,67 @@ def test_main_from_parse(capsys):
     assert "Generating Persistent genome of a dataset containing 4 genomes" in out
     assert ("The core genome contains 2 families, each one having exactly 4 "
             "members, from the 4 different genomes.") in out
+
+
+def test_main_batch(capsys):
+    """
+    Test that in batch mode, all persistent genomes asked are generated, with the same
+    content as when they are generated one by one
+    """
+    batch = [(1, False, False, False), (0.99, False, False, True),
+             (0.99, False, True, True), (0.99, True, False, True)]
+    outfiles = corepers.main("cmd", UPAN, 1, False, False, GENEPATH, "", False, 0, False,
+                             batch=batch)
+    exp_names = ["PersGenome_pangenome.lst-all_1.lst", "PersGenome_pangenome.lst-all_F0.99.lst",
+                 "PersGenome_pangenome.lst-all_F0.99-mixed.lst",
+                 "PersGenome_pangenome.lst-all_F0.99-multi.lst"]
+    assert outfiles == [os.path.join(GENEPATH, name) for name in exp_names]
+    exp_files = ["exp_coregenome.txt", "exp_pers-floor-strict.txt", "exp_pers-floor-mixed.txt",
+                 "exp_pers-floor-multi.txt"]
+    for outfile, exp_file in zip(outfiles, exp_files):
+        assert tutil.compare_order_content(outfile, os.path.join(EXP_PATH, exp_file))
+    out, err = capsys.readouterr()
+    assert "Will generate a CoreGenome." in out
+    assert out.count("Generating Persistent genome of a dataset containing 4 genomes") == 4
+
+
+def test_main_subsets(capsys):
+    """
+    Test that with subsets given in a directory, the persistent genomes of all subsets are
+    generated, with the same content as when they are generated one by one
+    """
+    subdir = os.path.join(GENEPATH, "subsets")
+    os.makedirs(subdir)
+    with open(os.path.join(subdir, "lstinfo-ok.lst"), "w") as lst:
+        lst.write("GEN4.1111.00001 toto we don't use other fields\n")
+        lst.write("GENO.1216.00003\n")
+    shutil.copyfile(os.path.join(TEST_PATH, "test_lstinfo.txt"), os.path.join(subdir, "all.lst"))
+    batch = [(1, False, False, False), (0.99, True, False, True)]
+    outfiles = corepers.main("cmd", UPAN, 1, False, False, GENEPATH, "", False, 0, False,
+                             batch=batch, subsets=subdir)
+    exp_names = ["PersGenome_pangenome.lst-all.lst_1.lst",
+                 "PersGenome_pangenome.lst-all.lst_F0.99-multi.lst",
+                 "PersGenome_pangenome.lst-lstinfo-ok.lst_1.lst",
+                 "PersGenome_pangenome.lst-lstinfo-ok.lst_F0.99-multi.lst"]
+    assert outfiles == [os.path.join(GENEPATH, name) for name in exp_names]
+    exp_files = ["exp_coregenome.txt", "exp_pers-floor-multi.txt",
+                 "exp_coregenome_subset.txt", "exp_pers-floor-multi_subset.txt"]
+    for outfile, exp_file in zip(outfiles, exp_files):
+        assert tutil.compare_order_content(outfile, os.path.join(EXP_PATH, exp_file))
+    out, err = capsys.readouterr()
+    assert out.count("Generating Persistent genome of a dataset containing 4 genomes") == 2
+    assert out.count("Generating Persistent genome of a dataset containing 2 genomes") == 2
+
+
+def test_main_subsets_table():
+    """
+    Test that with subsets given in a table, the core genome of each subset is generated
+    """
+    table = os.path.join(GENEPATH, "subsets.txt")
+    with open(table, "w") as tab:
+        tab.write("clade1 GEN4.1111.00001\nclade1 GENO.1216.00003\n")
+    outfiles = corepers.main("cmd", UPAN, 1, False, False, GENEPATH, "", False, 0, False,
+                             subsets=table)
+    assert outfiles == [os.path.join(GENEPATH, "PersGenome_pangenome.lst-clade1_1.lst")]
+    assert tutil.compare_order_content(outfiles[0],
+                                       os.path.join(EXP_PATH, "exp_coregenome_subset.txt"))
@@ -149,6 +149,17 @@ def test_parser_default():
     assert not options.outfile
     assert options.verbose == 0
     assert not options.quiet
+    assert not options.db_cache
+    assert not options.clean_db_cache
+    assert not options.sweep
+    assert options.engine == "cluster"
+    assert not options.dedup
+    assert not options.update
+    assert not options.stream_db
+    assert not options.max_memory
+    assert options.accumulation == 0
+    assert not options.heaps
+    assert not options.accum_chunk
 
 
 def test_parser_all_threads():
@@ -198,3 +209,126 @@ def test_parser_1thread():
     assert not options.outfile
     assert options.verbose == 0
     assert not options.quiet
+
+
+def test_parser_sweep():
+    """
+    Test that when several identity thresholds are given for a sweep, they are all kept
+    """
+    parser = argparse.ArgumentParser(description="Do pangenome", add_help=False)
+    pangenome.build_parser(parser)
+    options = pangenome.parse(parser,
+                              "-l lstinfo -n TEST4 -d dbpath -o od --sweep 0.9 0.95".split())
+    assert options.min_id == 0.8
+    assert options.sweep == [0.9, 0.95]
+
+
+def test_parser_sweep_wrong_id(capsys):
+    """
+    Test that when a threshold of the sweep is not between 0 and 1, it exits with an error
+    """
+    parser = argparse.ArgumentParser(description="Do pangenome", add_help=False)
+    pangenome.build_parser(parser)
+    with pytest.raises(SystemExit):
+        pangenome.parse(parser, "-l lstinfo -n TEST4 -d dbpath -o od --sweep 0.9 95".split())
+    _, err = capsys.readouterr()
+    assert "The minimum %% of identity must be in [0, 1]. Invalid value: 95" in err
+
+
+def test_parser_engine():
+    """
+    Test that the clustering engine given is kept
+    """
+    parser = argparse.ArgumentParser(description="Do pangenome", add_help=False)
+    pangenome.build_parser(parser)
+    options = pangenome.parse(parser,
+                              "-l lstinfo -n TEST4 -d dbpath -o od --engine linclust".split())
+    assert options.engine == "linclust"
+
+
+def test_parser_wrong_engine(capsys):
+    """
+    Test that when the clustering engine given does not exist, it exits with an error
+    """
+    parser = argparse.ArgumentParser(description="Do pangenome", add_help=False)
+    pangenome.build_parser(parser)
+    with pytest.raises(SystemExit):
+        pangenome.parse(parser, "-l lstinfo -n TEST4 -d dbpath -o od --engine toto".split())
+    _, err = capsys.readouterr()
+    assert "argument --engine: invalid choice: 'toto'" in err
+
+
+def test_parser_update():
+    """
+    Test that the pangenome to update is kept
+    """
+    parser = argparse.ArgumentParser(description="Do pangenome", add_help=False)
+    pangenome.build_parser(parser)
+    options = pangenome.parse(parser,
+                              "-l lstinfo -n TEST4 -d dbpath -o od --update pan.lst".split())
+    assert options.update == "pan.lst"
+
+
+@pytest.mark.parametrize("option", ["--sweep 0.9", "--dedup"])
+def test_parser_update_incompatible(option, capsys):
+    """
+    Test that --update cannot be used with --sweep or --dedup
+    """
+    parser = argparse.ArgumentParser(description="Do pangenome", add_help=False)
+    pangenome.build_parser(parser)
+    with pytest.raises(SystemExit):
+        pangenome.parse(parser, ("-l lstinfo -n TEST4 -d dbpath -o od --update pan.lst " +
+                                 option).split())
+    _, err = capsys.readouterr()
+    assert f"--update cannot be used with {option.split()[0]}" in err
+
+
+@pytest.mark.parametrize("option", ["--dedup", "--update pan.lst"])
+def test_parser_stream_incompatible(option, capsys):
+    """
+    Test that --stream-db cannot be used with --dedup or --update
+    """
+    parser = argparse.ArgumentParser(description="Do pangenome", add_help=False)
+    pangenome.build_parser(parser)
+    with pytest.raises(SystemExit):
+        pangenome.parse(parser, ("-l lstinfo -n TEST4 -d dbpath -o od --stream-db " +
+                                 option).split())
+    _, err = capsys.readouterr()
+    assert f"--stream-db cannot be used with {option.split()[0]}" in err
+
+
+def test_parser_max_memory(capsys):
+    """
+    Test that the max memory is kept with mmseqs format, and that a wrong size exits with
+    an error
+    """
+    parser = argparse.ArgumentParser(description="Do pangenome", add_help=False)
+    pangenome.build_parser(parser)
+    options = pangenome.parse(parser, "-l lstinfo -n TEST4 -d dbpath -o od --max-memory 20g".split())
+    assert options.max_memory == "20G"
+    with pytest.raises(SystemExit):
+        pangenome.parse(parser, "-l lstinfo -n TEST4 -d dbpath -o od --max-memory 20".split())
+    _, err = capsys.readouterr()
+    assert "invalid memory size: '20'" in err
+
+
+def test_parser_accumulation(capsys):
+    """
+    Test that accumulation options are kept, and that --heaps and --accum-chunk cannot be
+    used without --accumulation
+    """
+    parser = argparse.ArgumentParser(description="Do pangenome", add_help=False)
+    pangenome.build_parser(parser)
+    options = pangenome.parse(parser, ("-l lstinfo -n TEST4 -d dbpath -o od --accumulation 100 "
+                                       "--heaps --accum-chunk 1000").split())
+    assert options.accumulation == 100
+    assert options.heaps
+    assert options.accum_chunk == 1000
+    with pytest.raises(SystemExit):
+        pangenome.parse(parser, "-l lstinfo -n TEST4 -d dbpath -o od --heaps".split())
+    _, err = capsys.readouterr()
+    assert "--heaps and --accum-chunk can only be used with --accumulation" in err
+    with pytest.raises(SystemExit):
+        pangenome.parse(parser, "-l lstinfo -n TEST4 -d dbpath -o od --accumulation -2".split())
+    _, err = capsys.readouterr()
+    assert "Invalid value: -2" in err
@@ -60,6 +60,17 @@ def test_main_from_parse():
     args.outfile = None
     args.verbose = 0
     args.quiet = False
+    args.db_cache = None
+    args.clean_db_cache = False
+    args.sweep = None
+    args.engine = "cluster"
+    args.dedup = False
+    args.update = None
+    args.stream_db = False
+    args.max_memory = None
+    args.accumulation = 0
+    args.heaps = False
+    args.accum_chunk = None
     args.argv = ["pangenome", "pan.py", "test_main_from_parse"]
     # Run main_from_parse
     pan.main_from_parse(args)
@@ -160,7 +160,7 @@ def test_main_quicktree_notverbose(capsys):
 
 def test_main_fastme(capsys):
     """
-    Test that when giving the alignment file, running with fastme, no bootstraps,
+    Test that when giving the alignment file, running with fastme, with bootstraps,
     it creates expected files
     """
     outdir = GENEPATH
@@ -171,27 +171,27 @@ def test_main_fastme(capsys):
     cmd = "cmd: test_main_quicktree"
     tree.main(cmd, ALIGNMENT, outdir, soft, model, threads, boot=boot, verbose=16, write_boot=True)
     # Check output files
-    # phylip alignments
-    phylip = os.path.join(outdir, "exp_pers4genomes.grp.aln.phylip")
-    assert os.path.isfile(phylip)
+    # site patterns
+    base = os.path.join(outdir, "exp_pers4genomes.grp.aln")
+    assert os.path.isfile(base + ".patterns.npz")
     # fastme logfile
-    log_file = phylip + ".fastme.log"
+    log_file = base + ".fastme.log"
     assert os.path.isfile(log_file)
     with open(log_file, "r") as logf:
         fastme_lines = logf.readlines()
-    assert "Input data type  DNA" in " ".join(fastme_lines)
-    assert "evolutionary model  F84" in " ".join(fastme_lines)
+    assert "Input data type  Distance matrix" in " ".join(fastme_lines)
     # tree file
-    tree_file = phylip + ".fastme_tree.nwk"
+    tree_file = base + ".fastme_tree.nwk"
     assert os.path.isfile(tree_file)
     assert not tutils.is_tree_lengths(tree_file)
     assert tutils.is_tree_bootstrap(tree_file)
     # bootstrap file
-    tree_boot_file = phylip + ".fastme_bootstraps.nwk"
+    tree_boot_file = base + ".fastme_bootstraps.nwk"
     assert os.path.isfile(tree_boot_file)
     with open(tree_boot_file, "r") as tbf:
-        lines = tbf.readlines()
+        lines = [line for line in tbf if line.strip()]
     assert len(lines) == boot
+    assert not os.path.isfile(base + ".fastme_dist-mat.txt")
     # log files
     logs_base = os.path.join(outdir, "PanACoTA-tree-fastme.log")
     assert os.path.isfile(logs_base)
@@ -200,14 +200,17 @@ def test_main_fastme(capsys):
     assert os.path.isfile(logs_base + ".err")
     # Check logs
     out, err = capsys.readouterr()
-    assert "Converting fasta alignment to PHYLIP-relaxed format." in out
+    assert "Compressing alignment into site patterns." in out
+    assert "Computing TN93 distances from 81 site patterns." in out
     assert "Running FastME..." in out
-    assert ("fastme -i test/data/tree/generated_by_func_tests/exp_pers4genomes.grp.aln.phylip "
-            "-d T -n B -s  -b 100 -o test/data/tree/generated_by_func_tests/"
-            "exp_pers4genomes.grp.aln.phylip.fastme_tree.nwk "
-            "-I test/data/tree/generated_by_func_tests/exp_pers4genomes.grp.aln.phylip.fastme.log "
-            "-B test/data/tree/generated_by_func_tests/"
-            "exp_pers4genomes.grp.aln.phylip.fastme_bootstraps.nwk") in out
+    assert ("fastme -i test/data/tree/generated_by_func_tests/"
+            "exp_pers4genomes.grp.aln.fastme_dist-mat.txt -n B -s "
+            " -o test/data/tree/generated_by_func_tests/exp_pers4genomes.grp.aln.fastme_tree.nwk "
+            "-I test/data/tree/generated_by_func_tests/exp_pers4genomes.grp.aln.fastme.log") in out
+    assert ("fastme -i test/data/tree/generated_by_func_tests/"
+            "exp_pers4genomes.grp.aln.fastme_boot_dist-mat.txt -D 100 -n B -s  "
+            "-o test/data/tree/generated_by_func_tests/"
+            "exp_pers4genomes.grp.aln.fastme_bootstraps.nwk") in out
     assert "END" in out
 
 
@@ -225,25 +228,22 @@ def test_fastme_matrix(capsys):
     cmd = "cmd: test_main_quicktree"
     tree.main(cmd, ALIGNMENT, outdir, soft, model, threads, boot=boot, verbose=16, write_boot=True, write_mat=True)
     # Check output files
-    # phylip alignments
-    phylip = os.path.join(outdir, "exp_pers4genomes.grp.aln.phylip")
-    assert os.path.isfile(phylip)
+    base = os.path.join(outdir, "exp_pers4genomes.grp.aln")
+    assert os.path.isfile(base + ".patterns.npz")
     # fastme logfile
-    log_file = phylip + ".fastme.log"
+    log_file = base + ".fastme.log"
     assert os.path.isfile(log_file)
-    with open(log_file, "r") as logf:
-        fastme_lines = logf.readlines()
-        print(fastme_lines)
-    assert "Input data type  DNA" in " ".join(fastme_lines)
-    assert "evolutionary model  F84" in " ".join(fastme_lines)
     # tree file
-    tree_file = phylip + ".fastme_tree.nwk"
+    tree_file = base + ".fastme_tree.nwk"
     assert os.path.isfile(tree_file)
     assert tutils.is_tree_lengths(tree_file)
     assert not tutils.is_tree_bootstrap(tree_file)
     # matrix file
-    mat_file = phylip + ".fastme_dist-mat.txt"
+    mat_file = base + ".fastme_dist-mat.txt"
     assert os.path.isfile(mat_file)
+    with open(mat_file, "r") as matf:
+        assert matf.readline() == "4\n"
+    assert not os.path.isfile(base + ".fastme_bootstraps.nwk")
     # log files
     logs_base = os.path.join(outdir, "PanACoTA-tree-fastme.log")
     assert os.path.isfile(logs_base)
@@ -252,14 +252,10 @@ def test_fastme_matrix(capsys):
     assert os.path.isfile(logs_base + ".err")
     # Check logs
     out, err = capsys.readouterr()
-    assert "Converting fasta alignment to PHYLIP-relaxed format." in out
+    assert "Compressing alignment into site patterns." in out
     assert "Running FastME..." in out
-    assert ("fastme -i test/data/tree/generated_by_func_tests/exp_pers4genomes.grp.aln.phylip ") in out
-    assert "-d T -n B -s" in out
-    assert ("-o test/data/tree/generated_by_func_tests/"
-            "exp_pers4genomes.grp.aln.phylip.fastme_tree.nwk ") in out
-    assert "-I test/data/tree/generated_by_func_tests/exp_pers4genomes.grp.aln.phylip.fastme.log" in out
-    assert "exp_pers4genomes.grp.aln.phylip.fastme_bootstraps.nwk" in out
+    assert ("fastme -i test/data/tree/generated_by_func_tests/"
+            "exp_pers4genomes.grp.aln.fastme_dist-mat.txt -n B -s ") in out
     assert "END" in out
 
 
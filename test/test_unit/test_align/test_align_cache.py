@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Unit tests for the align_cache submodule in align module
+"""
+import logging
+import os
+import shutil
+
+import pytest
+
+import PanACoTA.align_module.align_cache as acache
+import test.test_unit.utilities_for_tests as tutil
+
+
+ALDIR = os.path.join("test", "data", "align")
+EXPPATH = os.path.join(ALDIR, "exp_files")
+GENEPATH = os.path.join(ALDIR, "generated_by_unit-tests")
+CACHE = os.path.join(GENEPATH, "cache")
+MAFFT = os.path.join(EXPPATH, "exp_aldir-pers", "mafft-align.8.aln")
+BTR = os.path.join(EXPPATH, "exp_aldir-pers", "mafft-btr.8.aln")
+
+
+@pytest.fixture(autouse=True)
+def setup_teardown_module():
+    """
+    Create cache directory before each test, and remove all generated files after
+    """
+    os.makedirs(CACHE)
+    print("setup")
+
+    yield
+    shutil.rmtree(GENEPATH)
+    print("teardown")
+
+
+def test_family_key():
+    """
+    Test that family key does not depend on sequence order, but depends on names, sequences
+    and aligner settings
+    """
+    prts = [(b"prot1", b"MKL"), (b"prot2", b"MKV")]
+    gens = [(b"prot1", b"ATGAAACTG"), (b"prot2", b"ATGAAAGTG")]
+    key = acache.family_key(prts, gens, "mafft --auto")
+    assert len(key) == 64
+    assert acache.family_key(prts[::-1], gens[::-1], "mafft --auto") == key
+    assert acache.family_key(prts, gens, "famsa") != key
+    assert acache.family_key([(b"prot3", b"MKL"), prts[1]], gens, "mafft --auto") != key
+    assert acache.family_key(prts, [gens[0], (b"prot2", b"ATGAAAGTC")], "mafft --auto") != key
+    # A sequence cannot be moved from proteins to genes without changing the key
+    assert acache.family_key(prts + gens, [], "mafft --auto") != key
+
+
+def test_put_get():
+    """
+    Test that alignments stored can be copied from the cache, and that a family not
+    stored is a miss
+    """
+    acache.put(CACHE, "key1", [MAFFT, BTR])
+    outs = [os.path.join(GENEPATH, "out.aln"), os.path.join(GENEPATH, "out-btr.aln")]
+    assert acache.get(CACHE, "key1", outs)
+    assert tutil.compare_file_content(outs[0], MAFFT)
+    assert tutil.compare_file_content(outs[1], BTR)
+    assert not acache.get(CACHE, "key2", [os.path.join(GENEPATH, "other.aln"),
+                                           os.path.join(GENEPATH, "other-btr.aln")])
+    assert not os.path.exists(os.path.join(GENEPATH, "other.aln"))
+    stats = acache.read_stats(CACHE)
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["stored"] == 1
+    assert stats["entries"] == 1
+    assert stats["size"] == os.path.getsize(MAFFT) + os.path.getsize(BTR)
+
+
+def test_put_existing():
+    """
+    Test that storing a family already in cache keeps the existing entry, and does not leave
+    temporary files
+    """
+    acache.put(CACHE, "key1", [MAFFT, BTR])
+    acache.put(CACHE, "key1", [BTR, MAFFT])
+    assert sorted(os.listdir(CACHE)) == ["key1", acache.STATS_FILE]
+    assert tutil.compare_file_content(os.path.join(CACHE, "key1", "mafft-align.aln"), MAFFT)
+    assert acache.read_stats(CACHE)["stored"] == 1
+
+
+def test_evict():
+    """
+    Test that least recently used families are removed until the cache is under the
+    given size, a family read being used more recently than a family stored later
+    """
+    for num, key in enumerate(["key1", "key2", "key3"]):
+        acache.put(CACHE, key, [MAFFT, BTR])
+        os.utime(os.path.join(CACHE, key), (num, num))
+    # key1 is used
+    acache.get(CACHE, "key1", [os.path.join(GENEPATH, "out.aln"),
+                               os.path.join(GENEPATH, "out-btr.aln")])
+    entry_size = os.path.getsize(MAFFT) + os.path.getsize(BTR)
+    assert acache.evict(CACHE, 3 * entry_size) == []
+    assert acache.evict(CACHE, 2 * entry_size - 1) == ["key2", "key3"]
+    assert [key for _, _, key in acache.get_entries(CACHE)] == ["key1"]
+    assert acache.read_stats(CACHE)["evicted"] == 2
+
+
+def test_report(caplog):
+    """
+    Test that stats of the run are given, and current content of the cache
+    """
+    caplog.set_level(logging.INFO)
+    acache.put(CACHE, "key1", [MAFFT, BTR])
+    before = acache.read_stats(CACHE)
+    acache.get(CACHE, "key1", [os.path.join(GENEPATH, "out.aln"),
+                               os.path.join(GENEPATH, "out-btr.aln")])
+    acache.get(CACHE, "key2", [os.path.join(GENEPATH, "out2.aln"),
+                               os.path.join(GENEPATH, "out2-btr.aln")])
+    acache.put(CACHE, "key2", [MAFFT, BTR])
+    run = acache.report(CACHE, before)
+    assert run["hits"] == 1
+    assert run["misses"] == 1
+    assert run["stored"] == 1
+    assert run["evicted"] == 0
+    assert run["entries"] == 2
+    assert (f"Alignment cache {CACHE}: 1 families found in cache, 1 aligned, 1 stored, "
+            "0 evicted. It contains 2 families (0.0 MB).") in caplog.text
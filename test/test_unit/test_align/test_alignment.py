@@ -9,10 +9,12 @@ import os
 import subprocess
 import pytest
 import shutil
+import sys
 
 import multiprocessing
 
 import PanACoTA.align_module.alignment as al
+import PanACoTA.align_module.align_cache as acache
 import test.test_unit.utilities_for_tests as tutil
 
 
@@ -201,6 +203,50 @@ def test_backtranslate_problem(caplog):
     assert not os.path.isfile(btr_file)
 
 
+def test_backtranslate_difflen(caplog):
+    """
+    Test that when a gene is too short for its aligned protein, the btr file is generated
+    (its sequence is shorter than the others), and it returns False with an error message
+    """
+    caplog.set_level(logging.DEBUG)
+    mafft_file = os.path.join(GENEPATH, "mafft-difflen.aln")
+    gen_file = os.path.join(GENEPATH, "current-difflen.gen")
+    btr_file = os.path.join(GENEPATH, "test_btr_output.aln")
+    with open(mafft_file, "w") as mf:
+        mf.write(">prot1 desc\nMK-L\n>prot2\nM-KL\n")
+    with open(gen_file, "w") as gf:
+        gf.write(">prot1 desc\nATGAAACTGTAA\n>prot2\nATGAAAC\n")
+    logger = logging.getLogger("test_backtranslate")
+    assert not al.back_translate(5, mafft_file, gen_file, btr_file, 2, logger)
+    assert ("Nucleic alignments for family 5 (in test/data/align/generated_by_unit-tests/"
+            "test_btr_output.aln) do not all have the same length. Lengths found are: "
+            "{10, 12}") in caplog.text
+    with open(btr_file) as bf:
+        assert bf.read() == ">prot1\nATGAAA---CTG\n>prot2\nATG---AAAC\n"
+
+
+def test_prt2codon():
+    """
+    Test back-translation of aligned proteins: each residue takes the next codon, each
+    gap gives '---', stop codon is not used, and a too short gene gives empty codons
+    """
+    assert al.prt2codon(b"--MK-L", b"ATGAAACTGTAA") == b"------ATGAAA---CTG"
+    assert al.prt2codon(b"M-KL", b"ATGAAAC") == b"ATG---AAAC"
+    assert al.prt2codon(b"M-K", b"") == b"---"
+    assert al.prt2codon(b"", b"ATG") == b""
+
+
+def test_read_fasta_bytes():
+    """
+    Test that sequences are read with the first word of their header as name, and only the
+    first word of each sequence line
+    """
+    fasta = os.path.join(GENEPATH, "seqs.fa")
+    with open(fasta, "w") as faf:
+        faf.write(">seq1 desc\nACG\nTT other\n\n>seq2\n>seq3\nA\n")
+    assert al.read_fasta_bytes(fasta) == [(b"seq1", b"ACGTT"), (b"seq2", b""), (b"seq3", b"A")]
+
+
 def test_mafft_align(caplog):
     """
     Test that when giving a file containing extracted proteins, it aligns them as expected
@@ -219,6 +265,123 @@ def test_mafft_align(caplog):
     assert tutil.compare_file_content(mafft_file, exp_mafft)
 
 
+def test_mafft_align_threads(caplog):
+    """
+    Test that when several threads are given for the family, mafft is run with them
+    """
+    caplog.set_level(logging.DEBUG)
+    prt_file = os.path.join(EXPPATH, "exp_aldir", "current.1.prt")
+    mafft_file = os.path.join(GENEPATH, "test_mafft_align.aln")
+    logger = logging.getLogger("test_check_mafft_align")
+    assert al.mafft_align(1, prt_file, mafft_file, 4, logger, threads=3) == 4
+    assert ("Mafft command: mafft --auto --amino --thread 3 "
+            "test/data/align/exp_files/exp_aldir/current.1.prt") in caplog.text
+    exp_mafft = os.path.join(EXPPATH, "exp_aldir", "mafft-align.1.aln")
+    assert tutil.compare_file_content(mafft_file, exp_mafft)
+
+
+# Stub aligner: saves its arguments, and writes a prepared alignment where the aligner writes
+# its output (stdout if out is None)
+STUB_ALIGNER = """#!{python}
+import sys
+args = sys.argv[1:]
+with open({argsfile!r}, "w") as argf:
+    argf.write(" ".join(args))
+out = {out}
+with open({alnfile!r}) as alnf:
+    aln = alnf.read()
+if out is None:
+    sys.stdout.write(aln)
+else:
+    with open(out, "w") as outf:
+        outf.write(aln)
+"""
+
+
+def make_stub_aligner(name, out, aln_file, monkeypatch):
+    """
+    Create a stub executable for the given aligner, first in $PATH, which writes the content
+    of aln_file to its output.
+    Returns the file where the stub saves its arguments.
+    """
+    bindir = os.path.join(GENEPATH, "bin")
+    os.makedirs(bindir, exist_ok=True)
+    argsfile = os.path.join(GENEPATH, name + ".args")
+    stub = os.path.join(bindir, name)
+    with open(stub, "w") as stubf:
+        stubf.write(STUB_ALIGNER.format(python=sys.executable, argsfile=argsfile,
+                                        out=out, alnfile=aln_file))
+    os.chmod(stub, 0o755)
+    monkeypatch.setenv("PATH", bindir + os.pathsep + os.environ["PATH"])
+    return argsfile
+
+
+@pytest.mark.parametrize("aligner, out, exp_args", [
+    ("mafft", "None", "--auto --amino --thread 2 {prt}"),
+    ("famsa", "args[-1]", "-t 2 {prt} {aln}"),
+    ("muscle", "args[args.index('-output') + 1]", "-align {prt} -output {aln} -threads 2"),
+    ("clustalo", "args[args.index('-o') + 1]", "-i {prt} -o {aln} --outfmt=fasta --threads=2 --force"),
+])
+def test_mafft_align_backends(aligner, out, exp_args, caplog, monkeypatch):
+    """
+    Test that each aligner is run with the expected command, and that its output is
+    converted to the same format as mafft output (order of proteins given, full headers,
+    upper case and 60 characters per line)
+    """
+    caplog.set_level(logging.DEBUG)
+    prt_file = os.path.join(EXPPATH, "exp_aldir", "current.1.prt")
+    mafft_file = os.path.join(GENEPATH, "test_mafft_align.aln")
+    exp_mafft = os.path.join(EXPPATH, "exp_aldir", "mafft-align.1.aln")
+    if aligner == "mafft":
+        stub_out = exp_mafft
+    else:
+        # Alignment written by the other aligners: in another order, only with protein names,
+        # lower case, and different line lengths
+        stub_out = os.path.join(GENEPATH, "stub_out.aln")
+        with open(stub_out, "w") as stubf:
+            for name, seq in reversed(al.read_fasta_bytes(exp_mafft)):
+                seq = seq.decode().lower()
+                stubf.write(">" + name.decode() + "\n")
+                stubf.write("\n".join(seq[i:i + 50] for i in range(0, len(seq), 50)) + "\n")
+    argsfile = make_stub_aligner(aligner, out, stub_out, monkeypatch)
+    logger = logging.getLogger("test_check_mafft_align")
+    infos = {}
+    assert al.mafft_align(1, prt_file, mafft_file, 4, logger, infos, threads=2,
+                          aligner=aligner) == 4
+    with open(argsfile) as argf:
+        assert argf.read() == exp_args.format(prt=prt_file, aln=mafft_file)
+    assert f"{aligner.capitalize()} command: {aligner} " in caplog.text
+    assert tutil.compare_file_content(mafft_file, exp_mafft)
+    assert infos[mafft_file].nb == 4
+
+
+def test_mafft_align_auto(caplog, monkeypatch):
+    """
+    Test that with 'auto' aligner, a small family is aligned with mafft
+    """
+    caplog.set_level(logging.DEBUG)
+    prt_file = os.path.join(EXPPATH, "exp_aldir", "current.1.prt")
+    mafft_file = os.path.join(GENEPATH, "test_mafft_align.aln")
+    exp_mafft = os.path.join(EXPPATH, "exp_aldir", "mafft-align.1.aln")
+    make_stub_aligner("mafft", "None", exp_mafft, monkeypatch)
+    logger = logging.getLogger("test_check_mafft_align")
+    assert al.mafft_align(1, prt_file, mafft_file, 4, logger, aligner="auto") == 4
+    assert f"Mafft command: mafft --auto --amino {prt_file}" in caplog.text
+    assert tutil.compare_file_content(mafft_file, exp_mafft)
+
+
+def test_choose_aligner():
+    """
+    Test that the aligner asked is used, and that with 'auto', big families are aligned
+    with famsa
+    """
+    assert al.choose_aligner("muscle", 5000) == "muscle"
+    assert al.choose_aligner("auto", al.LARGE_FAMILY - 1) == "mafft"
+    assert al.choose_aligner("auto", al.LARGE_FAMILY) == "famsa"
+    assert al.get_executables("auto") == ["mafft", "famsa"]
+    assert al.get_executables("clustalo") == ["clustalo"]
+
+
 def test_mafft_align_error(caplog):
     """
     Test that when giving a wrong file with the sequence to extract (non existing file),
@@ -385,6 +548,50 @@ def test_family_align(caplog):
     assert tutil.compare_file_content(btr_file, exp_btr)
 
 
+def test_family_align_cache(caplog, monkeypatch):
+    """
+    Test that with an alignment cache, alignments of a family are stored in the cache once
+    done, and then copied from it instead of aligning the family again.
+    """
+    caplog.set_level(logging.DEBUG)
+    prt_file = os.path.join(EXPPATH, "exp_aldir-pers", "current.8.prt")
+    gen_file = os.path.join(EXPPATH, "exp_aldir-pers", "current.8.gen")
+    miss_file = os.path.join(EXPPATH, "exp_aldir-pers", "current.8.miss.lst")
+    mafft_file = os.path.join(GENEPATH, "test_fam_align.8.aln")
+    btr_file = os.path.join(GENEPATH, "test_fam_align_btr.8.aln")
+    exp_mafft = os.path.join(EXPPATH, "exp_aldir-pers", "mafft-align.8.aln")
+    exp_btr = os.path.join(EXPPATH, "exp_aldir-pers", "mafft-btr.8.aln")
+    cache_dir = os.path.join(GENEPATH, "cache")
+    os.makedirs(cache_dir)
+    make_stub_aligner("mafft", "None", exp_mafft, monkeypatch)
+    logger = logging.getLogger("test_fam_align")
+    # Not in cache: aligned, and stored
+    assert al.family_alignment(prt_file, gen_file, miss_file, mafft_file, btr_file, 8, 4,
+                               logger, cache_dir=cache_dir) == 3
+    assert "Aligning family 8" in caplog.text
+    stats = acache.read_stats(cache_dir)
+    assert (stats["misses"], stats["hits"], stats["stored"], stats["entries"]) == (1, 0, 1, 1)
+    # Now in cache: copied, without running the aligner
+    os.remove(os.path.join(GENEPATH, "bin", "mafft"))
+    os.remove(mafft_file)
+    os.remove(btr_file)
+    caplog.clear()
+    infos = {}
+    assert al.family_alignment(prt_file, gen_file, miss_file, mafft_file, btr_file, 8, 4,
+                               logger, infos, cache_dir=cache_dir) == 3
+    assert "Aligning family 8" not in caplog.text
+    assert "fam 8: alignments found in cache" in caplog.text
+    assert tutil.compare_file_content(mafft_file, exp_mafft)
+    assert tutil.compare_file_content(btr_file, exp_btr)
+    assert infos[btr_file].nb == 3
+    assert acache.read_stats(cache_dir)["hits"] == 1
+    # Adding missing genomes does not change the cache
+    assert al.add_missing_genomes(btr_file, "bt", miss_file, 8, 4, True, logger, infos)
+    key = [name for name in os.listdir(cache_dir) if len(name) == 64][0]
+    assert tutil.compare_file_content(os.path.join(cache_dir, key, "mafft-prt2nuc.aln"),
+                                      exp_btr)
+
+
 def test_family_align_wrongextract(caplog):
     """
     Test that when giving prt file (3 extracted), gen file (3 extracted), miss file (1)
@@ -616,6 +823,37 @@ def test_check_addmissing_ok():
     assert al.check_add_missing(btr_file, num_fam, ngenomes, logger, prev) is True
 
 
+def test_check_addmissing_info():
+    """
+    Test that when information on sequences is given, the btr file is not read
+    """
+    btr_file = os.path.join(GENEPATH, "not-existing.aln")
+    logger = logging.getLogger("test_check_add_missing")
+    info = al.AlignInfo([12, 12, 12])
+    assert al.check_add_missing(btr_file, 8, 3, logger, False, info=info) is True
+    assert al.check_add_missing(btr_file, 8, 4, logger, True, info=info) == 12
+    assert al.check_add_missing(btr_file, 8, 3, logger, True,
+                                info=al.AlignInfo([12, 9, 12])) is False
+
+
+def test_scan_fasta():
+    """
+    Test that number of sequences and their lengths are found, whatever the line lengths,
+    and including empty sequences. Check that count_seqs gives the same number.
+    """
+    fasta = os.path.join(GENEPATH, "seqs.aln")
+    with open(fasta, "w") as faf:
+        faf.write(">seq1 desc\nAC--\nGT\n>seq2\n>seq3\nACG---\n\n")
+    info = al.scan_fasta(fasta)
+    assert info.lens == [6, 0, 6]
+    assert info.nb == 3
+    assert info.widths == {0, 6}
+    assert al.count_seqs(fasta) == 3
+    btr_file = os.path.join(EXPPATH, "exp_aldir-pers", "mafft-btr.8.aln")
+    assert al.scan_fasta(btr_file).nb == al.count_seqs(btr_file) == 3
+    assert al.scan_fasta(btr_file).widths == {al.check_lens(btr_file, 8, None)[0]}
+
+
 def test_check_addmissing_difflen():
     """
     Test that when giving a btr file with sequences with different lengths, it returns False
@@ -750,6 +988,26 @@ def test_add_missing_btrmiss(caplog):
     assert tutil.compare_file_content(btr_file, final_btr)
 
 
+def test_add_missing_btrmiss_infos(caplog):
+    """
+    Same as test_add_missing_btrmiss, but giving the information on btr_file sequences:
+    it is used instead of reading the file, and updated with the missing genome added
+    """
+    caplog.set_level(logging.DEBUG)
+    ref_btr_file = os.path.join(EXPPATH, "exp_aldir-pers", "mafft-btr.8.aln")
+    btr_file = os.path.join(GENEPATH, "test_add_missing_genomes.aln")
+    shutil.copyfile(ref_btr_file, btr_file)
+    miss_file = os.path.join(EXPPATH, "exp_aldir-pers", "current.8.miss.lst")
+    infos = {btr_file: al.scan_fasta(btr_file)}
+    assert infos[btr_file].nb == 3
+    logger = logging.getLogger("test_add_missing")
+    assert al.add_missing_genomes(btr_file, "bt", miss_file, 8, 4, "OK", logger, infos) is True
+    assert infos[btr_file].nb == 4
+    assert infos[btr_file].widths == al.scan_fasta(btr_file).widths
+    final_btr = os.path.join(EXPPATH, "exp_aldir-pers", "mafft-prt2nuc.8.aln")
+    assert tutil.compare_file_content(btr_file, final_btr)
+
+
 def test_add_missing_btrmiss2(caplog):
     """
     Giving a btr_file with all sequences with same lengths, but 2 sequences less that the
@@ -1076,11 +1334,37 @@ def test_handle_family_addfalse():
     assert not q.get()
 
 
+def test_get_family_sizes():
+    """
+    Test that size of each family is the size of its extracted proteins file, 0 if it
+    does not exist
+    """
+    prefix = os.path.join(GENEPATH, "TEST")
+    with open(prefix + "-current.1.prt", "w") as prtf:
+        prtf.write(">prot1\nMKL\n")
+    with open(prefix + "-current.8.prt", "w") as prtf:
+        prtf.write(">prot1\nMKLMKL\n>prot2\nMKLMKL\n")
+    assert al.get_family_sizes(prefix, [1, 8, 10]) == {1: 11, 8: 28, 10: 0}
+
+
+def test_schedule_families():
+    """
+    Test that families are sorted from the biggest to the smallest, with a number of
+    threads proportional to their part of the total size, between 1 and the total number of
+    threads
+    """
+    sizes = {1: 10, 2: 500, 3: 20, 4: 1000, 5: 0}
+    assert al.schedule_families(sizes, 4) == [(4, 2), (2, 1), (3, 1), (1, 1), (5, 1)]
+    assert al.schedule_families(sizes, 16) == [(4, 10), (2, 5), (3, 1), (1, 1), (5, 1)]
+    assert al.schedule_families({1: 10}, 4) == [(1, 4)]
+    assert al.schedule_families({1: 0, 2: 0}, 4) == [(1, 1), (2, 1)]
+
+
 def test_align_all_true(caplog):
     """
-    Giving aldir with prt, gen and miss files for families 1 and 8, as well as concat file (
-    empty). It should create mafft and prt2nuc files for families 1 and 8, remove concat
-    file, and return True.
+    Giving aldir with prt, gen and miss files for families 1 and 8, as well as grouped by
+    genome file (empty). It should create mafft and prt2nuc files for families 1 and 8, remove
+    grouped file, and return True.
     """
     caplog.set_level(logging.DEBUG)
     aldir = os.path.join(GENEPATH, "aldir")
@@ -1110,9 +1394,11 @@ def test_align_all_true(caplog):
     # empty miss file for family 1
     open(cur_miss1, "w").close()
     assert os.path.isfile(cur_miss1)
-    # create empty concat-file, to check that it is removed
-    concat = os.path.join(aldir, dname + "-complete.nucl.cat.aln")
-    open(concat, "w").close()
+    # create empty grouped by genome file, to check that it is removed
+    treedir = os.path.join(GENEPATH, "Phylo-" + dname)
+    os.makedirs(treedir)
+    grpfile = os.path.join(treedir, dname + ".nucl.grp.aln")
+    open(grpfile, "w").close()
     assert al.align_all_families(prefix, all_fams, ngenomes, dname, quiet, threads)
     # Check output files
     out_mafft1 = os.path.join(aldir, dname + "-mafft-align.1.aln")
@@ -1127,7 +1413,7 @@ def test_align_all_true(caplog):
     assert tutil.compare_order_content(out_btr1, exp_btr1)
     assert tutil.compare_order_content(out_mafft8, exp_mafft8)
     assert tutil.compare_order_content(out_btr8, exp_btr8)
-    assert not os.path.isfile(concat)
+    assert not os.path.isfile(grpfile)
     # Check logs
     assert ("Starting alignment of all families: protein alignment, back-translation to "
             "nucleotides, and add missing genomes in the family") in caplog.text
@@ -1143,7 +1429,7 @@ def test_align_all_true(caplog):
 def test_align_all_exists_true(caplog):
     """
     Giving aldir with prt, gen, miss, mafft and prt2nuc files for families 1 and 8, as well as
-    concat file (empty). It should keep concat file, and return True.
+    grouped by genome file (empty). It should keep grouped file, and return True.
     """
     caplog.set_level(logging.DEBUG)
     aldir = os.path.join(GENEPATH, "aldir")
@@ -1182,17 +1468,19 @@ def test_align_all_exists_true(caplog):
         shutil.copyfile(f1, f2)
     # empty miss file for family 1
     open(cur_miss1, "w").close()
-    # create empty concat-file, to check that it is removed
-    concat = os.path.join(aldir, dname + "-complete.aa.cat.aln")
-    open(concat, "w").close()
+    # create empty grouped by genome file, to check that it is removed
+    treedir = os.path.join(GENEPATH, "Phylo-" + dname)
+    os.makedirs(treedir)
+    grpfile = os.path.join(treedir, dname + ".aa.grp.aln")
+    open(grpfile, "w").close()
     assert al.align_all_families(prefix, all_fams, ngenomes, dname, quiet, threads)
     # Check output files
     assert tutil.compare_order_content(out_mafft1, exp_mafft1)
     assert tutil.compare_order_content(out_btr1, exp_btr1)
     assert tutil.compare_order_content(out_mafft8, exp_mafft8)
     assert tutil.compare_order_content(out_btr8, exp_btr8)
-    assert os.path.isfile(concat)
-    with open(concat, "r") as conf:
+    assert os.path.isfile(grpfile)
+    with open(grpfile, "r") as conf:
         assert conf.readlines() == []
     # Check logs
     assert ("Starting alignment of all families: protein alignment, back-translation to "
@@ -1211,9 +1499,9 @@ def test_align_all_exists_true(caplog):
 
 def test_align_all_false(caplog):
     """
-    Giving aldir with prt, gen, miss files for families 1 and 8, as well as
-    concat file (empty). But for family 8, miss file is empty: total number of genomes does not
-    correspond. It should return error message for fam 8, info logs for fam 1, remove concat file,
+    Giving aldir with prt, gen, miss files for families 1 and 8, as well as grouped by genome
+    file (empty). But for family 8, miss file is empty: total number of genomes does not
+    correspond. It should return error message for fam 8, info logs for fam 1, remove grouped file,
     and return False
     """
     caplog.set_level(logging.DEBUG)
@@ -1243,9 +1531,11 @@ def test_align_all_false(caplog):
     # empty miss file for family 1 and 8
     open(cur_miss1, "w").close()
     open(cur_miss8, "w").close()
-    # create empty concat-file, to check that it is removed
-    concat = os.path.join(aldir, dname + "-complete.aa.cat.aln")
-    open(concat, "w").close()
+    # create empty grouped by genome file, to check that it is removed
+    treedir = os.path.join(GENEPATH, "Phylo-" + dname)
+    os.makedirs(treedir)
+    grpfile = os.path.join(treedir, dname + ".aa.grp.aln")
+    open(grpfile, "w").close()
     assert not al.align_all_families(prefix, all_fams, ngenomes, dname, quiet, threads)
     # Check output files
     out_mafft1 = os.path.join(aldir, dname + "-mafft-align.1.aln")
@@ -1258,7 +1548,7 @@ def test_align_all_false(caplog):
     assert tutil.compare_order_content(out_btr1, exp_btr1)
     assert not os.path.isfile(out_mafft8)
     assert not os.path.isfile(out_btr8)
-    assert not os.path.isfile(concat)
+    assert not os.path.isfile(grpfile)
     # Check logs
     assert ("Starting alignment of all families: protein alignment, back-translation to "
             "nucleotides, and add missing genomes in the family") in caplog.text
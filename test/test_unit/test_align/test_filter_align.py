@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Unit tests for the filter_align submodule in align module
+"""
+import os
+import logging
+import shutil
+
+import numpy as np
+import pytest
+
+import PanACoTA.align_module.filter_align as filt
+
+
+ALPATH = os.path.join("test", "data", "align")
+GENEPATH = os.path.join(ALPATH, "generated_by_unit-tests")
+PREFIX = os.path.join(GENEPATH, "TEST")
+GRP = os.path.join(GENEPATH, "TEST.nucl.grp.aln")
+# Alignment of each family, for genomes G1 to G4
+FAMS = {1: ["AAC-", "AAT-", "AGC-", "AGTA"],
+        2: ["C-G", "T-G", "T-G", "C-G"],
+        3: ["--GA", "AC-A", "AC-A", "GCTA"]}
+
+
+@pytest.fixture(autouse=True)
+def setup_teardown_module():
+    """
+    Before each test, write the alignment of each family, and the alignment grouped by
+    genome. Remove them after.
+    """
+    os.mkdir(GENEPATH)
+    for num, seqs in FAMS.items():
+        with open(f"{PREFIX}-mafft-prt2nuc.{num}.aln", "w") as famf:
+            for gen, seq in enumerate(seqs):
+                famf.write(f">G{gen + 1}_{num}\n{seq}\n")
+    with open(GRP, "w") as grpf:
+        for gen in range(4):
+            grpf.write(f">G{gen + 1}\n" + "".join(FAMS[num][gen] for num in FAMS) + "\n")
+    print("setup")
+
+    yield
+    shutil.rmtree(GENEPATH)
+    print("teardown")
+
+
+def read_lines(filename):
+    """
+    Get content of a file, as a list of lines
+    """
+    with open(filename) as inf:
+        return inf.read().splitlines()
+
+
+def test_read_matrix():
+    """
+    Test that alignment is read as a matrix of characters, with 1 line per sequence
+    """
+    names, matrix = filt.read_matrix(GRP)
+    assert names == [b"G1", b"G2", b"G3", b"G4"]
+    assert matrix.dtype == np.uint8
+    assert matrix.shape == (4, 11)
+    assert matrix[3].tobytes() == b"AGTAC-GGCTA"
+
+
+def test_read_matrix_case_lines():
+    """
+    Test that sequences on several lines are read entirely, and in upper case, so that
+    lower case residues are counted as their state
+    """
+    ali = os.path.join(GENEPATH, "lower.aln")
+    with open(ali, "w") as alif:
+        alif.write(">G1 desc\nacg\nT-\n>G2\nAC-tt\n")
+    names, matrix = filt.read_matrix(ali)
+    assert names == [b"G1", b"G2"]
+    assert [row.tobytes() for row in matrix] == [b"ACGT-", b"AC-TT"]
+
+
+def test_read_matrix_difflen(caplog):
+    """
+    Test that when sequences do not all have the same length, it exits with an error
+    """
+    ali = os.path.join(GENEPATH, "difflen.aln")
+    with open(ali, "w") as alif:
+        alif.write(">G1\nACGT\n>G2\nACG\n")
+    with pytest.raises(SystemExit):
+        filt.read_matrix(ali)
+    assert f"All sequences of {ali} do not have the same length." in caplog.text
+
+
+def test_select_columns():
+    """
+    Test columns kept with each filter, and count of constant sites removed
+    """
+    _, matrix = filt.read_matrix(GRP)
+    keep, const, nb_gappy = filt.select_columns(matrix, b"ACGT")
+    assert keep.all()
+    assert list(const) == [0, 0, 0, 0]
+    assert nb_gappy == 0
+    keep, _, nb_gappy = filt.select_columns(matrix, b"ACGT", max_gaps=0.25)
+    assert list(np.flatnonzero(keep)) == [0, 1, 2, 4, 6, 7, 8, 10]
+    assert nb_gappy == 3
+    keep, const, _ = filt.select_columns(matrix, b"ACGT", sites="variable")
+    assert list(np.flatnonzero(keep)) == [1, 2, 4, 7, 9]
+    # Constant: A, A (with gaps), G, C (with gaps), A. Column with only gaps is not constant
+    assert list(const) == [3, 1, 1, 0]
+    keep, const, _ = filt.select_columns(matrix, b"ACGT", max_gaps=0.5, sites="informative")
+    # Column 7 (-, A, A, G) is variable, but not informative
+    assert list(np.flatnonzero(keep)) == [1, 2, 4]
+    assert list(const) == [2, 1, 1, 0]
+
+
+def test_select_columns_chunks(monkeypatch):
+    """
+    Test that columns selected are the same when the matrix is read by blocks of columns
+    """
+    _, matrix = filt.read_matrix(GRP)
+    keep, const, nb_gappy = filt.select_columns(matrix, b"ACGT", 0.5, "informative")
+    monkeypatch.setattr(filt, "CHUNK_SIZE", 8)
+    keep2, const2, nb_gappy2 = filt.select_columns(matrix, b"ACGT", 0.5, "informative")
+    assert (keep == keep2).all()
+    assert (const == const2).all()
+    assert nb_gappy == nb_gappy2
+
+
+def test_write_partitions():
+    """
+    Test that families are written as nexus charsets, without families with no column
+    """
+    partfile = os.path.join(GENEPATH, "parts.nex")
+    filt.write_partitions(partfile, [1, 2, 3], [4, 0, 3])
+    assert read_lines(partfile) == ["#nexus", "begin sets;", "    charset fam_1 = 1-4;",
+                                    "    charset fam_3 = 5-7;", "end;"]
+
+
+def test_filter_alignment(caplog):
+    """
+    Test that filtered alignment, partitions and constant sites are written
+    """
+    caplog.set_level(logging.DEBUG)
+    out = filt.filter_alignment(GRP, PREFIX, [1, 2, 3], "nucl", 0.5, "informative")
+    base = os.path.join(GENEPATH, "TEST.nucl.grp")
+    assert out == base + ".filtered.aln"
+    assert read_lines(out) == [">G1", "ACC", ">G2", "ATT", ">G3", "GCT", ">G4", "GTC"]
+    assert read_lines(base + ".partitions.nex")[2:5] == ["    charset fam_1 = 1-4;",
+                                                         "    charset fam_2 = 5-7;",
+                                                         "    charset fam_3 = 8-11;"]
+    assert read_lines(base + ".filtered.partitions.nex")[2:4] == [
+        "    charset fam_1 = 1-2;", "    charset fam_2 = 3-3;", ]
+    assert read_lines(base + ".filtered.partitions.nex")[4] == "end;"
+    assert read_lines(base + ".filtered.fconst") == ["2,1,1,0"]
+    assert ("3 columns kept out of 11: 2 removed with too many gaps, 4 constant and 2 other "
+            "non-informative sites removed.") in caplog.text
+
+
+def test_filter_alignment_gaps():
+    """
+    Test that without sites filter, only gappy columns are removed, and no constant sites
+    file is written
+    """
+    out = filt.filter_alignment(GRP, PREFIX, [1, 2, 3], "nucl", max_gaps=0)
+    assert read_lines(out) == [">G1", "AACCGA", ">G2", "AATTGA", ">G3", "AGCTGA",
+                               ">G4", "AGTCGA"]
+    assert not os.path.isfile(os.path.join(GENEPATH, "TEST.nucl.grp.filtered.fconst"))
+
+
+def test_filter_alignment_wrong_width(caplog):
+    """
+    Test that if families do not have the same number of columns as the alignment grouped
+    by genome, it exits with an error
+    """
+    with pytest.raises(SystemExit):
+        filt.filter_alignment(GRP, PREFIX, [1, 3], "nucl", 0.5)
+    assert ("contains 11 columns, whereas families contain 8 columns") in caplog.text
@@ -149,6 +149,101 @@ def test_extract_seq_out_different_notasked():
     assert not os.path.isfile(out2)
 
 
+def test_index_sequences():
+    """
+    Test that all records are found, with their name and position, including a header
+    with a tabulation and a last record without final new line
+    """
+    content = ">seq1 desc\nACGT\nAC\n>seq2\tdesc more\nAAA\n>seq3"
+    index = gseq.index_sequences(content)
+    assert [name for name, _, _ in index] == ["seq1", "seq2", "seq3"]
+    assert [content[start:end] for _, start, end in index] == \
+        [">seq1 desc\nACGT\nAC\n", ">seq2\tdesc more\nAAA\n", ">seq3"]
+    assert gseq.index_sequences("") == []
+
+
+def test_file_pool():
+    """
+    Test that the pool keeps at most max_open files open, closing the least recently used,
+    and that a closed file is reopened in append mode
+    """
+    paths = [os.path.join(GENEPATH, f"pool{num}.txt") for num in range(3)]
+    with gseq.FilePool(2) as pool:
+        pool.get(paths[0]).write("a")
+        first = pool.get(paths[1])
+        first.write("b")
+        pool.get(paths[0]).write("c")
+        pool.get(paths[2]).write("d")
+        assert first.closed
+        assert list(pool.files) == [paths[0], paths[2]]
+        pool.get(paths[1]).write("e")
+    assert not pool.files
+    contents = []
+    for path in paths:
+        with open(path) as pathf:
+            contents.append(pathf.read())
+    assert contents == ["ac", "be", "d"]
+    assert 1 <= gseq.get_max_open_files() <= gseq.MAX_OPEN_FILES
+
+
+def test_file_pool_more_files(monkeypatch):
+    """
+    Test that with more files than max_open, each written in turn by several genomes, files
+    are not opened at each write: text waiting to be written is kept until the buffer is full
+    or the pool is closed, and each file gets its text in order
+    """
+    opened = []
+
+    def counting_open(path, mode="r"):
+        opened.append(path)
+        return open(path, mode)
+
+    monkeypatch.setattr(gseq, "open", counting_open, raising=False)
+    paths = [os.path.join(GENEPATH, f"pool{num}.txt") for num in range(5)]
+    with gseq.FilePool(2) as pool:
+        for genome in range(3):
+            for path in paths:
+                pool.write(path, f"G{genome}")
+        assert not opened
+    assert sorted(opened) == paths
+    assert not pool.files and not pool.buffers
+    for path in paths:
+        with open(path) as pathf:
+            assert pathf.read() == "G0G1G2"
+    # With a small buffer, it is written each time it is full: an open file is written
+    # directly, other files are opened once per flush (5 + 2 + 3 times instead of 15)
+    opened.clear()
+    with gseq.FilePool(2, max_buffer=10) as pool:
+        for genome in range(3):
+            for path in paths:
+                pool.write(path, f"H{genome}")
+    assert len(opened) == 10
+    for path in paths:
+        with open(path) as pathf:
+            assert pathf.read() == "G0G1G2H0H1H2"
+
+
+def test_extract_seq_shared_pool():
+    """
+    Test that when extracting sequences with a pool of open files shared between 2 fasta
+    files, each output file gets the sequences of both files, in order
+    """
+    out1 = os.path.join(GENEPATH, "test_extract1.prt")
+    out2 = os.path.join(GENEPATH, "test_extract2.prt")
+    to_extract = {"GEN2.1017.00001.b0001_00001": out1,
+                  "GEN2.1017.00001.i0003_00008": out2,
+                  "GEN2.1017.00001.b0004_00013": out1}
+    with gseq.FilePool(1) as pool:
+        for _ in range(2):
+            with open(FASTA, "r") as fasf:
+                gseq.extract_sequences(to_extract, fasf, files_todo=[out1, out2], handles=pool)
+    for out, exp in [(out1, "exp_extracted1.prt"), (out2, "exp_extracted2.prt")]:
+        with open(os.path.join(EXPPATH, exp)) as expf:
+            exp_content = expf.read()
+        with open(out) as outf:
+            assert outf.read() == exp_content * 2
+
+
 def test_get_names_files():
     """
     Test that given an open tab file (containing 2 columns: name of sequence to extract,
@@ -602,3 +697,52 @@ def test_get_all_seqs_allexist(caplog):
             "will use them for the next step. If you want to re-extract a given "
             "family, remove its prt and gen extraction files. If you want to "
             "re-extract all families, use option -F (or --force).") in caplog.text
+
+
+def test_get_shards():
+    """
+    Test that genomes are split into consecutive shards, all genomes being in 1 shard
+    """
+    genomes = [f"G{num}" for num in range(10)]
+    shards = gseq.get_shards(genomes, 2)
+    assert len(shards) == 8
+    assert [gen for shard in shards for gen in shard] == genomes
+    assert [len(shard) for shard in shards] == [2, 2, 1, 1, 1, 1, 1, 1]
+    assert gseq.get_shards(genomes[:3], 4) == [["G0"], ["G1"], ["G2"]]
+
+
+@pytest.mark.parametrize("threads", [2, 3])
+def test_get_all_seqs_threads(threads):
+    """
+    Test that extracting sequences with several processes gives exactly the same family files
+    (same sequences, in the same order) as with 1 process, and removes fragments
+    """
+    all_genomes = ["GEN2.1017.00001", "GEN4.1111.00001", "GENO.1017.00001", "GENO.1216.00002"]
+    dname = "TESTgetAllSeq"
+    listdir = os.path.join(GENEPATH, "Listdir")
+    os.makedirs(listdir)
+    ref_listdir = os.path.join(TESTPATH, "test_listdir")
+    all_fams = [1, 6]
+    aldirs = [os.path.join(GENEPATH, f"Align{num}") for num in [1, threads]]
+    for nb_threads, aldir in zip([1, threads], aldirs):
+        os.makedirs(aldir)
+        for gen in all_genomes:
+            for seqtype in ["gen", "prt"]:
+                # getentry files give the output file, in the align directory
+                with open(os.path.join(ref_listdir, f"getentry-{seqtype}_{gen}")) as ref, \
+                     open(os.path.join(listdir, f"{dname}-getEntry_{seqtype}_{gen}.txt"),
+                          "w") as out:
+                    for line in ref:
+                        seq, famfile = line.split()
+                        out.write(f"{seq} {os.path.join(aldir, os.path.basename(famfile))}\n")
+        gseq.get_all_seqs(all_genomes, dname, DBPATH, listdir, aldir, all_fams, True,
+                          threads=nb_threads)
+    for fam in all_fams:
+        for ext in ["prt", "gen"]:
+            famfile = f"{dname}-current.{fam}.{ext}"
+            with open(os.path.join(aldirs[0], famfile)) as serial, \
+                 open(os.path.join(aldirs[1], famfile)) as parallel:
+                content = serial.read()
+                assert content != ""
+                assert parallel.read() == content
+    assert sorted(os.listdir(aldirs[1])) == sorted(os.listdir(aldirs[0]))
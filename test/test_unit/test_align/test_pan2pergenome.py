@@ -11,6 +11,7 @@ import logging
 import pytest
 
 import PanACoTA.align_module.pan_to_pergenome as p2p
+from PanACoTA import utils_pangenome as upan
 import test.test_unit.utilities_for_tests as tutil
 
 ALPATH = os.path.join("test", "data", "align")
@@ -258,6 +259,35 @@ def test_prot_per_strain_noformat():
     assert all_prots == exp_prots
 
 
+@pytest.mark.parametrize("pers, all_genomes",
+    [(os.path.join("test", "data", "persgenome", "exp_files", "exp_pers-floor-mixed.txt"),
+      ["GEN4.1111.00001", "GENO.0817.00001", "GENO.1216.00002", "GENO.1216.00003"]),
+     (os.path.join(TESTPATH, "pers_genome_complete-gembase.txt"),
+      ["GEN4.1111.00001.C001", "GEN4.1111.00001.P001", "GENO.1216.00002.C002",
+       "GENO.1216.00003.C001"]),
+     (os.path.join(TESTPATH, "pers_genome_noformat.txt"),
+      ["my.genome-name", "my-genome", "genome1", "genome3"])])
+def test_prot_per_strain_index(pers, all_genomes, caplog):
+    """
+    Test that when the persistent genome has an index, proteins are classified from it,
+    with the same result as from the persistent genome file. An index older than the
+    persistent genome file is not used.
+    """
+    caplog.set_level(logging.DEBUG)
+    exp = p2p.proteins_per_strain(pers, all_genomes)
+    pers_copy = os.path.join(GENEPATH, "pers.lst")
+    shutil.copyfile(pers, pers_copy)
+    with open(pers) as persf:
+        fams = {line.split()[0]: line.split()[1:] for line in persf}
+    upan.write_protein_index(fams, pers_copy)
+    assert p2p.proteins_per_strain(pers_copy, all_genomes) == exp
+    assert f"Using protein index of {pers_copy}" in caplog.text
+    caplog.clear()
+    os.utime(pers_copy, (os.path.getmtime(pers_copy) + 10,) * 2)
+    assert p2p.proteins_per_strain(pers_copy, all_genomes) == exp
+    assert "Using protein index" not in caplog.text
+
+
 def test_prot_per_strain_member_bis(caplog):
     """
     Test parser of persistent genome file when a same member is in 2 different families
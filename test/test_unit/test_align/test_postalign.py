@@ -12,6 +12,7 @@ import logging
 import PanACoTA.align_module.post_align as pal
 import test.test_unit.utilities_for_tests as tutil
 from PanACoTA import utils
+from PanACoTA import utils_pangenome as upan
 
 # Define common variables
 ALPATH = os.path.join("test", "data", "align")
@@ -63,6 +64,17 @@ def test_get_genome_included():
     genomes = [ "TOTO.0215.00002", "TOTO.0315.00001", "ESCO.0215.00002", "aTOTO.0215.00002"]
     assert pal.get_genome(header, genomes) == "aTOTO.0215.00002"
 
+def test_get_genome_longest():
+    """
+    Given a header and a list of genomes, with several genome names starting the header,
+    check that it returns the longest one ending at a separator
+    """
+    genomes = ["GEN", "GEN_1", "GEN_12"]
+    assert pal.get_genome(">GEN_12_00065", genomes) == "GEN_12"
+    assert pal.get_genome(">GEN_1234 some description", genomes) == "GEN"
+    resolver = upan.GenomeResolver(genomes)
+    assert pal.get_genome("GEN_1_00012", genomes, resolver) == "GEN_1"
+
 # def test_get_genome_not_start():
 #     """
 #     Given a header and a list of genomes, check that it returns the expected genome. The genome
@@ -85,385 +97,319 @@ def test_get_genome_notfound(caplog):
             "['TOTO.0315.00001', 'ESCO.0215.00002', 'ESCO.0215.00001']") in caplog.text
 
 
-def test_write_groups(caplog):
+def split_families(catfile, prefix, nb_genomes=4):
     """
-    Check that giving a list of genomes and corresponding sequences, it writes all of them in
-    fasta format in the given output file.
+    Split a file of concatenated alignments into 1 file per family, of 'nb_genomes' sequences
+    each. Returns the list of family files created.
     """
-    caplog.set_level(logging.DEBUG)
-    outfile = os.path.join(GENEPATH, "test_write_groups.fa")
-    sequences = {"ESCO.0216.00001": ["AAAAA-", "TTTTT", "CCCCC", "GGGGG"],
-                 "ESCO.0216.00002": ["AAAAT-", "TTTTA", "-CCCG", "GGGGC"],
-                 "ESCO.0216.00003": ["AAAAAA", "TT-TT", "CCC-C", "GCGG-"]}
-    pal.write_groups(outfile, sequences)
-    assert "Writing alignments per genome" in caplog.text
-    with open(outfile, "r") as outf:
-        lines = outf.readlines()
-    assert len(lines) == 6
-    exp_lines = [">ESCO.0216.00001\n", "AAAAA-TTTTTCCCCCGGGGG\n",
-                 ">ESCO.0216.00002\n", "AAAAT-TTTTA-CCCGGGGGC\n",
-                 ">ESCO.0216.00003\n", "AAAAAATT-TTCCC-CGCGG-\n"]
-    assert lines == exp_lines
+    records = [">" + rec for rec in open(catfile).read().split(">") if rec]
+    ali_files = []
+    for num in range(0, len(records), nb_genomes):
+        ali_file = f"{prefix}-mafft-prt2nuc.{num // nb_genomes + 1}.aln"
+        with open(ali_file, "w") as alif:
+            alif.write("".join(records[num:num + nb_genomes]))
+        ali_files.append(ali_file)
+    return ali_files
 
 
-def test_read_alignment(caplog):
+def test_get_family_widths():
     """
-    Giving a file with proteins aligned, and a list of genomes, returns, for each genome,
-    the list of sequences found.
+    Check that width of each family is the length of its first sequence, even when
+    written on several lines
     """
-    caplog.set_level(logging.DEBUG)
-    alnfile = os.path.join(TESTPATH, "complete.cat.fictive4genomes.aln")
-    all_genomes = ["GEN2.1017.00001", "GEN4.1111.00001", "GENO.1017.00001", "GENO.1216.00002"]
-    seqs = pal.read_alignments(alnfile, all_genomes)
-    exp_seq = {"GEN2.1017.00001": ["AAATCTCGGAGATCTCGCGCGGATATATCGCGCTATAGCGCT",
-                                   "---TTCGCGCGGAGAGGCGCTCTCGGCG",
-                                   "----------------------------------------------------"],
-               "GEN4.1111.00001": ["AAATCTCGGAGTTCTCGCGCGGGTA---CGCGCTATAGCGCT",
-                                   "---TTCGCGCGGAGAGGCGCTCTCG---",
-                                   "CGGTATAGGGCGCTAC----CCGGATATAGGGCTCTCGGAATTCGCAAC-CC"],
-               "GENO.1017.00001": ["-------GGAGATCTCGCGCGGATATATCGCGCTATAGCGCT",
-                                   "AAATTCGCGCGGAGAGGCGCTCTCGAAA",
-                                   "CGGTATAGGGCGCTACTTTTCCGGATATAGGGCTCTCGGAATTCG--ACACC"],
-               "GENO.1216.00002": ["AAATCTCGGAGATCTCGCGCGGATATATAAAACTATAGCGCT",
-                                   "----------------------------",
-                                   "CGGTATGGGGCGCTAC----CCGGATATAGGGCTCTCGGAATTCGCAAC-CG"]
-               }
-    assert seqs == exp_seq
-    assert "3 sequences found per genome" in caplog.text
+    ali_files = split_families(os.path.join(TESTPATH, "complete.cat.fictive4genomes.aln"),
+                               os.path.join(GENEPATH, "fictive"))
+    assert pal.get_family_widths(ali_files) == [42, 28, 52]
+    ali_8 = os.path.join(EXPPATH, "exp_aldir-pers", "mafft-prt2nuc.8.aln")
+    assert pal.get_family_widths([ali_8]) == [789]
 
 
-def test_read_alignment_diffnbseq(caplog):
+def test_init_grouped_file():
     """
-    Giving a file with proteins aligned, and a list of genomes, with 3 proteins for each genome,
-    except for 1 genome which has 4 proteins. Exits with an error message.
+    Check that the grouped file contains all genome headers, and space for their sequences
     """
-    caplog.set_level(logging.DEBUG)
-    alnfile = os.path.join(TESTPATH, "complete.cat.fictive4genomes-diffnbseq.aln")
-    all_genomes = ["GEN2.1017.00001", "GEN4.1111.00001", "GENO.1017.00001", "GENO.1216.00002"]
-    assert pal.read_alignments(alnfile, all_genomes) is None
-    assert ("Problems occurred while grouping alignments by genome: all genomes do not have the "
-            "same number of sequences. Check that each protein name contains the name of the "
-            "genome from which it comes.") in caplog.text
-
-
-def test_read_alignment_nogenome(caplog):
-    """
-    Giving a file with proteins aligned, and a list of genomes, but with one genome missing,
-    check that it returns None, and an error message specifying the protein not having a
-    corresponding genome.
-    """
-    caplog.set_level(logging.DEBUG)
-    alnfile = os.path.join(TESTPATH, "complete.cat.fictive4genomes-diffnbseq.aln")
-    all_genomes = ["GEN2.1017.00001", "GEN4.1111.00001", "GENO.1017.00001"]
-    assert pal.read_alignments(alnfile, all_genomes) is None
-    assert ("Protein GENO.1216.00002.i0001_00003 does not correspond to any genome name given... "
-            "['GEN2.1017.00001', 'GEN4.1111.00001', 'GENO.1017.00001']") in caplog.text
+    outfile = os.path.join(GENEPATH, "test_init.grp.aln")
+    genomes = ["GEN2.1017.00001", "GENO.1216.00002"]
+    starts = pal.init_grouped_file(outfile, genomes, 5)
+    with open(outfile, "rb") as outf:
+        content = outf.read()
+    assert content == b">GEN2.1017.00001\n\0\0\0\0\0\n>GENO.1216.00002\n\0\0\0\0\0\n"
+    assert list(starts) == [17, 40]
 
 
 def test_group_by_genome(caplog):
     """
-    Test that giving a file with all proteins aligned, a list of genomes, and an output
+    Test that giving the alignment files of all families, a list of genomes, and an output
     filename, it writes in output the alignment grouped by genome and returns True
     """
     caplog.set_level(logging.DEBUG)
-    alnfile = os.path.join(TESTPATH, "complete.cat.fictive4genomes.aln")
-    all_genomes = ["GEN2.1017.00001", "GEN4.1111.00001", "GENO.1017.00001", "GENO.1216.00002"]
+    ali_files = split_families(os.path.join(TESTPATH, "complete.cat.fictive4genomes.aln"),
+                               os.path.join(GENEPATH, "fictive"))
+    all_genomes = ["GENO.1216.00002", "GEN4.1111.00001", "GENO.1017.00001", "GEN2.1017.00001"]
     outgrp = os.path.join(GENEPATH, "test_group_by_genome")
-    args = (all_genomes, alnfile, outgrp)
-    assert pal.group_by_genome(args)
+    # Temporary file of an interrupted run is not reused
+    with open(outgrp + ".tmp", "w") as tmpf:
+        tmpf.write(">partial\nACGT\n")
+    tracks = {"nucleic": (ali_files, outgrp)}
+    assert pal.launch_group_by_genome(all_genomes, tracks, True) == {"nucleic": True}
     exp_grp = os.path.join(EXPPATH, "exp_fictive.grp.aln")
     assert tutil.compare_order_content(outgrp, exp_grp)
+    assert not os.path.isfile(outgrp + ".tmp")
     assert "3 sequences found per genome" in caplog.text
     assert "Writing alignments per genome" in caplog.text
 
 
 def test_group_by_genome_nogenome(caplog):
     """
-    Test that giving a file with all proteins aligned, a list of genomes but with 1 genome missing,
+    Test that giving alignment files, a list of genomes but with 1 genome missing,
     it returns False, and an error message with the protein not having a corresponding genome
     """
     caplog.set_level(logging.DEBUG)
-    alnfile = os.path.join(TESTPATH, "complete.cat.fictive4genomes.aln")
+    ali_files = split_families(os.path.join(TESTPATH, "complete.cat.fictive4genomes.aln"),
+                               os.path.join(GENEPATH, "fictive"))
     all_genomes = ["GEN2.1017.00001", "GEN4.1111.00001", "GENO.1017.00001"]
     outgrp = os.path.join(GENEPATH, "test_group_by_genome")
-    args = (all_genomes, alnfile, outgrp)
-    assert pal.group_by_genome(args) is False
+    tracks = {"nucleic": (ali_files, outgrp)}
+    assert pal.launch_group_by_genome(all_genomes, tracks, True) == {"nucleic": False}
     assert not os.path.isfile(outgrp)
     assert ("Protein GENO.1216.00002.i0001_00003 does not correspond to any genome name given... "
             "['GEN2.1017.00001', 'GEN4.1111.00001', 'GENO.1017.00001']") in caplog.text
 
 
+def test_group_by_genome_diffnbseq(caplog):
+    """
+    Giving alignment files where a family does not contain 1 sequence per genome (last
+    family only contains 1 genome). Returns False with an error message, and does not keep
+    grp file.
+    """
+    caplog.set_level(logging.DEBUG)
+    ali_files = split_families(os.path.join(TESTPATH,
+                                            "complete.cat.fictive4genomes-diffnbseq.aln"),
+                               os.path.join(GENEPATH, "fictive"))
+    all_genomes = ["GEN2.1017.00001", "GEN4.1111.00001", "GENO.1017.00001", "GENO.1216.00002"]
+    outgrp = os.path.join(GENEPATH, "test_group_by_genome")
+    tracks = {"nucleic": (ali_files, outgrp)}
+    assert pal.launch_group_by_genome(all_genomes, tracks, True) == {"nucleic": False}
+    assert not os.path.isfile(outgrp)
+    assert not os.path.isfile(outgrp + ".tmp")
+    assert ("Problems occurred while grouping alignments by genome: all genomes do not have the "
+            "same number of sequences. Check that each protein name contains the name of the "
+            "genome from which it comes.") in caplog.text
+
+
+def test_group_by_genome_difflen(caplog):
+    """
+    Giving alignment files where a sequence of a family does not have the same length as the
+    others. Returns False with an error message, and does not keep grp file.
+    """
+    caplog.set_level(logging.DEBUG)
+    ali_files = split_families(os.path.join(TESTPATH, "complete.cat.fictive4genomes.aln"),
+                               os.path.join(GENEPATH, "fictive"))
+    with open(ali_files[1], "a") as alif:
+        alif.write(">GEN2.1017.00001.i0002_00005\nAAA\n")
+    with open(ali_files[1]) as alif:
+        content = alif.read().replace(">GEN2.1017.00001.i0002_00005\n---TTCGCGCGGAGAGGCGCTCTCGGCG\n",
+                                      "")
+    with open(ali_files[1], "w") as alif:
+        alif.write(content)
+    all_genomes = ["GEN2.1017.00001", "GEN4.1111.00001", "GENO.1017.00001", "GENO.1216.00002"]
+    outgrp = os.path.join(GENEPATH, "test_group_by_genome")
+    tracks = {"nucleic": (ali_files, outgrp)}
+    assert pal.launch_group_by_genome(all_genomes, tracks, True) == {"nucleic": False}
+    assert not os.path.isfile(outgrp)
+    assert ("Problems occurred while grouping alignments by genome: sequences in "
+            f"{ali_files[1]} do not all have the same length.") in caplog.text
+
+
+def pers_families(prefix):
+    """
+    Copy back-translated alignments of all persistent families, and return their list
+    """
+    ali_files = []
+    for fam in [1, 4, 6, 8, 10, 11, 13, 14]:
+        ali_file = f"{prefix}-mafft-prt2nuc.{fam}.aln"
+        shutil.copyfile(os.path.join(EXPPATH, "exp_aldir-pers", f"mafft-prt2nuc.{fam}.aln"),
+                        ali_file)
+        ali_files.append(ali_file)
+    return ali_files
+
+
 def test_launch_gbg(caplog):
     """
-    Giving an alignment file, and a list of genomes, and a tree directory, check that it
+    Giving alignment files, and a list of genomes, and a tree directory, check that it
     generates the expected filename, with the expected content, and returns True.
     """
     caplog.set_level(logging.DEBUG)
     all_genomes = ["GENO.1216.00002", "GEN2.1017.00001", "GEN4.1111.00001", "GENO.1017.00001"]
-    alnfile = os.path.join(TESTPATH, "complete.cat.pers4genomes.aln")
-    status = "Done"
+    ali_files = pers_families(os.path.join(GENEPATH, "TESTlaunch"))
     treedir = os.path.join(GENEPATH, "test_phylo-pers4genomes")
-    # Create tree dir, with empty output file
     os.makedirs(treedir)
     out_grp = os.path.join(treedir, "TESTlaunch.grp.aln")
-    open(out_grp, "w").close()
-    dname = "TESTlaunch"
     quiet = False
-    assert pal.launch_group_by_genome(all_genomes, alnfile, status, out_grp, dname, "nucl", quiet) is True
+    tracks = {"nucl": (ali_files, out_grp)}
+    assert pal.launch_group_by_genome(all_genomes, tracks, quiet) == {"nucl": True}
     exp_grp = os.path.join(EXPPATH, "exp_pers4genomes.grp.aln")
     assert tutil.compare_order_content(out_grp, exp_grp)
     assert "Grouping nucl alignments per genome" in caplog.text
 
 
+def test_launch_gbg_quiet(caplog):
+    """
+    Same as test_launch_gbg, but in quiet mode.
+    """
+    caplog.set_level(logging.DEBUG)
+    all_genomes = ["GEN2.1017.00001", "GEN4.1111.00001", "GENO.1017.00001", "GENO.1216.00002"]
+    ali_files = pers_families(os.path.join(GENEPATH, "TESTlaunch"))
+    out_grp = os.path.join(GENEPATH, "TESTlaunch.grp.aln")
+    quiet = True
+    tracks = {"toto": (ali_files, out_grp)}
+    assert pal.launch_group_by_genome(all_genomes, tracks, quiet) == {"toto": True}
+    exp_grp = os.path.join(EXPPATH, "exp_pers4genomes.grp.aln")
+    assert tutil.compare_order_content(out_grp, exp_grp)
+    assert "Grouping toto alignments per genome" in caplog.text
+
+
 def test_launch_gbg_existsempty(caplog):
     """
-    Giving an alignment file, and a list of genomes, and saying that we did not re-create this
-    concatenated file. As the group by genome file already exists (even if empty...), it won't
-    recreate it, just return None and keep it.
+    Giving alignment files, and a list of genomes. As the group by genome file already exists
+    (even if empty...), it won't recreate it, just return True and keep it.
     """
     caplog.set_level(logging.DEBUG)
     all_genomes = ["GENO.1216.00002", "GEN2.1017.00001", "GEN4.1111.00001", "GENO.1017.00001"]
-    alnfile = os.path.join(TESTPATH, "complete.cat.pers4genomes.aln")
-    status = "OK"
-    treedir = os.path.join(GENEPATH, "test_phylo-pers4genomes")
-    # Create tree dir, with empty output file
-    os.makedirs(treedir)
-    out_grp = os.path.join(treedir, "TESTlaunch.grp.aln")
+    ali_files = pers_families(os.path.join(GENEPATH, "TESTlaunch"))
+    out_grp = os.path.join(GENEPATH, "TESTlaunch.grp.aln")
     open(out_grp, "w").close()
-    dname = "TESTlaunch"
     quiet = False
-    assert pal.launch_group_by_genome(all_genomes, alnfile, status, out_grp, dname, "aa", quiet) is True
+    tracks = {"aa": (ali_files, out_grp)}
+    assert pal.launch_group_by_genome(all_genomes, tracks, quiet) == {"aa": True}
     assert "Grouping aa alignments per genome" not in caplog.text
+    assert ("aa alignments already grouped by genome in "
+            "test/data/align/generated_by_unit-tests/TESTlaunch.grp.aln. "
+            "Program will end.") in caplog.text
     with open(out_grp, "r") as outf:
         assert outf.readlines() == []
 
 
-def test_launch_gbg_ok_notexist(caplog):
-    """
-    Giving an alignment file, and a list of genomes, and a tree directory, and saying that we
-    did not re-create this concatenated file. As group by genome file does not exist,
-    it will create it as if concatenation was just done, and return True
-    """
-    caplog.set_level(logging.DEBUG)
-    all_genomes = ["GEN2.1017.00001", "GEN4.1111.00001", "GENO.1017.00001", "GENO.1216.00002"]
-    alnfile = os.path.join(TESTPATH, "complete.cat.pers4genomes.aln")
-    status = "OK"
-    treedir = os.path.join(GENEPATH, "test_phylo-pers4genomes")
-    # Create tree dir
-    os.makedirs(treedir)
-    out_grp = os.path.join(treedir, "TESTlaunch.grp.aln")
-    dname = "TESTlaunch"
-    quiet = False
-    assert pal.launch_group_by_genome(all_genomes, alnfile, status, out_grp, dname, "toto", quiet) is True
-    exp_grp = os.path.join(EXPPATH, "exp_pers4genomes.grp.aln")
-    assert tutil.compare_order_content(out_grp, exp_grp)
-    assert "Grouping toto alignments per genome" in caplog.text
-
-
 def test_launch_gbg_nogenome(caplog):
     """
-    Giving an alignment file, and a list of genomes with one genome missing, check that it
+    Giving alignment files, and a list of genomes with one genome missing, check that it
     returns False, with an error message for the protein not having a corresponding genome,
     and does not create grp file
     """
     caplog.set_level(logging.DEBUG)
     all_genomes = ["GEN2.1017.00001", "GEN4.1111.00001", "GENO.1017.00001"]
-    alnfile = os.path.join(TESTPATH, "complete.cat.pers4genomes.aln")
-    status = "OK"
-    treedir = os.path.join(GENEPATH, "test_phylo-pers4genomes")
-    # Create tree dir
-    os.makedirs(treedir)
-    out_grp = os.path.join(treedir, "TESTlaunch.grp.aln")
-    dname = "TESTlaunch"
+    ali_files = pers_families(os.path.join(GENEPATH, "TESTlaunch"))
+    out_grp = os.path.join(GENEPATH, "TESTlaunch.grp.aln")
     quiet = False
-    assert pal.launch_group_by_genome(all_genomes, alnfile, status, treedir, dname, "nn", quiet) is False
+    tracks = {"nn": (ali_files, out_grp)}
+    assert pal.launch_group_by_genome(all_genomes, tracks, quiet) == {"nn": False}
     assert not os.path.isfile(out_grp)
     assert "Grouping nn alignments per genome" in caplog.text
 
 
-def test_concat_nucl(caplog):
+def test_launch_gbg_threads(caplog):
     """
-    Given a list of families, and a directory where are alignment files, check that the files
-    corresponding to the given families are concatenated as expected, and it returns "Done" and
-    expected output filename
+    Giving alignment files in nucleic and aa, check that both tracks are grouped by genome
+    at the same time, in blocks written by several processes, and that logs of processes
+    are kept.
     """
     caplog.set_level(logging.DEBUG)
-    # Prepare aldir with all needed alignment files
-    aldir = os.path.join(GENEPATH, "test_concat_aldir")
-    dname = "TEST-concat"
-    prefix = os.path.join(aldir, dname)
-    orig_btr1 = os.path.join(EXPPATH, "exp_aldir", "mafft-prt2nuc.1.aln")
-    orig_btr8 = os.path.join(EXPPATH, "exp_aldir-pers", "mafft-prt2nuc.8.aln")
-    orig_btr11 = os.path.join(EXPPATH, "exp_aldir-pers", "mafft-prt2nuc.11.aln")
-    btr1 = os.path.join(aldir, dname + "-mafft-prt2nuc.1.aln")
-    btr8 = os.path.join(aldir, dname + "-mafft-prt2nuc.8.aln")
-    btr11 = os.path.join(aldir, dname + "-mafft-prt2nuc.11.aln")
-    os.makedirs(aldir)
-    shutil.copyfile(orig_btr1, btr1)
-    shutil.copyfile(orig_btr8, btr8)
-    shutil.copyfile(orig_btr11, btr11)
-    # Other parameters, and run concatenation
-    fam_nums = [1, 8, 11]
-    quiet = False
-    output, mess = pal.concat_alignments(fam_nums, prefix, "nucl", quiet)
-    assert output == os.path.join(aldir, dname + "-complete.nucl.cat.aln")
-    ref_concat = os.path.join(EXPPATH, "exp_concat_4genomes-fam1-8-11.aln")
-    assert tutil.compare_order_content(output, ref_concat)
-    assert mess == "Done"
-    assert "Concatenating all nucl alignment files" in caplog.text
+    all_genomes = ["GENO.1216.00002", "GEN2.1017.00001", "GEN4.1111.00001", "GENO.1017.00001"]
+    prefix = os.path.join(GENEPATH, "TESTlaunch")
+    ali_files = pers_families(prefix)
+    ali_aa = []
+    for fam in [1, 4, 6, 8, 10, 11, 13, 14]:
+        name = f"mafft-align.{fam}-completed.aln" if fam in [4, 8] else f"mafft-align.{fam}.aln"
+        ali_aa.append(f"{prefix}-mafft-align.{fam}.aln")
+        shutil.copyfile(os.path.join(EXPPATH, "exp_aldir-pers", name), ali_aa[-1])
+    out_grp = os.path.join(GENEPATH, "TESTlaunch.nucl.grp.aln")
+    out_grp_aa = os.path.join(GENEPATH, "TESTlaunch.aa.grp.aln")
+    tracks = {"nucleic": (ali_files, out_grp), "protein": (ali_aa, out_grp_aa)}
+    assert pal.launch_group_by_genome(all_genomes, tracks, False, threads=3) == {
+        "nucleic": True, "protein": True}
+    assert tutil.compare_order_content(out_grp,
+                                       os.path.join(EXPPATH, "exp_pers4genomes.grp.aln"))
+    assert tutil.compare_order_content(out_grp_aa,
+                                       os.path.join(EXPPATH, "exp_pers4genomes.aa.grp.aln"))
+    assert "8 sequences found per genome in nucleic alignments" in caplog.text
+    assert "8 sequences found per genome in protein alignments" in caplog.text
+    # Problem in 1 track: the other one is still written
+    os.remove(out_grp)
+    os.remove(out_grp_aa)
+    with open(ali_aa[2], "a") as alif:
+        alif.write(">GEN2.1017.00001.b0001_00001\nMKL\n")
+    assert pal.launch_group_by_genome(all_genomes, tracks, True, threads=3) == {
+        "nucleic": True, "protein": False}
+    assert tutil.compare_order_content(out_grp,
+                                       os.path.join(EXPPATH, "exp_pers4genomes.grp.aln"))
+    assert not os.path.isfile(out_grp_aa)
+    assert ("Problems occurred while grouping alignments by genome: all genomes do not have the "
+            "same number of sequences.") in caplog.text
 
 
-def test_concat_aa(caplog):
+def test_split_columns():
     """
-    Given a list of families, and a directory where are alignment files, check that the files
-    corresponding to the given families are concatenated as expected, and it returns "Done" and
-    expected output filename
+    Check that families are split in blocks of consecutive families with about the same
+    number of columns
     """
-    caplog.set_level(logging.DEBUG)
-    # Prepare aldir with all needed alignment files
-    aldir = os.path.join(GENEPATH, "test_concat_aldir")
-    dname = "TEST-concat"
-    prefix = os.path.join(aldir, dname)
-    orig_btr1 = os.path.join(EXPPATH, "exp_aldir", "mafft-align.1.aln")
-    orig_btr8 = os.path.join(EXPPATH, "exp_aldir-pers", "mafft-align.8-completed.aln")
-    orig_btr11 = os.path.join(EXPPATH, "exp_aldir-pers", "mafft-align.11.aln")
-    btr1 = os.path.join(aldir, dname + "-mafft-align.1.aln")
-    btr8 = os.path.join(aldir, dname + "-mafft-align.8.aln")
-    btr11 = os.path.join(aldir, dname + "-mafft-align.11.aln")
-    os.makedirs(aldir)
-    shutil.copyfile(orig_btr1, btr1)
-    shutil.copyfile(orig_btr8, btr8)
-    shutil.copyfile(orig_btr11, btr11)
-    # Other parameters, and run concatenation
-    fam_nums = [1, 8, 11]
-    quiet = False
-    output, mess = pal.concat_alignments(fam_nums, prefix, "aa", quiet)
-    assert output == os.path.join(aldir, dname + "-complete.aa.cat.aln")
-    ref_concat = os.path.join(EXPPATH, "exp_concat_4genomes-fam1-8-11.aa.aln")
-    assert tutil.compare_order_content(output, ref_concat)
-    assert mess == "Done"
-    assert "Concatenating all aa alignment files" in caplog.text
+    assert pal.split_columns([10, 10, 10, 10], 2) == [(0, 2), (2, 4)]
+    assert pal.split_columns([30, 5, 5, 10, 10], 2) == [(0, 1), (1, 5)]
+    assert pal.split_columns([10, 10, 10], 1) == [(0, 3)]
+    assert pal.split_columns([10, 10], 8) == [(0, 1), (1, 2)]
+    assert pal.split_columns([], 4) == [(0, 0)]
 
 
-def test_concat_quiet(caplog):
+def test_get_family_files():
     """
-    Given a list of families, and a directory where are alignment files, check that the files
-    corresponding to the given families are concatenated as expected, and it returns "Done" and
-    expected output filename
+    Given a list of families, and a directory where are alignment files, check that it
+    returns the files corresponding to the given families, in nucl and aa
     """
-    caplog.set_level(logging.DEBUG)
-    # Prepare aldir with all needed alignment files
-    aldir = os.path.join(GENEPATH, "test_concat_aldir")
-    dname = "TESTconcat"
-    prefix = os.path.join(aldir, dname)
-    orig_btr1 = os.path.join(EXPPATH, "exp_aldir", "mafft-prt2nuc.1.aln")
-    orig_btr8 = os.path.join(EXPPATH, "exp_aldir-pers", "mafft-prt2nuc.8.aln")
-    orig_btr11 = os.path.join(EXPPATH, "exp_aldir-pers", "mafft-prt2nuc.11.aln")
-    btr1 = os.path.join(aldir, dname + "-mafft-prt2nuc.1.aln")
-    btr8 = os.path.join(aldir, dname + "-mafft-prt2nuc.8.aln")
-    btr11 = os.path.join(aldir, dname + "-mafft-prt2nuc.11.aln")
-    os.makedirs(aldir)
-    shutil.copyfile(orig_btr1, btr1)
-    shutil.copyfile(orig_btr8, btr8)
-    shutil.copyfile(orig_btr11, btr11)
-    # Other parameters, and run concatenation
-    fam_nums = [1, 8, 11]
-    quiet = True
-    output, mess = pal.concat_alignments(fam_nums, prefix, "nucl", quiet)
-    assert output == os.path.join(aldir, dname + "-complete.nucl.cat.aln")
-    ref_concat = os.path.join(EXPPATH, "exp_concat_4genomes-fam1-8-11.aln")
-    assert tutil.compare_order_content(output, ref_concat)
-    assert mess == "Done"
-    assert "Concatenating all nucl alignment files" in caplog.text
+    prefix = os.path.join(GENEPATH, "TEST-files")
+    for info in ["mafft-prt2nuc", "mafft-align"]:
+        for fam in [1, 8, 11]:
+            open(f"{prefix}-{info}.{fam}.aln", "w").close()
+    assert pal.get_family_files([1, 8, 11], prefix, "nucl") == [
+        f"{prefix}-mafft-prt2nuc.1.aln", f"{prefix}-mafft-prt2nuc.8.aln",
+        f"{prefix}-mafft-prt2nuc.11.aln"]
+    assert pal.get_family_files([11, 1], prefix, "aa") == [
+        f"{prefix}-mafft-align.11.aln", f"{prefix}-mafft-align.1.aln"]
 
 
-def test_concat_noalignfile(caplog):
+def test_get_family_files_noalignfile(caplog):
     """
     Given a list of families, and a directory where are alignment files except for 1 family,
     for which we do not have the alignment file
     """
     caplog.set_level(logging.DEBUG)
-    # Prepare aldir with all needed alignment files
-    aldir = os.path.join(GENEPATH, "test_concat_aldir")
-    dname = "TESTconcat"
-    prefix = os.path.join(aldir, dname)
-    orig_btr1 = os.path.join(EXPPATH, "exp_aldir", "mafft-prt2nuc.1.aln")
-    orig_btr8 = os.path.join(EXPPATH, "exp_aldir-pers", "mafft-prt2nuc.8.aln")
-    orig_btr11 = os.path.join(EXPPATH, "exp_aldir-pers", "mafft-prt2nuc.11.aln")
-    btr1 = os.path.join(aldir, dname + "-mafft-prt2nuc.1.aln")
-    btr8 = os.path.join(aldir, dname + "-mafft-prt2nuc.8.aln")
-    btr11 = os.path.join(aldir, dname + "-mafft-prt2nuc.11.aln")
-    os.makedirs(aldir)
-    shutil.copyfile(orig_btr1, btr1)
-    shutil.copyfile(orig_btr8, btr8)
-    shutil.copyfile(orig_btr11, btr11)
-    # Other parameters, and run concatenation
+    prefix = os.path.join(GENEPATH, "TESTfiles")
+    for fam in [1, 8, 11]:
+        open(f"{prefix}-mafft-prt2nuc.{fam}.aln", "w").close()
     fam_nums = [1, 8, 11, 15]
-    quiet = False
     with pytest.raises(SystemExit):
-        pal.concat_alignments(fam_nums, prefix, "nucl", quiet)
+        pal.get_family_files(fam_nums, prefix, "nucl")
     assert ("The alignment file "
-            "test/data/align/generated_by_unit-tests/test_concat_aldir/"
-            "TESTconcat-mafft-prt2nuc.15.aln "
+            "test/data/align/generated_by_unit-tests/"
+            "TESTfiles-mafft-prt2nuc.15.aln "
             "does not exist. Please check the families you want, and their corresponding "
             "alignment files") in caplog.text
 
 
-def test_concat_outexists(caplog):
-    """
-    Given a list of families, and a directory where are alignment files and the concatenated
-    file, check that it keeps this outfile, and returns "OK" with a warning message
-    """
-    caplog.set_level(logging.DEBUG)
-    # Prepare aldir with all needed alignment files
-    aldir = os.path.join(GENEPATH, "test_concat_aldir")
-    dname = "TESTconcat"
-    prefix = os.path.join(aldir, dname)
-    orig_btr1 = os.path.join(EXPPATH, "exp_aldir", "mafft-prt2nuc.1.aln")
-    orig_btr8 = os.path.join(EXPPATH, "exp_aldir-pers", "mafft-prt2nuc.8.aln")
-    orig_btr11 = os.path.join(EXPPATH, "exp_aldir-pers", "mafft-prt2nuc.11.aln")
-    btr1 = os.path.join(aldir, dname + "-mafft-prt2nuc.1.aln")
-    btr8 = os.path.join(aldir, dname + "-mafft-prt2nuc.8.aln")
-    btr11 = os.path.join(aldir, dname + "-mafft-prt2nuc.11.aln")
-    os.makedirs(aldir)
-    shutil.copyfile(orig_btr1, btr1)
-    shutil.copyfile(orig_btr8, btr8)
-    shutil.copyfile(orig_btr11, btr11)
-    # Create empty concatenated file
-    outempty = os.path.join(aldir, dname + "-complete.aa.cat.aln")
-    open(outempty, "w").close()
-    # Other parameters, and run concatenation
-    fam_nums = [1, 8, 11]
-    quiet = False
-    output, mess = pal.concat_alignments(fam_nums, prefix, "aa", quiet)
-    assert output == outempty
-    assert mess == "OK"
-    with open(output, "r") as outf:
-        assert outf.readlines() == []
-    assert "aa alignments already concatenated" in caplog.text
-    assert ("aa alignments already concatenated in "
-            "test/data/align/generated_by_unit-tests/test_concat_aldir/"
-            "TESTconcat-complete.aa.cat.aln. "
-            "Program will use it for next steps") in caplog.text
-
-
-def test_concat_tototype(caplog):
+def test_get_family_files_tototype(caplog):
     """
-    ask to align with 'toto' type of alignment
+    ask to group 'toto' type of alignment
     """
     fam_nums = [1, 8, 11]
     prefix = "my_prefix"
-    quiet = False
     with pytest.raises(SystemExit):
-        pal.concat_alignments(fam_nums, prefix, "toto", quiet)
-    assert "Not possible to concatenate 'toto' type of alignments" in caplog.text
-
+        pal.get_family_files(fam_nums, prefix, "toto")
+    assert "Not possible to group 'toto' type of alignments" in caplog.text
 
 
 def test_postalign(caplog):
     """
     Test that when running post-alignment on a folder containing all expected alignment files,
-    it creates concatenated alignments, and a folder Phylo with the alignments grouped by genome.
+    it creates a folder Phylo with the alignments grouped by genome, without concatenating
+    alignment files.
     """
     caplog.set_level(logging.DEBUG)
     # define parameters
@@ -497,19 +443,9 @@ def test_postalign(caplog):
     shutil.copyfile(orig_ali11, ali11)
     # Run post-alignment
     pal.post_alignment(fam_nums, all_genomes, prefix, outdir, dname, prot_ali, quiet)
-    # print(caplog.text)
-    # CHECK CONCAT
-    # Check that concatenated file in nucl is created and with expected content
-    out_concat_nucl = os.path.join(aldir, dname + "-complete.nucl.cat.aln")
-    assert os.path.isfile(out_concat_nucl)
-    ref_concat_nucl = os.path.join(EXPPATH, "exp_concat_4genomes-fam1-8-11.aln")
-    assert tutil.compare_order_content(out_concat_nucl, ref_concat_nucl)
-    # Check concatenated in aa
-    out_concat_aa = os.path.join(aldir, dname + "-complete.aa.cat.aln")
-    assert os.path.isfile(out_concat_aa)
-    ref_concat_aa = os.path.join(EXPPATH, "exp_concat_4genomes-fam1-8-11.aa.aln")
-    assert tutil.compare_order_content(out_concat_aa, ref_concat_aa)
-    # CHECK GROUPED
+    # Check that no concatenated file is created
+    assert not os.path.isfile(os.path.join(aldir, dname + "-complete.nucl.cat.aln"))
+    assert not os.path.isfile(os.path.join(aldir, dname + "-complete.aa.cat.aln"))
     # Check that grouped by genome file in nucleotides is created, with expected content
     treedir = os.path.join(outdir, "Phylo-" + dname)
     out_grp = os.path.join(treedir, dname + ".nucl.grp.aln")
@@ -522,9 +458,7 @@ def test_postalign(caplog):
     exp_grp_aa = os.path.join(EXPPATH, "exp_grp_4genomes-fam1-8-11.aa.aln")
     assert tutil.compare_order_content(out_grp_aa, exp_grp_aa)
     # check logs
-    assert "Concatenating all nucl alignment files" in caplog.text
     assert "Grouping nucleic alignments per genome" in caplog.text
-    assert "Concatenating all aa alignment files" in caplog.text
     assert "Grouping protein alignments per genome" in caplog.text
 
 
@@ -595,15 +529,11 @@ def test_postalign_missgenome(caplog):
     # Run post-alignment
     with pytest.raises(SystemExit):
         pal.post_alignment(fam_nums, all_genomes, prefix, outdir, dname, prot_ali, quiet)
-    # Check that concatenated file is created and with expected content
-    out_concat = os.path.join(aldir, dname + "-complete.nucl.cat.aln")
-    assert not os.path.isfile(out_concat)
     # Check that grouped by genome file is not created
     treedir = os.path.join(outdir, "Phylo-" + dname)
     out_grp = os.path.join(treedir, dname + ".nucl.grp.aln")
     assert not os.path.isfile(out_grp)
     # check logs
-    assert "Concatenating all nucl alignment files" in caplog.text
     assert "Grouping nucleic alignments per genome" in caplog.text
     assert "An error occurred. We could not group DNA alignments by genome." in caplog.text
 
@@ -612,8 +542,8 @@ def test_postalign_error_grpaa(caplog):
     """
     Test that when running post-alignment on a folder containing :
     - all btr files ok
-    - all mafft files ok + concat mafft not ok (1 génome missing for 1 family)
-    concat and group works for nucleic, but fails for aa. Just puts an error message, but 
+    - all mafft files, but 1 genome missing for 1 family
+    group works for nucleic, but fails for aa. Just puts an error message, but
     still returns the nucl grp file (without exit).
     """
     caplog.set_level(logging.DEBUG)
@@ -632,40 +562,31 @@ def test_postalign_error_grpaa(caplog):
     orig_btr8 = os.path.join(EXPPATH, "exp_aldir-pers", "mafft-prt2nuc.8.aln")
     orig_btr11 = os.path.join(EXPPATH, "exp_aldir-pers", "mafft-prt2nuc.11.aln")
     orig_ali1 = os.path.join(EXPPATH, "exp_aldir", "mafft-align.1.aln")
+    orig_ali8 = os.path.join(EXPPATH, "exp_aldir-pers", "mafft-align.8.aln")
     orig_ali11 = os.path.join(EXPPATH, "exp_aldir-pers", "mafft-align.11.aln")
-    orig_concat_aa = os.path.join(EXPPATH, "exp_concat_4genomes-fam1-8-11-error.aa.aln")
     btr1 = os.path.join(aldir, dname + "-mafft-prt2nuc.1.aln")
     btr8 = os.path.join(aldir, dname + "-mafft-prt2nuc.8.aln")
     btr11 = os.path.join(aldir, dname + "-mafft-prt2nuc.11.aln")
     ali1 = os.path.join(aldir, dname + "-mafft-align.1.aln")
+    ali8 = os.path.join(aldir, dname + "-mafft-align.8.aln")
     ali11 = os.path.join(aldir, dname + "-mafft-align.11.aln")
-    concataa = os.path.join(aldir, dname + "-complete.aa.cat.aln")
     shutil.copyfile(orig_btr1, btr1)
     shutil.copyfile(orig_btr8, btr8)
     shutil.copyfile(orig_btr11, btr11)
     shutil.copyfile(orig_ali1, ali1)
+    shutil.copyfile(orig_ali8, ali8)
     shutil.copyfile(orig_ali11, ali11)
-    shutil.copyfile(orig_concat_aa, concataa)
     # Run post-alignment
-    out_concat = os.path.join(aldir, dname + "-complete.nucl.cat.aln")
     treedir = os.path.join(outdir, "Phylo-" + dname)
     out_grp = os.path.join(treedir, dname + ".nucl.grp.aln")
     assert pal.post_alignment(fam_nums, all_genomes, prefix, outdir, dname, prot_ali, quiet) == out_grp
-    # Check that concatenated file is created and with expected content
-    ref_concat_nucl = os.path.join(EXPPATH, "exp_concat_4genomes-fam1-8-11.aln")
-    assert os.path.isfile(out_concat)
-    assert tutil.compare_order_content(out_concat, ref_concat_nucl)
-    # Check that grouped by genome file is not created
+    # Check that grouped by genome file is created for nucleic, and not for aa
     assert os.path.isfile(out_grp)
     exp_grp = os.path.join(EXPPATH, "exp_grp_4genomes-fam1-8-11.aln")
     assert tutil.compare_order_content(out_grp, exp_grp)
+    assert not os.path.isfile(os.path.join(treedir, dname + ".aa.grp.aln"))
     # check logs
-    assert "Concatenating all nucl alignment files" in caplog.text
     assert "Grouping nucleic alignments per genome" in caplog.text
-    assert ("aa alignments already concatenated in test/data/align/generated_by_unit-tests/"
-            "test_post-align/aldir_post-align/TESTpost-complete.aa.cat.aln. "
-            "Program will use it for next steps. If you want to redo it, "
-            "remove it before running.") in caplog.text
     assert "Grouping protein alignments per genome" in caplog.text
     assert ("An error occurred. We could not group protein alignments by genome") in caplog.text
 
@@ -700,14 +621,10 @@ def test_postalign_diffnbseq(caplog):
     # Run post-alignment
     with pytest.raises(SystemExit):
         pal.post_alignment(fam_nums, all_genomes, prefix, outdir, dname, prot_ali, quiet)
-    # Check that concatenated file is created and with expected content
-    out_concat = os.path.join(aldir, dname + "-complete.cat.aln")
-    assert not os.path.isfile(out_concat)
     # Check that grouped by genome file is not created
     treedir = os.path.join(outdir, "Phylo-" + dname)
-    out_grp = os.path.join(treedir, dname + ".grp.aln")
+    out_grp = os.path.join(treedir, dname + ".nucl.grp.aln")
     assert not os.path.isfile(out_grp)
     # check logs
-    assert "Concatenating all nucl alignment files" in caplog.text
     assert "Grouping nucleic alignments per genome" in caplog.text
     assert "An error occurred. We could not group DNA alignments by genome." in caplog.text
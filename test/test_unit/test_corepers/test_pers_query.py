@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Unit tests for the pers_query submodule in corepers module
+"""
+import os
+import json
+import http.client
+import socket
+import shutil
+import threading
+import pytest
+
+import PanACoTA.corepers_module.pers_query as pquery
+import PanACoTA.corepers_module.persistent_functions as persf
+import test.test_unit.utilities_for_tests as tutils
+
+
+PERS_PATH = os.path.join("test", "data", "persgenome")
+GENEPATH = os.path.join(PERS_PATH, "generated_by_unit-tests_query")
+EXP_PATH = os.path.join(PERS_PATH, "exp_files")
+PAN = os.path.join(GENEPATH, "pangenome.lst")
+SUBSET = ["GEN4.1111.00001", "GENO.1216.00003"]
+
+
+@pytest.fixture(autouse=True)
+def setup_teardown_module():
+    """
+    Copy pangenome file to the directory of generated files, and remove it at the end
+    """
+    os.mkdir(GENEPATH)
+    shutil.copyfile(os.path.join(PERS_PATH, "test_files", "test_pan-for-corepers.txt"), PAN)
+    print("setup")
+
+    yield
+    shutil.rmtree(GENEPATH)
+    print("teardown")
+
+
+@pytest.fixture
+def server():
+    """
+    Start a service on a free local port, and stop it at the end
+    """
+    query = pquery.PangenomeQuery(PAN, outdir=GENEPATH)
+    serv = pquery.make_server(query, "127.0.0.1:0")
+    thread = threading.Thread(target=serv.serve_forever, daemon=True)
+    thread.start()
+    yield serv
+    serv.shutdown()
+    serv.server_close()
+
+
+def request(serv, method, url, body=None):
+    """
+    Send a request to the service, and return the status and the JSON answer
+    """
+    conn = http.client.HTTPConnection(*serv.server_address)
+    conn.request(method, url, body=body)
+    resp = conn.getresponse()
+    answer = json.loads(resp.read())
+    conn.close()
+    return resp.status, answer
+
+
+def test_query_core():
+    """
+    Test that the core genome of all genomes and of a subset are as expected, and that
+    the count matrix is saved and then reused
+    """
+    query = pquery.PangenomeQuery(PAN, outdir=GENEPATH)
+    assert os.path.isfile(os.path.join(PAN + ".matrix", "counts.npy"))
+    fams = query.get_pers(outfile="core.lst")
+    assert len(fams) == 2
+    assert tutils.compare_order_content(os.path.join(GENEPATH, "core.lst"),
+                                        os.path.join(EXP_PATH, "exp_coregenome.txt"))
+    query.get_pers(genomes=SUBSET, outfile="core-sub.lst")
+    assert tutils.compare_order_content(os.path.join(GENEPATH, "core-sub.lst"),
+                                        os.path.join(EXP_PATH, "exp_coregenome_subset.txt"))
+    query2 = pquery.PangenomeQuery(PAN)
+    assert isinstance(query2.matrix[2], persf.np.memmap)
+    assert query2.get_pers(genomes=SUBSET) == query.get_pers(genomes=SUBSET)
+
+
+def test_query_cache():
+    """
+    Test that the same query, with genomes in another order, is answered from cache
+    """
+    query = pquery.PangenomeQuery(PAN, cache_size=2)
+    fams = query.get_pers(genomes=SUBSET, tol=0.99, multi=True, floor=True)
+    assert query.get_pers(genomes=SUBSET[::-1], tol=0.99, multi=True, floor=True) is fams
+    query.get_pers(tol=0.5)
+    query.get_pers(tol=0.6)
+    info = query.cache_info()
+    assert (info.hits, info.misses, info.currsize) == (1, 3, 2)
+
+
+def test_query_underscore_genomes():
+    """
+    Test that for a subset of genomes whose names contain '_', members of these genomes are
+    returned in each persistent family, directly and by the service
+    """
+    pan = os.path.join(GENEPATH, "pangenome-underscore.lst")
+    with open(pan, "w") as panf:
+        panf.write("1 GEN_1_00001 GEN_2_00003 GEN_3_00002\n")
+        panf.write("2 GEN_1_00002 GEN_3_00004\n")
+    query = pquery.PangenomeQuery(pan)
+    exp_fams = {"1": ["GEN_1_00001", "GEN_2_00003"]}
+    assert query.get_pers(genomes=["GEN_1", "GEN_2"]) == exp_fams
+    serv = pquery.make_server(query, "127.0.0.1:0")
+    thread = threading.Thread(target=serv.serve_forever, daemon=True)
+    thread.start()
+    try:
+        status, answer = request(serv, "GET", "/pers?genomes=GEN_1,GEN_2")
+    finally:
+        serv.shutdown()
+        serv.server_close()
+    assert status == 200
+    assert answer == {"nb_families": 1, "families": exp_fams}
+
+
+@pytest.mark.parametrize("params, error",
+                         [({"tol": 1.5}, "tol must be in [0, 1]"),
+                          ({"tol": 0.9, "multi": True, "mixed": True},
+                           "multi and mixed families cannot be allowed together"),
+                          ({"floor": True}, "floor cannot be used with tol=1"),
+                          ({"outfile": "core.lst"}, "No output directory given")])
+def test_query_wrong(params, error):
+    """
+    Test that wrong queries raise an error
+    """
+    query = pquery.PangenomeQuery(PAN)
+    with pytest.raises(ValueError) as err:
+        query.get_pers(**params)
+    assert error in str(err.value)
+
+
+def test_query_wrong_outfile():
+    """
+    Test that a persistent genome cannot be written outside the output directory
+    """
+    query = pquery.PangenomeQuery(PAN, outdir=GENEPATH)
+    with pytest.raises(ValueError) as err:
+        query.get_pers(outfile="../core.lst")
+    assert "Invalid output file name: '../core.lst'" in str(err.value)
+
+
+def test_parse_query():
+    """
+    Test that parameters given in URL or JSON are converted to get_pers arguments
+    """
+    assert pquery.parse_query({"genomes": ["A,B", "C"], "tol": ["0.9"], "mixed": ["true"]}) == \
+        {"genomes": ["A", "B", "C"], "tol": 0.9, "multi": False, "mixed": True,
+         "floor": False, "outfile": None}
+    assert pquery.parse_query({"tol": 0.5, "floor": True, "outfile": "pers.lst"}) == \
+        {"genomes": None, "tol": 0.5, "multi": False, "mixed": False, "floor": True,
+         "outfile": "pers.lst"}
+    with pytest.raises(ValueError) as err:
+        pquery.parse_query({"toto": 1})
+    assert "Unknown parameter(s): toto" in str(err.value)
+    with pytest.raises(ValueError):
+        pquery.parse_query({"genomes": "A"})
+    for params in [{"tol": {}}, {"tol": "abc"}, {"tol": True}, {"multi": {}},
+                   {"outfile": 3}]:
+        with pytest.raises(ValueError):
+            pquery.parse_query(params)
+
+
+def test_server_get(server):
+    """
+    Test GET queries on the HTTP service
+    """
+    status, answer = request(server, "GET", "/pers?genomes=" + ",".join(SUBSET))
+    assert status == 200
+    assert answer["nb_families"] == 3
+    assert sorted(answer["families"]) == ["1", "3", "5"]
+    status, answer = request(server, "GET", "/pers?tol=1&outfile=core.lst")
+    assert status == 200
+    assert answer == {"nb_families": 2, "outfile": os.path.join(GENEPATH, "core.lst")}
+    assert tutils.compare_order_content(os.path.join(GENEPATH, "core.lst"),
+                                        os.path.join(EXP_PATH, "exp_coregenome.txt"))
+    status, answer = request(server, "GET", "/pers?tol=2")
+    assert status == 400
+    assert "tol must be in [0, 1]" in answer["error"]
+    status, answer = request(server, "GET", "/toto")
+    assert status == 404
+
+
+def test_server_post(server):
+    """
+    Test POST queries on the HTTP service, from several threads at once
+    """
+    body = json.dumps({"genomes": SUBSET, "tol": 0.99, "multi": True, "floor": True})
+    answers = []
+    threads = [threading.Thread(target=lambda: answers.append(request(server, "POST", "/pers",
+                                                                      body)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(answers) == 4
+    assert all(status == 200 and answer["nb_families"] == 9 for status, answer in answers)
+    status, answer = request(server, "POST", "/pers", "not json")
+    assert status == 400
+    assert answer == {"error": "Invalid JSON body."}
+    status, answer = request(server, "POST", "/pers", json.dumps({"tol": {}}))
+    assert status == 400
+    assert answer == {"error": "tol must be a number. Invalid value: {}"}
+
+
+def test_server_unix():
+    """
+    Test a query on the HTTP service listening on a Unix socket
+    """
+    path = os.path.join(GENEPATH, "query.sock")
+    serv = pquery.make_server(pquery.PangenomeQuery(PAN), "unix:" + path)
+    thread = threading.Thread(target=serv.serve_forever, daemon=True)
+    thread.start()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(path)
+            sock.sendall(b"GET /pers HTTP/1.0\r\n\r\n")
+            resp = b""
+            while True:
+                data = sock.recv(4096)
+                if not data:
+                    break
+                resp += data
+    finally:
+        serv.shutdown()
+        serv.server_close()
+    header, body = resp.split(b"\r\n\r\n", 1)
+    assert header.startswith(b"HTTP/1.0 200")
+    assert json.loads(body)["nb_families"] == 2
+    # Socket left by the previous service is replaced
+    serv = pquery.make_server(pquery.PangenomeQuery(PAN), "unix:" + path)
+    serv.server_close()
+
+
+def test_server_unix_notsocket(caplog):
+    """
+    Test that a file which is not a socket is not removed to listen on its path
+    """
+    path = os.path.join(GENEPATH, "query.sock")
+    with open(path, "w") as sockf:
+        sockf.write("not a socket")
+    with pytest.raises(ValueError) as err:
+        pquery.make_server(pquery.PangenomeQuery(PAN), "unix:" + path)
+    assert "already exists and is not a Unix socket" in str(err.value)
+    with pytest.raises(SystemExit):
+        pquery.serve(pquery.PangenomeQuery(PAN), "unix:" + path)
+    assert "already exists and is not a Unix socket" in caplog.text
+    with open(path) as sockf:
+        assert sockf.read() == "not a socket"
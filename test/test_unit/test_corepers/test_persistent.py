@@ -8,8 +8,10 @@ import os
 import logging
 import pytest
 import shutil
+import scipy.sparse
 
 import PanACoTA.corepers_module.persistent_functions as persf
+from PanACoTA import utils_pangenome as utilsp
 import test.test_unit.utilities_for_tests as tutils
 
 
@@ -104,110 +106,6 @@ def setup_teardown_module():
     print("teardown")
 
 
-def test_uniq_mems():
-    """
-    Test that it returns True when there is only 1 member of each genome in the given family
-    """
-    family = {"strain1": ["member"],
-              "strain2": ["member2"],
-              "strain3": ["member3"]}
-    assert persf.uniq_members(family)
-
-
-def test_nonuniq_mems():
-    """
-    Test that it returns False when there is more than 1 member in a genome
-    """
-    family = {"strain1": ["member", "member-bis"],
-              "strain2": ["member2"],
-              "strain3": ["member3"]}
-    assert not persf.uniq_members(family)
-
-
-def test_zero_mem(caplog):
-    """
-    Test that when there are no member in 1 family, and 1 in all others, it
-    returns True but with a warning message.
-    """
-    caplog.set_level(logging.DEBUG)
-    family = {"strain1": ["member"],
-              "strain2": ["member2"],
-              "strain3": ["member3"],
-              "strain4": []}
-    assert persf.uniq_members(family)
-    assert "Problem, no members for strain4!" in caplog.text
-
-
-def test_zero_mem_notuniq(caplog):
-    """
-    Test that when there are no member in 1 family, and several in 1 other family, it
-    returns False + a warning message.
-    """
-    caplog.set_level(logging.DEBUG)
-    family = {"strain1": [],
-              "strain2": ["member2"],
-              "strain3": ["member3", "hello"],
-              "strain4": ["my_member"]}
-    assert not persf.uniq_members(family)
-    assert "Problem, no members for strain1!" in caplog.text
-
-
-def test_mixed():
-    """
-    Test that it returns true when there is exactly 1 member in 3 genomes/4 (and minimum
-    asked is 3), and several members in the other strain
-    """
-    family = {"strain1": ["member"],
-              "strain2": ["member2"],
-              "strain3": ["member3"],
-              "strain4": ["member4", "member4bis"]}
-    assert persf.mixed_family(family, 3)
-
-
-def test_mixed_empty(caplog):
-    """
-    Test that when there is exactly 1 member in 3 genomes / 4 (and min 3 asked),
-    and 0 in the other genomes, it returns True.
-    """
-    caplog.set_level(logging.DEBUG)
-    family = {"strain1": ["member"],
-              "strain2": ["member2"],
-              "strain2b": [],
-              "strain3b": [],
-              "strain4": [],
-              "strain3": ["member3"],
-              "strain5": []}
-    assert persf.mixed_family(family, 3)
-    assert "Problem, no members for strain2b" in caplog.text
-    assert "Problem, no members for strain3b" in caplog.text
-    assert "Problem, no members for strain4" in caplog.text
-
-
-def test_not_mixed():
-    """
-    Test that it returns false when there are less than the required
-    number of genomes with exactly 1 member
-    """
-    family = {"strain1": ["member"],
-              "strain2": ["member2"],
-              "strain3": ["member3"],
-              "strain4": ["member4", "member4bis"]}
-    assert not persf.mixed_family(family, 4)
-
-
-def test_mixed_more():
-    """
-    Test that it returns true when there are more than the required
-    number of genomes with exactly 1 member
-    """
-    family = {"strain1": ["member"],
-              "strain2": ["member2"],
-              "strain3": ["member3"],
-              "strain4": ["member4"],
-              "strain5": ["member5"]}
-    assert persf.mixed_family(family, 3)
-
-
 def test_write_pers():
     """
     Test that output file is written as expected
@@ -223,88 +121,34 @@ def test_write_pers():
     persf.write_persistent(fams, outfile)
     expfile = os.path.join(EXP_PATH, "exp_persgenome1.txt")
     assert tutils.compare_order_content(outfile, expfile)
+    assert utilsp.has_protein_index(outfile)
+    index = utilsp.load_protein_index(outfile)
+    assert utilsp.get_protein_family(index, "ESCO.0812.00002.i002_02000") == 5
 
 
-def test_isinsubset():
-    """
-    Check if a given protein is in the given list of genomes
-    """
-    # With gembase format
-    protein = "GENO.1234.genomename.contignum_proteinnum"
-    genomes = ["GENO.1234.genomename", "GENO.1234.toto"]
-    assert persf.is_in_subset(protein, genomes)
-    # With other format
-    protein2 = "along-genome'name_2344-f"
-    genomes2 = ["along-genome'name", "genome1", "GENO.1234.toto"]
-    assert persf.is_in_subset(protein2, genomes2)
-
-
-def test_not_isinsubset():
-    """
-    Check if a given protein is not in the given list of genomes
-    """
-    # With gembase format
-    protein = "GENO.1234.genomename1.contignum_proteinnum"
-    genomes = ["GENO.1234.genomename", "GENO.1234.toto"]
-    assert not persf.is_in_subset(protein, genomes)
-    # With other format
-    protein2 = "along-genome-name_2344-f"
-    genomes2 = ["along-genome'name", "genome1", "GENO.1234.toto"]
-    assert not persf.is_in_subset(protein2, genomes2)
-
-
-def test_get_subset(caplog):
+def test_read_subset(caplog):
     """
-    Get FAMS_BY_STRAIN and FAMILIES but only with
-    proteins from given genome list
+    Read the genomes of a subset: first column of the list file
     """
     caplog.set_level(logging.DEBUG)
     lstinfo = os.path.join(GENEPATH, "lstinfo-ok.lst")
     with open(lstinfo, "w") as lst:
         lst.write("GEN4.1111.00001 toto we don't use other fields\n")
         lst.write("GENO.1216.00003\n")
-    fbs, fam, genomes = persf.get_subset_genomes(FAMS_BY_STRAIN, FAMILIES, lstinfo)
-    exp_fams = {'1': ['GEN4.1111.00001.b0001_00001', 'GENO.1216.00003.i0001_00003'],
-            '10': ['GEN4.1111.00001.i0001_00004'],
-            '11': ['GEN4.1111.00001.i0001_00005'],
-            '12': ['GEN4.1111.00001.i0001_00008', 'GENO.1216.00003.i0001_00004',
-                   'GENO.1216.00003.i0001_01000'],
-            '2': ['GEN4.1111.00001.i0001_00003'],
-            '3': ['GEN4.1111.00001.b0001_00009', 'GENO.1216.00003.i0001_01010'],
-            '5': ['GEN4.1111.00001.i0001_00002', 'GENO.1216.00003.i0080_00010'],
-            '6': ['GEN4.1111.00001.i0001_00006'],
-            '8': ['GEN4.1111.00001.i0001_00007'],
-            }
-    exp_fbs = {'1': {'GEN4.1111.00001': ['GEN4.1111.00001.b0001_00001'],
-                      'GENO.1216.00003': ['GENO.1216.00003.i0001_00003']},
-                '10': {'GEN4.1111.00001': ['GEN4.1111.00001.i0001_00004']},
-                '11': {'GEN4.1111.00001': ['GEN4.1111.00001.i0001_00005']},
-                '12': {'GEN4.1111.00001': ['GEN4.1111.00001.i0001_00008'],
-                       'GENO.1216.00003': ['GENO.1216.00003.i0001_00004', 'GENO.1216.00003.i0001_01000']
-                       },
-                '2': {'GEN4.1111.00001': ['GEN4.1111.00001.i0001_00003']},
-                '3': {'GEN4.1111.00001': ['GEN4.1111.00001.b0001_00009'],
-                      'GENO.1216.00003': ['GENO.1216.00003.i0001_01010']},
-                '5': {'GEN4.1111.00001': ['GEN4.1111.00001.i0001_00002'],
-                      'GENO.1216.00003': ['GENO.1216.00003.i0080_00010']},
-                '6': {'GEN4.1111.00001': ['GEN4.1111.00001.i0001_00006']},
-                '8': {'GEN4.1111.00001': ['GEN4.1111.00001.i0001_00007']}}
-    assert fam == exp_fams
-    assert fbs == exp_fbs
-    assert genomes == ["GEN4.1111.00001", "GENO.1216.00003"]
+    assert persf.read_subset(lstinfo) == ["GEN4.1111.00001", "GENO.1216.00003"]
     assert ("Getting subset of pangenome for genomes in "
             "test/data/persgenome/generated_by_unit-tests/lstinfo-ok.lst") in caplog.text
 
 
-def test_get_subset_empty(caplog):
+def test_read_subset_empty(caplog):
     """
-    Test get subset of families but the list of genomes file is empty
+    Test reading a subset, but the list of genomes file is empty
     """
     caplog.set_level(logging.DEBUG)
     lstinfo = os.path.join(GENEPATH, "lstinfo-empty.lst")
     open(lstinfo, "w").close()
     with pytest.raises(SystemExit):
-        persf.get_subset_genomes(FAMS_BY_STRAIN, FAMILIES, lstinfo)
+        persf.read_subset(lstinfo)
     assert ("Getting subset of pangenome for genomes in "
             "test/data/persgenome/generated_by_unit-tests/lstinfo-empty.lst") in caplog.text
     assert ("No genome found in "
@@ -312,6 +156,124 @@ def test_get_subset_empty(caplog):
             "file") in caplog.text
 
 
+def test_subset_members():
+    """
+    Test that members kept for a subset are those of its genomes, including genome names
+    with '_', and not members of a genome whose name starts with a genome of the subset
+    """
+    fams = {1: ["GEN_1_00001", "GEN_2_00003", "GEN_12_00001", "GEN_00004"],
+            2: ["ESCO.1512.00001.i0002_00012", "ESCO.1512.00002.i0001_00002"]}
+    list_genomes = ["GEN_1", "GEN_2", "ESCO.1512.00001"]
+    assert persf.get_subset_members(fams, list_genomes) == {
+        1: ["GEN_1_00001", "GEN_2_00003"], 2: ["ESCO.1512.00001.i0002_00012"]}
+    # Family selected from the count matrix of the subset keeps all its subset members
+    fbs = {1: {"GEN_1": ["GEN_1_00001"], "GEN_2": ["GEN_2_00003"]}}
+    matrix = persf.get_count_matrix(fbs)
+    mask = persf.get_subset_mask(matrix[1], ["GEN_1", "GEN_2"])
+    counts = persf.get_fam_counts(persf.get_subset_matrix(matrix, mask))
+    pers = persf.get_pers_from_counts(counts, {1: ["GEN_1_00001", "GEN_2_00003"]}, 2)
+    assert persf.get_subset_members(pers, ["GEN_1", "GEN_2"]) == {
+        1: ["GEN_1_00001", "GEN_2_00003"]}
+
+
+def test_read_subsets_dir(caplog):
+    """
+    Test that subsets given as a directory of genome lists are read, named after their file
+    """
+    caplog.set_level(logging.DEBUG)
+    subdir = os.path.join(GENEPATH, "subsets")
+    os.makedirs(subdir)
+    with open(os.path.join(subdir, "cladeB.lst"), "w") as lst:
+        lst.write("GEN4.1111.00001 other fields\nGENO.1216.00003\n")
+    with open(os.path.join(subdir, "cladeA.lst"), "w") as lst:
+        lst.write("GENO.0817.00001\n")
+    subsets = persf.read_subsets(subdir)
+    assert subsets == {"cladeA.lst": ["GENO.0817.00001"],
+                       "cladeB.lst": ["GEN4.1111.00001", "GENO.1216.00003"]}
+    assert list(subsets) == ["cladeA.lst", "cladeB.lst"]
+    assert "Getting subset of pangenome for genomes in " in caplog.text
+
+
+def test_read_subsets_table():
+    """
+    Test that subsets given as a table (subset name, genome name) are read
+    """
+    table = os.path.join(GENEPATH, "subsets.txt")
+    with open(table, "w") as tab:
+        tab.write("cladeB GEN4.1111.00001\ncladeA\tGENO.0817.00001\n\n"
+                  "cladeB GENO.1216.00003 other field\n")
+    subsets = persf.read_subsets(table)
+    assert list(subsets) == ["cladeB", "cladeA"]
+    assert subsets["cladeB"] == ["GEN4.1111.00001", "GENO.1216.00003"]
+    assert subsets["cladeA"] == ["GENO.0817.00001"]
+
+
+def test_read_subsets_wrong(caplog):
+    """
+    Test that a table line without genome name, or a subset path which does not exist,
+    exits with an error
+    """
+    table = os.path.join(GENEPATH, "subsets.txt")
+    with open(table, "w") as tab:
+        tab.write("cladeB GEN4.1111.00001\ncladeA\n")
+    with pytest.raises(SystemExit):
+        persf.read_subsets(table)
+    assert "Line 2 of " + table + " must contain the subset name and the genome name" in caplog.text
+    with pytest.raises(SystemExit):
+        persf.read_subsets(os.path.join(GENEPATH, "nofile"))
+    assert "nofile file not found." in caplog.text
+
+
+def test_get_subset_mask():
+    """
+    Test that the mask selects the columns of genomes in the subset, and that the
+    count matrix of the subset is the one of the subset of families
+    """
+    matrix = persf.get_count_matrix(FAMS_BY_STRAIN)
+    mask = persf.get_subset_mask(matrix[1], ["GENO.1216.00003", "GEN4.1111.00001", "UNKNOWN"])
+    assert list(mask) == [True, False, False, True]
+    fam_nums, genomes, counts = persf.get_subset_matrix(matrix, mask)
+    assert fam_nums == list(FAMS_BY_STRAIN)
+    assert genomes == ["GEN4.1111.00001", "GENO.1216.00003"]
+    assert counts.shape == (14, 2)
+    assert list(counts[fam_nums.index("12")]) == [1, 2]
+    assert list(counts[fam_nums.index("4")]) == [0, 0]
+
+
+@pytest.mark.parametrize("dense_max", [10**7, 10])
+@pytest.mark.parametrize("tol, multi, mixed, floor",
+                         [(1, False, False, False), (0.5, False, False, False),
+                          (0.5, True, False, False), (0.5, False, True, False),
+                          (0.5, False, False, True)])
+def test_subset_pers(tol, multi, mixed, floor, dense_max, monkeypatch):
+    """
+    Test that the persistent genome of a subset obtained from the masked count matrix is the
+    same as the one obtained from the subset of families, with dense or sparse matrix
+    """
+    monkeypatch.setattr(persf, "DENSE_MAX_CELLS", dense_max)
+    lstinfo = os.path.join(GENEPATH, "lstinfo-ok.lst")
+    list_genomes = ["GEN4.1111.00001", "GENO.1216.00003", "GENO.0817.00001"]
+    with open(lstinfo, "w") as lst:
+        lst.write("\n".join(list_genomes) + "\n")
+    genomes = persf.read_subset(lstinfo)
+    # Pangenome of the subset: only its genomes and their members
+    fbs = {}
+    fam = {}
+    for fam_num, family in FAMS_BY_STRAIN.items():
+        kept = {genome: members for genome, members in family.items() if genome in genomes}
+        if kept:
+            fbs[fam_num] = kept
+            fam[fam_num] = [member for member in FAMILIES[fam_num]
+                            if any(member in members for members in kept.values())]
+    exp_pers = persf.get_pers(fbs, fam, len(genomes), tol, multi, mixed, floor)
+    matrix = persf.get_count_matrix(FAMS_BY_STRAIN)
+    mask = persf.get_subset_mask(matrix[1], list_genomes)
+    counts = persf.get_fam_counts(persf.get_subset_matrix(matrix, mask))
+    pers = persf.get_pers_from_counts(counts, FAMILIES, len(list_genomes), tol, multi, mixed,
+                                      floor)
+    assert persf.get_subset_members(pers, list_genomes) == exp_pers
+
+
 def test_get_core_strict(caplog):
     """
     Getting a core genome (4 genomes, all having exactly 1 member)
@@ -415,3 +377,121 @@ def test_get_99pers_multi(caplog):
     assert exp_fams == fams
     assert ("The persistent genome contains 4 families with members present in "
             "at least 4 different genomes (99.0% of the total number of genomes).") in caplog.text
+
+
+def test_get_count_matrix():
+    """
+    Check the number of members of each genome in each family
+    """
+    fam_nums, genomes, counts = persf.get_count_matrix(FAMS_BY_STRAIN)
+    assert fam_nums == list(FAMS_BY_STRAIN)
+    assert genomes == ['GEN4.1111.00001', 'GENO.0817.00001', 'GENO.1216.00002',
+                       'GENO.1216.00003']
+    assert counts.shape == (14, 4)
+    assert list(counts[fam_nums.index("1")]) == [1, 1, 2, 1]
+    assert list(counts[fam_nums.index("6")]) == [1, 2, 1, 0]
+    assert list(counts[fam_nums.index("14")]) == [0, 0, 1, 0]
+    assert counts.sum() == sum(len(mems) for mems in FAMILIES.values())
+
+
+def test_get_count_matrix_sparse(monkeypatch):
+    """
+    Check that a sparse matrix is used for big pangenomes, with the same content
+    """
+    _, _, dense = persf.get_count_matrix(FAMS_BY_STRAIN)
+    monkeypatch.setattr(persf, "DENSE_MAX_CELLS", 10)
+    fam_nums, _, counts = persf.get_count_matrix(FAMS_BY_STRAIN)
+    assert scipy.sparse.issparse(counts)
+    assert (counts.toarray() == dense).all()
+
+
+@pytest.mark.parametrize("dense_max", [10**7, 10])
+def test_save_load_count_matrix(dense_max, monkeypatch):
+    """
+    Check that a saved count matrix, dense or sparse, is loaded memory-mapped with the
+    same content
+    """
+    monkeypatch.setattr(persf, "DENSE_MAX_CELLS", dense_max)
+    matrix = persf.get_count_matrix(FAMS_BY_STRAIN)
+    matrix_dir = os.path.join(GENEPATH, "matrix")
+    persf.save_count_matrix(matrix, matrix_dir)
+    fam_nums, genomes, counts = persf.load_count_matrix(matrix_dir)
+    assert fam_nums == matrix[0]
+    assert genomes == matrix[1]
+    if dense_max == 10:
+        assert scipy.sparse.issparse(counts)
+        # arrays are views of memory-mapped files
+        assert not counts.data.flags.writeable
+        assert (counts.toarray() == matrix[2].toarray()).all()
+    else:
+        assert isinstance(counts, persf.np.memmap)
+        assert (counts == matrix[2]).all()
+
+
+@pytest.mark.parametrize("dense_max", [10**7, 10])
+def test_get_fam_counts(dense_max, monkeypatch, caplog):
+    """
+    Check number of genomes, of genomes with exactly 1 member and of genomes with several
+    members, for each family, with a dense or sparse matrix
+    """
+    monkeypatch.setattr(persf, "DENSE_MAX_CELLS", dense_max)
+    fam_nums, nb_genomes, nb_uniq, nb_multi = persf.get_fam_counts(
+        persf.get_count_matrix(FAMS_BY_STRAIN))
+    assert fam_nums == list(FAMS_BY_STRAIN)
+    counts = {num: (gen, uniq, multi) for num, gen, uniq, multi in
+              zip(fam_nums, nb_genomes, nb_uniq, nb_multi)}
+    assert counts["1"] == (4, 3, 1)
+    assert counts["12"] == (4, 3, 1)
+    assert counts["3"] == (4, 4, 0)
+    assert counts["6"] == (3, 2, 1)
+    assert counts["14"] == (1, 1, 0)
+    assert "Problem" not in caplog.text
+
+
+def test_get_fam_counts_empty(caplog):
+    """
+    Check that a genome without member in a family is considered absent from it, and that
+    a warning is given
+    """
+    fams = {"1": {"GEN1": [], "GEN2": ["GEN2_1"]}, "2": {"GEN1": ["GEN1_1", "GEN1_2"]}}
+    fam_nums, nb_genomes, nb_uniq, nb_multi = persf.get_fam_counts(persf.get_count_matrix(fams))
+    assert fam_nums == ["1", "2"]
+    assert list(nb_genomes) == [1, 1]
+    assert list(nb_uniq) == [1, 0]
+    assert list(nb_multi) == [0, 1]
+    assert "Problem, no members for 1 genome(s) of families!" in caplog.text
+
+
+def pers_reference(fam_by_strain, nb_strains, tol, multi, mixed, floor):
+    """
+    Persistent families found by looping over families, and counting members of each genome
+    """
+    min_members = persf.get_min_members(nb_strains, tol, floor)
+    if mixed:
+        return {num for num, fam in fam_by_strain.items()
+                if sum(len(members) == 1 for members in fam.values()) >= min_members}
+    return {num for num, fam in fam_by_strain.items()
+            if len(fam) >= min_members
+            and (multi or all(len(members) <= 1 for members in fam.values()))}
+
+
+@pytest.mark.parametrize("tol, multi, mixed, floor",
+                         [(1, False, False, False), (1, True, False, False),
+                          (0.99, False, False, True), (0.99, False, True, True),
+                          (0.99, True, False, True), (0.99, False, False, False),
+                          (0.99, False, True, False), (0.99, True, False, False),
+                          (0.5, False, True, False), (0.5, False, False, True)])
+def test_get_pers_from_counts(tol, multi, mixed, floor, caplog):
+    """
+    Check that persistent genomes obtained from counts are the same as the ones obtained
+    by checking each family, and the same as the ones of get_pers, with the same log message
+    """
+    caplog.set_level(logging.DEBUG)
+    exp_fams = persf.get_pers(FAMS_BY_STRAIN, FAMILIES, 4, tol, multi, mixed, floor)
+    exp_log = caplog.records[-1].message
+    caplog.clear()
+    counts = persf.get_fam_counts(persf.get_count_matrix(FAMS_BY_STRAIN))
+    fams = persf.get_pers_from_counts(counts, FAMILIES, 4, tol, multi, mixed, floor)
+    assert fams == exp_fams
+    assert set(fams) == pers_reference(FAMS_BY_STRAIN, 4, tol, multi, mixed, floor)
+    assert caplog.records[-1].message == exp_log
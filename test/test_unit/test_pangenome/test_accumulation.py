@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Unit tests for the accumulation submodule in pangenome module
+"""
+
+import os
+import logging
+import shutil
+import numpy as np
+import pytest
+
+import PanACoTA.pangenome_module.accumulation as accu
+
+
+GENEPATH = os.path.join("test", "data", "pangenome", "generated_by_unit-tests_accu")
+# 5 genomes x 6 families
+PRESENCE = np.array([[1, 1, 0, 0, 1, 0],
+                     [1, 0, 1, 0, 1, 0],
+                     [1, 1, 1, 0, 0, 0],
+                     [1, 1, 0, 1, 1, 0],
+                     [1, 0, 0, 0, 1, 1]], dtype=bool)
+
+
+@pytest.fixture(autouse=True)
+def setup_teardown_module():
+    """
+    Create directory to put generated files, and remove it at the end
+    """
+    os.mkdir(GENEPATH)
+    print("setup")
+
+    yield
+    shutil.rmtree(GENEPATH)
+    print("teardown")
+
+
+def naive_curves(presence, perm):
+    """
+    Pan and core genome sizes for one order of genomes, with sets of families
+    """
+    pan, core = [], []
+    fams_pan = set()
+    fams_core = None
+    for genome in perm:
+        fams = set(np.flatnonzero(presence[genome]))
+        fams_pan |= fams
+        fams_core = fams if fams_core is None else fams_core & fams
+        pan.append(len(fams_pan))
+        core.append(len(fams_core))
+    return pan, core
+
+
+def test_presence_matrix():
+    """
+    Check that presence matrix has 1 line per genome, 1 column per family
+    """
+    qualis = {"1": [1, 1, 0], "2": [0, 1, 0]}
+    presence = accu.get_presence_matrix(qualis, ["A", "B", "C"])
+    assert presence.tolist() == [[True, False], [True, True], [False, False]]
+
+
+@pytest.mark.parametrize("threads, chunk", [(1, None), (1, 4), (2, None), (3, 1)])
+def test_accumulation_curves(threads, chunk):
+    """
+    Check that pan and core curves are the same as the ones computed with sets, for all
+    permutations, whatever the number of processes and size of family chunks
+    """
+    nb_perm = 7
+    pan, core = accu.accumulation_curves(PRESENCE, nb_perm, threads, chunk)
+    assert pan.shape == core.shape == (nb_perm, 5)
+    rng = np.random.default_rng(accu.SEED)
+    for num in range(nb_perm):
+        exp_pan, exp_core = naive_curves(PRESENCE, rng.permutation(5))
+        assert pan[num].tolist() == exp_pan
+        assert core[num].tolist() == exp_core
+    assert (pan[:, -1] == 6).all()
+    assert (core[:, -1] == 1).all()
+
+
+def test_fit_heaps():
+    """
+    Check that Heaps' law parameters are found from an exact power law, and that no fit is
+    done when no genome adds new families
+    """
+    nb_genomes = np.arange(1, 31)
+    new_fams = 100 * nb_genomes.astype(float) ** -0.6
+    new_fams[0] = 3000
+    pan = np.cumsum(new_fams)[np.newaxis, :]
+    kappa, alpha = accu.fit_heaps(pan)
+    assert kappa == pytest.approx(100)
+    assert alpha == pytest.approx(0.6)
+    assert accu.fit_heaps(np.array([[10, 10, 10, 10]])) is None
+
+
+def test_do_accumulation(caplog):
+    """
+    Check that curves and Heaps' law fit are written
+    """
+    caplog.set_level(logging.INFO)
+    pangenome = os.path.join(GENEPATH, "pangenome")
+    qualis = {str(num): list(col) for num, col in enumerate(PRESENCE.T.astype(int))}
+    fit = accu.do_accumulation(qualis, [f"G{num}" for num in range(5)], pangenome, 10,
+                               heaps=True)
+    curves = np.loadtxt(pangenome + ".accumulation.tsv", skiprows=1)
+    assert curves.shape == (5, 9)
+    assert curves[:, 0].tolist() == [1, 2, 3, 4, 5]
+    assert (curves[:, 1] <= curves[:, 4]).all()
+    assert (curves[:, 5] >= 1).all()
+    with open(pangenome + ".heaps.tsv") as heapf:
+        lines = heapf.readlines()
+    assert lines[0] == "kappa\talpha\tpangenome\n"
+    assert lines[1].split()[2] in ["open", "closed"]
+    assert fit is not None
+    assert "Heaps' law fit: kappa = " in caplog.text
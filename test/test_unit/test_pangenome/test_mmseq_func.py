@@ -381,6 +381,47 @@ def test_tsv2pangenome():
         assert "End: " in end_line
 
 
+def test_expand_clusters():
+    """
+    Check that proteins removed from a deduplicated bank are added to the cluster of the
+    protein with the same sequence, whether it is the representative of the cluster or not
+    """
+    dupfile = os.path.join(GENEPATH, "test_expand.dup.tsv")
+    with open(dupfile, "w") as dupf:
+        dupf.write("GEN1_00001\tGEN4_00001\nGEN2_00001\tGEN5_00001\n"
+                   "GEN1_00001\tGEN6_00001\nGEN3_00002\tGEN4_00002\n")
+    clusters = {"GEN1_00001": ["GEN1_00001", "GEN2_00001"],
+                "GEN3_00002": ["GEN3_00002"],
+                "GEN3_00003": ["GEN3_00003"]}
+    mmseqs.expand_clusters(clusters, dupfile)
+    assert clusters == {"GEN1_00001": ["GEN1_00001", "GEN2_00001", "GEN4_00001",
+                                       "GEN6_00001", "GEN5_00001"],
+                        "GEN3_00002": ["GEN3_00002", "GEN4_00002"],
+                        "GEN3_00003": ["GEN3_00003"]}
+
+
+def test_tsv2pangenome_dedup():
+    """
+    From mmseq tsv file of a deduplicated bank, generate pangenome file containing all
+    proteins, including the ones removed from the bank
+    """
+    mmseqclust = os.path.join(GENEPATH, "test_dedup_clust")
+    with open(mmseqclust + ".tsv", "w") as tsvf:
+        tsvf.write("GEN1_00001\tGEN1_00001\nGEN1_00001\tGEN2_00001\n"
+                   "GEN3_00002\tGEN3_00002\n")
+    dupfile = os.path.join(GENEPATH, "test_dedup.dup.tsv")
+    with open(dupfile, "w") as dupf:
+        dupf.write("GEN1_00001\tGEN3_00001\nGEN3_00002\tGEN1_00002\n")
+    logmmseq = os.path.join(GENEPATH, "test_dedup.log")
+    outfile = os.path.join(GENEPATH, "test_dedup_pangenome.lst")
+    fams = mmseqs.mmseqs_tsv_to_pangenome(mmseqclust, logmmseq, outfile, dupfile)
+    assert fams == {1: ["GEN1_00001", "GEN2_00001", "GEN3_00001"],
+                    2: ["GEN1_00002", "GEN3_00002"]}
+    with open(outfile) as outf:
+        assert outf.readlines() == ["1 GEN1_00001 GEN2_00001 GEN3_00001\n",
+                                    "2 GEN1_00002 GEN3_00002\n"]
+
+
 def test_mmseq2pan_givenout():
     """
     From mmseq clust output, convert to pangenome (with steps inside, already tested by the other
@@ -484,6 +525,397 @@ def test_get_info_parallel():
     assert info == "0.8-mode1-th12"
 
 
+def test_get_info_engine():
+    """
+    Check that the clustering engine is in the string given by get_info, if it is not
+    the default one
+    """
+    assert mmseqs.get_info(1, 0.8, 1, "cluster") == "0.8-mode1"
+    assert mmseqs.get_info(1, 0.8, 1, "linclust") == "0.8-mode1-linclust"
+    assert mmseqs.get_info(4, 0.95, 0, "cascade") == "0.95-mode0-cascade-th4"
+
+
+def test_run_clust_wrong_engine(caplog):
+    """
+    Check that when the clustering engine does not exist, it exits with an error message
+    """
+    args = ("mmseqdb", "mmseqclust", "tmpdir", "logmmseq", 0.8, 1, 1)
+    with pytest.raises(SystemExit):
+        mmseqs.run_mmseqs_clust(args, "toto")
+    assert ("Unknown clustering engine 'toto'. Choose among ['cluster', 'linclust', "
+            "'cascade'].") in caplog.text
+
+
+@pytest.mark.parametrize("engine", ["linclust", "cascade"])
+def test_run_clust_engines(engine, caplog):
+    """
+    Checks that, when we run mmseq clust with linclust and cascade engines, it creates the
+    same kind of clustering output as mmseqs cluster, which can be converted to the
+    expected pangenome.
+    """
+    caplog.set_level(15)
+    mmseqdb = os.path.join(PATH_TEST_FILES, "mmseq_db")
+    mmseqclust = os.path.join(GENEPATH, f"test_mmseq_{engine}-out")
+    tmpdir = os.path.join(GENEPATH, "test_mmseq_tmp")
+    os.makedirs(tmpdir)
+    logmmseq = os.path.join(GENEPATH, f"test_mmseq_{engine}.log")
+    args = (mmseqdb, mmseqclust, tmpdir, logmmseq, 0.8, 1, 1)
+    mmseqs.run_mmseqs_clust(args, engine)
+    assert os.path.isfile(mmseqclust)
+    assert os.path.isfile(mmseqclust + ".index")
+    assert f"MMseqs command: mmseqs linclust {mmseqdb} " in caplog.text
+    panfile = os.path.join(GENEPATH, f"test_pan_{engine}.lst")
+    fams = mmseqs.mmseqs_to_pangenome(mmseqdb, mmseqclust, logmmseq, panfile)
+    # All proteins are in the pangenome, once
+    members = [mem for fam in fams.values() for mem in fam]
+    exp_members = [mem for fam in FAMILIES4G for mem in fam]
+    assert sorted(members) == sorted(exp_members)
+
+
+def test_get_db_cache_default():
+    """
+    Check that, when no database cache is given, it is created in the output directory
+    """
+    outdir = os.path.join(GENEPATH, "test_db_cache")
+    db_cache = mmseqs.get_db_cache(outdir)
+    assert db_cache == os.path.join(outdir, "mmseqs_db_cache")
+    assert os.path.isdir(db_cache)
+
+
+def test_get_db_cache_given():
+    """
+    Check that, when a database cache is given, it is used (and created)
+    """
+    given = os.path.join(GENEPATH, "shared_cache")
+    db_cache = mmseqs.get_db_cache(os.path.join(GENEPATH, "outdir"), given)
+    assert db_cache == given
+    assert os.path.isdir(given)
+    assert not os.path.isdir(os.path.join(GENEPATH, "outdir"))
+
+
+def test_bank_checksum():
+    """
+    Check that the checksum depends on the bank content only, and not on its name
+    """
+    prt_path = os.path.join(PATH_EXP_FILES, "exp_EXEM.All.prt")
+    copied = os.path.join(GENEPATH, "other_name.prt")
+    shutil.copyfile(prt_path, copied)
+    assert mmseqs.bank_checksum(prt_path) == mmseqs.bank_checksum(copied)
+    with open(copied, "a") as cf:
+        cf.write(">new_prot\nMKT\n")
+    assert mmseqs.bank_checksum(prt_path) != mmseqs.bank_checksum(copied)
+
+
+def test_bank_checksum_files():
+    """
+    Check that the checksum of a list of protein files depends on the content of each file,
+    in the given order
+    """
+    lstinfo = os.path.join(PATH_TEST_FILES, "list_to_pan.txt")
+    dbpath = os.path.join(PATH_TEST_FILES, "example_db", "Proteins")
+    with open(lstinfo) as lstf:
+        genomes = [line.split()[0] for line in lstf if "_name" not in line]
+    files = [os.path.join(dbpath, gen + ".prt") for gen in genomes]
+    copied = [os.path.join(GENEPATH, os.path.basename(file)) for file in files]
+    for file, copy in zip(files, copied):
+        shutil.copyfile(file, copy)
+    assert mmseqs.bank_checksum(files) == mmseqs.bank_checksum(copied)
+    assert mmseqs.bank_checksum(files[::-1]) != mmseqs.bank_checksum(files)
+    assert mmseqs.bank_checksum(files[:1]) == mmseqs.file_md5(files[0])
+    with open(copied[1], "a") as cf:
+        cf.write(">new_prot\nMKT\n")
+    assert mmseqs.bank_checksum(files) != mmseqs.bank_checksum(copied)
+
+
+def test_bank_checksum_cache(monkeypatch):
+    """
+    Check that with a cache, files are read again only when their size or modification
+    time changed
+    """
+    db_cache = os.path.join(GENEPATH, "test_checksum_cache")
+    os.makedirs(db_cache)
+    prt_path = os.path.join(GENEPATH, "bank.prt")
+    shutil.copyfile(os.path.join(PATH_EXP_FILES, "exp_EXEM.All.prt"), prt_path)
+    checksum = mmseqs.bank_checksum(prt_path, db_cache)
+    assert checksum == mmseqs.file_md5(prt_path)
+    saved = mmseqs.read_checksums(db_cache)
+    assert saved[os.path.abspath(prt_path)][2] == checksum
+    read = []
+    real_md5 = mmseqs.file_md5
+    monkeypatch.setattr(mmseqs, "file_md5", lambda file: read.append(file) or real_md5(file))
+    assert mmseqs.bank_checksum(prt_path, db_cache) == checksum
+    assert read == []
+    with open(prt_path, "a") as prtf:
+        prtf.write(">new_prot\nMKT\n")
+    assert mmseqs.bank_checksum(prt_path, db_cache) != checksum
+    assert read == [prt_path]
+    assert not [file for file in os.listdir(db_cache) if file.endswith(".tmp")]
+
+
+def test_stream_to_fifo():
+    """
+    Check that all files are written, in order, to the named pipe
+    """
+    import threading
+    dbpath = os.path.join(PATH_TEST_FILES, "example_db", "Proteins")
+    files = [os.path.join(dbpath, gen + ".prt") for gen in ["GEN2.1017.00001", "GEN4.1111.00001"]]
+    fifo = os.path.join(GENEPATH, "test.fifo")
+    os.mkfifo(fifo)
+    writer = threading.Thread(target=mmseqs.stream_to_fifo, args=(files, fifo))
+    writer.start()
+    with open(fifo) as fifof:
+        content = fifof.read()
+    writer.join()
+    exp = ""
+    for file in files:
+        with open(file) as inf:
+            exp += inf.read()
+    assert content == exp
+
+
+def write_lookup(mmseqdb, names):
+    """
+    Write a mmseqs lookup file with the given protein names
+    """
+    with open(mmseqdb + ".lookup", "w") as lookf:
+        for num, name in enumerate(names):
+            lookf.write(f"{num}\t{name}\t0\n")
+
+
+def test_check_db_genomes(caplog):
+    """
+    Check that a database containing proteins of all genomes, in order, is ok
+    """
+    caplog.set_level(15)
+    mmseqdb = os.path.join(GENEPATH, "test-msDB")
+    write_lookup(mmseqdb, ["GEN2.1017.00001.b0001_00001", "GEN2.1017.00001.b0001_00002",
+                           "GEN4.1111.00001.b0001_00001", "genome_1"])
+    assert mmseqs.check_db_genomes(mmseqdb, ["GEN2.1017.00001", "GEN4.1111.00001", "genome"])
+    assert "mmseqs database contains 4 proteins of 3 genomes." in caplog.text
+
+
+def test_check_db_genomes_empty(caplog):
+    """
+    Check that a database without proteins for a genome is not ok
+    """
+    mmseqdb = os.path.join(GENEPATH, "test-msDB")
+    write_lookup(mmseqdb, ["GEN2.1017.00001.b0001_00001", "GEN4.1111.00001.b0001_00001"])
+    assert not mmseqs.check_db_genomes(mmseqdb, ["GEN2.1017.00001", "GENO.1017.00001",
+                                                 "GEN4.1111.00001"])
+    assert ("No protein found in mmseqs database test/data/pangenome/generated_by_unit-tests/"
+            "test-msDB for 1 genome(s) of the list: GENO.1017.00001") in caplog.text
+
+
+def test_check_db_genomes_unknown(caplog):
+    """
+    Check that a database with a protein of another genome, or not consecutive with the
+    other proteins of its genome, is not ok
+    """
+    mmseqdb = os.path.join(GENEPATH, "test-msDB")
+    write_lookup(mmseqdb, ["GEN2.1017.00001.b0001_00001", "GEN4.1111.00001.b0001_00001",
+                           "GEN2.1017.00001.b0001_00002"])
+    assert not mmseqs.check_db_genomes(mmseqdb, ["GEN2.1017.00001", "GEN4.1111.00001"])
+    assert ("Protein GEN2.1017.00001.b0001_00002 of mmseqs database test/data/pangenome/"
+            "generated_by_unit-tests/test-msDB does not belong to any genome of the "
+            "list") in caplog.text
+
+
+def test_create_mmseqdb_files(caplog):
+    """
+    Check that the mmseqs database built from per-genome protein files contains all proteins
+    """
+    caplog.set_level(15)
+    lstinfo = os.path.join(PATH_TEST_FILES, "list_to_pan.txt")
+    dbpath = os.path.join(PATH_TEST_FILES, "example_db", "Proteins")
+    with open(lstinfo) as lstf:
+        genomes = [line.split()[0] for line in lstf if "_name" not in line]
+    files = [os.path.join(dbpath, gen + ".prt") for gen in genomes]
+    mmseqdb = os.path.join(GENEPATH, "test_create_mmseqsdb-files")
+    logmmseq = os.path.join(GENEPATH, "mmseq-createdb.log")
+    assert mmseqs.create_mmseqs_db(mmseqdb, files, logmmseq)
+    assert "mmseqs createdb <4 protein files>" in caplog.text
+    for ext in mmseqs.DB_EXTS:
+        assert os.path.isfile(mmseqdb + ext)
+    assert mmseqs.check_db_genomes(mmseqdb, genomes)
+
+
+def test_get_split_memory_limit(monkeypatch):
+    """
+    Check that the memory limit given by the user is used, and that 80% of the memory
+    available is used otherwise
+    """
+    assert mmseqs.get_split_memory_limit("20G") == "20G"
+    assert mmseqs.get_split_memory_limit("0") is None
+    monkeypatch.setattr(utils, "get_available_memory", lambda: 10 * 1024**3)
+    assert mmseqs.get_split_memory_limit() == "8192M"
+
+
+def test_get_split_memory_limit_unknown(monkeypatch, caplog):
+    """
+    Check that when the memory available cannot be found, no limit is given to mmseqs
+    """
+    monkeypatch.setattr(utils, "get_available_memory", lambda: None)
+    assert mmseqs.get_split_memory_limit() is None
+    assert "Could not find the memory available" in caplog.text
+
+
+def test_mem_option():
+    """
+    Check the option added to mmseqs commands
+    """
+    assert mmseqs.mem_option(None) == ""
+    assert mmseqs.mem_option("8192M") == " --split-memory-limit 8192M"
+
+
+def test_parse_mmseqs_log():
+    """
+    Check that processing time of each mmseqs module is read from the log
+    """
+    log = ["cluster db clust tmp --min-seq-id 0.8\n",
+           "\n",
+           "MMseqs Version: 13.45111\n",
+           "prefilter tmp/db tmp/db tmp/pref --sub-mat nucl:nucleotide.out\n",
+           "Time for merging to pref: 0h 0m 0s 2ms\n",
+           "Time for processing: 0h 0m 1s 250ms\n",
+           "align tmp/db tmp/db tmp/pref tmp/aln\n",
+           "Time for processing: 1h 2m 3s 4ms\n",
+           "clust tmp/db tmp/aln clust\n",
+           "Time for processing: 0h 0m 0s 10ms\n"]
+    steps = mmseqs.parse_mmseqs_log(log)
+    assert steps == [{"module": "prefilter", "time_s": 1.25},
+                     {"module": "align", "time_s": 3723.004},
+                     {"module": "clust", "time_s": 0.01}]
+
+
+def test_run_mmseqs_cmd():
+    """
+    Check that a command is run, its output is written to the log file, and the resources
+    it used are added to the json report next to it
+    """
+    import json
+    logfile = os.path.join(GENEPATH, "mmseq_test.log")
+    tmpdir = os.path.join(GENEPATH, "tmp")
+    os.makedirs(tmpdir)
+    with open(os.path.join(tmpdir, "file.txt"), "w") as tf:
+        tf.write("a" * 100)
+    assert mmseqs.run_mmseqs_cmd(f"ls {tmpdir}", "error", logfile, mode="w", tmpdir=tmpdir) == 0
+    assert mmseqs.run_mmseqs_cmd(f"ls {tmpdir}", "error", logfile) == 0
+    with open(logfile) as logf:
+        assert logf.read() == "file.txt\nfile.txt\n"
+    resfile = os.path.join(GENEPATH, "mmseq_test.json")
+    assert mmseqs.get_resource_file(logfile) == resfile
+    with open(resfile) as resf:
+        records = json.load(resf)
+    assert len(records) == 2
+    assert records[0]["subcommand"] == tmpdir
+    assert records[0]["command"] == f"ls {tmpdir}"
+    assert records[0]["returncode"] == 0
+    assert records[0]["wall_time_s"] >= 0
+    assert records[0]["peak_rss_kb"] > 0
+    assert records[0]["tmp_disk_usage_bytes"] == 100
+    assert records[0]["steps"] == []
+    assert records[1]["tmp_disk_usage_bytes"] is None
+    # New log file: new report
+    mmseqs.run_mmseqs_cmd(f"ls {tmpdir}", "error", logfile, mode="w")
+    with open(resfile) as resf:
+        assert len(json.load(resf)) == 1
+
+
+def test_run_mmseqs_cmd_error(caplog):
+    """
+    Check that when a command fails, or cannot be run, the error is logged, and the program
+    exits only if asked
+    """
+    logfile = os.path.join(GENEPATH, "mmseq_test.log")
+    assert mmseqs.run_mmseqs_cmd("ls nodir", "ls failed", logfile, eof=False) != 0
+    assert "ls failed" in caplog.text
+    with pytest.raises(SystemExit):
+        mmseqs.run_mmseqs_cmd("ls nodir", "ls failed", logfile)
+    assert mmseqs.run_mmseqs_cmd("toto arg", "toto failed", logfile, eof=False) == 1
+    assert "error: command '>toto arg' is not possible." in caplog.text
+
+
+def test_dir_size():
+    """
+    Check the disk space used by all files of a directory
+    """
+    outdir = os.path.join(GENEPATH, "test_dir_size")
+    os.makedirs(os.path.join(outdir, "sub"))
+    with open(os.path.join(outdir, "f1"), "w") as f1, \
+         open(os.path.join(outdir, "sub", "f2"), "w") as f2:
+        f1.write("a" * 10)
+        f2.write("b" * 32)
+    assert mmseqs.dir_size(outdir) == 42
+
+
+def test_clean_db_cache(caplog):
+    """
+    Check that all databases are removed from the cache, except the ones to keep
+    """
+    caplog.set_level(15)
+    db_cache = os.path.join(GENEPATH, "test_clean_cache")
+    for checksum in ["aaa", "bbb", "ccc"]:
+        os.makedirs(os.path.join(db_cache, checksum))
+        open(os.path.join(db_cache, checksum, "bank-msDB"), "w").close()
+    removed = mmseqs.clean_db_cache(db_cache, keep=["bbb"])
+    assert removed == ["aaa", "ccc"]
+    assert os.listdir(db_cache) == ["bbb"]
+    assert ("Removing mmseqs database 'test/data/pangenome/generated_by_unit-tests/"
+            "test_clean_cache/aaa'") in caplog.text
+
+
+def test_clean_db_cache_locked(caplog):
+    """
+    Check that a database used by another run (locked) is not removed from the cache
+    """
+    import fcntl
+    db_cache = os.path.join(GENEPATH, "test_clean_cache_locked")
+    os.makedirs(os.path.join(db_cache, "aaa"))
+    with open(os.path.join(db_cache, "aaa.lock"), "w") as lockf:
+        fcntl.flock(lockf, fcntl.LOCK_SH)
+        assert mmseqs.clean_db_cache(db_cache) == []
+    assert os.path.isdir(os.path.join(db_cache, "aaa"))
+    assert ("mmseqs database test/data/pangenome/generated_by_unit-tests/"
+            "test_clean_cache_locked/aaa is currently used by another run. "
+            "It will not be removed.") in caplog.text
+    assert mmseqs.clean_db_cache(db_cache) == ["aaa"]
+    assert os.listdir(db_cache) == []
+
+
+def test_lock_db_entry(monkeypatch):
+    """
+    Check that a database entry can be locked before its folder exists, that a run which
+    does not wait gives up when the entry is locked, and that the lock is taken again if its
+    file is removed while waiting
+    """
+    db_cache = os.path.join(GENEPATH, "test_lock_cache")
+    os.makedirs(db_cache)
+    with mmseqs.lock_db_entry(db_cache, "aaa") as lockf:
+        assert lockf.name == os.path.join(db_cache, "aaa.lock")
+        with mmseqs.lock_db_entry(db_cache, "aaa", blocking=False) as other:
+            assert other is None
+    # Lock file removed (by a cache cleaning) after being opened, before being locked
+    real_open = open
+    def open_then_remove(path, mode):
+        lockf = real_open(path, mode)
+        if not open_then_remove.done:
+            open_then_remove.done = True
+            os.remove(path)
+        return lockf
+    open_then_remove.done = False
+    monkeypatch.setattr(mmseqs, "open", open_then_remove, raising=False)
+    with mmseqs.lock_db_entry(db_cache, "bbb") as lockf:
+        assert os.path.isfile(lockf.name)
+        assert os.stat(lockf.name).st_ino == os.fstat(lockf.fileno()).st_ino
+
+
+def test_clean_db_cache_nodir():
+    """
+    Check that cleaning a cache which does not exist does nothing
+    """
+    assert mmseqs.clean_db_cache(os.path.join(GENEPATH, "no_cache")) == []
+
+
 def test_do_pangenome(caplog):
     """
     Check that expected output files are created,
@@ -969,3 +1401,107 @@ def test_run_all_pangenome_panexists_wrong(caplog):
     assert caplog.records[1].levelname == "WARNING"
     assert caplog.records[2].levelname == "INFO"
     assert caplog.records[3].levelname == "ERROR"
+
+
+def test_run_sweep_pangenome_allexist(caplog):
+    """
+    Check that, when the pangenome files of all thresholds already exist, they are read,
+    and no mmseqs step is run
+    """
+    caplog.set_level(15)
+    outdir = os.path.join(GENEPATH, "test_run_sweep")
+    os.makedirs(outdir)
+    prt_path = os.path.join(PATH_EXP_FILES, "exp_EXEM.All.prt")
+    exp_pan = os.path.join(PATH_EXP_FILES, "exp_pangenome-4genomes.lst")
+    for min_id in [0.8, 0.9]:
+        panfile = os.path.join(outdir, f"PanGenome-exp_EXEM.All.prt-clust-{min_id}-mode1.lst")
+        shutil.copyfile(exp_pan, panfile)
+    res = mmseqs.run_sweep_pangenome([0.9, 0.8, 0.9], 1, outdir, prt_path, 1)
+    assert list(res) == [0.8, 0.9]
+    for min_id, (fams, panfile) in res.items():
+        assert panfile == os.path.join(outdir,
+                                       f"PanGenome-exp_EXEM.All.prt-clust-{min_id}-mode1.lst")
+        assert len(fams) == 16
+    assert ("Will run MMseqs2 with:\n\t- minimum sequence identities = 80.0%, 90.0%\n"
+            "\t- cluster mode 1") in caplog.text
+    assert not os.path.isdir(os.path.join(outdir, "tmp_exp_EXEM.All.prt_sweep0.8"))
+    assert not os.path.isdir(os.path.join(outdir, "mmseqs_db_cache"))
+
+
+def test_run_sweep_pangenome(caplog):
+    """
+    Check that, given a prt bank and several thresholds, it compares proteins only once,
+    and creates 1 pangenome per threshold. At 80%, the pangenome must be the expected one.
+    """
+    caplog.set_level(15)
+    outdir = os.path.join(GENEPATH, "test_run_sweep")
+    os.makedirs(outdir)
+    prt_path = os.path.join(PATH_EXP_FILES, "exp_EXEM.All.prt")
+    res = mmseqs.run_sweep_pangenome([0.8, 0.95], 1, outdir, prt_path, 1, quiet=True)
+    assert list(res) == [0.8, 0.95]
+    fams80, panfile80 = res[0.8]
+    assert panfile80 == os.path.join(outdir, "PanGenome-exp_EXEM.All.prt-clust-0.8-mode1.lst")
+    exp_pan = os.path.join(PATH_EXP_FILES, "exp_pangenome-4genomes.lst")
+    with open(exp_pan, "r") as ep, open(panfile80, "r") as pan:
+        lines_exp = set(tuple(line.split()[1:]) for line in ep)
+        lines_out = set(tuple(line.split()[1:]) for line in pan)
+    assert lines_exp == lines_out
+    # More stringent threshold cannot merge families
+    fams95, panfile95 = res[0.95]
+    assert os.path.isfile(panfile95)
+    assert len(fams95) >= len(fams80)
+    assert sum(len(fam) for fam in fams95.values()) == sum(len(fam) for fam in fams80.values())
+    # All-vs-all comparison is done once, at the lowest threshold
+    assert caplog.text.count("mmseqs prefilter") == 1
+    assert "Comparing all proteins at 80.0% identity..." in caplog.text
+    assert "Clustering proteins at 80.0% identity..." in caplog.text
+    assert "Clustering proteins at 95.0% identity..." in caplog.text
+
+
+def test_families_to_file():
+    """
+    Check that families are written with their own number, sorted by number, and with
+    their members sorted
+    """
+    families = {12: ["GEN2.1017.00001.b0002_00010", "GEN2.1017.00001.i0002_00004"],
+                3: ["GENO.1216.00002.i0001_00002", "GEN4.1111.00001.b0001_00001"]}
+    fileout = os.path.join(GENEPATH, "families.lst")
+    fams = mmseqs.families_to_file(families, fileout)
+    assert fams == {3: ["GEN4.1111.00001.b0001_00001", "GENO.1216.00002.i0001_00002"],
+                    12: ["GEN2.1017.00001.i0002_00004", "GEN2.1017.00001.b0002_00010"]}
+    with open(fileout) as fo:
+        lines = fo.readlines()
+    assert lines == ["3 GEN4.1111.00001.b0001_00001 GENO.1216.00002.i0001_00002\n",
+                     "12 GEN2.1017.00001.i0002_00004 GEN2.1017.00001.b0002_00010\n"]
+
+
+def test_run_update_pangenome(caplog):
+    """
+    Check that, starting from the expected pangenome restricted to 2 genomes, adding the 2
+    other genomes keeps all existing families with their number, and puts all proteins of
+    new genomes in a family.
+    """
+    import PanACoTA.pangenome_module.protein_seq_functions as protf
+    caplog.set_level(15)
+    outdir = os.path.join(GENEPATH, "test_run_update")
+    os.makedirs(outdir)
+    old_strains = ["GEN2.1017.00001", "GEN4.1111.00001"]
+    old_families = {}
+    with open(os.path.join(PATH_EXP_FILES, "exp_pangenome-4genomes.lst")) as ep:
+        for line in ep:
+            num, *members = line.split()
+            members = [mem for mem in members if mem.startswith(tuple(old_strains))]
+            if members:
+                old_families[num] = members
+    lstinfo = os.path.join(PATH_TEST_FILES, "list_to_pan.txt")
+    dbpath = os.path.join(PATH_TEST_FILES, "example_db", "Proteins")
+    new_bank, reps_bank, reps = protf.build_update_banks(lstinfo, dbpath, "EXEM", outdir,
+                                                         old_families, old_strains, True)
+    families, panfile = mmseqs.run_update_pangenome(old_families, reps, 0.8, 1, outdir,
+                                                    new_bank, reps_bank, 1, quiet=True)
+    assert panfile == os.path.join(outdir, "PanGenome-EXEM.Update.prt-clust-0.8-mode1.lst")
+    assert os.path.isfile(panfile)
+    for num, members in old_families.items():
+        assert set(members) <= set(families[int(num)])
+    assert sum(len(fam) for fam in families.values()) == 45
+    assert "mmseqs search" in caplog.text
@@ -245,4 +245,41 @@ def test_all_post():
 
     # Check that bin pangenome file was created (as it did not exist before)
     assert os.path.isfile(pangenome + ".bin")
-    
\ No newline at end of file
+    # Check that protein index was created
+    assert os.path.isfile(os.path.join(pangenome + ".index", "proteins.npy"))
+    assert os.path.isfile(os.path.join(pangenome + ".index", "families.npy"))
+    
+
+def test_all_post_accumulation():
+    """
+    Check that when accumulation curves are asked, they are written, with the total
+    number of families and the number of core families for all genomes
+    """
+    pangenome = os.path.join(GENEPATH, "test_all_post")
+    post.post_treat(FAMILIES, pangenome, nb_perm=5, heaps=True)
+    with open(pangenome + ".accumulation.tsv") as accf:
+        lines = accf.readlines()
+    assert lines[0].split() == ["nb_genomes", "pan_mean", "pan_sd", "pan_min", "pan_max",
+                                "core_mean", "core_sd", "core_min", "core_max"]
+    assert len(lines) == 5
+    nb_core = sum(quali == [1, 1, 1, 1] for quali in EXP_QUALIS.values())
+    assert lines[-1].split() == ["4", f"{len(FAMILIES)}.00", "0.00", str(len(FAMILIES)),
+                                 str(len(FAMILIES)), f"{nb_core}.00", "0.00", str(nb_core),
+                                 str(nb_core)]
+    assert os.path.isfile(pangenome + ".heaps.tsv")
+
+
+def test_write_sweep_summary():
+    """
+    Check that, given pangenomes obtained with several thresholds, the comparison table
+    contains 1 line per threshold, sorted by threshold
+    """
+    fams_90 = {1: ["a_1", "b_1"], 2: ["a_2"], 3: ["b_2"]}
+    pangenomes = {0.9: (fams_90, "pan-0.9.lst"), 0.8: (FAMILIES, "pan-0.8.lst")}
+    outfile = os.path.join(GENEPATH, "test_sweep_summary.tsv")
+    post.write_sweep_summary(pangenomes, outfile)
+    with open(outfile) as outf:
+        lines = outf.readlines()
+    assert lines == ["min_id\tnb_families\tnb_singletons\tmax_members\tpangenome\n",
+                     "0.8\t16\t5\t5\tpan-0.8.lst\n",
+                     "0.9\t3\t2\t2\tpan-0.9.lst\n"]
@@ -112,3 +112,182 @@ def test_build_bank_exists(caplog):
     assert ("Protein bank test/data/pangenome/generated_by_unit-tests/Proteins/"
             "EXEM.All.prt already exists. It will be used by mmseqs.") in caplog.text
     assert caplog.records[0].levelname == "WARNING"
+
+
+def test_build_bank_dedup(caplog):
+    """
+    Build a protein bank keeping only 1 protein per unique sequence, and check that
+    all other proteins are in the mapping file, associated to the first protein found with
+    the same sequence.
+    """
+    caplog.set_level(logging.DEBUG)
+    lstinfo = os.path.join(PATH_TEST_FILES, "list_to_pan.txt")
+    dbpath = os.path.join(PATH_TEST_FILES, "example_db", "Proteins")
+    name = "EXEM"
+    spedir = os.path.join(GENEPATH, "test_build_dedup")
+    outfile = psf.build_prt_bank(lstinfo, dbpath, name, spedir, False, dedup=True)
+    exp_out = os.path.join(spedir, name + ".All.uniq.prt")
+    assert outfile == exp_out
+    dupfile = psf.get_dup_file(outfile)
+    assert dupfile == exp_out + ".dup.tsv"
+    with open(dupfile) as dupf:
+        dups = [line.split() for line in dupf]
+    assert dups == [["GEN2.1017.00001.i0003_00009", "GEN4.1111.00001.i0001_00008"],
+                    ["GEN4.1111.00001.i0001_00005", "GENO.1017.00001.i0002_00005"],
+                    ["GEN2.1017.00001.i0003_00008", "GENO.1017.00001.i0002_00009"],
+                    ["GENO.1216.00002.b0001_00001", "GENO.1216.00002.i0001_00002"],
+                    ["GEN2.1017.00001.b0002_00003", "GENO.1216.00002.i0001_00004"],
+                    ["GEN2.1017.00001.i0003_00009", "GENO.1216.00002.b0002_00009"]]
+    # Bank contains all proteins of the full bank, except duplicates
+    exp_bank = list(psf.read_proteins(os.path.join(PATH_EXP_FILES, "exp_EXEM.All.prt")))
+    removed = [dup for _, dup in dups]
+    exp_uniq = [prot for prot in exp_bank if prot[0][1:].split()[0] not in removed]
+    assert list(psf.read_proteins(outfile)) == exp_uniq
+    assert len(exp_uniq) == 39
+    assert "39 unique sequences among 45 proteins." in caplog.text
+
+
+def test_build_bank_dedup_exists(caplog):
+    """
+    Test that when a deduplicated bank and its mapping file already exist, they are reused.
+    If the mapping file is missing, the bank is rebuilt.
+    """
+    caplog.set_level(logging.DEBUG)
+    lstinfo = os.path.join(PATH_TEST_FILES, "list_to_pan.txt")
+    dbpath = os.path.join(PATH_TEST_FILES, "example_db", "Proteins")
+    spedir = os.path.join(GENEPATH, "test_build_dedup")
+    os.makedirs(spedir)
+    exp_out = os.path.join(spedir, "EXEM.All.uniq.prt")
+    open(exp_out, "w").close()
+    psf.build_prt_bank(lstinfo, dbpath, "EXEM", spedir, True, dedup=True)
+    assert "Building bank with all proteins" in caplog.text
+    assert os.path.getsize(exp_out) > 0
+    caplog.clear()
+    psf.build_prt_bank(lstinfo, dbpath, "EXEM", spedir, True, dedup=True)
+    assert ("Protein bank test/data/pangenome/generated_by_unit-tests/test_build_dedup/"
+            "EXEM.All.uniq.prt already exists. It will be used by mmseqs.") in caplog.text
+
+
+def test_get_representatives():
+    """
+    Test that the first member of each family is its representative
+    """
+    families = {1: ["GEN2_1", "GEN4_2"], "2": ["GEN4_1"], 10: ["GEN2_3", "GEN2_4", "GEN4_5"]}
+    assert psf.get_representatives(families) == {"GEN2_1": 1, "GEN4_1": "2", "GEN2_3": 10}
+
+
+def test_extract_proteins():
+    """
+    Test that only the given proteins are extracted, with their sequence
+    """
+    dbpath = os.path.join(PATH_TEST_FILES, "example_db", "Proteins")
+    files = [os.path.join(dbpath, gen + ".prt") for gen in ["GEN2.1017.00001", "GEN4.1111.00001"]]
+    names = {"GEN2.1017.00001.b0002_00003", "GEN4.1111.00001.i0001_00008", "toto"}
+    outfile = os.path.join(GENEPATH, "extracted.prt")
+    assert psf.extract_proteins(files, names, outfile) == 2
+    prots = list(psf.read_proteins(outfile))
+    assert [prot[0][1:].split()[0] for prot in prots] == ["GEN2.1017.00001.b0002_00003",
+                                                          "GEN4.1111.00001.i0001_00008"]
+    exp = {head: seq for head, seq in psf.read_proteins(files[1])}
+    assert prots[1][1] == exp[prots[1][0]]
+
+
+def test_build_update_banks(caplog):
+    """
+    Test that, when the existing pangenome contains 2 of the 4 genomes of lstinfo, the bank of
+    new proteins contains all proteins of the 2 other genomes, and the bank of representatives
+    contains the first member of each existing family.
+    """
+    caplog.set_level(logging.DEBUG)
+    lstinfo = os.path.join(PATH_TEST_FILES, "list_to_pan.txt")
+    dbpath = os.path.join(PATH_TEST_FILES, "example_db", "Proteins")
+    old_strains = ["GEN2.1017.00001", "GEN4.1111.00001"]
+    old_families = {1: ["GEN2.1017.00001.b0001_00001", "GEN4.1111.00001.b0001_00001"],
+                    2: ["GEN4.1111.00001.i0001_00008"]}
+    res = psf.build_update_banks(lstinfo, dbpath, "EXEM", GENEPATH, old_families,
+                                 old_strains, True)
+    new_bank, reps_bank, reps = res
+    assert new_bank == os.path.join(GENEPATH, "EXEM.Update.prt")
+    assert reps_bank == os.path.join(GENEPATH, "EXEM.Update-reps.prt")
+    assert reps == {"GEN2.1017.00001.b0001_00001": 1, "GEN4.1111.00001.i0001_00008": 2}
+    new_prots = [head[1:].split()[0] for head, _ in psf.read_proteins(new_bank)]
+    assert len(new_prots) == 23
+    assert all(prot.startswith("GENO.") for prot in new_prots)
+    rep_prots = [head[1:].split()[0] for head, _ in psf.read_proteins(reps_bank)]
+    assert rep_prots == ["GEN2.1017.00001.b0001_00001", "GEN4.1111.00001.i0001_00008"]
+    assert "2 new genome(s) to add to the pangenome." in caplog.text
+
+
+def test_build_update_banks_nonew():
+    """
+    Test that when all genomes of lstinfo are already in the pangenome, nothing is done
+    """
+    lstinfo = os.path.join(PATH_TEST_FILES, "list_to_pan.txt")
+    dbpath = os.path.join(PATH_TEST_FILES, "example_db", "Proteins")
+    old_strains = ["GEN2.1017.00001", "GEN4.1111.00001", "GENO.1017.00001", "GENO.1216.00002"]
+    assert psf.build_update_banks(lstinfo, dbpath, "EXEM", GENEPATH, {}, old_strains,
+                                  True) is None
+    assert os.listdir(GENEPATH) == []
+
+
+def test_build_update_banks_missing_rep(caplog):
+    """
+    Test that when a representative of an existing family is not found in protein files,
+    it exits with an error
+    """
+    caplog.set_level(logging.DEBUG)
+    lstinfo = os.path.join(PATH_TEST_FILES, "list_to_pan.txt")
+    dbpath = os.path.join(PATH_TEST_FILES, "example_db", "Proteins")
+    old_families = {1: ["GEN2.1017.00001.b0001_00001"], 2: ["GEN2.1017.00001.b0001_12345"]}
+    with pytest.raises(SystemExit):
+        psf.build_update_banks(lstinfo, dbpath, "EXEM", GENEPATH, old_families,
+                               ["GEN2.1017.00001", "OLD.0000.00001"], True)
+    assert ("1 genome(s) of the existing pangenome are not in "
+            "test/data/pangenome/test_files/list_to_pan.txt") in caplog.text
+    assert "Only 1 representatives of the 2 existing families were found" in caplog.text
+
+
+def test_get_prt_files(caplog):
+    """
+    Test that all protein files are returned in the order of lstinfo, and that the bank
+    is not written
+    """
+    caplog.set_level(logging.DEBUG)
+    lstinfo = os.path.join(PATH_TEST_FILES, "list_to_pan.txt")
+    dbpath = os.path.join(PATH_TEST_FILES, "example_db", "Proteins")
+    prt_path, files = psf.get_prt_files(lstinfo, dbpath, "EXEM", GENEPATH)
+    assert prt_path == os.path.join(GENEPATH, "EXEM.All.prt")
+    assert not os.path.isfile(prt_path)
+    assert files == [os.path.join(dbpath, gen + ".prt") for gen in
+                     ["GEN2.1017.00001", "GEN4.1111.00001", "GENO.1017.00001",
+                      "GENO.1216.00002"]]
+    assert "mmseqs database will be built directly from the 4 protein files" in caplog.text
+
+
+def test_get_prt_files_missing(caplog):
+    """
+    Test that when a protein file is missing, it exits with an error
+    """
+    lstinfo = os.path.join(GENEPATH, "lstinfo.txt")
+    with open(lstinfo, "w") as lstf:
+        lstf.write("gembase_name\nGEN2.1017.00001\nGEN5.1017.00001\n")
+    dbpath = os.path.join(PATH_TEST_FILES, "example_db", "Proteins")
+    with pytest.raises(SystemExit):
+        psf.get_prt_files(lstinfo, dbpath, "EXEM", None)
+    assert ("1 protein file(s) of genomes in test/data/pangenome/generated_by_unit-tests/"
+            "lstinfo.txt are missing or empty: test/data/pangenome/test_files/example_db/"
+            "Proteins/GEN5.1017.00001.prt") in caplog.text
+
+
+def test_get_prt_files_dup(caplog):
+    """
+    Test that when a genome is several times in lstinfo, it exits with an error
+    """
+    lstinfo = os.path.join(GENEPATH, "lstinfo.txt")
+    with open(lstinfo, "w") as lstf:
+        lstf.write("gembase_name\nGEN2.1017.00001\nGEN4.1111.00001\nGEN2.1017.00001\n")
+    dbpath = os.path.join(PATH_TEST_FILES, "example_db", "Proteins")
+    with pytest.raises(SystemExit):
+        psf.get_prt_files(lstinfo, dbpath, "EXEM", None)
+    assert ("Genome(s) GEN2.1017.00001 found several times in test/data/pangenome/"
+            "generated_by_unit-tests/lstinfo.txt") in caplog.text
@@ -10,6 +10,8 @@ import logging
 import pytest
 import shutil
 
+from Bio import Phylo
+
 import PanACoTA.tree_module.fastme_func as fme
 from PanACoTA import utils
 import test.test_unit.utilities_for_tests as tutil
@@ -241,7 +243,8 @@ def test_run_fme_notreename_rysym(caplog):
 
 def test_run_tree(caplog):
     """
-    Test generating tree from fasta alignment with fastme (conversion)
+    Test generating tree from fasta alignment with fastme, with a model computed from site
+    patterns: fastme is run on the distance matrix
     """
     caplog.set_level(logging.DEBUG)
     boot = None
@@ -251,53 +254,80 @@ def test_run_tree(caplog):
     write_boot = False
     write_matrix = False
     fme.run_tree(ALIGNMENT, boot, GENEPATH, quiet, threads, model=model, wb=write_boot, matrix=write_matrix)
-    assert "Converting fasta alignment to PHYLIP-relaxed format" in caplog.text
+    assert "Compressing alignment into site patterns" in caplog.text
+    assert "Computing TN93 distances from 81 site patterns." in caplog.text
     assert "Running FastME..." in caplog.text
     assert ("fastme "
-            "-i test/data/tree/generated_by_unit-tests/exp_pers4genomes.grp.aln.phylip "
-             "-d T -n B -s -T 1  "
-            "-o test/data/tree/generated_by_unit-tests/"
-            "exp_pers4genomes.grp.aln.phylip.fastme_tree.nwk "
+            "-i test/data/tree/generated_by_unit-tests/exp_pers4genomes.grp.aln.fastme_dist-mat.txt "
+            "-n B -s -T 1 "
+            "-o test/data/tree/generated_by_unit-tests/exp_pers4genomes.grp.aln.fastme_tree.nwk "
             "-I test/data/tree/generated_by_unit-tests/"
-            "exp_pers4genomes.grp.aln.phylip.fastme.log") in caplog.text
-    treefile = os.path.join(GENEPATH, "exp_pers4genomes.grp.aln.phylip.fastme_tree.nwk")
+            "exp_pers4genomes.grp.aln.fastme.log") in caplog.text
+    treefile = os.path.join(GENEPATH, "exp_pers4genomes.grp.aln.fastme_tree.nwk")
     assert tree_util.is_tree_lengths(treefile)
     assert not tree_util.is_tree_bootstrap(treefile)
-    logs = os.path.join(GENEPATH, "exp_pers4genomes.grp.aln.phylip.fastme.log")
+    logs = os.path.join(GENEPATH, "exp_pers4genomes.grp.aln.fastme.log")
     assert os.path.isfile(logs)
-    phylip = os.path.join(GENEPATH, "exp_pers4genomes.grp.aln.phylip")
-    assert os.path.isfile(phylip)
+    assert os.path.isfile(os.path.join(GENEPATH, "exp_pers4genomes.grp.aln.patterns.npz"))
+    assert not os.path.isfile(os.path.join(GENEPATH,
+                                           "exp_pers4genomes.grp.aln.fastme_dist-mat.txt"))
 
-    # Redo with phylip alignments already generated
+    # Redo with site patterns already generated, and bootstraps
     boot = 110
-    treefile = os.path.join(GENEPATH, "test_rerun_tree-fastme.tree")
-    quiet = False
-    threads = 1
-    model = 'T'
     write_boot = True
+    write_matrix = True
     fme.run_tree(ALIGNMENT, boot, GENEPATH, quiet, threads, model=model, matrix=write_matrix, wb=write_boot)
-    assert "Phylip alignment file already existing." in caplog.text
-    assert ("The Phylip alignment file "
-            "test/data/tree/generated_by_unit-tests/exp_pers4genomes.grp.aln.phylip "
-            "already exists. The program will use it instead of re-converting "
+    assert "Site patterns file already existing." in caplog.text
+    assert ("The site patterns file "
+            "test/data/tree/generated_by_unit-tests/exp_pers4genomes.grp.aln.patterns.npz "
+            "already exists. The program will use it instead of re-compressing "
             "test/data/align/exp_files/exp_pers4genomes.grp.aln") in caplog.text
-    assert "Running FastME..." in caplog.text
-    assert ("fastme -i test/data/tree/generated_by_unit-tests/exp_pers4genomes.grp.aln.phylip "
-            "-d T -n B -s -T 1 -b 110 "
+    assert "Computing distances of 110 bootstrap replicates." in caplog.text
+    assert ("fastme -i test/data/tree/generated_by_unit-tests/"
+            "exp_pers4genomes.grp.aln.fastme_boot_dist-mat.txt -D 110 -n B -s -T 1 "
             "-o test/data/tree/generated_by_unit-tests/"
-            "exp_pers4genomes.grp.aln.phylip.fastme_tree.nwk "
-            "-I test/data/tree/generated_by_unit-tests/"
-            "exp_pers4genomes.grp.aln.phylip.fastme.log "
-            "-B test/data/tree/generated_by_unit-tests/"
-            "exp_pers4genomes.grp.aln.phylip.fastme_bootstraps.nwk") in caplog.text
-    treefile = os.path.join(GENEPATH, "exp_pers4genomes.grp.aln.phylip.fastme_tree.nwk")
+            "exp_pers4genomes.grp.aln.fastme_bootstraps.nwk") in caplog.text
     assert not tree_util.is_tree_lengths(treefile)
     assert tree_util.is_tree_bootstrap(treefile)
-    logs = os.path.join(GENEPATH, "exp_pers4genomes.grp.aln.phylip.fastme.log")
-    assert os.path.isfile(logs)
-    phylip = os.path.join(GENEPATH, "exp_pers4genomes.grp.aln.phylip")
-    assert os.path.isfile(phylip)
-    bootfile = "test/data/tree/generated_by_unit-tests/exp_pers4genomes.grp.aln.phylip.fastme_bootstraps.nwk"
-    # bootfile = os.path.join(GENEPATH, "exp_pers4genomes.grp.aln.phylip.fastme_bootstraps.nwk")
-    assert os.path.isfile(bootfile)
+    assert os.path.isfile(os.path.join(GENEPATH, "exp_pers4genomes.grp.aln.fastme_bootstraps.nwk"))
+    assert os.path.isfile(os.path.join(GENEPATH, "exp_pers4genomes.grp.aln.fastme_dist-mat.txt"))
+    assert not os.path.isfile(os.path.join(GENEPATH,
+                                           "exp_pers4genomes.grp.aln.fastme_boot_dist-mat.txt"))
+
 
+def test_run_tree_phylip(caplog):
+    """
+    Test generating tree from fasta alignment with fastme, with a model not computed from
+    site patterns: alignment is converted to phylip, and fastme computes distances
+    """
+    caplog.set_level(logging.DEBUG)
+    fme.run_tree(ALIGNMENT, None, GENEPATH, False, 1, model="4", wb=False, matrix=False)
+    assert "Converting fasta alignment to PHYLIP-relaxed format" in caplog.text
+    assert ("fastme "
+            "-i test/data/tree/generated_by_unit-tests/exp_pers4genomes.grp.aln.phylip "
+            "-d 4 -n B -s -T 1  ") in caplog.text
+    treefile = os.path.join(GENEPATH, "exp_pers4genomes.grp.aln.phylip.fastme_tree.nwk")
+    assert tree_util.is_tree_lengths(treefile)
+    assert not os.path.isfile(os.path.join(GENEPATH, "exp_pers4genomes.grp.aln.patterns.npz"))
+
+
+def test_add_supports():
+    """
+    Test that each branch of the tree gets the percentage of bootstrap trees containing it,
+    whatever the position of the root in bootstrap trees
+    """
+    treefile = os.path.join(GENEPATH, "tree.nwk")
+    bootfile = os.path.join(GENEPATH, "boot.nwk")
+    with open(treefile, "w") as treef:
+        treef.write("(A:0.1,B:0.2,(C:0.1,(D:0.1,E:0.2):0.05):0.3);\n")
+    with open(bootfile, "w") as bootf:
+        bootf.write("(A:0.1,B:0.2,(C:0.1,(D:0.1,E:0.2):0.05):0.3);\n"
+                    "(C:0.1,(A:0.1,B:0.2):0.1,(D:0.1,E:0.2):0.05);\n"
+                    "(D:0.1,(A:0.1,C:0.2):0.1,(B:0.1,E:0.2):0.05);\n")
+    fme.add_supports(treefile, bootfile, "A")
+    assert tree_util.is_tree_bootstrap(treefile)
+    tree = Phylo.read(treefile, "newick")
+    supports = {tuple(sorted(leaf.name for leaf in clade.get_terminals())): clade.confidence
+                for clade in tree.get_nonterminals()}
+    assert supports[("C", "D", "E")] == pytest.approx(66.67)
+    assert supports[("D", "E")] == pytest.approx(66.67)
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Unit tests for site_patterns submodule of tree_module
+"""
+
+import os
+import logging
+import shutil
+
+import numpy as np
+import pytest
+
+import PanACoTA.tree_module.site_patterns as sp
+from PanACoTA.align_module import filter_align
+
+
+# Define common variables
+ALIGNMENT = os.path.join("test", "data", "align", "exp_files", "exp_pers4genomes.grp.aln")
+GENEPATH = os.path.join("test", "data", "tree", "generated_by_unit-tests")
+PATFILE = os.path.join(GENEPATH, "patterns.npz")
+
+
+@pytest.fixture(autouse=True)
+def setup_teardown_module():
+    """
+    Create directory to put generated files before each test, and remove it after
+    """
+    os.mkdir(GENEPATH)
+    print("setup")
+
+    yield
+    shutil.rmtree(GENEPATH)
+    print("teardown")
+
+
+def get_matrix(*seqs):
+    """
+    Get alignment matrix from the given sequences
+    """
+    return np.array([np.frombuffer(seq, dtype=np.uint8) for seq in seqs])
+
+
+def test_compress():
+    """
+    Test that unique columns are given in order of first occurrence, with their number of
+    occurrences
+    """
+    matrix = get_matrix(b"AACAC-", b"AGCGC-", b"AGTGTA")
+    patterns, weights = sp.compress(matrix)
+    assert [bytes(row) for row in patterns] == [b"AAC-", b"AGC-", b"AGTA"]
+    assert list(weights) == [1, 2, 2, 1]
+
+
+def test_compress_collision(monkeypatch):
+    """
+    Test that different columns with the same hash are not merged
+    """
+    matrix = get_matrix(b"AACAC-", b"AGCGC-", b"AGTGTA")
+    monkeypatch.setattr(sp, "column_hashes", lambda mat: np.zeros(mat.shape[1], dtype=np.uint64))
+    patterns, weights = sp.compress(matrix)
+    assert [bytes(row) for row in patterns] == [b"AAC-", b"AGC-", b"AGTA"]
+    assert list(weights) == [1, 2, 2, 1]
+
+
+def test_compress_alignment(caplog):
+    """
+    Test that site patterns of an alignment are saved, and that they give back all columns
+    of the alignment
+    """
+    caplog.set_level(logging.DEBUG)
+    sp.compress_alignment(ALIGNMENT, PATFILE)
+    assert "6438 columns compressed into 81 site patterns (79.5x)." in caplog.text
+    names, patterns, weights = sp.load_patterns(PATFILE)
+    exp_names, matrix = filter_align.read_matrix(ALIGNMENT)
+    assert names == [name.decode() for name in exp_names]
+    assert weights.sum() == matrix.shape[1]
+    columns = {bytes(col): 0 for col in matrix.T}
+    for col in matrix.T:
+        columns[bytes(col)] += 1
+    assert {bytes(col): weight for col, weight in zip(patterns.T, weights)} == columns
+    sp.compress_alignment(ALIGNMENT, PATFILE)
+    assert "Site patterns file already existing." in caplog.text
+
+
+@pytest.mark.parametrize("model", ["p", "J", "K", "T"])
+def test_distance_patterns(model):
+    """
+    Test that distances computed from weighted site patterns are the same as from all columns
+    """
+    _, matrix = filter_align.read_matrix(ALIGNMENT)
+    patterns, weights = sp.compress(matrix)
+    dist = sp.distance_matrix(patterns, weights, model)
+    assert np.allclose(dist, sp.distance_matrix(matrix, np.ones(matrix.shape[1]), model))
+    assert np.allclose(dist, dist.T)
+    assert (dist[~np.eye(4, dtype=bool)] > 0).all()
+
+
+def test_pair_counts():
+    """
+    Test counts of sites compared, identical, with each type of transition, and with a
+    transversion, for each pair of sequences, with pattern weights
+    """
+    matrix = get_matrix(b"ACGTACGTT-", b"GCGTAAGTT-", b"ACGTACGT-A", b"GTATGCGTTA")
+    patterns, weights = sp.compress(matrix)
+    compared, matches, trans_ag, trans_ct, transv = sp.pair_counts(patterns, weights)
+    assert compared[0, 1] == compared[1, 0] == 9
+    assert compared[0, 2] == 8
+    assert compared[0, 0] == 9
+    assert matches[0, 1] == 7
+    assert trans_ag[0, 1] == trans_ag[1, 0] == 1
+    assert transv[0, 1] == 1
+    # Sequences 0 and 3: A <-> G, C <-> T, G <-> A, T <-> T, A <-> G, then identical sites
+    assert trans_ag[0, 3] == trans_ag[3, 0] == 3
+    assert trans_ct[0, 3] == trans_ct[3, 0] == 1
+    assert transv[0, 3] == 0
+    assert np.allclose(compared, matches + trans_ag + trans_ct + transv)
+
+
+def test_distance_values():
+    """
+    Test distances with each model, ignoring sites with a gap
+    """
+    # 1 transition (A <-> G) and 1 transversion (C <-> A) out of 8 sites compared
+    matrix = get_matrix(b"ACGTACGTT-", b"GCGTAAGTT-", b"ACGTACGT-A")
+    patterns, weights = sp.compress(matrix)
+    assert sp.distance_matrix(patterns, weights, "p")[0, 1] == pytest.approx(2 / 9)
+    assert sp.distance_matrix(patterns, weights, "p")[0, 2] == 0
+    assert (sp.distance_matrix(patterns, weights, "J")[0, 1]
+            == pytest.approx(-3 / 4 * np.log(1 - 4 / 3 * 2 / 9)))
+    assert (sp.distance_matrix(patterns, weights, "K")[0, 1]
+            == pytest.approx(-1 / 2 * np.log(1 - 3 / 9) - 1 / 4 * np.log(1 - 2 / 9)))
+
+
+def test_distance_saturated(caplog):
+    """
+    Test that pairs of sequences without any site to compare get the maximum distance
+    """
+    matrix = get_matrix(b"ACG--", b"---TA", b"ACGTA")
+    patterns, weights = sp.compress(matrix)
+    dist = sp.distance_matrix(patterns, weights, "T")
+    assert dist[0, 1] == dist[1, 0] == sp.MAX_DIST
+    assert dist[0, 2] == 0
+    assert ("1 pairs of sequences have no site to compare, or a saturated TN93 distance: "
+            "their distance is set to 10.0.") in caplog.text
+
+
+def test_bootstrap_weights():
+    """
+    Test that each bootstrap replicate resamples as many columns as in the alignment, only
+    among existing patterns
+    """
+    weights = np.array([10, 0, 5, 1])
+    boots = sp.bootstrap_weights(weights, 20, seed=1)
+    assert boots.shape == (20, 4)
+    assert (boots.sum(axis=1) == 16).all()
+    assert (boots[:, 1] == 0).all()
+    assert (sp.bootstrap_weights(weights, 20, seed=1) == boots).all()
+
+
+def test_write_distances():
+    """
+    Test that distance matrices are written one after the other, in PHYLIP format
+    """
+    outfile = os.path.join(GENEPATH, "dist.txt")
+    sp.write_distances(outfile, ["G1", "G2"], [np.array([[0, 0.5], [0.5, 0]])] * 2)
+    with open(outfile) as outf:
+        assert outf.read() == ("2\nG1 0.00000000 0.50000000\nG2 0.50000000 0.00000000\n\n") * 2
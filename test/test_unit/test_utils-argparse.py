@@ -183,6 +183,19 @@ def test_perc_id():
     assert ("The minimum %% of identity must be in [0, 1]. Invalid value: 1.1") in str(err.value)
 
 
+def test_mem_size():
+    """
+    Test that memory sizes are returned with mmseqs format, and that wrong sizes raise an error
+    """
+    assert autils.mem_size("20G") == "20G"
+    assert autils.mem_size("500m") == "500M"
+    assert autils.mem_size("0") == "0"
+    for wrong in ["G", "20", "1.5G", "20Go", "0G", "-2G"]:
+        with pytest.raises(argparse.ArgumentTypeError) as err:
+            autils.mem_size(wrong)
+        assert f"invalid memory size: '{wrong}'" in str(err.value)
+
+
 def test_conf_parser_init_empty(capsys):
     """
     test class Conf_all_parser init when no config file or empty config file
@@ -446,4 +446,78 @@ def test_read_lstinfo_nofile(caplog):
     with pytest.raises(SystemExit):
         upan.read_lstinfo("non-existing-file.txt", logger)
     assert ("non-existing-file.txt file not found") in caplog.text
-    
\ No newline at end of file
+    
+
+def test_get_strain():
+    """
+    Check genome name found from gembase and other protein names
+    """
+    assert upan.get_strain("ESCO.1512.00001.i0002_12124") == "ESCO.1512.00001"
+    assert upan.get_strain("my_genome_00012") == "my_genome"
+
+
+def test_genome_resolver():
+    """
+    Check that genome of a protein is the longest correct prefix of its name, found among
+    all genomes, for gembase and other protein names
+    """
+    resolver = upan.GenomeResolver(["ESCO.1512.00001", "ESCO.1512.00001.C001", "GEN", "GEN_12",
+                                    "my_genome"])
+    assert resolver.find("ESCO.1512.00001.i0002_12124") == "ESCO.1512.00001"
+    assert resolver.find("ESCO.1512.00001.C001_00012") == "ESCO.1512.00001.C001"
+    assert resolver.find("GEN_12_00001") == "GEN_12"
+    assert resolver.find("GEN_1234") == "GEN"
+    assert resolver.find("my_genome") == "my_genome"
+    assert resolver.find("my_genome2_00001") is None
+    assert resolver.find("ESCO.1512.00002.i0002_12124") is None
+    # If not found, genome name is given by get_strain
+    assert resolver("ESCO.1512.00002.i0002_12124") == "ESCO.1512.00002"
+    assert resolver("GEN_12_00001") == "GEN_12"
+    assert upan.GenomeResolver()("my_genome_00012") == "my_genome"
+
+
+def test_protein_index():
+    """
+    Check that the protein index gives the family of each protein, and all proteins of
+    a genome (and not of genomes with a longer name starting the same way)
+    """
+    families = {'1': ['GEN2.1017.00001.i0002_00004', 'GEN_1_00001'],
+                '10': ['GEN_12_00003', 'GEN2.1017.00001.b0001_00009'],
+                '2': ['GEN_1_00002']}
+    pangenome = os.path.join(GENEPATH, "pangenome.lst")
+    index_dir = upan.write_protein_index(families, pangenome)
+    assert index_dir == pangenome + ".index"
+    index = upan.load_protein_index(pangenome)
+    assert index[0].tolist() == sorted(member.encode() for members in families.values()
+                                       for member in members)
+    for num, members in families.items():
+        for member in members:
+            assert upan.get_protein_family(index, member) == int(num)
+    assert upan.get_protein_family(index, "GEN_1_00003") is None
+    assert upan.get_protein_family(index, "GEN2.1017.00001.i0002_00004_long_name") is None
+    assert upan.get_protein_family(index, "A") is None
+    assert upan.get_protein_family(index, "ZZZ") is None
+    assert upan.get_genome_families(index, "GEN_1") == {"GEN_1_00001": 1, "GEN_1_00002": 2}
+    assert upan.get_genome_families(index, "GEN2.1017.00001") == \
+        {'GEN2.1017.00001.b0001_00009': 10, 'GEN2.1017.00001.i0002_00004': 1}
+    assert upan.get_genome_families(index, "GEN3") == {}
+    # With a resolver, proteins of genomes whose name is not in gembase format are found
+    resolver = upan.GenomeResolver(["GEN_1", "GEN_12", "GEN2.1017.00001"])
+    assert upan.get_genome_families(index, "GEN_1", resolver) == \
+        {"GEN_1_00001": 1, "GEN_1_00002": 2}
+    assert upan.has_protein_index(pangenome) is False
+    open(pangenome, "w").close()
+    os.utime(pangenome, (0, 0))
+    assert upan.has_protein_index(pangenome)
+    os.utime(pangenome)
+    os.utime(os.path.join(index_dir, "families.npy"), (0, 0))
+    assert not upan.has_protein_index(pangenome)
+
+
+def test_protein_index_missing(caplog):
+    """
+    Check that loading the index of a pangenome without index exits with an error
+    """
+    with pytest.raises(SystemExit):
+        upan.load_protein_index(os.path.join(GENEPATH, "nopan.lst"))
+    assert "No index found for pangenome" in caplog.text
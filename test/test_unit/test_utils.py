@@ -816,6 +816,20 @@ def test_check_resdirnodir():
     utils.check_out_dirs("totoresdir")
 
 
+def test_get_available_memory():
+    """
+    Test that the memory available is a positive number of bytes, not more than the memory
+    of the machine
+    """
+    mem = utils.get_available_memory()
+    if not os.path.isfile("/proc/meminfo"):
+        assert mem is None
+        return
+    with open("/proc/meminfo") as memf:
+        total = int(memf.readline().split()[1]) * 1024
+    assert 0 < mem <= total
+
+
 def test_run_cmd_error_noquit(caplog):
     """
     Test that when we try to run a command which does not exist, it returns an error message,